@@ -0,0 +1,93 @@
+import asyncio
+import math
+import os
+import random
+import threading
+import time
+
+import metrics
+
+# Сколько регистраций на одно событие в секунду пропускать после начального всплеска (0 - без ограничения)
+ADMISSION_RATE = float(os.getenv("ADMISSION_RATE", "20"))
+# Сколько регистраций на событие пропускается сразу, без ожидания
+ADMISSION_BURST = int(os.getenv("ADMISSION_BURST", "40"))
+# Дольше этого запрос не ждёт своей очереди: ему отвечают 429 с Retry-After
+ADMISSION_MAX_WAIT = float(os.getenv("ADMISSION_MAX_WAIT", "5"))
+# После скольких ключей окно удаляет ключи, чьи слоты уже прошли
+PRUNE_THRESHOLD = 10000
+
+admission_requests = metrics.registry.counter(
+    "admission_requests_total", "Registration requests passed through the admission window by outcome", ("outcome",)
+)
+
+
+class AdmissionRejected(Exception):
+    """Очередь события заполнена; retry_after - через сколько секунд стоит повторить запрос"""
+
+    def __init__(self, retry_after: float):
+        super().__init__("Слишком много запросов на регистрацию, повторите позже")
+        self.retry_after = retry_after
+
+    @property
+    def retry_after_header(self) -> str:
+        return str(max(1, math.ceil(self.retry_after)))
+
+
+class AdmissionWindow:
+    """Сглаживание всплесков регистраций на одно событие (GCRA)
+
+    Для каждого ключа хранится теоретическое время следующего слота: первые
+    burst запросов проходят сразу, следующие получают слоты через 1/rate
+    секунд в порядке прихода и ждут их в asyncio.sleep, не занимая поток.
+    Если ждать пришлось бы дольше max_wait, запрос отклоняется без занятия
+    слота, а Retry-After указывает, когда слот появится, с разбросом на длину
+    очереди, чтобы отклонённые клиенты не вернулись одновременно.
+    """
+
+    def __init__(self, rate: float = ADMISSION_RATE, burst: int = ADMISSION_BURST,
+                 max_wait: float = ADMISSION_MAX_WAIT, clock=time.monotonic):
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self.max_wait = max_wait
+        self._clock = clock
+        self._lock = threading.Lock()
+        # Ключ -> теоретическое время следующего слота
+        self._slots = {}
+        self._stats = {"admitted": 0, "delayed": 0, "rejected": 0}
+
+    def reserve(self, key) -> float:
+        """Занятие слота для ключа: сколько секунд ждать (0 - сразу) или AdmissionRejected"""
+        if self.rate <= 0:
+            return 0.0
+        interval = 1.0 / self.rate
+        tolerance = (self.burst - 1) * interval
+        with self._lock:
+            now = self._clock()
+            slot = max(self._slots.get(key, now), now)
+            wait = max(slot - tolerance - now, 0.0)
+            if wait > self.max_wait:
+                self._stats["rejected"] += 1
+                admission_requests.inc("rejected")
+                # Через wait - max_wait освободится первый слот, ещё за max_wait - очередь целиком
+                raise AdmissionRejected(wait - self.max_wait + random.random() * self.max_wait)
+            if len(self._slots) >= PRUNE_THRESHOLD:
+                self._slots = {k: v for k, v in self._slots.items() if v > now}
+            self._slots[key] = slot + interval
+            outcome = "delayed" if wait else "admitted"
+            self._stats[outcome] += 1
+        admission_requests.inc(outcome)
+        return wait
+
+    async def acquire(self, key):
+        """Ожидание слота для ключа; при переполненной очереди - AdmissionRejected"""
+        wait = self.reserve(key)
+        if wait:
+            await asyncio.sleep(wait)
+
+    def info(self) -> dict:
+        with self._lock:
+            return {"rate": self.rate, "burst": self.burst, "max_wait": self.max_wait,
+                    "keys": len(self._slots), **self._stats}
+
+
+admission_window = AdmissionWindow()
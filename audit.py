@@ -0,0 +1,204 @@
+import logging
+import queue
+import threading
+import time
+
+from queries import statement
+
+AUDIT_INSERT = statement("audit_log.insert", '''
+    INSERT INTO ExpertAuditLog (expert_id, hackathon_id, action_type, target_type, target_id, details, ip_address, created_at)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+''')
+
+logger = logging.getLogger(__name__)
+
+
+class AuditLogError(Exception):
+    """Запись журнала не сохранена (durability='sync')"""
+
+
+class _FlushMarker:
+    """Метка в очереди: писатель отмечает событие после записи всего, что было до неё"""
+
+    def __init__(self):
+        self.event = threading.Event()
+        # Ошибка пачки, записанной после предыдущей метки (запись не сохранена)
+        self.error = None
+
+
+class AuditLogWriter:
+    """Фоновая пакетная запись журнала действий экспертов
+
+    Записи попадают в ограниченную очередь в памяти, а отдельный поток
+    сбрасывает их пачками в одной транзакции. Режимы durability:
+    'async' - запрос не ждёт записи на диск; 'sync' - запрос ждёт фиксации
+    своей пачки (одновременные запросы фиксируются общей транзакцией).
+    При переполнении очереди запись выполняется синхронно, без потерь.
+    Пачка, не записанная за три попытки, пишется в лог с ошибкой; в режиме
+    'sync' запрос, чья запись не сохранилась или не дождалась фиксации,
+    получает AuditLogError.
+    """
+
+    def __init__(self, connect, batch_size: int = 500, flush_interval: float = 0.05,
+                 max_queue: int = 10000, durability: str = "async"):
+        if durability not in ("async", "sync"):
+            raise ValueError("durability должен быть 'async' или 'sync'")
+        self._connect = connect
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.durability = durability
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._stopping = False
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            "rows_written": 0,
+            "batches": 0,
+            "overflow_writes": 0,
+            "failed_rows": 0,
+            "last_flush_ms": 0.0,
+            "max_flush_ms": 0.0,
+            "total_flush_ms": 0.0
+        }
+
+    def _ensure_started(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stopping = False
+                self._thread = threading.Thread(target=self._run, name="audit-log-writer", daemon=True)
+                self._thread.start()
+
+    def submit(self, row: tuple):
+        """Постановка записи в очередь"""
+        if self._stopping:
+            self._checked(self._write([row]))
+            return
+        self._ensure_started()
+        try:
+            self._queue.put(row, timeout=1.0)
+        except queue.Full:
+            with self._stats_lock:
+                self._stats["overflow_writes"] += 1
+            self._checked(self._write([row]))
+            return
+        if self.durability == "sync":
+            marker = self._flush(5.0)
+            if marker is not None:
+                if not marker.event.is_set():
+                    raise AuditLogError("Запись журнала действий не зафиксирована за 5 секунд")
+                self._checked(marker.error)
+
+    def _checked(self, error):
+        if error is not None and self.durability == "sync":
+            raise AuditLogError("Запись журнала действий не сохранена") from error
+
+    def _flush(self, timeout: float):
+        if self._thread is None or not self._thread.is_alive():
+            return None
+        marker = _FlushMarker()
+        self._queue.put(marker)
+        if not marker.event.wait(timeout):
+            logger.error("Audit log flush timed out after %.1f s with %d records queued",
+                         timeout, self._queue.qsize())
+        return marker
+
+    def flush(self, timeout: float = 5.0) -> bool:
+        """Ожидание записи всех ранее поставленных в очередь записей"""
+        marker = self._flush(timeout)
+        if marker is None:
+            return self._queue.empty()
+        return marker.event.is_set()
+
+    def stop(self, timeout: float = 10.0):
+        """Остановка писателя со сбросом очереди на диск"""
+        if self._thread is None:
+            return
+        self._stopping = True
+        self._queue.put(None)
+        self._thread.join(timeout)
+        self._thread = None
+
+    def _run(self):
+        conn = self._connect()
+        error = None
+        try:
+            while True:
+                try:
+                    item = self._queue.get(timeout=self.flush_interval)
+                except queue.Empty:
+                    continue
+
+                batch = []
+                markers = []
+                stop = False
+                while True:
+                    if item is None:
+                        stop = True
+                    elif isinstance(item, _FlushMarker):
+                        markers.append(item)
+                    else:
+                        batch.append(item)
+                    if len(batch) >= self.batch_size:
+                        break
+                    try:
+                        item = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+
+                if batch:
+                    error = self._write(batch, conn) or error
+                for marker in markers:
+                    marker.error = error
+                    marker.event.set()
+                if markers:
+                    error = None
+                if stop:
+                    break
+        finally:
+            conn.close()
+
+    def _write(self, rows, conn=None):
+        """Запись пачки; возвращает исключение, если пачку так и не удалось записать"""
+        own_conn = conn is None
+        if own_conn:
+            conn = self._connect()
+        started = time.perf_counter()
+        try:
+            for attempt in range(3):
+                try:
+                    conn.executemany(AUDIT_INSERT, rows)
+                    conn.commit()
+                    break
+                except Exception as e:
+                    conn.rollback()
+                    if attempt == 2:
+                        logger.exception("Audit log write failed, %d records dropped", len(rows))
+                        with self._stats_lock:
+                            self._stats["failed_rows"] += len(rows)
+                        return e
+                    time.sleep(0.05 * (attempt + 1))
+        finally:
+            if own_conn:
+                conn.close()
+
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        with self._stats_lock:
+            self._stats["rows_written"] += len(rows)
+            self._stats["batches"] += 1
+            self._stats["last_flush_ms"] = elapsed_ms
+            self._stats["max_flush_ms"] = max(self._stats["max_flush_ms"], elapsed_ms)
+            self._stats["total_flush_ms"] += elapsed_ms
+
+    def metrics(self) -> dict:
+        with self._stats_lock:
+            stats = dict(self._stats)
+        total_flush_ms = stats.pop("total_flush_ms")
+        stats["avg_flush_ms"] = total_flush_ms / stats["batches"] if stats["batches"] else 0.0
+        stats["queue_depth"] = self._queue.qsize()
+        stats["queue_capacity"] = self._queue.maxsize
+        stats["durability"] = self.durability
+        stats["running"] = self._thread is not None and self._thread.is_alive()
+        return stats
@@ -0,0 +1,219 @@
+import gzip
+import heapq
+import itertools
+import json
+import os
+import threading
+from datetime import datetime, timedelta
+
+from queries import statement, template
+
+# Каталог архивных сегментов журнала экспертов
+ARCHIVE_DIR = os.getenv("AUDIT_ARCHIVE_DIR", "audit_archive")
+# Срок хранения в горячей таблице, если для хакатона не задана политика
+DEFAULT_RETENTION_DAYS = int(os.getenv("AUDIT_LOG_RETENTION_DAYS", "90"))
+# Максимум записей в одном сегменте
+SEGMENT_ROWS = 50000
+
+AUDIT_COLUMNS = ("id", "expert_id", "hackathon_id", "action_type", "target_type",
+                 "target_id", "details", "ip_address", "created_at")
+
+RETENTION_BY_HACKATHON = statement(
+    "audit_retention.by_hackathon", "SELECT retention_days FROM AuditRetentionPolicies WHERE hackathon_id = ?"
+)
+RETENTION_UPSERT = statement("audit_retention.upsert", '''
+    INSERT INTO AuditRetentionPolicies (hackathon_id, retention_days, updated_at)
+    VALUES (?, ?, ?)
+    ON CONFLICT (hackathon_id) DO UPDATE SET
+        retention_days = excluded.retention_days,
+        updated_at = excluded.updated_at
+''')
+ROTATION_POLICIES = statement("audit_log.rotation_policies", '''
+    SELECT DISTINCT l.hackathon_id, COALESCE(r.retention_days, ?)
+    FROM ExpertAuditLog l
+    LEFT JOIN AuditRetentionPolicies r ON r.hackathon_id = l.hackathon_id
+''')
+EXPIRED_ROWS = statement("audit_log.expired", f'''
+    SELECT {", ".join(AUDIT_COLUMNS)} FROM ExpertAuditLog
+    WHERE hackathon_id = ? AND created_at < ?
+    ORDER BY created_at, id
+    LIMIT ?
+''')
+SEGMENT_INSERT = statement("audit_segments.insert", '''
+    INSERT INTO AuditArchiveSegments (hackathon_id, path, min_created_at, max_created_at, row_count, created_at)
+    VALUES (?, ?, ?, ?, ?, ?)
+''')
+SEGMENT_EXPERT_INSERT = statement(
+    "audit_segments.insert_expert", "INSERT INTO AuditArchiveSegmentExperts (segment_id, expert_id) VALUES (?, ?)"
+)
+AUDIT_DELETE = statement("audit_log.delete", "DELETE FROM ExpertAuditLog WHERE id = ?")
+EXPIRED_IDS = template("audit_log.expired_ids", "SELECT id FROM ExpertAuditLog WHERE id IN ({placeholders})")
+HOT_ROWS = template("audit_log.query", f'''
+    SELECT {", ".join(AUDIT_COLUMNS)} FROM ExpertAuditLog
+    WHERE {{conditions}}
+    ORDER BY created_at DESC, id DESC
+    LIMIT ?
+''')
+SEGMENTS = template("audit_segments.query", '''
+    SELECT s.path, s.max_created_at FROM AuditArchiveSegments s
+    WHERE {conditions}
+    ORDER BY s.max_created_at DESC
+''')
+
+
+# Ротации не выполняются параллельно: иначе одни и те же записи попали бы в два сегмента
+_rotate_lock = threading.Lock()
+
+
+def _segment_path(hackathon_id: int, first_id: int, last_id: int) -> str:
+    return os.path.join(f"hackathon_{hackathon_id}", f"{first_id:012d}-{last_id:012d}.jsonl.gz")
+
+
+def _write_segment(path: str, rows):
+    """Запись сжатого сегмента; файл появляется под итоговым именем только целиком"""
+    full_path = os.path.join(ARCHIVE_DIR, path)
+    os.makedirs(os.path.dirname(full_path), exist_ok=True)
+    tmp_path = full_path + ".tmp"
+    with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+        for row in rows:
+            f.write(json.dumps(dict(zip(AUDIT_COLUMNS, row)), ensure_ascii=False))
+            f.write("\n")
+    with open(tmp_path, "rb") as f:
+        os.fsync(f.fileno())
+    os.replace(tmp_path, full_path)
+
+
+def read_segment(path: str):
+    with gzip.open(os.path.join(ARCHIVE_DIR, path), "rt", encoding="utf-8") as f:
+        for line in f:
+            yield json.loads(line)
+
+
+def get_retention_days(conn, hackathon_id: int) -> int:
+    cursor = conn.cursor()
+    cursor.execute(RETENTION_BY_HACKATHON, (hackathon_id,))
+    row = cursor.fetchone()
+    return row[0] if row else DEFAULT_RETENTION_DAYS
+
+
+def set_retention_days(conn, hackathon_id: int, retention_days: int):
+    conn.execute(RETENTION_UPSERT, (hackathon_id, retention_days, datetime.now().isoformat()))
+    conn.commit()
+
+
+def register_segment(conn, hackathon_id: int, path: str, rows, now: str) -> bool:
+    """Регистрация записанного сегмента в индексе и удаление его записей из горячей таблицы
+
+    Выполняется в операции записи (см. db.archive_audit_segment). Если часть
+    записей уже удалена, сегмент не регистрируется, а файл остаётся
+    неиспользованным.
+    """
+    cursor = conn.cursor()
+    ids = [row[0] for row in rows]
+    cursor.execute(EXPIRED_IDS.format(placeholders=", ".join("?" * len(ids))), ids)
+    if len(cursor.fetchall()) != len(ids):
+        return False
+    cursor.execute(SEGMENT_INSERT, (hackathon_id, path, rows[0][8], rows[-1][8], len(rows), now))
+    segment_id = cursor.lastrowid
+    cursor.executemany(
+        SEGMENT_EXPERT_INSERT,
+        [(segment_id, expert_id) for expert_id in {row[1] for row in rows}]
+    )
+    cursor.executemany(AUDIT_DELETE, [(i,) for i in ids])
+    conn.commit()
+    return True
+
+
+def rotate(conn, register, now: datetime = None):
+    """Перенос устаревших записей журнала в архивные сегменты
+
+    Для каждого хакатона записи старше срока хранения читаются по conn
+    и выгружаются в новый сжатый сегмент вне потока записи, после чего
+    register(hackathon_id, path, rows, now) в одной транзакции писателя
+    регистрирует сегмент в индексе и удаляет записи из горячей таблицы.
+    Сегменты после записи не изменяются.
+    """
+    now = now or datetime.now()
+    with _rotate_lock:
+        cursor = conn.cursor()
+        cursor.execute(ROTATION_POLICIES, (DEFAULT_RETENTION_DAYS,))
+        policies = cursor.fetchall()
+
+        segments = []
+        for hackathon_id, retention_days in policies:
+            cutoff = (now - timedelta(days=retention_days)).isoformat()
+            while True:
+                cursor.execute(EXPIRED_ROWS, (hackathon_id, cutoff, SEGMENT_ROWS))
+                rows = [tuple(row) for row in cursor.fetchall()]
+                if not rows:
+                    break
+
+                ids = [row[0] for row in rows]
+                path = _segment_path(hackathon_id, min(ids), max(ids))
+                _write_segment(path, rows)
+                if not register(hackathon_id, path, rows, now.isoformat()):
+                    break
+                segments.append({"hackathon_id": hackathon_id, "path": path, "rows": len(rows)})
+                if len(rows) < SEGMENT_ROWS:
+                    break
+        return segments
+
+
+def query(conn, expert_id: int = None, hackathon_id: int = None, start: str = None, end: str = None,
+          limit: int = 50, offset: int = 0):
+    """Записи журнала за период из горячей таблицы и архива, новые сначала
+
+    start и end сравниваются с created_at как строки, поэтому ожидаются
+    в виде полного локального ISO-времени (см. db.query_audit_log).
+    """
+    start = start or ""
+    end = end or "9999"
+    need = offset + limit
+    cursor = conn.cursor()
+
+    conditions = ["created_at >= ?", "created_at <= ?"]
+    params = [start, end]
+    if expert_id is not None:
+        conditions.append("expert_id = ?")
+        params.append(expert_id)
+    if hackathon_id is not None:
+        conditions.append("hackathon_id = ?")
+        params.append(hackathon_id)
+    cursor.execute(HOT_ROWS.format(conditions=" AND ".join(conditions)), params + [need])
+    rows = [dict(zip(AUDIT_COLUMNS, row)) for row in cursor.fetchall()]
+    for row in rows:
+        row["archived"] = False
+
+    segment_conditions = ["s.max_created_at >= ?", "s.min_created_at <= ?"]
+    segment_params = [start, end]
+    if hackathon_id is not None:
+        segment_conditions.append("s.hackathon_id = ?")
+        segment_params.append(hackathon_id)
+    if expert_id is not None:
+        segment_conditions.append(
+            "EXISTS (SELECT 1 FROM AuditArchiveSegmentExperts e WHERE e.segment_id = s.id AND e.expert_id = ?)"
+        )
+        segment_params.append(expert_id)
+    cursor.execute(SEGMENTS.format(conditions=" AND ".join(segment_conditions)), segment_params)
+
+    def sort_key(row):
+        return row["created_at"], row["id"]
+
+    def archived_rows(path):
+        for row in read_segment(path):
+            if not start <= row["created_at"] <= end:
+                continue
+            if expert_id is not None and row["expert_id"] != expert_id:
+                continue
+            row["archived"] = True
+            yield row
+
+    for path, max_created_at in cursor.fetchall():
+        # Сегменты идут по убыванию времени: дальше только более старые записи
+        if len(rows) >= need and max_created_at < rows[need - 1]["created_at"]:
+            break
+        # Сегмент читается построчно, в памяти остаются только need самых новых записей
+        rows = heapq.nlargest(need, itertools.chain(rows, archived_rows(path)), key=sort_key)
+
+    rows.sort(key=sort_key, reverse=True)
+    return rows[offset:need]
@@ -0,0 +1,47 @@
+import argparse
+
+import db
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Пересчёт агрегатов и пакетной аналитики по исходным таблицам")
+    parser.add_argument("target", choices=["activity", "demographics", "funnel", "reputation", "team-counts"])
+    parser.add_argument("--db", default=db.DB_PATH, help="путь к файлу БД")
+    parser.add_argument("--entity", action="append", choices=sorted(db.ACTIVITY_EVENTS),
+                        help="сущность для activity (можно несколько, по умолчанию все)")
+    args = parser.parse_args(argv)
+
+    db.DB_PATH = args.db
+    db.analytics_snapshot.source_path = args.db
+    db.init_database()
+    try:
+        if args.target == "activity":
+            totals = db.backfill_activity_rollups(args.entity)
+            for entity, count in totals.items():
+                print(f"{entity}: {count} events")
+        elif args.target == "demographics":
+            result = db.reconcile_demographics(repair=True)
+            print(f"{result['buckets']} buckets, {result['drift']} drifted"
+                  + (", repaired" if result["repaired"] else ""))
+        elif args.target == "funnel":
+            result = db.run_participation_funnel()
+            print(f"{result['kind']} v{result['version']} computed in {result['duration_ms']} ms")
+        elif args.target == "team-counts":
+            result = db.verify_team_member_counts(repair=True)
+            print(f"{result['drift']} teams drifted" + (", repaired" if result["repaired"] else ""))
+        else:
+            db.db_writer.run("rebuild_reputation_rollups", _rebuild_reputation)
+            print("Reputation rollups rebuilt")
+    finally:
+        db.db_writer.stop()
+
+
+def _rebuild_reputation():
+    conn = db.get_db_connection()
+    db.rebuild_reputation_rollups(conn.cursor())
+    conn.commit()
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+"""Общая подготовка бенчмарков: отдельная БД во временном каталоге и клиент приложения"""
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ADMIN_PASSWORD = "admin123"
+
+
+def scratch_env() -> str:
+    """Перенаправление БД и рабочих каталогов во временный каталог; вызывать до импорта db"""
+    workdir = tempfile.mkdtemp(prefix="hackathon_hub_bench_")
+    os.environ.update(
+        DB_PATH=os.path.join(workdir, "hackathon_hub.db"),
+        ANALYTICS_SNAPSHOT_DIR=os.path.join(workdir, "analytics_snapshot"),
+        AUDIT_ARCHIVE_DIR=os.path.join(workdir, "audit_archive"),
+        PROFILE_DIR=os.path.join(workdir, "profiles"),
+        TEMPLATE_BYTECODE_DIR=os.path.join(workdir, "template_cache"),
+        STATUS_SCHEDULER="0",
+        NOTIFICATIONS="0",
+        ADM_PASS=ADMIN_PASSWORD
+    )
+    # Шаблоны и статика ищутся относительно корня репозитория
+    os.chdir(ROOT)
+    if ROOT not in sys.path:
+        sys.path.insert(0, ROOT)
+    return workdir
+
+
+def admin_client():
+    """TestClient приложения с сессией администратора"""
+    from fastapi.testclient import TestClient
+    import main
+
+    client = TestClient(main.app)
+    response = client.post("/api/admin/login", json={"login": "admin", "password": ADMIN_PASSWORD})
+    assert response.status_code == 200, response.text
+    return client
+
+
+def best_of(fn, repeat: int = 3) -> float:
+    """Лучшее время fn() из repeat запусков, мс"""
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - started) * 1000)
+    return min(timings)
@@ -0,0 +1,85 @@
+"""Списки пользователей и хакатонов: словари + jsonable_encoder против строк RowModel + orjson
+
+Сравниваются путь до перехода на rows.py (get_all_* и FastAPI-кодирование ответа)
+и текущий (list_* и FastJSONResponse), затем замеряются сами эндпоинты.
+Запуск: python benchmarks/list_endpoints.py [число пользователей и хакатонов]
+"""
+import gc
+import sys
+import tracemalloc
+
+from common import scratch_env, admin_client, best_of
+
+scratch_env()
+COUNT = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+
+from fastapi.encoders import jsonable_encoder  # noqa: E402
+from fastapi.responses import JSONResponse  # noqa: E402
+
+import db  # noqa: E402
+from rows import FastJSONResponse  # noqa: E402
+
+
+def fill():
+    db.init_database()
+    conn = db._open_connection()
+    conn.executemany(
+        "INSERT INTO Users (username, email, password, age, fio, city, role, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+        [(f"user{i}", f"user{i}@example.com", "$2b$12$" + "x" * 53, 18 + i % 40, f"Иванов Иван {i}", "Москва",
+          "participant", "2025-11-01T10:00:00") for i in range(COUNT)]
+    )
+    conn.executemany(
+        "INSERT INTO Hackathons (name, description, organizer, start_date, end_date, duration_hours, prize_fund,"
+        " max_team_size, status, created_at, published) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        [(f"Hack {i}", "Описание хакатона " * 5, "Org", f"2027-01-{1 + i % 28:02d}T10:00:00",
+          f"2027-02-{1 + i % 28:02d}T10:00:00", 48, "100000", 5, "upcoming", "2025-11-01T10:00:00", 1)
+         for i in range(COUNT)]
+    )
+    conn.commit()
+    conn.close()
+
+
+def users_before():
+    users = db.get_all_users()
+    for user in users:
+        user.pop("password", None)
+    return JSONResponse(jsonable_encoder(users))
+
+
+def users_after():
+    return FastJSONResponse(db.list_users())
+
+
+def hackathons_before():
+    return JSONResponse(jsonable_encoder(db.get_all_hackathons()))
+
+
+def hackathons_after():
+    return FastJSONResponse(db.list_hackathons())
+
+
+def peak_mb(fn) -> float:
+    gc.collect()
+    tracemalloc.start()
+    fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak / 1e6
+
+
+def main():
+    fill()
+    print(f"{COUNT} users, {COUNT} hackathons; best of 3, tracemalloc peak")
+    for name, before, after in (("users", users_before, users_after),
+                                ("hackathons", hackathons_before, hackathons_after)):
+        print(f"  {name:<11} dicts + jsonable_encoder {best_of(before):6.0f} ms, {peak_mb(before):4.0f} MB"
+              f"  ->  rows + orjson {best_of(after):6.0f} ms, {peak_mb(after):4.0f} MB")
+
+    client = admin_client()
+    for path in ("/api/users", "/api/hackathons"):
+        client.get(path)
+        print(f"  GET {path}: {best_of(lambda: client.get(path)):.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+"""PUT /api/reputation по одной записи против одного PUT /api/reputation/batch
+
+Запуск: python benchmarks/reputation_batch.py [число участий]
+"""
+import sys
+
+from common import scratch_env, admin_client, best_of
+
+scratch_env()
+COUNT = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+
+import db  # noqa: E402
+
+
+def main():
+    db.init_database()
+    hackathon_id = db.create_hackathon({"name": "Benchmark", "start_date": "2030-01-01", "end_date": "2030-01-02"})
+    participation_ids = []
+    for i in range(COUNT):
+        user_id = db.create_user({"username": f"bench{i}", "email": f"bench{i}@example.com", "password": "x"})
+        participation_ids.append(db.create_participation(user_id, hackathon_id, "participant"))
+    client = admin_client()
+
+    def single():
+        for i, participation_id in enumerate(participation_ids):
+            response = client.put("/api/reputation", json={
+                "participation_id": participation_id, "new_reputation": i % 50, "reason": "single"
+            })
+            assert response.status_code == 200, response.text
+
+    def batch():
+        response = client.put("/api/reputation/batch", json={"updates": [
+            {"participation_id": participation_id, "new_reputation": i % 50 + 1, "reason": "batch"}
+            for i, participation_id in enumerate(participation_ids)
+        ]})
+        assert response.status_code == 200 and response.json()["updated"] == COUNT, response.text
+
+    print(f"{COUNT} single PUT /api/reputation: {best_of(single):.0f} ms")
+    print(f"one PUT /api/reputation/batch of {COUNT}: {best_of(batch):.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
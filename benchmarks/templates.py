@@ -0,0 +1,68 @@
+"""Компиляция и рендер шаблонов: отдельные окружения роутеров против общего с кэшем байткода
+
+Каждый режим запускается в новом процессе:
+  lazy   - как до templating.py: окружение без байткода, страница компилируется при первом запросе к ней
+  cold   - общее окружение, precompile() без байткода на диске
+  warm   - то же при уже записанном байткоде
+  render - рендер hackathons.html в прогретом окружении
+Запуск: python benchmarks/templates.py
+"""
+import os
+import subprocess
+import sys
+import time
+
+from common import ROOT, scratch_env
+
+RENDERS = 2000
+
+
+def run(mode: str) -> str:
+    result = subprocess.run([sys.executable, os.path.abspath(__file__), mode], capture_output=True, text=True,
+                            check=True, env=dict(os.environ, PYTHONPATH=ROOT))
+    return result.stdout.strip()
+
+
+def measure(mode: str):
+    from starlette.requests import Request
+
+    if mode == "lazy":
+        from fastapi.templating import Jinja2Templates
+
+        env = Jinja2Templates(directory="templates").env
+        timings = {}
+        for name in env.list_templates(extensions=["html"]):
+            started = time.perf_counter()
+            env.get_template(name)
+            timings[name] = (time.perf_counter() - started) * 1000
+        slowest = ", ".join(f"{name} {ms:.1f} ms" for name, ms in sorted(timings.items(), key=lambda x: -x[1])[:3])
+        print(f"first-hit compile of {len(timings)} templates: {sum(timings.values()):.1f} ms in total ({slowest})")
+        return
+
+    import templating
+
+    if mode in ("cold", "warm"):
+        result = templating.precompile()
+        print(f"precompile of {result['templates']} templates: {result['duration_ms']:.1f} ms")
+        return
+
+    templating.precompile()
+    template = templating.templates.env.get_template("hackathons.html")
+    request = Request({"type": "http", "method": "GET", "path": "/", "headers": [], "query_string": b""})
+    started = time.perf_counter()
+    for _ in range(RENDERS):
+        template.render(request=request, user=None)
+    print(f"hackathons.html render: {(time.perf_counter() - started) / RENDERS * 1000:.3f} ms")
+
+
+def main():
+    scratch_env()
+    for mode in ("lazy", "cold", "warm", "render"):
+        print(f"{mode:<6} {run(mode)}")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        measure(sys.argv[1])
+    else:
+        main()
@@ -1,302 +1,293 @@
+import atexit
+import hashlib
+import json
+import os
+import time
 import sqlite3
-from datetime import datetime
+from datetime import date, datetime, timedelta
+from itertools import combinations
 from fastapi import Request, HTTPException, status
 from typing import Optional, List
 
+from leaderboard import leaderboards
+from waitlist import waitlists
+from scoring import project_scores
+from audit import AuditLogWriter
+import audit_archive
+import funnel
+from migrations import SchemaCapabilities, ensure_schema
+from writer import DatabaseWriter
+from snapshot import AnalyticsSnapshot
+from scheduler import StatusKind, StatusScheduler, parse_moment
+from notifications import (
+    NotificationDispatcher, ReminderScheduler, REMINDERS, create_sink, describe_offset, parse_offsets
+)
+from queries import statement, template, connect_options
+from rows import row_model, select_columns, fetch_models
+import metrics
+
 # Путь к БД
-DB_PATH = "hackathon_hub.db"
+DB_PATH = os.getenv("DB_PATH", "hackathon_hub.db")
+# Сколько секунд ждать освобождения блокировки БД
+BUSY_TIMEOUT = float(os.getenv("DB_BUSY_TIMEOUT", "5"))
+# Возможности схемы; заполняются при init_database и не требуют интроспекции в запросах
+schema = SchemaCapabilities()
+
 def init_database():
-    """Инициализация базы данных SQLite с новой схемой"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-
-    # Создание таблицы пользователей с новой схемой
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS Users (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            username TEXT NOT NULL,
-            email TEXT NOT NULL UNIQUE,
-            password TEXT NOT NULL,
-            age INTEGER,
-            fio TEXT,
-            telegram_nickname TEXT UNIQUE,
-            basics_knowledge TEXT,
-            city TEXT,
-            team_name TEXT,
-            looking_for_team BOOLEAN DEFAULT FALSE,
-            role TEXT NOT NULL DEFAULT 'user',
-            created_at TEXT NOT NULL
-        )
-    ''')
+    """Приведение схемы БД к последней версии (при актуальной схеме - только чтение версии)"""
+    auto_upgrade = os.getenv("DB_AUTO_MIGRATE", "1") != "0"
+    schema.set_version(ensure_schema(DB_PATH, auto_upgrade))
+    # WAL: чтение не блокируется записью; режим сохраняется в файле БД
+    conn = sqlite3.connect(DB_PATH, timeout=BUSY_TIMEOUT)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.close()
 
-    # Создание таблицы хакатонов
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS Hackathons (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT NOT NULL,
-            description TEXT,
-            organizer TEXT,
-            start_date TEXT NOT NULL,
-            end_date TEXT NOT NULL,
-            duration_hours INTEGER,
-            prize_fund TEXT,
-            max_team_size INTEGER,
-            status TEXT NOT NULL DEFAULT 'upcoming',
-            created_at TEXT NOT NULL
-        )
-    ''')
+# Вспомогательные функции для работы с БД
+def _open_connection(**kwargs):
+    conn = sqlite3.connect(DB_PATH, timeout=BUSY_TIMEOUT, **connect_options(), **kwargs)
+    conn.row_factory = sqlite3.Row  # Для доступа к колонкам по имени
+    # Каскады ON DELETE из схемы действуют только с включёнными внешними ключами (настройка соединения).
+    # Обычный курсор: служебная настройка не учитывается в статистике и бюджетах запросов
+    conn.cursor(sqlite3.Cursor).execute("PRAGMA foreign_keys = ON")
+    return conn
 
-    # Создание таблицы команд
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS Teams (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            hackathon_id INTEGER NOT NULL,
-            name TEXT NOT NULL,
-            description TEXT,
-            captain_id INTEGER NOT NULL,
-            created_at TEXT NOT NULL,
-            FOREIGN KEY (hackathon_id) REFERENCES Hackathons(id) ON DELETE CASCADE,
-            FOREIGN KEY (captain_id) REFERENCES Users(id) ON DELETE CASCADE,
-            UNIQUE(hackathon_id, name)
-        )
-    ''')
+def get_db_connection():
+    """Создание соединения с базой данных (внутри операции записи - общее соединение писателя)"""
+    shared = db_writer.connection()
+    if shared is not None:
+        return shared
+    return _open_connection()
+
+def _reset_caches():
+    """Сброс кэшей в памяти, если пакет не зафиксировался или упал хук после фиксации"""
+    leaderboards.invalidate()
+    project_scores.invalidate()
+    waitlists.invalidate()
+
+# Единственный поток записи: операции, изменяющие БД, выполняются по очереди с групповой фиксацией
+db_writer = DatabaseWriter(
+    lambda: _open_connection(isolation_level=None),
+    batch_size=int(os.getenv("DB_WRITER_BATCH", "64")),
+    max_queue=int(os.getenv("DB_WRITER_QUEUE", "1000")),
+    on_abort=_reset_caches,
+    enabled=os.getenv("DB_WRITER", "1") != "0"
+)
+atexit.register(db_writer.stop)
+
+# Копия БД для тяжёлых аналитических запросов
+analytics_snapshot = AnalyticsSnapshot(
+    DB_PATH,
+    os.getenv("ANALYTICS_SNAPSHOT_DIR", "analytics_snapshot"),
+    refresh_interval=float(os.getenv("ANALYTICS_SNAPSHOT_INTERVAL", "300")),
+    busy_timeout=BUSY_TIMEOUT,
+    connect_options=connect_options
+)
+
+def get_analytics_connection():
+    """Соединение только для чтения с копией БД для аналитики"""
+    return analytics_snapshot.connect()
+
+# Фоновая пакетная запись журнала действий экспертов
+audit_writer = AuditLogWriter(get_db_connection, durability=os.getenv("AUDIT_LOG_DURABILITY", "async"))
+atexit.register(audit_writer.stop)
+
+# Метрики внутренних компонентов, считываются в момент сбора /metrics
+_caches = {"leaderboards": leaderboards, "project_scores": project_scores, "waitlists": waitlists,
+           "analytics_snapshot": analytics_snapshot}
+
+def _cache_requests():
+    return {(name, result): count for name, cache in _caches.items()
+            for result, count in (("hit", cache.hits), ("miss", cache.misses))}
+
+def _cache_hit_ratios():
+    ratios = {}
+    for name, cache in _caches.items():
+        total = cache.hits + cache.misses
+        ratios[(name,)] = cache.hits / total if total else None
+    return ratios
+
+metrics.registry.callback("cache_requests_total", "In-memory cache lookups by result",
+                          _cache_requests, ("cache", "result"), kind="counter")
+metrics.registry.callback("cache_hit_ratio", "Share of cache lookups served from memory", _cache_hit_ratios, ("cache",))
+metrics.registry.callback("db_writer_queue_depth", "Write operations waiting for the writer thread",
+                          lambda: db_writer.metrics()["queue_depth"])
+metrics.registry.callback("db_writer_batches_total", "Group-committed write batches",
+                          lambda: db_writer.metrics()["batches"], kind="counter")
+metrics.registry.callback("db_writer_rejected_total", "Write operations rejected with a full queue",
+                          lambda: db_writer.metrics()["rejected"], kind="counter")
+metrics.registry.callback("audit_log_queue_depth", "Expert audit records waiting to be flushed",
+                          lambda: audit_writer.metrics()["queue_depth"])
+metrics.registry.callback("analytics_snapshot_age_seconds", "Age of the analytics database copy",
+                          analytics_snapshot.age_seconds)
+
+USER_BY_EMAIL = statement("users.by_email", "SELECT * FROM Users WHERE LOWER(email) = LOWER(?)")
 
-    # Создание таблицы участий (Participation) - связывает пользователя, хакатон, роль и репутацию
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS Participations (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER NOT NULL,
-            hackathon_id INTEGER NOT NULL,
-            role TEXT NOT NULL,
-            team_id INTEGER,
-            reputation INTEGER DEFAULT 0,
-            created_at TEXT NOT NULL,
-            updated_at TEXT NOT NULL,
-            FOREIGN KEY (user_id) REFERENCES Users(id) ON DELETE CASCADE,
-            FOREIGN KEY (hackathon_id) REFERENCES Hackathons(id) ON DELETE CASCADE,
-            FOREIGN KEY (team_id) REFERENCES Teams(id) ON DELETE SET NULL,
-            UNIQUE(user_id, hackathon_id)
-        )
-    ''')
+def get_user_by_email(email: str):
+    """Получение пользователя по email (регистронезависимый поиск)"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute(USER_BY_EMAIL, (email,))
+    user = cursor.fetchone()
+    conn.close()
+    return dict(user) if user else None
 
-    # Создание таблицы истории изменений репутации
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS ReputationHistory (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            participation_id INTEGER NOT NULL,
-            old_reputation INTEGER NOT NULL,
-            new_reputation INTEGER NOT NULL,
-            changed_by INTEGER NOT NULL,
-            reason TEXT,
-            created_at TEXT NOT NULL,
-            FOREIGN KEY (participation_id) REFERENCES Participations(id) ON DELETE CASCADE,
-            FOREIGN KEY (changed_by) REFERENCES Users(id) ON DELETE CASCADE
-        )
-    ''')
+USER_BY_ID = statement("users.by_id", "SELECT * FROM Users WHERE id = ?")
 
-    # Создание таблицы проектов/презентаций
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS Projects (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            hackathon_id INTEGER NOT NULL,
-            team_id INTEGER,
-            participation_id INTEGER NOT NULL,
-            title TEXT NOT NULL,
-            description TEXT,
-            presentation_url TEXT,
-            area_topic TEXT,
-            status TEXT DEFAULT 'draft',
-            created_at TEXT NOT NULL,
-            updated_at TEXT NOT NULL,
-            FOREIGN KEY (hackathon_id) REFERENCES Hackathons(id) ON DELETE CASCADE,
-            FOREIGN KEY (team_id) REFERENCES Teams(id) ON DELETE SET NULL,
-            FOREIGN KEY (participation_id) REFERENCES Participations(id) ON DELETE CASCADE
-        )
-    ''')
+def get_user_by_id(user_id: int):
+    """Получение пользователя по ID"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute(USER_BY_ID, (user_id,))
+    user = cursor.fetchone()
+    conn.close()
+    return dict(user) if user else None
 
-    # Создание таблицы областей экспертизы экспертов
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS ExpertAreas (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            expert_id INTEGER NOT NULL,
-            hackathon_id INTEGER NOT NULL,
-            area_topic TEXT NOT NULL,
-            created_at TEXT NOT NULL,
-            FOREIGN KEY (expert_id) REFERENCES Users(id) ON DELETE CASCADE,
-            FOREIGN KEY (hackathon_id) REFERENCES Hackathons(id) ON DELETE CASCADE,
-            UNIQUE(expert_id, hackathon_id, area_topic)
-        )
-    ''')
+# Колонки пользователя, которые можно задавать при создании и изменении
+USER_FIELDS = ("username", "email", "password", "age", "fio", "telegram_nickname", "basics_knowledge",
+               "city", "team_name", "looking_for_team", "hackathons", "intensives", "role", "created_at")
 
-    # Создание таблицы комментариев экспертов к проектам
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS ProjectComments (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            project_id INTEGER NOT NULL,
-            expert_id INTEGER NOT NULL,
-            comment TEXT NOT NULL,
-            rating INTEGER,
-            created_at TEXT NOT NULL,
-            updated_at TEXT NOT NULL,
-            FOREIGN KEY (project_id) REFERENCES Projects(id) ON DELETE CASCADE,
-            FOREIGN KEY (expert_id) REFERENCES Users(id) ON DELETE CASCADE
-        )
-    ''')
+USER_BY_TELEGRAM = statement("users.by_telegram", "SELECT * FROM Users WHERE telegram_nickname = ?")
 
-    # Создание таблицы аудита действий экспертов
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS ExpertAuditLog (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            expert_id INTEGER NOT NULL,
-            hackathon_id INTEGER NOT NULL,
-            action_type TEXT NOT NULL,
-            target_type TEXT,
-            target_id INTEGER,
-            details TEXT,
-            ip_address TEXT,
-            created_at TEXT NOT NULL,
-            FOREIGN KEY (expert_id) REFERENCES Users(id) ON DELETE CASCADE,
-            FOREIGN KEY (hackathon_id) REFERENCES Hackathons(id) ON DELETE CASCADE
-        )
-    ''')
+def get_user_by_telegram(telegram_nickname: str):
+    """Получение пользователя по Telegram nickname"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute(USER_BY_TELEGRAM, (telegram_nickname,))
+    user = cursor.fetchone()
+    conn.close()
+    return dict(user) if user else None
 
-    # Создание таблицы вебинаров/семинаров
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS Webinars (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT NOT NULL,
-            description TEXT,
-            speaker TEXT NOT NULL,
-            date_time TEXT NOT NULL,
-            duration_hours REAL,
-            location TEXT DEFAULT 'Онлайн',
-            max_participants INTEGER,
-            status TEXT NOT NULL DEFAULT 'upcoming',
-            created_at TEXT NOT NULL
-        )
-    ''')
+ALL_USERS = statement("users.all", "SELECT * FROM Users")
 
-    # Создание таблицы интенсивных курсов
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS Courses (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT NOT NULL,
-            description TEXT,
-            instructor TEXT NOT NULL,
-            start_date TEXT NOT NULL,
-            end_date TEXT NOT NULL,
-            hours_per_week INTEGER,
-            max_students INTEGER,
-            status TEXT NOT NULL DEFAULT 'upcoming',
-            certificate_available BOOLEAN DEFAULT FALSE,
-            created_at TEXT NOT NULL
-        )
-    ''')
+def get_all_users():
+    """Получение всех пользователей"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute(ALL_USERS)
+    users = [dict(row) for row in cursor.fetchall()]
+    conn.close()
+    return users
+
+# Колонки списка пользователей: все, кроме пароля
+USER_LIST_COLUMNS = ("id", "username", "email", "age", "fio", "telegram_nickname", "balls", "basics_knowledge",
+                     "city", "team_name", "looking_for_team", "hackathons", "intensives", "role", "created_at")
+UserRow = row_model("UserRow", USER_LIST_COLUMNS)
+USER_LIST = statement("users.list", f"SELECT {select_columns(USER_LIST_COLUMNS)} FROM Users")
+USER_LIST_LEGACY = statement("users.list_legacy", '''
+    SELECT id, username, email, age, fio, telegram_nickname, 0, basics_knowledge,
+           city, team_name, looking_for_team, '', '', role, created_at
+    FROM Users
+''')
+
+def list_users():
+    """Список пользователей без паролей (компактные строки UserRow)"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute(USER_LIST if schema.user_profile_columns else USER_LIST_LEGACY)
+    users = fetch_models(cursor, UserRow)
+    conn.close()
+    return users
 
-    # Создание таблицы регистраций на вебинары
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS WebinarRegistrations (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER NOT NULL,
-            webinar_id INTEGER NOT NULL,
-            created_at TEXT NOT NULL,
-            FOREIGN KEY (user_id) REFERENCES Users(id) ON DELETE CASCADE,
-            FOREIGN KEY (webinar_id) REFERENCES Webinars(id) ON DELETE CASCADE,
-            UNIQUE(user_id, webinar_id)
-        )
-    ''')
+USER_INSERT = template("users.insert", "INSERT INTO Users ({columns}) VALUES ({placeholders})")
 
-    # Создание таблицы регистраций на курсы
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS CourseRegistrations (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER NOT NULL,
-            course_id INTEGER NOT NULL,
-            created_at TEXT NOT NULL,
-            FOREIGN KEY (user_id) REFERENCES Users(id) ON DELETE CASCADE,
-            FOREIGN KEY (course_id) REFERENCES Courses(id) ON DELETE CASCADE,
-            UNIQUE(user_id, course_id)
+@db_writer.operation
+def create_user(fields: dict):
+    """Создание пользователя; created_at проставляется, если не передан"""
+    values = {key: value for key, value in fields.items() if key in USER_FIELDS}
+    values.setdefault("created_at", datetime.now().isoformat())
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute(
+            USER_INSERT.format(columns=", ".join(values), placeholders=", ".join("?" * len(values))),
+            list(values.values())
         )
-    ''')
-
-    # Добавляем примеры хакатонов для тестирования (если их нет)
-    cursor.execute("SELECT COUNT(*) FROM Hackathons")
-    if cursor.fetchone()[0] == 0:
-        sample_hackathons = [
-            {
-                "name": "Tech Innovation Challenge 2024",
-                "description": "Создайте инновационные решения для будущего технологий. Фокус на AI, IoT и блокчейн.",
-                "organizer": "TechCorp",
-                "start_date": "2024-03-15T00:00:00",
-                "end_date": "2024-03-17T00:00:00",
-                "duration_hours": 48,
-                "prize_fund": "$50,000",
-                "max_team_size": 5,
-                "status": "upcoming"
-            },
-            {
-                "name": "GreenTech Hackathon",
-                "description": "Разработайте экологичные технологические решения для устойчивого будущего.",
-                "organizer": "EcoSolutions",
-                "start_date": "2024-03-22T00:00:00",
-                "end_date": "2024-03-24T00:00:00",
-                "duration_hours": 36,
-                "prize_fund": "$30,000",
-                "max_team_size": 4,
-                "status": "upcoming"
-            },
-            {
-                "name": "Web Development Marathon",
-                "description": "Создайте современные веб-приложения с использованием последних технологий.",
-                "organizer": "WebDev Academy",
-                "start_date": "2024-03-10T00:00:00",
-                "end_date": "2024-03-12T00:00:00",
-                "duration_hours": 48,
-                "prize_fund": "$25,000",
-                "max_team_size": 4,
-                "status": "ongoing"
-            }
-        ]
-
-        for hackathon in sample_hackathons:
-            cursor.execute('''
-                INSERT INTO Hackathons (name, description, organizer, start_date, end_date, 
-                                       duration_hours, prize_fund, max_team_size, status, created_at)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                hackathon["name"], hackathon["description"], hackathon["organizer"],
-                hackathon["start_date"], hackathon["end_date"], hackathon["duration_hours"],
-                hackathon["prize_fund"], hackathon["max_team_size"], hackathon["status"],
-                datetime.now().isoformat()
-            ))
-
+    except sqlite3.IntegrityError:
+        conn.close()
+        raise ValueError("Пользователь с таким email или Telegram nickname уже существует")
+    user_id = cursor.lastrowid
+    record_activity(cursor, "users", "registered", values["created_at"])
+    apply_demographic_delta(cursor, None, user_demographics(cursor, user_id))
     conn.commit()
     conn.close()
+    return user_id
 
-# Вспомогательные функции для работы с БД
-def get_db_connection():
-    """Создание соединения с базой данных"""
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row  # Для доступа к колонкам по имени
-    return conn
+USER_UPDATE = template("users.update", "UPDATE Users SET {assignments} WHERE id = ?")
 
-def get_user_by_email(email: str):
-    """Получение пользователя по email (регистронезависимый поиск)"""
+@db_writer.operation
+def update_user(user_id: int, fields: dict):
+    """Обновление полей пользователя"""
+    values = {key: value for key, value in fields.items() if key in USER_FIELDS}
+    if not values:
+        raise ValueError("Нет полей для обновления")
     conn = get_db_connection()
     cursor = conn.cursor()
-    cursor.execute("SELECT * FROM Users WHERE LOWER(email) = LOWER(?)", (email,))
-    user = cursor.fetchone()
+    demographic = any(key in DEMOGRAPHIC_COLUMNS for key in values)
+    old = user_demographics(cursor, user_id) if demographic else None
+    cursor.execute(
+        USER_UPDATE.format(assignments=", ".join(f"{key} = ?" for key in values)),
+        list(values.values()) + [user_id]
+    )
+    updated = cursor.rowcount
+    if demographic and updated:
+        apply_demographic_delta(cursor, old, user_demographics(cursor, user_id))
+    conn.commit()
     conn.close()
-    return dict(user) if user else None
-
-def get_user_by_id(user_id: int):
-    """Получение пользователя по ID"""
+    if updated == 0:
+        raise ValueError("Пользователь не найден")
+
+USER_DELETE = statement("users.delete", "DELETE FROM Users WHERE id = ?")
+USER_PARTICIPATION_HACKATHONS = statement("participations.user_hackathons", '''
+    SELECT hackathon_id FROM Participations WHERE user_id = ?
+''')
+USER_CAPTAIN_TEAMS = statement("teams.by_captain", "SELECT id, hackathon_id FROM Teams WHERE captain_id = ?")
+USER_REGISTERED_EVENTS = statement("users.registered_events", '''
+    SELECT 'webinar', webinar_id FROM WebinarRegistrations WHERE user_id = ?
+    UNION ALL
+    SELECT 'course', course_id FROM CourseRegistrations WHERE user_id = ?
+''')
+USER_WAITLISTS = statement("waitlists.by_user", "SELECT kind, event_id FROM Waitlists WHERE user_id = ?")
+
+@db_writer.operation
+def delete_user(user_id: int):
+    """Удаление пользователя вместе с его участиями и командами, где он капитан
+
+    Зависимые строки удаляет каскад внешних ключей (участия, команды капитана,
+    проекты, комментарии, регистрации); здесь обновляются кэши в памяти и
+    освободившиеся места на событиях отдаются листу ожидания.
+    """
     conn = get_db_connection()
     cursor = conn.cursor()
-    cursor.execute("SELECT * FROM Users WHERE id = ?", (user_id,))
-    user = cursor.fetchone()
+    old = user_demographics(cursor, user_id)
+    cursor.execute(USER_CAPTAIN_TEAMS, (user_id,))
+    teams = cursor.fetchall()
+    cursor.execute(USER_PARTICIPATION_HACKATHONS, (user_id,))
+    hackathon_ids = [row[0] for row in cursor.fetchall()]
+    cursor.execute(USER_REGISTERED_EVENTS, (user_id, user_id))
+    events = cursor.fetchall()
+    waitlisted = []
+    if schema.waitlists:
+        cursor.execute(USER_WAITLISTS, (user_id,))
+        waitlisted = cursor.fetchall()
+    cursor.execute(USER_DELETE, (user_id,))
+    deleted = cursor.rowcount
+    if deleted:
+        apply_demographic_delta(cursor, old, None)
+        for team_id, hackathon_id in teams:
+            db_writer.after_commit(leaderboards.on_team_deleted, hackathon_id, team_id)
+        for hackathon_id in hackathon_ids:
+            db_writer.after_commit(leaderboards.on_participation_deleted, hackathon_id, user_id)
+        # Вместе с проектами и комментариями пользователя меняются оценки проектов
+        db_writer.after_commit(project_scores.invalidate)
+        for kind, event_id in waitlisted:
+            db_writer.after_commit(waitlists.on_removed, kind, event_id, user_id)
+        now = datetime.now().isoformat()
+        for kind, event_id in events:
+            _promote(cursor, ENROLLMENTS[kind], event_id, now)
+    conn.commit()
     conn.close()
-    return dict(user) if user else None
+    if deleted == 0:
+        raise ValueError("Пользователь не найден")
 
 def get_current_user(request: Request):
     """Получение текущего пользователя из сессии"""
@@ -315,6 +306,11 @@ def require_admin(request: Request):
         )
     return user
 
+EXPERT_PARTICIPATION = statement("participations.expert", '''
+    SELECT * FROM Participations
+    WHERE user_id = ? AND hackathon_id = ? AND role = 'expert'
+''')
+
 def require_expert_in_hackathon(request: Request, hackathon_id: int):
     """Проверка, что пользователь является экспертом в данном хакатоне"""
     user = get_current_user(request)
@@ -331,10 +327,7 @@ def require_expert_in_hackathon(request: Request, hackathon_id: int):
     # Проверяем, является ли пользователь экспертом в этом хакатоне
     conn = get_db_connection()
     cursor = conn.cursor()
-    cursor.execute('''
-        SELECT * FROM Participations 
-        WHERE user_id = ? AND hackathon_id = ? AND role = 'expert'
-    ''', (user["id"], hackathon_id))
+    cursor.execute(EXPERT_PARTICIPATION, (user["id"], hackathon_id))
     participation = cursor.fetchone()
     conn.close()
 
@@ -346,331 +339,639 @@ def require_expert_in_hackathon(request: Request, hackathon_id: int):
     return user
 
 # Функции для работы с хакатонами
+HACKATHON_BY_ID = statement("hackathons.by_id", "SELECT * FROM Hackathons WHERE id = ?")
+
 def get_hackathon_by_id(hackathon_id: int):
     """Получение хакатона по ID"""
     conn = get_db_connection()
     cursor = conn.cursor()
-    cursor.execute("SELECT * FROM Hackathons WHERE id = ?", (hackathon_id,))
+    cursor.execute(HACKATHON_BY_ID, (hackathon_id,))
     hackathon = cursor.fetchone()
     conn.close()
     return dict(hackathon) if hackathon else None
 
+HACKATHONS_BY_IDS = template("hackathons.by_ids", "SELECT * FROM Hackathons WHERE id IN ({placeholders})")
+
+def get_hackathons_by_ids(hackathon_ids: List[int]):
+    """Хакатоны по списку ID одним запросом (в порядке списка, отсутствующие пропускаются)"""
+    if not hackathon_ids:
+        return []
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    placeholders = ", ".join("?" * len(hackathon_ids))
+    cursor.execute(HACKATHONS_BY_IDS.format(placeholders=placeholders), list(hackathon_ids))
+    hackathons = {row["id"]: dict(row) for row in cursor.fetchall()}
+    conn.close()
+    return [hackathons[hackathon_id] for hackathon_id in hackathon_ids if hackathon_id in hackathons]
+
+HACKATHONS_BY_STATUS = statement("hackathons.by_status", "SELECT * FROM Hackathons WHERE status = ? ORDER BY start_date DESC")
+ALL_HACKATHONS = statement("hackathons.all", "SELECT * FROM Hackathons ORDER BY start_date DESC")
+
 def get_all_hackathons(status_filter: str = None):
     """Получение всех хакатонов с опциональной фильтрацией по статусу"""
     conn = get_db_connection()
     cursor = conn.cursor()
     if status_filter:
-        cursor.execute("SELECT * FROM Hackathons WHERE status = ? ORDER BY start_date DESC", (status_filter,))
+        cursor.execute(HACKATHONS_BY_STATUS, (status_filter,))
     else:
-        cursor.execute("SELECT * FROM Hackathons ORDER BY start_date DESC")
+        cursor.execute(ALL_HACKATHONS)
     hackathons = [dict(row) for row in cursor.fetchall()]
     conn.close()
     return hackathons
 
+HACKATHON_LIST_COLUMNS = ("id", "name", "description", "organizer", "start_date", "end_date", "duration_hours",
+                          "prize_fund", "max_team_size", "status", "created_at", "min_participants", "published")
+# participant_count заполняет обработчик списка
+HackathonRow = row_model("HackathonRow", HACKATHON_LIST_COLUMNS, extra=("participant_count",))
+HACKATHON_LIST = template("hackathons.list", f'''
+    SELECT {select_columns(HACKATHON_LIST_COLUMNS)} FROM Hackathons
+    {{where}} ORDER BY start_date DESC
+''')
+HACKATHON_LIST_LEGACY = template("hackathons.list_legacy", '''
+    SELECT id, name, description, organizer, start_date, end_date, duration_hours,
+           prize_fund, max_team_size, status, created_at, 0, 0
+    FROM Hackathons
+    {where} ORDER BY start_date DESC
+''')
+
+def list_hackathons(status_filter: str = None):
+    """Хакатоны для списка (компактные строки HackathonRow), новые первыми"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    query = HACKATHON_LIST if schema.hackathon_publishing else HACKATHON_LIST_LEGACY
+    if status_filter:
+        cursor.execute(query.format(where="WHERE status = ?"), (status_filter,))
+    else:
+        cursor.execute(query.format(where=""))
+    hackathons = fetch_models(cursor, HackathonRow)
+    conn.close()
+    return hackathons
+
+HACKATHON_INSERT = statement("hackathons.insert", '''
+    INSERT INTO Hackathons (name, description, organizer, start_date, end_date,
+                           duration_hours, prize_fund, max_team_size, status,
+                           min_participants, published, created_at)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+''')
+HACKATHON_INSERT_LEGACY = statement("hackathons.insert_legacy", '''
+    INSERT INTO Hackathons (name, description, organizer, start_date, end_date,
+                           duration_hours, prize_fund, max_team_size, status, created_at)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+''')
+
+@db_writer.operation
+def create_hackathon(data: dict):
+    """Создание хакатона"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    now = datetime.now().isoformat()
+    dates = (data["start_date"], data["end_date"])
+    status = status_scheduler.current_status("hackathons", dates, data.get("status", "upcoming"))
+    if schema.hackathon_publishing:
+        cursor.execute(HACKATHON_INSERT, (
+            data["name"], data.get("description"), data.get("organizer"),
+            data["start_date"], data["end_date"], data.get("duration_hours"),
+            data.get("prize_fund"), data.get("max_team_size"), status,
+            data.get("min_participants") or 0, data.get("published") or 0, now
+        ))
+    else:
+        cursor.execute(HACKATHON_INSERT_LEGACY, (
+            data["name"], data.get("description"), data.get("organizer"),
+            data["start_date"], data["end_date"], data.get("duration_hours"),
+            data.get("prize_fund"), data.get("max_team_size"), status, now
+        ))
+    hackathon_id = cursor.lastrowid
+    db_writer.after_commit(status_scheduler.schedule, "hackathons", hackathon_id, dates, status)
+    db_writer.after_commit(reminder_scheduler.schedule, "hackathons", hackathon_id, dates, status)
+    conn.commit()
+    conn.close()
+    return hackathon_id
+
+HACKATHON_UPDATE = statement("hackathons.update", '''
+    UPDATE Hackathons
+    SET name = ?, description = ?, organizer = ?, start_date = ?, end_date = ?,
+        duration_hours = ?, prize_fund = ?, max_team_size = ?, status = ?,
+        min_participants = ?, published = ?
+    WHERE id = ?
+''')
+HACKATHON_UPDATE_LEGACY = statement("hackathons.update_legacy", '''
+    UPDATE Hackathons
+    SET name = ?, description = ?, organizer = ?, start_date = ?, end_date = ?,
+        duration_hours = ?, prize_fund = ?, max_team_size = ?, status = ?
+    WHERE id = ?
+''')
+
+@db_writer.operation
+def update_hackathon(hackathon_id: int, data: dict):
+    """Обновление хакатона"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    dates = (data["start_date"], data["end_date"])
+    status = status_scheduler.current_status("hackathons", dates, data.get("status", "upcoming"))
+    if schema.hackathon_publishing:
+        cursor.execute(HACKATHON_UPDATE, (
+            data["name"], data.get("description"), data.get("organizer"),
+            data["start_date"], data["end_date"], data.get("duration_hours"),
+            data.get("prize_fund"), data.get("max_team_size"), status,
+            data.get("min_participants") or 0, data.get("published") or 0, hackathon_id
+        ))
+    else:
+        cursor.execute(HACKATHON_UPDATE_LEGACY, (
+            data["name"], data.get("description"), data.get("organizer"),
+            data["start_date"], data["end_date"], data.get("duration_hours"),
+            data.get("prize_fund"), data.get("max_team_size"), status,
+            hackathon_id
+        ))
+    db_writer.after_commit(status_scheduler.schedule, "hackathons", hackathon_id, dates, status)
+    db_writer.after_commit(reminder_scheduler.schedule, "hackathons", hackathon_id, dates, status)
+    conn.commit()
+    conn.close()
+
+PARTICIPANT_COUNTS = template("participations.counts", '''
+    SELECT hackathon_id, COUNT(*) FROM Participations
+    WHERE hackathon_id IN ({placeholders})
+    GROUP BY hackathon_id
+''')
+
+def get_participant_counts(hackathon_ids: List[int]):
+    """Количество участников по каждому хакатону одним запросом"""
+    counts = {hackathon_id: 0 for hackathon_id in hackathon_ids}
+    if not counts:
+        return counts
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    placeholders = ", ".join("?" * len(counts))
+    cursor.execute(PARTICIPANT_COUNTS.format(placeholders=placeholders), list(counts))
+    counts.update(dict(cursor.fetchall()))
+    conn.close()
+    return counts
+
 # Функции для работы с участиями
+PARTICIPATION_DETAILS = statement("participations.details", '''
+    SELECT p.*, u.username, u.fio, u.email, h.name as hackathon_name,
+           t.name as team_name
+    FROM Participations p
+    JOIN Users u ON p.user_id = u.id
+    JOIN Hackathons h ON p.hackathon_id = h.id
+    LEFT JOIN Teams t ON p.team_id = t.id
+    WHERE p.user_id = ? AND p.hackathon_id = ?
+''')
+
 def get_participation(user_id: int, hackathon_id: int):
     """Получение участия пользователя в хакатоне"""
     conn = get_db_connection()
     cursor = conn.cursor()
-    cursor.execute('''
-        SELECT p.*, u.username, u.fio, u.email, h.name as hackathon_name,
-               t.name as team_name
-        FROM Participations p
-        JOIN Users u ON p.user_id = u.id
-        JOIN Hackathons h ON p.hackathon_id = h.id
-        LEFT JOIN Teams t ON p.team_id = t.id
-        WHERE p.user_id = ? AND p.hackathon_id = ?
-    ''', (user_id, hackathon_id))
+    cursor.execute(PARTICIPATION_DETAILS, (user_id, hackathon_id))
+    participation = cursor.fetchone()
+    conn.close()
+    return dict(participation) if participation else None
+
+PARTICIPATION_BY_ID = statement("participations.by_id", "SELECT * FROM Participations WHERE id = ?")
+
+def get_participation_by_id(participation_id: int):
+    """Получение участия по ID"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute(PARTICIPATION_BY_ID, (participation_id,))
     participation = cursor.fetchone()
     conn.close()
     return dict(participation) if participation else None
 
+USER_PARTICIPATIONS = statement("participations.by_user", '''
+    SELECT p.*, h.name as hackathon_name, h.status as hackathon_status,
+           h.start_date, h.end_date, t.name as team_name, t.id as team_id
+    FROM Participations p
+    JOIN Hackathons h ON p.hackathon_id = h.id
+    LEFT JOIN Teams t ON p.team_id = t.id
+    WHERE p.user_id = ?
+    ORDER BY h.start_date DESC
+''')
+
 def get_user_participations(user_id: int):
     """Получение всех участий пользователя"""
     conn = get_db_connection()
     cursor = conn.cursor()
-    cursor.execute('''
-        SELECT p.*, h.name as hackathon_name, h.status as hackathon_status,
-               h.start_date, h.end_date, t.name as team_name, t.id as team_id
-        FROM Participations p
-        JOIN Hackathons h ON p.hackathon_id = h.id
-        LEFT JOIN Teams t ON p.team_id = t.id
-        WHERE p.user_id = ?
-        ORDER BY h.start_date DESC
-    ''', (user_id,))
+    cursor.execute(USER_PARTICIPATIONS, (user_id,))
     participations = [dict(row) for row in cursor.fetchall()]
     conn.close()
     return participations
 
+HACKATHON_PARTICIPANTS = statement("participations.by_hackathon", '''
+    SELECT p.*, u.username, u.fio, u.email, u.telegram_nickname
+    FROM Participations p
+    JOIN Users u ON p.user_id = u.id
+    WHERE p.hackathon_id = ?
+    ORDER BY p.reputation DESC, u.username
+''')
+
 def get_hackathon_participants(hackathon_id: int):
     """Получение всех участников хакатона"""
     conn = get_db_connection()
     cursor = conn.cursor()
-    cursor.execute('''
-        SELECT p.*, u.username, u.fio, u.email, u.telegram_nickname
-        FROM Participations p
-        JOIN Users u ON p.user_id = u.id
-        WHERE p.hackathon_id = ?
-        ORDER BY p.reputation DESC, u.username
-    ''', (hackathon_id,))
+    cursor.execute(HACKATHON_PARTICIPANTS, (hackathon_id,))
     participants = [dict(row) for row in cursor.fetchall()]
     conn.close()
     return participants
 
+PARTICIPATION_FIND = statement("participations.find", '''
+    SELECT * FROM Participations WHERE user_id = ? AND hackathon_id = ?
+''')
+PARTICIPATION_INSERT = statement("participations.insert", '''
+    INSERT INTO Participations (user_id, hackathon_id, role, team_id, reputation, created_at, updated_at)
+    VALUES (?, ?, ?, ?, 0, ?, ?)
+''')
+
+# Вступление в команду - один условный запрос: проверка места и запись выполняются
+# под блокировкой записи SQLite, поэтому одновременные вступления не переполняют команду.
+# max_team_size NULL или 0 - без ограничения; {members} - число участников команды t
+TEAM_HAS_ROOM = "{members} < COALESCE(NULLIF(h.max_team_size, 0), 9223372036854775807)"
+PARTICIPATION_INSERT_IN_TEAM = template("participations.insert_in_team", f'''
+    INSERT INTO Participations (user_id, hackathon_id, role, team_id, reputation, created_at, updated_at)
+    SELECT ?1, ?2, ?3, t.id, 0, ?5, ?5
+    FROM Teams t
+    JOIN Hackathons h ON h.id = t.hackathon_id
+    WHERE t.id = ?4 AND t.hackathon_id = ?2 AND {TEAM_HAS_ROOM}
+''')
+# Первая по имени команда со свободным местом (как в get_available_teams)
+PARTICIPATION_INSERT_OPEN_TEAM = template("participations.insert_open_team", f'''
+    INSERT INTO Participations (user_id, hackathon_id, role, team_id, reputation, created_at, updated_at)
+    SELECT ?1, ?2, ?3, t.id, 0, ?4, ?4
+    FROM Hackathons h
+    JOIN Teams t ON t.hackathon_id = h.id
+    WHERE h.id = ?2 AND {TEAM_HAS_ROOM}
+    ORDER BY t.name
+    LIMIT 1
+''')
+PARTICIPATION_TEAM = statement("participations.team", "SELECT team_id FROM Participations WHERE id = ?")
+
+def _team_members_sql() -> str:
+    """Число участников команды t: счётчик из Teams или подзапрос для старой схемы"""
+    if schema.team_member_counts:
+        return "t.member_count"
+    return "(SELECT COUNT(*) FROM Participations tp WHERE tp.team_id = t.id)"
+
+@db_writer.operation
 def create_participation(user_id: int, hackathon_id: int, role: str, team_id: int = None):
-    """Создание участия пользователя в хакатоне"""
+    """Создание участия пользователя в хакатоне; с командой - только при свободном месте"""
     conn = get_db_connection()
     cursor = conn.cursor()
 
     # Проверяем, не существует ли уже участие
-    cursor.execute('''
-        SELECT * FROM Participations WHERE user_id = ? AND hackathon_id = ?
-    ''', (user_id, hackathon_id))
+    cursor.execute(PARTICIPATION_FIND, (user_id, hackathon_id))
     if cursor.fetchone():
         conn.close()
         raise ValueError("Пользователь уже участвует в этом хакатоне")
 
     now = datetime.now().isoformat()
-    cursor.execute('''
-        INSERT INTO Participations (user_id, hackathon_id, role, team_id, reputation, created_at, updated_at)
-        VALUES (?, ?, ?, ?, 0, ?, ?)
-    ''', (user_id, hackathon_id, role, team_id, now, now))
+    if team_id is None:
+        cursor.execute(PARTICIPATION_INSERT, (user_id, hackathon_id, role, team_id, now, now))
+    else:
+        cursor.execute(PARTICIPATION_INSERT_IN_TEAM.format(members=_team_members_sql()),
+                       (user_id, hackathon_id, role, team_id, now))
+        if not cursor.rowcount:
+            cursor.execute(TEAM_IN_HACKATHON, (team_id, hackathon_id))
+            found = cursor.fetchone()
+            conn.close()
+            raise ValueError("Команда достигла максимального размера" if found else "Команда не найдена")
 
     participation_id = cursor.lastrowid
+    record_activity(cursor, "participations", "joined", now)
     conn.commit()
     conn.close()
+    db_writer.after_commit(leaderboards.on_participation_created, hackathon_id, user_id, team_id)
     return participation_id
 
+@db_writer.operation
+def join_open_team(user_id: int, hackathon_id: int, role: str = "team_member"):
+    """Участие с автоматическим вступлением в первую команду со свободным местом
+
+    Возвращает (participation_id, team_id) или None, если свободных команд нет.
+    """
+    conn = get_db_connection()
+    cursor = conn.cursor()
+
+    cursor.execute(PARTICIPATION_FIND, (user_id, hackathon_id))
+    if cursor.fetchone():
+        conn.close()
+        raise ValueError("Пользователь уже участвует в этом хакатоне")
+
+    now = datetime.now().isoformat()
+    cursor.execute(PARTICIPATION_INSERT_OPEN_TEAM.format(members=_team_members_sql()),
+                   (user_id, hackathon_id, role, now))
+    if not cursor.rowcount:
+        conn.close()
+        return None
+    participation_id = cursor.lastrowid
+    cursor.execute(PARTICIPATION_TEAM, (participation_id,))
+    team_id = cursor.fetchone()[0]
+    record_activity(cursor, "participations", "joined", now)
+    conn.commit()
+    conn.close()
+    db_writer.after_commit(leaderboards.on_participation_created, hackathon_id, user_id, team_id)
+    return participation_id, team_id
+
+PARTICIPATION_TEAM_CAPTAIN = statement("participations.team_captain", '''
+    SELECT p.team_id, t.captain_id FROM Participations p
+    LEFT JOIN Teams t ON p.team_id = t.id
+    WHERE p.user_id = ? AND p.hackathon_id = ?
+''')
+TEAM_DELETE = statement("teams.delete", "DELETE FROM Teams WHERE id = ?")
+PARTICIPATION_DELETE = statement("participations.delete", '''
+    DELETE FROM Participations WHERE user_id = ? AND hackathon_id = ?
+''')
+
+@db_writer.operation
 def delete_participation(user_id: int, hackathon_id: int):
     """Удаление участия пользователя в хакатоне"""
     conn = get_db_connection()
     cursor = conn.cursor()
 
     # Проверяем, является ли пользователь капитаном команды
-    cursor.execute('''
-        SELECT p.team_id, t.captain_id FROM Participations p
-        LEFT JOIN Teams t ON p.team_id = t.id
-        WHERE p.user_id = ? AND p.hackathon_id = ?
-    ''', (user_id, hackathon_id))
+    cursor.execute(PARTICIPATION_TEAM_CAPTAIN, (user_id, hackathon_id))
     result = cursor.fetchone()
 
     if result and result[0] and result[1] == user_id:
-        # Если пользователь - капитан, удаляем команду (каскадное удаление)
-        cursor.execute('DELETE FROM Teams WHERE id = ?', (result[0],))
+        # Если пользователь - капитан, удаляем команду: у участников и проектов team_id станет NULL
+        cursor.execute(TEAM_DELETE, (result[0],))
+        db_writer.after_commit(leaderboards.on_team_deleted, hackathon_id, result[0])
 
-    cursor.execute('''
-        DELETE FROM Participations WHERE user_id = ? AND hackathon_id = ?
-    ''', (user_id, hackathon_id))
+    cursor.execute(PARTICIPATION_DELETE, (user_id, hackathon_id))
+    if cursor.rowcount:
+        record_activity(cursor, "participations", "left", datetime.now().isoformat())
+        db_writer.after_commit(leaderboards.on_participation_deleted, hackathon_id, user_id)
+        # Проекты участия удаляются каскадом вместе с оценками
+        db_writer.after_commit(project_scores.invalidate, hackathon_id)
 
     conn.commit()
     conn.close()
 
 # Функции для работы с командами
+TEAM_BY_NAME = statement("teams.by_name", '''
+    SELECT * FROM Teams WHERE hackathon_id = ? AND name = ?
+''')
+TEAM_INSERT = statement("teams.insert", '''
+    INSERT INTO Teams (hackathon_id, name, description, captain_id, created_at)
+    VALUES (?, ?, ?, ?, ?)
+''')
+
+@db_writer.operation
 def create_team(hackathon_id: int, name: str, captain_id: int, description: str = None):
     """Создание команды"""
     conn = get_db_connection()
     cursor = conn.cursor()
 
     # Проверяем уникальность имени команды в рамках хакатона
-    cursor.execute('''
-        SELECT * FROM Teams WHERE hackathon_id = ? AND name = ?
-    ''', (hackathon_id, name))
+    cursor.execute(TEAM_BY_NAME, (hackathon_id, name))
     if cursor.fetchone():
         conn.close()
         raise ValueError("Команда с таким именем уже существует в этом хакатоне")
 
     now = datetime.now().isoformat()
-    cursor.execute('''
-        INSERT INTO Teams (hackathon_id, name, description, captain_id, created_at)
-        VALUES (?, ?, ?, ?, ?)
-    ''', (hackathon_id, name, description, captain_id, now))
+    cursor.execute(TEAM_INSERT, (hackathon_id, name, description, captain_id, now))
 
     team_id = cursor.lastrowid
+    record_activity(cursor, "teams", "created", now)
     conn.commit()
     conn.close()
+    db_writer.after_commit(leaderboards.on_team_created, hackathon_id, team_id)
     return team_id
 
+TEAM_DETAILS = statement("teams.details", '''
+    SELECT t.*, u.username as captain_username, u.fio as captain_fio, h.name as hackathon_name
+    FROM Teams t
+    JOIN Users u ON t.captain_id = u.id
+    JOIN Hackathons h ON t.hackathon_id = h.id
+    WHERE t.id = ?
+''')
+
 def get_team_by_id(team_id: int):
     """Получение команды по ID"""
     conn = get_db_connection()
     cursor = conn.cursor()
-    cursor.execute('''
-        SELECT t.*, u.username as captain_username, u.fio as captain_fio, h.name as hackathon_name
-        FROM Teams t
-        JOIN Users u ON t.captain_id = u.id
-        JOIN Hackathons h ON t.hackathon_id = h.id
-        WHERE t.id = ?
-    ''', (team_id,))
+    cursor.execute(TEAM_DETAILS, (team_id,))
     team = cursor.fetchone()
     conn.close()
     return dict(team) if team else None
 
+TEAM_IN_HACKATHON = statement("teams.in_hackathon", '''
+    SELECT * FROM Teams WHERE id = ? AND hackathon_id = ?
+''')
+
 def get_team_by_code(hackathon_id: int, team_code: str):
     """Получение команды по коду (ID) в рамках хакатона"""
     try:
         team_id = int(team_code)
         conn = get_db_connection()
         cursor = conn.cursor()
-        cursor.execute('''
-            SELECT * FROM Teams WHERE id = ? AND hackathon_id = ?
-        ''', (team_id, hackathon_id))
+        cursor.execute(TEAM_IN_HACKATHON, (team_id, hackathon_id))
         team = cursor.fetchone()
         conn.close()
         return dict(team) if team else None
     except ValueError:
         return None
 
+TEAM_MEMBERS = statement("teams.members", '''
+    SELECT p.*, u.username, u.fio, u.email, u.telegram_nickname
+    FROM Participations p
+    JOIN Users u ON p.user_id = u.id
+    WHERE p.team_id = ?
+    ORDER BY
+        CASE p.role
+            WHEN 'captain' THEN 1
+            WHEN 'team_member' THEN 2
+            ELSE 3
+        END,
+        u.username
+''')
+
 def get_team_members(team_id: int):
     """Получение всех участников команды"""
     conn = get_db_connection()
     cursor = conn.cursor()
-    cursor.execute('''
-        SELECT p.*, u.username, u.fio, u.email, u.telegram_nickname
-        FROM Participations p
-        JOIN Users u ON p.user_id = u.id
-        WHERE p.team_id = ?
-        ORDER BY 
-            CASE p.role 
-                WHEN 'captain' THEN 1
-                WHEN 'team_member' THEN 2
-                ELSE 3
-            END,
-            u.username
-    ''', (team_id,))
+    cursor.execute(TEAM_MEMBERS, (team_id,))
     members = [dict(row) for row in cursor.fetchall()]
     conn.close()
     return members
 
+USER_TEAM = statement("teams.by_user", '''
+    SELECT t.* FROM Teams t
+    JOIN Participations p ON t.id = p.team_id
+    WHERE p.user_id = ? AND p.hackathon_id = ?
+''')
+
 def get_user_team_in_hackathon(user_id: int, hackathon_id: int):
     """Получение команды пользователя в хакатоне"""
     conn = get_db_connection()
     cursor = conn.cursor()
-    cursor.execute('''
-        SELECT t.* FROM Teams t
-        JOIN Participations p ON t.id = p.team_id
-        WHERE p.user_id = ? AND p.hackathon_id = ?
-    ''', (user_id, hackathon_id))
+    cursor.execute(USER_TEAM, (user_id, hackathon_id))
     team = cursor.fetchone()
     conn.close()
     return dict(team) if team else None
 
+PARTICIPATION_JOIN_TEAM = template("participations.join_team", f'''
+    UPDATE Participations
+    SET team_id = ?1, updated_at = ?2
+    WHERE user_id = ?3 AND hackathon_id = ?4 AND (
+        team_id IS ?1 OR EXISTS (
+            SELECT 1 FROM Teams t JOIN Hackathons h ON h.id = ?4
+            WHERE t.id = ?1 AND {TEAM_HAS_ROOM}
+        )
+    )
+''')
+PARTICIPATION_SET_TEAM = statement("participations.set_team", '''
+    UPDATE Participations
+    SET team_id = ?, updated_at = ?
+    WHERE user_id = ? AND hackathon_id = ?
+''')
+
+@db_writer.operation
 def add_member_to_team(user_id: int, hackathon_id: int, team_id: int):
     """Добавление участника в команду"""
     conn = get_db_connection()
     cursor = conn.cursor()
 
     # Проверяем участие
-    cursor.execute('''
-        SELECT * FROM Participations WHERE user_id = ? AND hackathon_id = ?
-    ''', (user_id, hackathon_id))
+    cursor.execute(PARTICIPATION_FIND, (user_id, hackathon_id))
     participation = cursor.fetchone()
     if not participation:
         conn.close()
         raise ValueError("Пользователь не участвует в этом хакатоне")
 
-    # Проверяем размер команды
-    cursor.execute('''
-        SELECT h.max_team_size, COUNT(p.id) as current_size
-        FROM Hackathons h
-        LEFT JOIN Participations p ON p.team_id = ?
-        WHERE h.id = ?
-        GROUP BY h.id
-    ''', (team_id, hackathon_id))
-    result = cursor.fetchone()
+    # Вступаем, только если в команде есть место (проверка и запись одним запросом)
+    now = datetime.now().isoformat()
+    cursor.execute(PARTICIPATION_JOIN_TEAM.format(members=_team_members_sql()), (team_id, now, user_id, hackathon_id))
+    if not cursor.rowcount:
+        conn.close()
+        raise ValueError("Команда достигла максимального размера")
 
-    if result and result[0]:
-        current_size = result[1] or 0
-        if current_size >= result[0]:
-            conn.close()
-            raise ValueError("Команда достигла максимального размера")
+    conn.commit()
+    conn.close()
+    db_writer.after_commit(leaderboards.on_team_changed, hackathon_id, user_id, team_id)
 
-    # Обновляем участие
+@db_writer.operation
+def set_participation_team(user_id: int, hackathon_id: int, team_id: int):
+    """Привязка участия к команде без проверки размера (капитан при создании команды)"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
     now = datetime.now().isoformat()
-    cursor.execute('''
-        UPDATE Participations 
-        SET team_id = ?, updated_at = ?
-        WHERE user_id = ? AND hackathon_id = ?
-    ''', (team_id, now, user_id, hackathon_id))
-
+    cursor.execute(PARTICIPATION_SET_TEAM, (team_id, now, user_id, hackathon_id))
     conn.commit()
     conn.close()
+    db_writer.after_commit(leaderboards.on_team_changed, hackathon_id, user_id, team_id)
+
+PARTICIPATION_CLEAR_TEAM = statement("participations.clear_team", '''
+    UPDATE Participations
+    SET team_id = NULL, updated_at = ?
+    WHERE user_id = ? AND hackathon_id = ?
+''')
 
+@db_writer.operation
 def remove_member_from_team(user_id: int, hackathon_id: int):
     """Удаление участника из команды"""
     conn = get_db_connection()
     cursor = conn.cursor()
     now = datetime.now().isoformat()
-    cursor.execute('''
-        UPDATE Participations 
-        SET team_id = NULL, updated_at = ?
-        WHERE user_id = ? AND hackathon_id = ?
-    ''', (now, user_id, hackathon_id))
+    cursor.execute(PARTICIPATION_CLEAR_TEAM, (now, user_id, hackathon_id))
     conn.commit()
     conn.close()
+    db_writer.after_commit(leaderboards.on_team_changed, hackathon_id, user_id, None)
 
+TEAM_NAME_TAKEN = statement("teams.name_taken", '''
+    SELECT * FROM Teams WHERE hackathon_id = ? AND name = ? AND id != ?
+''')
+TEAM_RENAME = statement("teams.rename", '''
+    UPDATE Teams SET name = ? WHERE id = ?
+''')
+
+@db_writer.operation
 def update_team_name(team_id: int, new_name: str, hackathon_id: int):
     """Обновление названия команды"""
     conn = get_db_connection()
     cursor = conn.cursor()
 
     # Проверяем уникальность
-    cursor.execute('''
-        SELECT * FROM Teams WHERE hackathon_id = ? AND name = ? AND id != ?
-    ''', (hackathon_id, new_name, team_id))
+    cursor.execute(TEAM_NAME_TAKEN, (hackathon_id, new_name, team_id))
     if cursor.fetchone():
         conn.close()
         raise ValueError("Команда с таким именем уже существует")
 
-    cursor.execute('''
-        UPDATE Teams SET name = ? WHERE id = ?
-    ''', (new_name, team_id))
+    cursor.execute(TEAM_RENAME, (new_name, team_id))
 
     conn.commit()
     conn.close()
 
+# Число участников берётся из Teams.member_count: свободные команды - диапазон индекса (hackathon_id, member_count)
+AVAILABLE_TEAMS = statement("teams.available", f'''
+    SELECT t.*,
+           h.max_team_size,
+           u.username as captain_username,
+           u.fio as captain_fio
+    FROM Hackathons h
+    JOIN Teams t ON t.hackathon_id = h.id
+    JOIN Users u ON t.captain_id = u.id
+    WHERE h.id = ? AND {TEAM_HAS_ROOM.format(members="t.member_count")}
+    ORDER BY t.name
+''')
+AVAILABLE_TEAMS_LEGACY = statement("teams.available_legacy", f'''
+    SELECT t.*,
+           COUNT(p.id) as member_count,
+           h.max_team_size,
+           u.username as captain_username,
+           u.fio as captain_fio
+    FROM Teams t
+    JOIN Hackathons h ON t.hackathon_id = h.id
+    JOIN Users u ON t.captain_id = u.id
+    LEFT JOIN Participations p ON t.id = p.team_id
+    WHERE t.hackathon_id = ?
+    GROUP BY t.id
+    HAVING {TEAM_HAS_ROOM.format(members="member_count")}
+    ORDER BY t.name
+''')
+
 def get_available_teams(hackathon_id: int):
     """Получение команд с доступными местами"""
     conn = get_db_connection()
     cursor = conn.cursor()
-    cursor.execute('''
-        SELECT t.*, 
-               COUNT(p.id) as member_count,
-               h.max_team_size,
-               u.username as captain_username,
-               u.fio as captain_fio
-        FROM Teams t
-        JOIN Hackathons h ON t.hackathon_id = h.id
-        JOIN Users u ON t.captain_id = u.id
-        LEFT JOIN Participations p ON t.id = p.team_id
-        WHERE t.hackathon_id = ?
-        GROUP BY t.id
-        HAVING member_count < COALESCE(h.max_team_size, 999) OR h.max_team_size IS NULL
-        ORDER BY t.name
-    ''', (hackathon_id,))
+    cursor.execute(AVAILABLE_TEAMS if schema.team_member_counts else AVAILABLE_TEAMS_LEGACY, (hackathon_id,))
     teams = [dict(row) for row in cursor.fetchall()]
     conn.close()
     return teams
 
+PARTICIPATION_SET_ROLE = statement("participations.set_role", '''
+    UPDATE Participations
+    SET role = ?, updated_at = ?
+    WHERE user_id = ? AND hackathon_id = ?
+''')
+
+@db_writer.operation
 def update_participation_role(user_id: int, hackathon_id: int, new_role: str):
     """Обновление роли пользователя в хакатоне"""
     conn = get_db_connection()
     cursor = conn.cursor()
     now = datetime.now().isoformat()
-    cursor.execute('''
-        UPDATE Participations 
-        SET role = ?, updated_at = ?
-        WHERE user_id = ? AND hackathon_id = ?
-    ''', (new_role, now, user_id, hackathon_id))
+    cursor.execute(PARTICIPATION_SET_ROLE, (new_role, now, user_id, hackathon_id))
     conn.commit()
     conn.close()
 
+PARTICIPATION_REPUTATION = statement("participations.reputation", "SELECT reputation, hackathon_id, user_id FROM Participations WHERE id = ?")
+PARTICIPATION_SET_REPUTATION = statement("participations.set_reputation", '''
+    UPDATE Participations
+    SET reputation = ?, updated_at = ?
+    WHERE id = ?
+''')
+REPUTATION_HISTORY_INSERT = statement("reputation_history.insert", '''
+    INSERT INTO ReputationHistory (participation_id, old_reputation, new_reputation, changed_by, reason, created_at)
+    VALUES (?, ?, ?, ?, ?, ?)
+''')
+
+@db_writer.operation
 def update_reputation(participation_id: int, new_reputation: int, changed_by: int, reason: str = None):
     """Обновление репутации с сохранением истории"""
     conn = get_db_connection()
     cursor = conn.cursor()
 
     # Получаем текущую репутацию
-    cursor.execute("SELECT reputation FROM Participations WHERE id = ?", (participation_id,))
+    cursor.execute(PARTICIPATION_REPUTATION, (participation_id,))
     result = cursor.fetchone()
     if not result:
         conn.close()
@@ -680,105 +981,399 @@ def update_reputation(participation_id: int, new_reputation: int, changed_by: in
 
     # Обновляем репутацию
     now = datetime.now().isoformat()
-    cursor.execute('''
-        UPDATE Participations 
-        SET reputation = ?, updated_at = ?
-        WHERE id = ?
-    ''', (new_reputation, now, participation_id))
+    cursor.execute(PARTICIPATION_SET_REPUTATION, (new_reputation, now, participation_id))
 
     # Сохраняем в историю
-    cursor.execute('''
-        INSERT INTO ReputationHistory (participation_id, old_reputation, new_reputation, changed_by, reason, created_at)
-        VALUES (?, ?, ?, ?, ?, ?)
-    ''', (participation_id, old_reputation, new_reputation, changed_by, reason, now))
+    cursor.execute(REPUTATION_HISTORY_INSERT, (participation_id, old_reputation, new_reputation, changed_by, reason, now))
+    record_reputation_rollups(cursor, [(participation_id, result["hackathon_id"], old_reputation, new_reputation, now)])
 
     conn.commit()
     conn.close()
+    db_writer.after_commit(leaderboards.on_reputation_changed, result["hackathon_id"], result["user_id"], new_reputation)
 
-def get_reputation_history(participation_id: int):
-    """Получение истории изменений репутации"""
+PARTICIPATIONS_BY_IDS = template("participations.by_ids", "SELECT * FROM Participations WHERE id IN ({placeholders})")
+
+def get_participations_by_ids(participation_ids: List[int]):
+    """Получение участий по списку ID одним запросом"""
+    if not participation_ids:
+        return {}
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    placeholders = ", ".join("?" * len(participation_ids))
+    cursor.execute(PARTICIPATIONS_BY_IDS.format(placeholders=placeholders), list(participation_ids))
+    participations = {row["id"]: dict(row) for row in cursor.fetchall()}
+    conn.close()
+    return participations
+
+PARTICIPATION_REPUTATIONS = template("participations.reputations", '''
+    SELECT id, reputation, hackathon_id, user_id FROM Participations WHERE id IN ({placeholders})
+''')
+
+@db_writer.operation
+def update_reputation_batch(updates: List[dict], changed_by: int):
+    """Пакетное обновление репутации с историей в одной транзакции
+
+    updates - список словарей с participation_id, new_reputation и reason.
+    Возвращает результат по каждому элементу в исходном порядке.
+    """
+    conn = get_db_connection()
+    cursor = conn.cursor()
+
+    ids = list({item["participation_id"] for item in updates})
+    current = {}
+    if ids:
+        placeholders = ", ".join("?" * len(ids))
+        cursor.execute(PARTICIPATION_REPUTATIONS.format(placeholders=placeholders), ids)
+        current = {row["id"]: dict(row) for row in cursor.fetchall()}
+
+    now = datetime.now().isoformat()
+    results = []
+    changes = []
+    history = []
+    rollups = []
+    for item in updates:
+        participation_id = item["participation_id"]
+        participation = current.get(participation_id)
+        if not participation:
+            results.append({"participation_id": participation_id, "status": "error", "detail": "Участие не найдено"})
+            continue
+
+        # Повторы одного участия в пакете применяются последовательно
+        old_reputation = participation["reputation"]
+        participation["reputation"] = item["new_reputation"]
+        changes.append((item["new_reputation"], now, participation_id))
+        history.append((participation_id, old_reputation, item["new_reputation"], changed_by, item.get("reason"), now))
+        rollups.append((participation_id, participation["hackathon_id"], old_reputation, item["new_reputation"], now))
+        results.append({
+            "participation_id": participation_id,
+            "status": "ok",
+            "old_reputation": old_reputation,
+            "new_reputation": item["new_reputation"]
+        })
+
+    try:
+        cursor.executemany(PARTICIPATION_SET_REPUTATION, changes)
+        cursor.executemany(REPUTATION_HISTORY_INSERT, history)
+        record_reputation_rollups(cursor, rollups)
+        conn.commit()
+    except sqlite3.Error:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+    for participation_id, _, new_reputation, _, _, _ in history:
+        participation = current[participation_id]
+        db_writer.after_commit(leaderboards.on_reputation_changed, participation["hackathon_id"], participation["user_id"], new_reputation)
+    return results
+
+REPUTATION_HISTORY_PAGE = statement("reputation_history.page", '''
+    SELECT rh.*, u.username as changed_by_username, u.fio as changed_by_fio
+    FROM ReputationHistory rh
+    JOIN Users u ON rh.changed_by = u.id
+    WHERE rh.participation_id = ?
+    ORDER BY rh.created_at DESC, rh.id DESC
+    LIMIT ? OFFSET ?
+''')
+
+def get_reputation_history(participation_id: int, limit: int = 50, offset: int = 0):
+    """Получение истории изменений репутации (постранично, новые сначала)"""
     conn = get_db_connection()
     cursor = conn.cursor()
-    cursor.execute('''
-        SELECT rh.*, u.username as changed_by_username, u.fio as changed_by_fio
-        FROM ReputationHistory rh
-        JOIN Users u ON rh.changed_by = u.id
-        WHERE rh.participation_id = ?
-        ORDER BY rh.created_at DESC
-    ''', (participation_id,))
+    cursor.execute(REPUTATION_HISTORY_PAGE, (participation_id, limit, offset))
     history = [dict(row) for row in cursor.fetchall()]
     conn.close()
     return history
 
+# ========== Агрегаты репутации по времени ==========
+ROLLUP_GRANULARITIES = ("hour", "day")
+
+def rollup_bucket(timestamp: str, granularity: str):
+    """Начало часового или дневного интервала для ISO-времени"""
+    if granularity == "hour":
+        return timestamp[:13] + ":00:00"
+    return timestamp[:10]
+
+# Накопленное изменение интервала (cumulative_delta) считается от предыдущего интервала
+ROLLUP_UPSERT = statement("reputation_rollups.upsert", '''
+    INSERT INTO ReputationRollups (scope, scope_id, granularity, bucket_start, changes_count,
+                                   delta_sum, gain_sum, loss_sum, last_reputation, cumulative_delta)
+    VALUES (?1, ?2, ?3, ?4, 1, ?5, ?6, ?7, ?8, ?5 + COALESCE((
+        SELECT cumulative_delta FROM ReputationRollups
+        WHERE scope = ?1 AND scope_id = ?2 AND granularity = ?3 AND bucket_start < ?4
+        ORDER BY bucket_start DESC LIMIT 1
+    ), 0))
+    ON CONFLICT (scope, scope_id, granularity, bucket_start) DO UPDATE SET
+        changes_count = changes_count + 1,
+        delta_sum = delta_sum + excluded.delta_sum,
+        gain_sum = gain_sum + excluded.gain_sum,
+        loss_sum = loss_sum + excluded.loss_sum,
+        last_reputation = excluded.last_reputation,
+        cumulative_delta = cumulative_delta + excluded.delta_sum
+''')
+# Изменение задним числом сдвигает накопленное у более поздних интервалов (обычно их нет)
+ROLLUP_SHIFT_LATER = statement("reputation_rollups.shift_later", '''
+    UPDATE ReputationRollups SET cumulative_delta = cumulative_delta + ?
+    WHERE scope = ? AND scope_id = ? AND granularity = ? AND bucket_start > ?
+''')
+ROLLUP_UPSERT_LEGACY = statement("reputation_rollups.upsert_legacy", '''
+    INSERT INTO ReputationRollups (scope, scope_id, granularity, bucket_start, changes_count,
+                                   delta_sum, gain_sum, loss_sum, last_reputation)
+    VALUES (?, ?, ?, ?, 1, ?, ?, ?, ?)
+    ON CONFLICT (scope, scope_id, granularity, bucket_start) DO UPDATE SET
+        changes_count = changes_count + 1,
+        delta_sum = delta_sum + excluded.delta_sum,
+        gain_sum = gain_sum + excluded.gain_sum,
+        loss_sum = loss_sum + excluded.loss_sum,
+        last_reputation = excluded.last_reputation
+''')
+
+def record_reputation_rollups(cursor, changes):
+    """Учёт изменений репутации в агрегатах (в транзакции вызывающего)
+
+    changes - кортежи (participation_id, hackathon_id, old_reputation, new_reputation, created_at).
+    """
+    rows = []
+    for participation_id, hackathon_id, old_reputation, new_reputation, created_at in changes:
+        delta = new_reputation - (old_reputation or 0)
+        gain = max(delta, 0)
+        loss = max(-delta, 0)
+        for granularity in ROLLUP_GRANULARITIES:
+            bucket = rollup_bucket(created_at, granularity)
+            rows.append(("participation", participation_id, granularity, bucket, delta, gain, loss, new_reputation))
+            rows.append(("hackathon", hackathon_id, granularity, bucket, delta, gain, loss, None))
+
+    if not schema.reputation_running_totals:
+        cursor.executemany(ROLLUP_UPSERT_LEGACY, rows)
+        return
+    for row in rows:
+        cursor.execute(ROLLUP_UPSERT, row)
+        cursor.execute(ROLLUP_SHIFT_LATER, (row[4],) + row[:4])
+
+ROLLUP_CLEAR = statement("reputation_rollups.clear", "DELETE FROM ReputationRollups")
+ROLLUP_SOURCE = statement("reputation_rollups.source", '''
+    SELECT rh.participation_id, p.hackathon_id, rh.old_reputation, rh.new_reputation, rh.created_at
+    FROM ReputationHistory rh
+    JOIN Participations p ON rh.participation_id = p.id
+    ORDER BY rh.created_at, rh.id
+''')
+
+def rebuild_reputation_rollups(cursor):
+    """Пересчёт агрегатов репутации по всей истории"""
+    cursor.execute(ROLLUP_CLEAR)
+    cursor.execute(ROLLUP_SOURCE)
+    while True:
+        changes = cursor.fetchmany(1000)
+        if not changes:
+            break
+        # Отдельный курсор, чтобы не сбросить выборку истории
+        record_reputation_rollups(cursor.connection.cursor(), [tuple(row) for row in changes])
+
+ROLLUP_BUCKETS = statement("reputation_rollups.buckets", '''
+    SELECT bucket_start, changes_count, delta_sum, gain_sum, loss_sum, last_reputation, cumulative_delta
+    FROM ReputationRollups
+    WHERE scope = ? AND scope_id = ? AND granularity = ? AND bucket_start BETWEEN ? AND ?
+    ORDER BY bucket_start
+''')
+ROLLUP_SUM_BEFORE_LEGACY = statement("reputation_rollups.sum_before_legacy", '''
+    SELECT COALESCE(SUM(delta_sum), 0) FROM ReputationRollups
+    WHERE scope = ? AND scope_id = ? AND granularity = ? AND bucket_start < ?
+''')
+ROLLUP_BUCKETS_LEGACY = statement("reputation_rollups.buckets_legacy", '''
+    SELECT bucket_start, changes_count, delta_sum, gain_sum, loss_sum, last_reputation
+    FROM ReputationRollups
+    WHERE scope = ? AND scope_id = ? AND granularity = ? AND bucket_start BETWEEN ? AND ?
+    ORDER BY bucket_start
+''')
+
+def period_moment(value: str, end: bool = False) -> str:
+    """Граница периода как локальное ISO-время; дата без времени в end - конец этого дня"""
+    try:
+        moment = datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError("Даты start и end ожидаются в формате YYYY-MM-DD или YYYY-MM-DDTHH:MM")
+    if moment.tzinfo is not None:
+        moment = moment.astimezone().replace(tzinfo=None)
+    if end and len(value) == 10:
+        moment += timedelta(days=1, microseconds=-1)
+    return moment.isoformat()
+
+def get_reputation_timeseries(scope: str, scope_id: int, granularity: str = "day",
+                              start: str = None, end: str = None):
+    """Получение агрегатов репутации по интервалам за произвольный период"""
+    start_bucket = rollup_bucket(period_moment(start), granularity) if start else ""
+    end_bucket = rollup_bucket(period_moment(end, end=True), granularity) if end else "9999"
+    conn = get_db_connection()
+    cursor = conn.cursor()
+
+    if schema.reputation_running_totals:
+        cursor.execute(ROLLUP_BUCKETS, (scope, scope_id, granularity, start_bucket, end_bucket))
+        buckets = [dict(row) for row in cursor.fetchall()]
+    else:
+        # Накопленное изменение до начала периода
+        cursor.execute(ROLLUP_SUM_BEFORE_LEGACY, (scope, scope_id, granularity, start_bucket))
+        cumulative = cursor.fetchone()[0]
+        cursor.execute(ROLLUP_BUCKETS_LEGACY, (scope, scope_id, granularity, start_bucket, end_bucket))
+        buckets = []
+        for row in cursor.fetchall():
+            bucket = dict(row)
+            cumulative += bucket["delta_sum"]
+            bucket["cumulative_delta"] = cumulative
+            buckets.append(bucket)
+    conn.close()
+    if scope != "participation":
+        for bucket in buckets:
+            bucket.pop("last_reputation")
+    return buckets
+
+def get_leaderboards():
+    """Получение таблиц лидеров (загружаются из БД при первом обращении)"""
+    if leaderboards.loaded:
+        leaderboards.hits += 1
+    else:
+        leaderboards.misses += 1
+        # Отдельное соединение: общее соединение операции записи видит незафиксированное
+        conn = _open_connection()
+        leaderboards.load(conn)
+        conn.close()
+    return leaderboards
+
+def get_leaderboard(limit: int, hackathon_id: int = None, teams: bool = False):
+    """Первые места таблицы лидеров хакатона (без hackathon_id - глобальной)"""
+    return get_leaderboards().top(limit, hackathon_id, teams)
+
+def get_leaderboard_position(user_id: int, radius: int, hackathon_id: int = None):
+    """Место пользователя в таблице лидеров и соседи по рейтингу; None, если его там нет"""
+    return get_leaderboards().position(user_id, radius, hackathon_id)
+
+USERNAMES = template("users.names", "SELECT id, username, fio FROM Users WHERE id IN ({placeholders})")
+
+def get_usernames(user_ids: List[int]):
+    """Получение имён пользователей по списку ID одним запросом"""
+    if not user_ids:
+        return {}
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    placeholders = ", ".join("?" * len(user_ids))
+    cursor.execute(USERNAMES.format(placeholders=placeholders), list(user_ids))
+    users = {row["id"]: dict(row) for row in cursor.fetchall()}
+    conn.close()
+    return users
+
+TEAM_NAMES = template("teams.names", "SELECT id, name, hackathon_id FROM Teams WHERE id IN ({placeholders})")
+
+def get_team_names(team_ids: List[int]):
+    """Получение названий команд по списку ID одним запросом"""
+    if not team_ids:
+        return {}
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    placeholders = ", ".join("?" * len(team_ids))
+    cursor.execute(TEAM_NAMES.format(placeholders=placeholders), list(team_ids))
+    teams = {row["id"]: dict(row) for row in cursor.fetchall()}
+    conn.close()
+    return teams
+
 # ========== Функции для работы с проектами ==========
+PROJECTS_BY_AREA = statement("projects.by_area", '''
+    SELECT p.*, t.name as team_name, u.username, u.fio, part.role
+    FROM Projects p
+    LEFT JOIN Teams t ON p.team_id = t.id
+    JOIN Participations part ON p.participation_id = part.id
+    JOIN Users u ON part.user_id = u.id
+    WHERE p.hackathon_id = ? AND p.area_topic = ?
+    ORDER BY p.created_at DESC
+''')
+PROJECTS_BY_HACKATHON = statement("projects.by_hackathon", '''
+    SELECT p.*, t.name as team_name, u.username, u.fio, part.role
+    FROM Projects p
+    LEFT JOIN Teams t ON p.team_id = t.id
+    JOIN Participations part ON p.participation_id = part.id
+    JOIN Users u ON part.user_id = u.id
+    WHERE p.hackathon_id = ?
+    ORDER BY p.created_at DESC
+''')
+
 def get_projects_by_hackathon(hackathon_id: int, area_topic: str = None):
     """Получение проектов хакатона, опционально фильтрованных по области"""
     conn = get_db_connection()
     cursor = conn.cursor()
     if area_topic:
-        cursor.execute('''
-            SELECT p.*, t.name as team_name, u.username, u.fio, part.role
-            FROM Projects p
-            LEFT JOIN Teams t ON p.team_id = t.id
-            JOIN Participations part ON p.participation_id = part.id
-            JOIN Users u ON part.user_id = u.id
-            WHERE p.hackathon_id = ? AND p.area_topic = ?
-            ORDER BY p.created_at DESC
-        ''', (hackathon_id, area_topic))
+        cursor.execute(PROJECTS_BY_AREA, (hackathon_id, area_topic))
     else:
-        cursor.execute('''
-            SELECT p.*, t.name as team_name, u.username, u.fio, part.role
-            FROM Projects p
-            LEFT JOIN Teams t ON p.team_id = t.id
-            JOIN Participations part ON p.participation_id = part.id
-            JOIN Users u ON part.user_id = u.id
-            WHERE p.hackathon_id = ?
-            ORDER BY p.created_at DESC
-        ''', (hackathon_id,))
+        cursor.execute(PROJECTS_BY_HACKATHON, (hackathon_id,))
     projects = [dict(row) for row in cursor.fetchall()]
     conn.close()
     return projects
 
+PROJECT_INSERT = statement("projects.insert", '''
+    INSERT INTO Projects (hackathon_id, team_id, participation_id, title, description,
+                          presentation_url, area_topic, status, created_at, updated_at)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+''')
+
+@db_writer.operation
+def create_project(hackathon_id: int, participation_id: int, title: str, description: str = None,
+                   presentation_url: str = None, area_topic: str = None, team_id: int = None,
+                   status: str = "draft"):
+    """Создание проекта участника"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    now = datetime.now().isoformat()
+    cursor.execute(PROJECT_INSERT, (hackathon_id, team_id, participation_id, title, description, presentation_url,
+          area_topic, status, now, now))
+    project_id = cursor.lastrowid
+    conn.commit()
+    conn.close()
+    return project_id
+
+PROJECT_DETAILS = statement("projects.details", '''
+    SELECT p.*, t.name as team_name, u.username, u.fio, part.role
+    FROM Projects p
+    LEFT JOIN Teams t ON p.team_id = t.id
+    JOIN Participations part ON p.participation_id = part.id
+    JOIN Users u ON part.user_id = u.id
+    WHERE p.id = ?
+''')
+
 def get_project_by_id(project_id: int):
     """Получение проекта по ID"""
     conn = get_db_connection()
     cursor = conn.cursor()
-    cursor.execute('''
-        SELECT p.*, t.name as team_name, u.username, u.fio, part.role
-        FROM Projects p
-        LEFT JOIN Teams t ON p.team_id = t.id
-        JOIN Participations part ON p.participation_id = part.id
-        JOIN Users u ON part.user_id = u.id
-        WHERE p.id = ?
-    ''', (project_id,))
+    cursor.execute(PROJECT_DETAILS, (project_id,))
     project = cursor.fetchone()
     conn.close()
     return dict(project) if project else None
 
 # ========== Функции для работы с областями экспертизы ==========
+EXPERT_AREAS = statement("expert_areas.by_expert", '''
+    SELECT * FROM ExpertAreas
+    WHERE expert_id = ? AND hackathon_id = ?
+    ORDER BY area_topic
+''')
+
 def get_expert_areas(expert_id: int, hackathon_id: int):
     """Получение областей экспертизы эксперта в хакатоне"""
     conn = get_db_connection()
     cursor = conn.cursor()
-    cursor.execute('''
-        SELECT * FROM ExpertAreas
-        WHERE expert_id = ? AND hackathon_id = ?
-        ORDER BY area_topic
-    ''', (expert_id, hackathon_id))
+    cursor.execute(EXPERT_AREAS, (expert_id, hackathon_id))
     areas = [dict(row) for row in cursor.fetchall()]
     conn.close()
     return areas
 
+EXPERT_AREA_INSERT = statement("expert_areas.insert", '''
+    INSERT INTO ExpertAreas (expert_id, hackathon_id, area_topic, created_at)
+    VALUES (?, ?, ?, ?)
+''')
+
+@db_writer.operation
 def add_expert_area(expert_id: int, hackathon_id: int, area_topic: str):
     """Добавление области экспертизы эксперту"""
     conn = get_db_connection()
     cursor = conn.cursor()
     now = datetime.now().isoformat()
     try:
-        cursor.execute('''
-            INSERT INTO ExpertAreas (expert_id, hackathon_id, area_topic, created_at)
-            VALUES (?, ?, ?, ?)
-        ''', (expert_id, hackathon_id, area_topic, now))
+        cursor.execute(EXPERT_AREA_INSERT, (expert_id, hackathon_id, area_topic, now))
         conn.commit()
         area_id = cursor.lastrowid
         conn.close()
@@ -787,104 +1382,208 @@ def add_expert_area(expert_id: int, hackathon_id: int, area_topic: str):
         conn.close()
         raise ValueError("Эта область уже назначена эксперту")
 
+EXPERT_AREA_DELETE = statement("expert_areas.delete", '''
+    DELETE FROM ExpertAreas
+    WHERE expert_id = ? AND hackathon_id = ? AND area_topic = ?
+''')
+
+@db_writer.operation
 def remove_expert_area(expert_id: int, hackathon_id: int, area_topic: str):
     """Удаление области экспертизы"""
     conn = get_db_connection()
     cursor = conn.cursor()
-    cursor.execute('''
-        DELETE FROM ExpertAreas
-        WHERE expert_id = ? AND hackathon_id = ? AND area_topic = ?
-    ''', (expert_id, hackathon_id, area_topic))
+    cursor.execute(EXPERT_AREA_DELETE, (expert_id, hackathon_id, area_topic))
     conn.commit()
     conn.close()
 
 # ========== Функции для работы с комментариями ==========
+PROJECT_COMMENTS = statement("comments.by_project", '''
+    SELECT c.*, u.username, u.fio
+    FROM ProjectComments c
+    JOIN Users u ON c.expert_id = u.id
+    WHERE c.project_id = ?
+    ORDER BY c.created_at DESC
+''')
+
 def get_project_comments(project_id: int):
     """Получение комментариев к проекту"""
     conn = get_db_connection()
     cursor = conn.cursor()
-    cursor.execute('''
-        SELECT c.*, u.username, u.fio
-        FROM ProjectComments c
-        JOIN Users u ON c.expert_id = u.id
-        WHERE c.project_id = ?
-        ORDER BY c.created_at DESC
-    ''', (project_id,))
+    cursor.execute(PROJECT_COMMENTS, (project_id,))
     comments = [dict(row) for row in cursor.fetchall()]
     conn.close()
     return comments
 
+PROJECT_HACKATHON = statement("projects.hackathon", "SELECT hackathon_id FROM Projects WHERE id = ?")
+COMMENT_INSERT = statement("comments.insert", '''
+    INSERT INTO ProjectComments (project_id, expert_id, comment, rating, created_at, updated_at)
+    VALUES (?, ?, ?, ?, ?, ?)
+''')
+
+@db_writer.operation
 def add_project_comment(project_id: int, expert_id: int, comment: str, rating: int = None):
     """Добавление комментария к проекту"""
     conn = get_db_connection()
     cursor = conn.cursor()
+    cursor.execute(PROJECT_HACKATHON, (project_id,))
+    project = cursor.fetchone()
+    if not project:
+        conn.close()
+        raise ValueError("Проект не найден")
+
     now = datetime.now().isoformat()
-    cursor.execute('''
-        INSERT INTO ProjectComments (project_id, expert_id, comment, rating, created_at, updated_at)
-        VALUES (?, ?, ?, ?, ?, ?)
-    ''', (project_id, expert_id, comment, rating, now, now))
+    cursor.execute(COMMENT_INSERT, (project_id, expert_id, comment, rating, now, now))
     comment_id = cursor.lastrowid
     conn.commit()
     conn.close()
+    db_writer.after_commit(project_scores.on_comment_added, project["hackathon_id"], comment_id, project_id,
+                           expert_id, rating)
     return comment_id
 
+COMMENT_UPDATE = statement("comments.update", '''
+    UPDATE ProjectComments
+    SET comment = ?, rating = ?, updated_at = ?
+    WHERE id = ?
+''')
+
+@db_writer.operation
 def update_project_comment(comment_id: int, comment: str, rating: int = None):
     """Обновление комментария"""
     conn = get_db_connection()
     cursor = conn.cursor()
     now = datetime.now().isoformat()
-    cursor.execute('''
-        UPDATE ProjectComments
-        SET comment = ?, rating = ?, updated_at = ?
-        WHERE id = ?
-    ''', (comment, rating, now, comment_id))
+    cursor.execute(COMMENT_UPDATE, (comment, rating, now, comment_id))
     conn.commit()
     conn.close()
+    db_writer.after_commit(project_scores.on_comment_updated, comment_id, rating)
+
+def get_project_scores(hackathon_id: int):
+    """Итоговые нормализованные оценки проектов хакатона (из кэша)"""
+    # Загрузка - на отдельном соединении: общее соединение операции записи видит незафиксированное
+    return project_scores.get(hackathon_id, _open_connection)
+
+COMMENT_DETAILS = statement("comments.details", '''
+    SELECT c.*, p.hackathon_id
+    FROM ProjectComments c
+    JOIN Projects p ON c.project_id = p.id
+    WHERE c.id = ?
+''')
+
+def get_project_comment_by_id(comment_id: int):
+    """Получение комментария по ID вместе с хакатоном проекта"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute(COMMENT_DETAILS, (comment_id,))
+    comment = cursor.fetchone()
+    conn.close()
+    return dict(comment) if comment else None
+
+REVIEW_QUEUE_COUNT = template("review_queue.count", "SELECT COUNT(*) FROM Projects p WHERE {where}")
+REVIEW_QUEUE_PAGE = template("review_queue.page", '''
+    SELECT p.*, t.name as team_name,
+           (SELECT COUNT(*) FROM ProjectComments c WHERE c.project_id = p.id) as comment_count,
+           (SELECT AVG(c.rating) FROM ProjectComments c WHERE c.project_id = p.id) as average_rating,
+           my.id as my_comment_id, my.rating as my_rating, my.updated_at as my_reviewed_at
+    FROM Projects p
+    LEFT JOIN Teams t ON p.team_id = t.id
+    LEFT JOIN ProjectComments my ON my.id = (
+        SELECT id FROM ProjectComments
+        WHERE project_id = p.id AND expert_id = ?
+        ORDER BY updated_at DESC LIMIT 1
+    )
+    WHERE {where}
+    ORDER BY p.created_at DESC, p.id DESC
+    LIMIT ? OFFSET ?
+''')
+
+def get_review_queue(expert_id: int, hackathon_id: int, all_areas: bool = False,
+                     review_status: str = None, limit: int = 20, offset: int = 0):
+    """Очередь проектов на оценку эксперта
+
+    Проекты из областей эксперта (или все при all_areas) с числом комментариев,
+    средней оценкой и статусом собственного отзыва эксперта. Ровно два запроса
+    независимо от размера страницы: общее количество и сама страница.
+    """
+    conditions = ["p.hackathon_id = ?"]
+    params = [hackathon_id]
+    if not all_areas:
+        conditions.append('''p.area_topic IN (
+            SELECT area_topic FROM ExpertAreas WHERE expert_id = ? AND hackathon_id = ?
+        )''')
+        params.extend([expert_id, hackathon_id])
+
+    reviewed = "EXISTS (SELECT 1 FROM ProjectComments mc WHERE mc.project_id = p.id AND mc.expert_id = ?)"
+    if review_status == "reviewed":
+        conditions.append(reviewed)
+        params.append(expert_id)
+    elif review_status == "pending":
+        conditions.append("NOT " + reviewed)
+        params.append(expert_id)
+    where = " AND ".join(conditions)
+
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute(REVIEW_QUEUE_COUNT.format(where=where), params)
+    total = cursor.fetchone()[0]
+
+    cursor.execute(REVIEW_QUEUE_PAGE.format(where=where), [expert_id] + params + [limit, offset])
+    projects = []
+    for row in cursor.fetchall():
+        project = dict(row)
+        project["review_status"] = "reviewed" if project["my_comment_id"] else "pending"
+        projects.append(project)
+    conn.close()
+    return {"total": total, "limit": limit, "offset": offset, "projects": projects}
 
 # ========== Функции для аудита ==========
 def log_expert_action(expert_id: int, hackathon_id: int, action_type: str, 
                      target_type: str = None, target_id: int = None, 
                      details: str = None, ip_address: str = None):
-    """Логирование действия эксперта"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
+    """Логирование действия эксперта (запись выполняется фоновым писателем)"""
     now = datetime.now().isoformat()
-    cursor.execute('''
-        INSERT INTO ExpertAuditLog (expert_id, hackathon_id, action_type, target_type, target_id, details, ip_address, created_at)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-    ''', (expert_id, hackathon_id, action_type, target_type, target_id, details, ip_address, now))
-    conn.commit()
-    conn.close()
+    audit_writer.submit((expert_id, hackathon_id, action_type, target_type, target_id, details, ip_address, now))
 
 # ========== Функции для работы с вебинарами ==========
+WEBINARS_BY_STATUS = statement("webinars.by_status", '''
+    SELECT * FROM Webinars
+    WHERE status = ?
+    ORDER BY date_time ASC
+''')
+ALL_WEBINARS = statement("webinars.all", '''
+    SELECT * FROM Webinars
+    ORDER BY date_time ASC
+''')
+
 def get_all_webinars(status_filter: Optional[str] = None):
     """Получение всех вебинаров"""
     conn = get_db_connection()
     cursor = conn.cursor()
     if status_filter:
-        cursor.execute('''
-            SELECT * FROM Webinars
-            WHERE status = ?
-            ORDER BY date_time ASC
-        ''', (status_filter,))
+        cursor.execute(WEBINARS_BY_STATUS, (status_filter,))
     else:
-        cursor.execute('''
-            SELECT * FROM Webinars
-            ORDER BY date_time ASC
-        ''')
+        cursor.execute(ALL_WEBINARS)
     webinars = [dict(row) for row in cursor.fetchall()]
     conn.close()
     return webinars
 
+WEBINAR_BY_ID = statement("webinars.by_id", "SELECT * FROM Webinars WHERE id = ?")
+
 def get_webinar_by_id(webinar_id: int):
     """Получение вебинара по ID"""
     conn = get_db_connection()
     cursor = conn.cursor()
-    cursor.execute('SELECT * FROM Webinars WHERE id = ?', (webinar_id,))
+    cursor.execute(WEBINAR_BY_ID, (webinar_id,))
     webinar = cursor.fetchone()
     conn.close()
     return dict(webinar) if webinar else None
 
+WEBINAR_INSERT = statement("webinars.insert", '''
+    INSERT INTO Webinars (name, description, speaker, date_time, duration_hours,
+                         location, max_participants, status, created_at)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+''')
+
+@db_writer.operation
 def create_webinar(name: str, description: str, speaker: str, date_time: str, 
                    duration_hours: Optional[float] = None, location: str = "Онлайн",
                    max_participants: Optional[int] = None, status: str = "upcoming"):
@@ -892,76 +1591,67 @@ def create_webinar(name: str, description: str, speaker: str, date_time: str,
     conn = get_db_connection()
     cursor = conn.cursor()
     now = datetime.now().isoformat()
-    cursor.execute('''
-        INSERT INTO Webinars (name, description, speaker, date_time, duration_hours, 
-                             location, max_participants, status, created_at)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-    ''', (name, description, speaker, date_time, duration_hours, location, 
+    status = status_scheduler.current_status("webinars", (date_time, duration_hours), status)
+    cursor.execute(WEBINAR_INSERT, (name, description, speaker, date_time, duration_hours, location, 
           max_participants, status, now))
     webinar_id = cursor.lastrowid
+    db_writer.after_commit(status_scheduler.schedule, "webinars", webinar_id, (date_time, duration_hours), status)
+    db_writer.after_commit(reminder_scheduler.schedule, "webinars", webinar_id, (date_time, duration_hours), status)
     conn.commit()
     conn.close()
     return webinar_id
 
+WEBINAR_REGISTRATION = statement("webinar_registrations.find", '''
+    SELECT * FROM WebinarRegistrations
+    WHERE user_id = ? AND webinar_id = ?
+''')
+WEBINAR_CAPACITY = statement("webinars.capacity", "SELECT max_participants FROM Webinars WHERE id = ?")
+WEBINAR_REGISTRATION_COUNT = statement("webinar_registrations.count", "SELECT COUNT(*) FROM WebinarRegistrations WHERE webinar_id = ?")
+WEBINAR_REGISTRATION_INSERT = statement("webinar_registrations.insert", '''
+    INSERT INTO WebinarRegistrations (user_id, webinar_id, created_at)
+    VALUES (?, ?, ?)
+''')
+
+@db_writer.operation
 def register_for_webinar(user_id: int, webinar_id: int):
-    """Регистрация пользователя на вебинар"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    # Проверяем, не зарегистрирован ли уже
-    cursor.execute('''
-        SELECT * FROM WebinarRegistrations
-        WHERE user_id = ? AND webinar_id = ?
-    ''', (user_id, webinar_id))
-    if cursor.fetchone():
-        conn.close()
-        raise ValueError("Вы уже зарегистрированы на этот вебинар")
-    
-    # Проверяем максимальное количество участников
-    cursor.execute('SELECT max_participants FROM Webinars WHERE id = ?', (webinar_id,))
-    result = cursor.fetchone()
-    if result and result[0]:
-        cursor.execute('SELECT COUNT(*) FROM WebinarRegistrations WHERE webinar_id = ?', (webinar_id,))
-        current_count = cursor.fetchone()[0]
-        if current_count >= result[0]:
-            conn.close()
-            raise ValueError("Достигнуто максимальное количество участников")
-    
-    now = datetime.now().isoformat()
-    cursor.execute('''
-        INSERT INTO WebinarRegistrations (user_id, webinar_id, created_at)
-        VALUES (?, ?, ?)
-    ''', (user_id, webinar_id, now))
-    registration_id = cursor.lastrowid
-    conn.commit()
-    conn.close()
-    return registration_id
+    """Регистрация пользователя на вебинар (без листа ожидания: при заполненном вебинаре - ошибка)"""
+    return _enroll(ENROLLMENTS["webinar"], user_id, webinar_id, waitlist=False)["registration_id"]
+
+USER_WEBINARS = statement("webinar_registrations.by_user", '''
+    SELECT w.*, wr.created_at as registration_date
+    FROM Webinars w
+    JOIN WebinarRegistrations wr ON w.id = wr.webinar_id
+    WHERE wr.user_id = ?
+    ORDER BY w.date_time ASC
+''')
 
 def get_user_webinar_registrations(user_id: int):
     """Получение всех регистраций пользователя на вебинары"""
     conn = get_db_connection()
     cursor = conn.cursor()
-    cursor.execute('''
-        SELECT w.*, wr.created_at as registration_date
-        FROM Webinars w
-        JOIN WebinarRegistrations wr ON w.id = wr.webinar_id
-        WHERE wr.user_id = ?
-        ORDER BY w.date_time ASC
-    ''', (user_id,))
+    cursor.execute(USER_WEBINARS, (user_id,))
     registrations = [dict(row) for row in cursor.fetchall()]
     conn.close()
     return registrations
 
+WEBINAR_REGISTRATION_DELETE = statement("webinar_registrations.delete", '''
+    DELETE FROM WebinarRegistrations
+    WHERE user_id = ? AND webinar_id = ?
+''')
+
+@db_writer.operation
 def cancel_webinar_registration(user_id: int, webinar_id: int):
     """Отмена регистрации на вебинар"""
     conn = get_db_connection()
     cursor = conn.cursor()
-    cursor.execute('''
-        DELETE FROM WebinarRegistrations
-        WHERE user_id = ? AND webinar_id = ?
-    ''', (user_id, webinar_id))
-    conn.commit()
+    cursor.execute(WEBINAR_REGISTRATION_DELETE, (user_id, webinar_id))
     deleted = cursor.rowcount
+    if deleted:
+        now = datetime.now().isoformat()
+        record_activity(cursor, "webinar_registrations", "cancelled", now)
+        # Освободившееся место сразу занимает первый в листе ожидания
+        _promote(cursor, ENROLLMENTS["webinar"], webinar_id, now)
+    conn.commit()
     conn.close()
     if deleted == 0:
         raise ValueError("Регистрация не найдена")
@@ -971,10 +1661,7 @@ def is_user_registered_for_webinar(user_id: int, webinar_id: int):
     """Проверка, зарегистрирован ли пользователь на вебинар"""
     conn = get_db_connection()
     cursor = conn.cursor()
-    cursor.execute('''
-        SELECT * FROM WebinarRegistrations
-        WHERE user_id = ? AND webinar_id = ?
-    ''', (user_id, webinar_id))
+    cursor.execute(WEBINAR_REGISTRATION, (user_id, webinar_id))
     result = cursor.fetchone()
     conn.close()
     return result is not None
@@ -983,40 +1670,74 @@ def get_webinar_participant_count(webinar_id: int):
     """Получение количества зарегистрированных участников вебинара"""
     conn = get_db_connection()
     cursor = conn.cursor()
-    cursor.execute('SELECT COUNT(*) FROM WebinarRegistrations WHERE webinar_id = ?', (webinar_id,))
+    cursor.execute(WEBINAR_REGISTRATION_COUNT, (webinar_id,))
     count = cursor.fetchone()[0]
     conn.close()
     return count
 
+WEBINAR_REGISTRATION_COUNTS = template("webinar_registrations.counts", '''
+    SELECT webinar_id, COUNT(*) FROM WebinarRegistrations
+    WHERE webinar_id IN ({placeholders})
+    GROUP BY webinar_id
+''')
+
+def get_webinar_participant_counts(webinar_ids: List[int]):
+    """Количество участников по каждому вебинару одним запросом"""
+    return _registration_counts(WEBINAR_REGISTRATION_COUNTS, webinar_ids)
+
+def _registration_counts(query, event_ids: List[int]):
+    counts = {event_id: 0 for event_id in event_ids}
+    if not counts:
+        return counts
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    placeholders = ", ".join("?" * len(counts))
+    cursor.execute(query.format(placeholders=placeholders), list(counts))
+    counts.update(dict(cursor.fetchall()))
+    conn.close()
+    return counts
+
 # ========== Функции для работы с курсами ==========
+COURSES_BY_STATUS = statement("courses.by_status", '''
+    SELECT * FROM Courses
+    WHERE status = ?
+    ORDER BY start_date ASC
+''')
+ALL_COURSES = statement("courses.all", '''
+    SELECT * FROM Courses
+    ORDER BY start_date ASC
+''')
+
 def get_all_courses(status_filter: Optional[str] = None):
     """Получение всех курсов"""
     conn = get_db_connection()
     cursor = conn.cursor()
     if status_filter:
-        cursor.execute('''
-            SELECT * FROM Courses
-            WHERE status = ?
-            ORDER BY start_date ASC
-        ''', (status_filter,))
+        cursor.execute(COURSES_BY_STATUS, (status_filter,))
     else:
-        cursor.execute('''
-            SELECT * FROM Courses
-            ORDER BY start_date ASC
-        ''')
+        cursor.execute(ALL_COURSES)
     courses = [dict(row) for row in cursor.fetchall()]
     conn.close()
     return courses
 
+COURSE_BY_ID = statement("courses.by_id", "SELECT * FROM Courses WHERE id = ?")
+
 def get_course_by_id(course_id: int):
     """Получение курса по ID"""
     conn = get_db_connection()
     cursor = conn.cursor()
-    cursor.execute('SELECT * FROM Courses WHERE id = ?', (course_id,))
+    cursor.execute(COURSE_BY_ID, (course_id,))
     course = cursor.fetchone()
     conn.close()
     return dict(course) if course else None
 
+COURSE_INSERT = statement("courses.insert", '''
+    INSERT INTO Courses (name, description, instructor, start_date, end_date,
+                        hours_per_week, max_students, status, certificate_available, created_at)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+''')
+
+@db_writer.operation
 def create_course(name: str, description: str, instructor: str, start_date: str, end_date: str,
                   hours_per_week: Optional[int] = None, max_students: Optional[int] = None,
                   status: str = "upcoming", certificate_available: bool = False):
@@ -1024,76 +1745,67 @@ def create_course(name: str, description: str, instructor: str, start_date: str,
     conn = get_db_connection()
     cursor = conn.cursor()
     now = datetime.now().isoformat()
-    cursor.execute('''
-        INSERT INTO Courses (name, description, instructor, start_date, end_date,
-                            hours_per_week, max_students, status, certificate_available, created_at)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-    ''', (name, description, instructor, start_date, end_date, hours_per_week,
+    status = status_scheduler.current_status("courses", (start_date, end_date), status)
+    cursor.execute(COURSE_INSERT, (name, description, instructor, start_date, end_date, hours_per_week,
           max_students, status, certificate_available, now))
     course_id = cursor.lastrowid
+    db_writer.after_commit(status_scheduler.schedule, "courses", course_id, (start_date, end_date), status)
+    db_writer.after_commit(reminder_scheduler.schedule, "courses", course_id, (start_date, end_date), status)
     conn.commit()
     conn.close()
     return course_id
 
+COURSE_REGISTRATION = statement("course_registrations.find", '''
+    SELECT * FROM CourseRegistrations
+    WHERE user_id = ? AND course_id = ?
+''')
+COURSE_CAPACITY = statement("courses.capacity", "SELECT max_students FROM Courses WHERE id = ?")
+COURSE_REGISTRATION_COUNT = statement("course_registrations.count", "SELECT COUNT(*) FROM CourseRegistrations WHERE course_id = ?")
+COURSE_REGISTRATION_INSERT = statement("course_registrations.insert", '''
+    INSERT INTO CourseRegistrations (user_id, course_id, created_at)
+    VALUES (?, ?, ?)
+''')
+
+@db_writer.operation
 def register_for_course(user_id: int, course_id: int):
-    """Регистрация пользователя на курс"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    # Проверяем, не зарегистрирован ли уже
-    cursor.execute('''
-        SELECT * FROM CourseRegistrations
-        WHERE user_id = ? AND course_id = ?
-    ''', (user_id, course_id))
-    if cursor.fetchone():
-        conn.close()
-        raise ValueError("Вы уже зарегистрированы на этот курс")
-    
-    # Проверяем максимальное количество студентов
-    cursor.execute('SELECT max_students FROM Courses WHERE id = ?', (course_id,))
-    result = cursor.fetchone()
-    if result and result[0]:
-        cursor.execute('SELECT COUNT(*) FROM CourseRegistrations WHERE course_id = ?', (course_id,))
-        current_count = cursor.fetchone()[0]
-        if current_count >= result[0]:
-            conn.close()
-            raise ValueError("Достигнуто максимальное количество студентов")
-    
-    now = datetime.now().isoformat()
-    cursor.execute('''
-        INSERT INTO CourseRegistrations (user_id, course_id, created_at)
-        VALUES (?, ?, ?)
-    ''', (user_id, course_id, now))
-    registration_id = cursor.lastrowid
-    conn.commit()
-    conn.close()
-    return registration_id
+    """Регистрация пользователя на курс (без листа ожидания: при заполненном курсе - ошибка)"""
+    return _enroll(ENROLLMENTS["course"], user_id, course_id, waitlist=False)["registration_id"]
+
+USER_COURSES = statement("course_registrations.by_user", '''
+    SELECT c.*, cr.created_at as registration_date
+    FROM Courses c
+    JOIN CourseRegistrations cr ON c.id = cr.course_id
+    WHERE cr.user_id = ?
+    ORDER BY c.start_date ASC
+''')
 
 def get_user_course_registrations(user_id: int):
     """Получение всех регистраций пользователя на курсы"""
     conn = get_db_connection()
     cursor = conn.cursor()
-    cursor.execute('''
-        SELECT c.*, cr.created_at as registration_date
-        FROM Courses c
-        JOIN CourseRegistrations cr ON c.id = cr.course_id
-        WHERE cr.user_id = ?
-        ORDER BY c.start_date ASC
-    ''', (user_id,))
+    cursor.execute(USER_COURSES, (user_id,))
     registrations = [dict(row) for row in cursor.fetchall()]
     conn.close()
     return registrations
 
+COURSE_REGISTRATION_DELETE = statement("course_registrations.delete", '''
+    DELETE FROM CourseRegistrations
+    WHERE user_id = ? AND course_id = ?
+''')
+
+@db_writer.operation
 def cancel_course_registration(user_id: int, course_id: int):
     """Отмена регистрации на курс"""
     conn = get_db_connection()
     cursor = conn.cursor()
-    cursor.execute('''
-        DELETE FROM CourseRegistrations
-        WHERE user_id = ? AND course_id = ?
-    ''', (user_id, course_id))
-    conn.commit()
+    cursor.execute(COURSE_REGISTRATION_DELETE, (user_id, course_id))
     deleted = cursor.rowcount
+    if deleted:
+        now = datetime.now().isoformat()
+        record_activity(cursor, "course_registrations", "cancelled", now)
+        # Освободившееся место сразу занимает первый в листе ожидания
+        _promote(cursor, ENROLLMENTS["course"], course_id, now)
+    conn.commit()
     conn.close()
     if deleted == 0:
         raise ValueError("Регистрация не найдена")
@@ -1103,10 +1815,7 @@ def is_user_registered_for_course(user_id: int, course_id: int):
     """Проверка, зарегистрирован ли пользователь на курс"""
     conn = get_db_connection()
     cursor = conn.cursor()
-    cursor.execute('''
-        SELECT * FROM CourseRegistrations
-        WHERE user_id = ? AND course_id = ?
-    ''', (user_id, course_id))
+    cursor.execute(COURSE_REGISTRATION, (user_id, course_id))
     result = cursor.fetchone()
     conn.close()
     return result is not None
@@ -1115,47 +1824,1151 @@ def get_course_participant_count(course_id: int):
     """Получение количества зарегистрированных студентов на курс"""
     conn = get_db_connection()
     cursor = conn.cursor()
-    cursor.execute('SELECT COUNT(*) FROM CourseRegistrations WHERE course_id = ?', (course_id,))
+    cursor.execute(COURSE_REGISTRATION_COUNT, (course_id,))
     count = cursor.fetchone()[0]
     conn.close()
     return count
 
-def get_expert_audit_log(expert_id: int, hackathon_id: int = None):
-    """Получение лога действий эксперта"""
+COURSE_REGISTRATION_COUNTS = template("course_registrations.counts", '''
+    SELECT course_id, COUNT(*) FROM CourseRegistrations
+    WHERE course_id IN ({placeholders})
+    GROUP BY course_id
+''')
+
+def get_course_participant_counts(course_ids: List[int]):
+    """Количество студентов по каждому курсу одним запросом"""
+    return _registration_counts(COURSE_REGISTRATION_COUNTS, course_ids)
+
+# ========== Листы ожидания ==========
+class EnrollmentKind:
+    """Регистрации на события одного вида (вебинары или курсы)
+
+    name - вид события в Waitlists, activity - сущность в агрегатах активности,
+    errors - сообщения о повторной регистрации и о заполненном событии.
+    """
+
+    def __init__(self, name: str, activity: str, registration, capacity, count, insert, errors):
+        self.name = name
+        self.activity = activity
+        self.registration = registration
+        self.capacity = capacity
+        self.count = count
+        self.insert = insert
+        self.errors = errors
+
+ENROLLMENTS = {
+    "webinar": EnrollmentKind(
+        "webinar", "webinar_registrations", WEBINAR_REGISTRATION, WEBINAR_CAPACITY,
+        WEBINAR_REGISTRATION_COUNT, WEBINAR_REGISTRATION_INSERT,
+        ("Вы уже зарегистрированы на этот вебинар", "Достигнуто максимальное количество участников")
+    ),
+    "course": EnrollmentKind(
+        "course", "course_registrations", COURSE_REGISTRATION, COURSE_CAPACITY,
+        COURSE_REGISTRATION_COUNT, COURSE_REGISTRATION_INSERT,
+        ("Вы уже зарегистрированы на этот курс", "Достигнуто максимальное количество студентов")
+    ),
+}
+
+WAITLIST_ENTRY = statement("waitlists.find", "SELECT id FROM Waitlists WHERE kind = ? AND event_id = ? AND user_id = ?")
+WAITLIST_ANY = statement("waitlists.any", "SELECT 1 FROM Waitlists WHERE kind = ? AND event_id = ? LIMIT 1")
+WAITLIST_HEAD = statement("waitlists.head", '''
+    SELECT id, user_id FROM Waitlists
+    WHERE kind = ? AND event_id = ?
+    ORDER BY id
+    LIMIT ?
+''')
+WAITLIST_INSERT = statement("waitlists.insert", '''
+    INSERT INTO Waitlists (kind, event_id, user_id, created_at)
+    VALUES (?, ?, ?, ?)
+''')
+WAITLIST_REMOVE = statement("waitlists.remove", "DELETE FROM Waitlists WHERE id = ?")
+WAITLIST_DELETE = statement("waitlists.delete", "DELETE FROM Waitlists WHERE kind = ? AND event_id = ? AND user_id = ?")
+
+def _free_seats(cursor, kind: EnrollmentKind, event_id: int):
+    """Число свободных мест события или None, если мест не ограничено"""
+    cursor.execute(kind.capacity, (event_id,))
+    result = cursor.fetchone()
+    if not result or not result[0]:
+        return None
+    cursor.execute(kind.count, (event_id,))
+    return max(result[0] - cursor.fetchone()[0], 0)
+
+def _promote(cursor, kind: EnrollmentKind, event_id: int, now: str) -> list:
+    """Регистрация первых в листе ожидания на свободные места (в транзакции вызывающего): [(user_id, registration_id)]"""
+    if not schema.waitlists:
+        return []
+    free = _free_seats(cursor, kind, event_id)
+    if free == 0:
+        return []
+    # LIMIT -1 в SQLite - без ограничения
+    cursor.execute(WAITLIST_HEAD, (kind.name, event_id, -1 if free is None else free))
+    promoted = []
+    for entry_id, user_id in cursor.fetchall():
+        cursor.execute(WAITLIST_REMOVE, (entry_id,))
+        cursor.execute(kind.insert, (user_id, event_id, now))
+        promoted.append((user_id, cursor.lastrowid))
+        db_writer.after_commit(waitlists.on_removed, kind.name, event_id, user_id)
+    if promoted:
+        record_activity(cursor, kind.activity, "registered", now, len(promoted))
+    return promoted
+
+def _enroll(kind: EnrollmentKind, user_id: int, event_id: int, waitlist: bool) -> dict:
+    """Регистрация на событие, а без свободных мест - постановка в лист ожидания
+
+    Без листа ожидания заполненное событие - ошибка, как и раньше. Пока очередь
+    не пуста, новые пользователи встают в её конец, даже если место есть:
+    места достаются в порядке постановки. Возвращает {"status": "registered",
+    "registration_id"} или {"status": "waitlisted"}.
+    """
+    waitlist = waitlist and schema.waitlists
+    conn = get_db_connection()
+    cursor = conn.cursor()
+
+    cursor.execute(kind.registration, (user_id, event_id))
+    if cursor.fetchone():
+        conn.close()
+        raise ValueError(kind.errors[0])
+
+    queued = False
+    if waitlist:
+        cursor.execute(WAITLIST_ENTRY, (kind.name, event_id, user_id))
+        if cursor.fetchone():
+            conn.close()
+            raise ValueError("Вы уже в листе ожидания")
+        cursor.execute(WAITLIST_ANY, (kind.name, event_id))
+        queued = cursor.fetchone() is not None
+
+    now = datetime.now().isoformat()
+    if not queued and _free_seats(cursor, kind, event_id) != 0:
+        cursor.execute(kind.insert, (user_id, event_id, now))
+        registration_id = cursor.lastrowid
+        record_activity(cursor, kind.activity, "registered", now)
+        conn.commit()
+        conn.close()
+        return {"status": "registered", "registration_id": registration_id}
+
+    if not waitlist:
+        conn.close()
+        raise ValueError(kind.errors[1])
+
+    cursor.execute(WAITLIST_INSERT, (kind.name, event_id, user_id, now))
+    db_writer.after_commit(waitlists.on_added, kind.name, event_id, user_id, cursor.lastrowid)
+    # Места могли освободиться без отмены (например, при увеличении вместимости)
+    registrations = dict(_promote(cursor, kind, event_id, now))
+    conn.commit()
+    conn.close()
+
+    if user_id in registrations:
+        return {"status": "registered", "registration_id": registrations[user_id]}
+    return {"status": "waitlisted"}
+
+@db_writer.operation
+def write_enrollment(kind: str, user_id: int, event_id: int) -> dict:
+    """Операция записи для enroll: регистрация или постановка в лист ожидания без расчёта позиции"""
+    return _enroll(ENROLLMENTS[kind], user_id, event_id, waitlist=True)
+
+def enroll(kind: str, user_id: int, event_id: int) -> dict:
+    """Регистрация на вебинар или курс (kind - "webinar" или "course") либо постановка в лист ожидания
+
+    Возвращает {"status": "registered", "registration_id"} или
+    {"status": "waitlisted", "position", "length"}. Позиция считается после
+    фиксации, вне потока записи: он не ждёт загрузки листов ожидания.
+    """
+    result = write_enrollment(kind, user_id, event_id)
+    if result["status"] == "waitlisted":
+        result.update(get_waitlist_position(kind, event_id, user_id))
+    return result
+
+@db_writer.operation
+def leave_waitlist(kind: str, user_id: int, event_id: int):
+    """Выход из листа ожидания"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute(WAITLIST_DELETE, (kind, event_id, user_id))
+    deleted = cursor.rowcount
+    if deleted:
+        db_writer.after_commit(waitlists.on_removed, kind, event_id, user_id)
+    conn.commit()
+    conn.close()
+    if deleted == 0:
+        raise ValueError("Вы не в листе ожидания")
+    return True
+
+def get_waitlists():
+    """Получение листов ожидания (загружаются из БД при первом обращении)"""
+    if waitlists.loaded:
+        waitlists.hits += 1
+    else:
+        waitlists.misses += 1
+        # Отдельное соединение: общее соединение операции записи видит незафиксированное
+        conn = _open_connection()
+        waitlists.load(conn)
+        conn.close()
+    return waitlists
+
+def get_waitlist_position(kind: str, event_id: int, user_id: int) -> dict:
+    """Позиция пользователя в листе ожидания (None - не в очереди) и длина очереди"""
+    if not schema.waitlists:
+        return {"position": None, "length": 0}
+    registry = get_waitlists()
+    return {"position": registry.position(kind, event_id, user_id), "length": registry.length(kind, event_id)}
+
+EXPERT_AUDIT_BY_HACKATHON = statement("audit_log.by_expert_hackathon", '''
+    SELECT * FROM ExpertAuditLog
+    WHERE expert_id = ? AND hackathon_id = ?
+    ORDER BY created_at DESC, id DESC
+    LIMIT ? OFFSET ?
+''')
+EXPERT_AUDIT = statement("audit_log.by_expert", '''
+    SELECT * FROM ExpertAuditLog
+    WHERE expert_id = ?
+    ORDER BY created_at DESC, id DESC
+    LIMIT ? OFFSET ?
+''')
+
+def get_expert_audit_log(expert_id: int, hackathon_id: int = None, limit: int = 50, offset: int = 0):
+    """Получение лога действий эксперта (постранично, новые сначала)"""
+    # Дожидаемся записи уже поставленных в очередь действий
+    audit_writer.flush()
     conn = get_db_connection()
     cursor = conn.cursor()
     if hackathon_id:
-        cursor.execute('''
-            SELECT * FROM ExpertAuditLog
-            WHERE expert_id = ? AND hackathon_id = ?
-            ORDER BY created_at DESC
-        ''', (expert_id, hackathon_id))
+        cursor.execute(EXPERT_AUDIT_BY_HACKATHON, (expert_id, hackathon_id, limit, offset))
     else:
-        cursor.execute('''
-            SELECT * FROM ExpertAuditLog
-            WHERE expert_id = ?
-            ORDER BY created_at DESC
-        ''', (expert_id,))
+        cursor.execute(EXPERT_AUDIT, (expert_id, limit, offset))
     logs = [dict(row) for row in cursor.fetchall()]
     conn.close()
     return logs
 
-def migrate_hackathons_table():
-    """Добавление новых колонок в таблицу Hackathons если их нет"""
+def get_audit_retention(hackathon_id: int):
+    """Срок хранения журнала экспертов хакатона в днях"""
+    conn = get_db_connection()
+    retention_days = audit_archive.get_retention_days(conn, hackathon_id)
+    conn.close()
+    return retention_days
+
+@db_writer.operation
+def set_audit_retention(hackathon_id: int, retention_days: int):
+    """Установка срока хранения журнала экспертов для хакатона"""
+    conn = get_db_connection()
+    audit_archive.set_retention_days(conn, hackathon_id, retention_days)
+    conn.close()
+
+@db_writer.operation
+def archive_audit_segment(hackathon_id: int, path: str, rows, now: str) -> bool:
+    """Регистрация архивного сегмента журнала и удаление его записей из горячей таблицы"""
+    conn = get_db_connection()
+    try:
+        return audit_archive.register_segment(conn, hackathon_id, path, rows, now)
+    finally:
+        conn.close()
+
+def rotate_audit_log():
+    """Перенос устаревших записей журнала экспертов в архив"""
+    audit_writer.flush()
+    conn = _open_connection()
+    try:
+        return audit_archive.rotate(conn, archive_audit_segment)
+    finally:
+        conn.close()
+
+def query_audit_log(expert_id: int = None, hackathon_id: int = None, start: str = None,
+                    end: str = None, limit: int = 50, offset: int = 0):
+    """Журнал экспертов за период с учётом архивных сегментов; дата без времени в end - весь этот день"""
+    start = period_moment(start) if start else None
+    end = period_moment(end, end=True) if end else None
+    audit_writer.flush()
+    conn = get_db_connection()
+    try:
+        return audit_archive.query(conn, expert_id, hackathon_id, start, end, limit, offset)
+    finally:
+        conn.close()
+
+# ========== Статистика (по копии БД для аналитики) ==========
+USERS_COUNT = statement("statistics.users", "SELECT COUNT(*) FROM Users")
+USERS_BY_ROLE_COUNT = statement("statistics.users_by_role", "SELECT COUNT(*) FROM Users WHERE role = ?")
+USERS_IN_MONTH_COUNT = statement(
+    "statistics.users_in_month", "SELECT COUNT(*) FROM Users WHERE strftime('%Y-%m', created_at) = ?"
+)
+USERS_BY_CITY = statement(
+    "statistics.users_by_city", "SELECT city, COUNT(*) FROM Users WHERE city IS NOT NULL GROUP BY city"
+)
+USERS_LOOKING_FOR_TEAM_COUNT = statement(
+    "statistics.users_looking_for_team", "SELECT COUNT(*) FROM Users WHERE looking_for_team = 1"
+)
+
+USER_SUMMARY_COUNTS = statement("statistics.user_summary_counts", '''
+    SELECT dimension, value, count FROM DemographicCounts
+    WHERE dimension IN ('role', 'city', 'looking_for_team') AND value2 = ''
+''')
+USERS_MONTH_ROLLUP = statement("statistics.users_month_rollup", '''
+    SELECT COALESCE(SUM(count), 0) FROM ActivityRollups
+    WHERE entity = 'users' AND granularity = 'month' AND bucket_start = ? AND event = 'registered'
+''')
+
+def _user_statistics_from_counts(cursor):
+    """Сводка по демографическим счётчикам и агрегатам регистраций, без прохода по Users"""
+    counts = {"role": {}, "city": {}, "looking_for_team": {}}
+    cursor.execute(USER_SUMMARY_COUNTS)
+    for dimension, value, count in cursor.fetchall():
+        counts[dimension][value] = count
+    if schema.activity_rollups:
+        cursor.execute(USERS_MONTH_ROLLUP, (datetime.now().strftime("%Y-%m-01"),))
+    else:
+        cursor.execute(USERS_IN_MONTH_COUNT, (datetime.now().strftime("%Y-%m"),))
+    users_this_month = cursor.fetchone()[0]
+    return {
+        "totalUsers": sum(counts["role"].values()),
+        "adminUsers": counts["role"].get("admin", 0),
+        "regularUsers": counts["role"].get("user", 0),
+        "usersThisMonth": users_this_month,
+        # Пустой город не считается указанным
+        "citiesStats": {city: count for city, count in counts["city"].items() if city},
+        "lookingForTeam": counts["looking_for_team"].get("1", 0)
+    }
+
+def get_user_statistics():
+    """Сводка по пользователям"""
+    conn = get_analytics_connection()
+    cursor = conn.cursor()
+    if schema.demographics:
+        stats = _user_statistics_from_counts(cursor)
+        conn.close()
+        return stats
+    cursor.execute(USERS_COUNT)
+    total_users = cursor.fetchone()[0]
+    cursor.execute(USERS_BY_ROLE_COUNT, ("admin",))
+    admin_users = cursor.fetchone()[0]
+    cursor.execute(USERS_BY_ROLE_COUNT, ("user",))
+    regular_users = cursor.fetchone()[0]
+    cursor.execute(USERS_IN_MONTH_COUNT, (datetime.now().strftime("%Y-%m"),))
+    users_this_month = cursor.fetchone()[0]
+    cursor.execute(USERS_BY_CITY)
+    cities_stats = dict(cursor.fetchall())
+    cursor.execute(USERS_LOOKING_FOR_TEAM_COUNT)
+    looking_for_team = cursor.fetchone()[0]
+    conn.close()
+    return {
+        "totalUsers": total_users,
+        "adminUsers": admin_users,
+        "regularUsers": regular_users,
+        "usersThisMonth": users_this_month,
+        "citiesStats": cities_stats,
+        "lookingForTeam": looking_for_team
+    }
+
+AGE_DISTRIBUTION = statement("statistics.age_distribution", '''
+    SELECT
+        CASE
+            WHEN age < 18 THEN 'До 18'
+            WHEN age BETWEEN 18 AND 25 THEN '18-25'
+            WHEN age BETWEEN 26 AND 35 THEN '26-35'
+            WHEN age BETWEEN 36 AND 45 THEN '36-45'
+            WHEN age > 45 THEN '45+'
+            ELSE 'Не указан'
+        END as age_group,
+        COUNT(*) as count
+    FROM Users
+    GROUP BY age_group
+    ORDER BY
+        CASE age_group
+            WHEN 'До 18' THEN 1
+            WHEN '18-25' THEN 2
+            WHEN '26-35' THEN 3
+            WHEN '36-45' THEN 4
+            WHEN '45+' THEN 5
+            ELSE 6
+        END
+''')
+
+def get_age_statistics():
+    """Распределение пользователей по возрастным группам: [(группа, количество)]"""
+    if schema.demographics:
+        return list(get_demographics("age")["counts"].items())
+    conn = get_analytics_connection()
+    cursor = conn.cursor()
+    cursor.execute(AGE_DISTRIBUTION)
+    age_data = cursor.fetchall()
+    conn.close()
+    return [tuple(row) for row in age_data]
+
+REGISTRATION_TIMELINE = statement("statistics.registration_timeline", '''
+    SELECT
+        DATE(created_at) as registration_date,
+        COUNT(*) as user_count
+    FROM Users
+    WHERE created_at >= date('now', '-30 days')
+    GROUP BY DATE(created_at)
+    ORDER BY registration_date
+''')
+
+REGISTRATION_ROLLUP_TIMELINE = statement("statistics.registration_rollup_timeline", '''
+    SELECT bucket_start, count FROM ActivityRollups
+    WHERE entity = 'users' AND granularity = 'day' AND event = 'registered' AND bucket_start >= ?
+    ORDER BY bucket_start
+''')
+
+def get_registration_statistics():
+    """Регистрации пользователей по дням за последние 30 дней: [(дата, количество)]"""
+    conn = get_analytics_connection()
+    cursor = conn.cursor()
+    if schema.activity_rollups:
+        cursor.execute(REGISTRATION_ROLLUP_TIMELINE, ((date.today() - timedelta(days=30)).isoformat(),))
+    else:
+        cursor.execute(REGISTRATION_TIMELINE)
+    timeline_data = cursor.fetchall()
+    conn.close()
+    return [tuple(row) for row in timeline_data]
+
+# ========== Агрегаты событий по дням, неделям и месяцам ==========
+ACTIVITY_GRANULARITIES = ("day", "week", "month")
+# Типы событий по сущностям
+ACTIVITY_EVENTS = {
+    "users": ("registered",),
+    "participations": ("joined", "left"),
+    "teams": ("created",),
+    "webinar_registrations": ("registered", "cancelled"),
+    "course_registrations": ("registered", "cancelled"),
+}
+# Таблицы, по строкам которых восстанавливаются события создания
+ACTIVITY_SOURCES = {
+    ("users", "registered"): "Users",
+    ("participations", "joined"): "Participations",
+    ("teams", "created"): "Teams",
+    ("webinar_registrations", "registered"): "WebinarRegistrations",
+    ("course_registrations", "registered"): "CourseRegistrations",
+}
+# Наибольшее число интервалов в одном ответе
+MAX_TIMELINE_BUCKETS = 1000
+
+def activity_bucket(day: str, granularity: str) -> str:
+    """Начало дня, недели (понедельник) или месяца для даты YYYY-MM-DD"""
+    if granularity == "day":
+        return day
+    if granularity == "month":
+        return day[:7] + "-01"
+    moment = date.fromisoformat(day)
+    return (moment - timedelta(days=moment.weekday())).isoformat()
+
+def _next_bucket(bucket: date, granularity: str) -> date:
+    if granularity == "day":
+        return bucket + timedelta(days=1)
+    if granularity == "week":
+        return bucket + timedelta(days=7)
+    return (bucket.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+ACTIVITY_UPSERT = statement("activity_rollups.upsert", '''
+    INSERT INTO ActivityRollups (entity, granularity, bucket_start, event, count)
+    VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT (entity, granularity, bucket_start, event) DO UPDATE SET
+        count = count + excluded.count
+''')
+
+def record_activity(cursor, entity: str, event: str, timestamp: str, count: int = 1):
+    """Учёт события в агрегатах по дням, неделям и месяцам (в транзакции вызывающего)"""
+    if not schema.activity_rollups:
+        return
+    day = timestamp[:10]
+    cursor.executemany(ACTIVITY_UPSERT, [
+        (entity, granularity, activity_bucket(day, granularity), event, count)
+        for granularity in ACTIVITY_GRANULARITIES
+    ])
+
+ACTIVITY_CLEAR = statement("activity_rollups.clear", "DELETE FROM ActivityRollups WHERE entity = ? AND event = ?")
+ACTIVITY_SOURCE = template("activity_rollups.source", '''
+    SELECT substr(created_at, 1, 10) AS day, COUNT(*) FROM {table}
+    WHERE created_at IS NOT NULL
+    GROUP BY day
+''')
+
+def rebuild_activity_rollups(cursor, entities=None) -> dict:
+    """Пересчёт событий создания по строкам таблиц: {сущность: событий}
+
+    Отмены и выходы восстановить нельзя - удалённых строк нет, поэтому
+    они учитываются только при записи и пересчётом не затрагиваются.
+    """
+    totals = {}
+    for (entity, event), table in ACTIVITY_SOURCES.items():
+        if entities and entity not in entities:
+            continue
+        cursor.execute(ACTIVITY_CLEAR, (entity, event))
+        cursor.execute(ACTIVITY_SOURCE.format(table=table))
+        buckets = {}
+        for day, count in cursor.fetchall():
+            for granularity in ACTIVITY_GRANULARITIES:
+                key = (granularity, activity_bucket(day, granularity))
+                buckets[key] = buckets.get(key, 0) + count
+        cursor.executemany(ACTIVITY_UPSERT, [
+            (entity, granularity, bucket, event, count) for (granularity, bucket), count in buckets.items()
+        ])
+        totals[entity] = sum(count for (granularity, _), count in buckets.items() if granularity == "day")
+    return totals
+
+@db_writer.operation
+def backfill_activity_rollups(entities=None) -> dict:
+    """Пересчёт агрегатов событий в отдельной операции записи"""
+    conn = get_db_connection()
+    totals = rebuild_activity_rollups(conn.cursor(), entities)
+    conn.commit()
+    conn.close()
+    return totals
+
+ACTIVITY_BUCKETS = statement("activity_rollups.buckets", '''
+    SELECT bucket_start, event, count FROM ActivityRollups
+    WHERE entity = ? AND granularity = ? AND bucket_start BETWEEN ? AND ?
+''')
+
+def _rollup_buckets(entity: str, granularity: str, first: str, last: str) -> list:
+    if not schema.activity_rollups:
+        return []
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute(ACTIVITY_BUCKETS, (entity, granularity, first, last))
+    rows = cursor.fetchall()
+    conn.close()
+    return rows
+
+def get_activity_timeline(entity: str = "users", granularity: str = "day",
+                          start: str = None, end: str = None) -> dict:
+    """События сущности по интервалам за период (по умолчанию - последние 30 дней)
+
+    Ответ читается из агрегатов: одна строка на интервал и тип события,
+    пустые интервалы заполняются нулями.
+    """
+    return activity_timeline(entity, granularity, start, end, _rollup_buckets)
+
+def activity_timeline(entity: str, granularity: str, start: Optional[str], end: Optional[str], load) -> dict:
+    """Ответ get_activity_timeline; load(entity, granularity, first, last) -> [(bucket_start, event, count)]"""
+    if entity not in ACTIVITY_EVENTS:
+        raise ValueError(f"Неизвестная сущность. Допустимые: {', '.join(ACTIVITY_EVENTS)}")
+    if granularity not in ACTIVITY_GRANULARITIES:
+        raise ValueError(f"Неверный интервал. Допустимые: {', '.join(ACTIVITY_GRANULARITIES)}")
+    try:
+        end_day = date.fromisoformat(end[:10]) if end else date.today()
+        start_day = date.fromisoformat(start[:10]) if start else end_day - timedelta(days=29)
+    except ValueError:
+        raise ValueError("Даты start и end ожидаются в формате YYYY-MM-DD")
+    if start_day > end_day:
+        raise ValueError("start должен быть не позже end")
+
+    first = date.fromisoformat(activity_bucket(start_day.isoformat(), granularity))
+    last = date.fromisoformat(activity_bucket(end_day.isoformat(), granularity))
+    events = ACTIVITY_EVENTS[entity]
+    buckets = {}
+    bucket = first
+    while bucket <= last:
+        if len(buckets) >= MAX_TIMELINE_BUCKETS:
+            raise ValueError(f"Слишком длинный период: больше {MAX_TIMELINE_BUCKETS} интервалов")
+        buckets[bucket.isoformat()] = dict.fromkeys(events, 0)
+        bucket = _next_bucket(bucket, granularity)
+
+    for bucket_start, event, count in load(entity, granularity, first.isoformat(), last.isoformat()):
+        buckets[bucket_start][event] = count
+
+    return {
+        "entity": entity,
+        "granularity": granularity,
+        "start": start_day.isoformat(),
+        "end": end_day.isoformat(),
+        "events": list(events),
+        "totals": {event: sum(counts[event] for counts in buckets.values()) for event in events},
+        "buckets": [{"bucket_start": bucket_start, **counts} for bucket_start, counts in buckets.items()]
+    }
+
+# ========== Демографические агрегаты ==========
+# Измерения; попарные разрезы (город × возраст и т.п.) ведутся для всех пар
+DEMOGRAPHIC_DIMENSIONS = ("age", "city", "basics_knowledge", "looking_for_team", "role")
+DEMOGRAPHIC_PAIRS = tuple(combinations(DEMOGRAPHIC_DIMENSIONS, 2))
+# Колонки Users, изменение которых переносит пользователя между корзинами
+DEMOGRAPHIC_COLUMNS = ("age", "city", "basics_knowledge", "looking_for_team", "role")
+AGE_GROUPS = ("До 18", "18-25", "26-35", "36-45", "45+", "Не указан")
+
+def age_group(age) -> str:
+    """Возрастная группа (те же границы, что в AGE_DISTRIBUTION)"""
+    if not isinstance(age, (int, float)):
+        return "Не указан"
+    if age < 18:
+        return "До 18"
+    if age <= 25:
+        return "18-25"
+    if age <= 35:
+        return "26-35"
+    if age <= 45:
+        return "36-45"
+    return "45+"
+
+def demographic_values(row) -> dict:
+    """Корзины пользователя по строке (age, city, basics_knowledge, looking_for_team, role)"""
+    age, city, basics_knowledge, looking_for_team, role = row
+    return {
+        "age": age_group(age),
+        "city": city or "",
+        "basics_knowledge": basics_knowledge or "",
+        "looking_for_team": "1" if looking_for_team == 1 else "0",
+        "role": role or ""
+    }
+
+def _demographic_keys(values: dict) -> set:
+    keys = {(dimension, values[dimension], "") for dimension in DEMOGRAPHIC_DIMENSIONS}
+    keys.update((f"{first}:{second}", values[first], values[second]) for first, second in DEMOGRAPHIC_PAIRS)
+    return keys
+
+USER_DEMOGRAPHICS = statement("users.demographics", '''
+    SELECT age, city, basics_knowledge, looking_for_team, role FROM Users WHERE id = ?
+''')
+DEMOGRAPHIC_ADD = statement("demographics.add", '''
+    INSERT INTO DemographicCounts (dimension, value, value2, count) VALUES (?, ?, ?, ?)
+    ON CONFLICT (dimension, value, value2) DO UPDATE SET count = count + excluded.count
+''')
+DEMOGRAPHIC_PRUNE = statement("demographics.prune", '''
+    DELETE FROM DemographicCounts WHERE dimension = ? AND value = ? AND value2 = ? AND count <= 0
+''')
+
+def user_demographics(cursor, user_id: int):
+    """Корзины пользователя по текущей строке в БД или None"""
+    if not schema.demographics:
+        return None
+    cursor.execute(USER_DEMOGRAPHICS, (user_id,))
+    row = cursor.fetchone()
+    return demographic_values(tuple(row)) if row else None
+
+def apply_demographic_delta(cursor, old: Optional[dict], new: Optional[dict]):
+    """Перенос пользователя между корзинами (в транзакции вызывающего); None - до создания или после удаления"""
+    if not schema.demographics or old == new:
+        return
+    old_keys = _demographic_keys(old) if old else set()
+    new_keys = _demographic_keys(new) if new else set()
+    removed = old_keys - new_keys
+    cursor.executemany(DEMOGRAPHIC_ADD, [(*key, -1) for key in removed] + [(*key, 1) for key in new_keys - old_keys])
+    cursor.executemany(DEMOGRAPHIC_PRUNE, list(removed))
+
+DEMOGRAPHIC_SOURCE = statement("demographics.source", "SELECT age, city, basics_knowledge, looking_for_team, role FROM Users")
+DEMOGRAPHIC_ALL = statement("demographics.all", "SELECT dimension, value, value2, count FROM DemographicCounts")
+DEMOGRAPHIC_CLEAR = statement("demographics.clear", "DELETE FROM DemographicCounts")
+DEMOGRAPHIC_INSERT = statement("demographics.insert", '''
+    INSERT INTO DemographicCounts (dimension, value, value2, count) VALUES (?, ?, ?, ?)
+''')
+
+def tally_demographics(rows, counts: dict = None) -> dict:
+    """Счётчики по строкам (age, city, basics_knowledge, looking_for_team, role): {(dimension, value, value2): count}"""
+    counts = {} if counts is None else counts
+    for row in rows:
+        for key in _demographic_keys(demographic_values(tuple(row))):
+            counts[key] = counts.get(key, 0) + 1
+    return counts
+
+def count_demographics(cursor) -> dict:
+    """Счётчики полным проходом по Users"""
+    counts = {}
+    cursor.execute(DEMOGRAPHIC_SOURCE)
+    while True:
+        rows = cursor.fetchmany(1000)
+        if not rows:
+            break
+        tally_demographics(rows, counts)
+    return counts
+
+def rebuild_demographics(cursor) -> int:
+    """Пересчёт демографических счётчиков по всей таблице Users"""
+    counts = count_demographics(cursor)
+    cursor.execute(DEMOGRAPHIC_CLEAR)
+    cursor.executemany(DEMOGRAPHIC_INSERT, [(*key, count) for key, count in counts.items()])
+    return len(counts)
+
+@db_writer.operation
+def reconcile_demographics(repair: bool = True) -> dict:
+    """Сверка счётчиков с таблицей Users; при repair счётчики пересчитываются
+
+    Выполняется в потоке записи, поэтому одновременные изменения
+    пользователей не дают ложных расхождений.
+    """
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    expected = count_demographics(cursor)
+    cursor.execute(DEMOGRAPHIC_ALL)
+    stored = {(dimension, value, value2): count for dimension, value, value2, count in cursor.fetchall()}
+    drift = [
+        {"dimension": key[0], "value": key[1], "value2": key[2],
+         "stored": stored.get(key, 0), "expected": expected.get(key, 0)}
+        for key in sorted(expected.keys() | stored.keys()) if stored.get(key, 0) != expected.get(key, 0)
+    ]
+    if repair and drift:
+        cursor.execute(DEMOGRAPHIC_CLEAR)
+        cursor.executemany(DEMOGRAPHIC_INSERT, [(*key, count) for key, count in expected.items()])
+    conn.commit()
+    conn.close()
+    return {"buckets": len(expected), "drift": len(drift), "repaired": bool(repair and drift), "differences": drift[:100]}
+
+DEMOGRAPHIC_DIMENSION = statement("demographics.dimension", '''
+    SELECT value, value2, count FROM DemographicCounts WHERE dimension = ?
+''')
+
+def _ordered(dimension: str, counts: dict) -> dict:
+    if dimension == "age":
+        return {group: counts[group] for group in AGE_GROUPS if group in counts}
+    return dict(sorted(counts.items(), key=lambda item: (-item[1], item[0])))
+
+def demographic_slice(dimension: str, by: str = None) -> tuple:
+    """Проверка измерений разреза: (имя счётчика, измерения в счётчике в обратном порядке)"""
+    for name in (dimension, by):
+        if name is not None and name not in DEMOGRAPHIC_DIMENSIONS:
+            raise ValueError(f"Неизвестное измерение. Допустимые: {', '.join(DEMOGRAPHIC_DIMENSIONS)}")
+    if by == dimension:
+        raise ValueError("Измерения разреза должны различаться")
+    swapped = by is not None and (by, dimension) in DEMOGRAPHIC_PAIRS
+    stored = dimension if by is None else (f"{by}:{dimension}" if swapped else f"{dimension}:{by}")
+    return stored, swapped
+
+def demographics_view(dimension: str, by: Optional[str], swapped: bool, rows) -> dict:
+    """Ответ get_demographics по строкам счётчика (value, value2, count)"""
+    if by is None:
+        return {"dimension": dimension, "counts": _ordered(dimension, {value: count for value, _, count in rows})}
+    table = {}
+    for value, value2, count in rows:
+        row_value, column_value = (value2, value) if swapped else (value, value2)
+        table.setdefault(row_value, {})[column_value] = count
+    table = {row_value: _ordered(by, columns) for row_value, columns in table.items()}
+    totals = {row_value: sum(columns.values()) for row_value, columns in table.items()}
+    return {
+        "dimension": dimension,
+        "by": by,
+        "counts": {row_value: table[row_value] for row_value in _ordered(dimension, totals)}
+    }
+
+def get_demographics(dimension: str, by: str = None) -> dict:
+    """Распределение пользователей по измерению или разрез двух измерений (из счётчиков)"""
+    stored, swapped = demographic_slice(dimension, by)
+    if not schema.demographics:
+        raise ValueError("Демографические агрегаты недоступны: обновите схему БД")
+
+    conn = get_analytics_connection()
+    cursor = conn.cursor()
+    cursor.execute(DEMOGRAPHIC_DIMENSION, (stored,))
+    rows = cursor.fetchall()
+    conn.close()
+    return demographics_view(dimension, by, swapped, rows)
+
+# ========== Число участников команд ==========
+TEAM_MEMBER_COUNTS_REBUILD = statement("teams.member_counts_rebuild", '''
+    UPDATE Teams SET member_count = (SELECT COUNT(*) FROM Participations p WHERE p.team_id = Teams.id)
+''')
+TEAM_MEMBER_COUNT_DRIFT = statement("teams.member_count_drift", '''
+    SELECT t.id, t.hackathon_id, t.member_count, COUNT(p.id) as actual
+    FROM Teams t
+    LEFT JOIN Participations p ON p.team_id = t.id
+    GROUP BY t.id
+    HAVING t.member_count != actual
+''')
+TEAM_MEMBER_COUNT_SET = statement("teams.member_count_set", "UPDATE Teams SET member_count = ? WHERE id = ?")
+
+def rebuild_team_member_counts(cursor):
+    """Пересчёт Teams.member_count по Participations (в транзакции вызывающего)"""
+    cursor.execute(TEAM_MEMBER_COUNTS_REBUILD)
+
+@db_writer.operation
+def verify_team_member_counts(repair: bool = True) -> dict:
+    """Сверка Teams.member_count с фактическим составом; при repair расхождения исправляются
+
+    Счётчики ведут триггеры, поэтому расхождение означает запись в обход
+    схемы (ручная правка, восстановление из копии без триггеров).
+    """
+    if not schema.team_member_counts:
+        raise ValueError("Счётчики участников команд недоступны: обновите схему БД")
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute(TEAM_MEMBER_COUNT_DRIFT)
+    drift = [dict(row) for row in cursor.fetchall()]
+    if repair and drift:
+        cursor.executemany(TEAM_MEMBER_COUNT_SET, [(team["actual"], team["id"]) for team in drift])
+    conn.commit()
+    conn.close()
+    return {"drift": len(drift), "repaired": bool(repair and drift), "teams": drift[:100]}
+
+# ========== Пакетная аналитика ==========
+# Вид результата воронки участия и когорт
+PARTICIPATION_FUNNEL = "participation_funnel"
+# Сколько последних версий каждого вида хранить
+ANALYTICS_RESULTS_KEEP = int(os.getenv("ANALYTICS_RESULTS_KEEP", "20"))
+
+ANALYTICS_RESULT_NEXT_VERSION = statement("analytics_results.next_version", '''
+    SELECT COALESCE(MAX(version), 0) + 1 FROM AnalyticsResults WHERE kind = ?
+''')
+ANALYTICS_RESULT_INSERT = statement("analytics_results.insert", '''
+    INSERT INTO AnalyticsResults (kind, version, computed_at, duration_ms, payload) VALUES (?, ?, ?, ?, ?)
+''')
+ANALYTICS_RESULT_PRUNE = statement("analytics_results.prune", '''
+    DELETE FROM AnalyticsResults WHERE kind = ? AND version <= ?
+''')
+ANALYTICS_RESULT_LATEST = statement("analytics_results.latest", '''
+    SELECT payload FROM AnalyticsResults WHERE kind = ? ORDER BY version DESC LIMIT 1
+''')
+ANALYTICS_RESULT_BY_VERSION = statement("analytics_results.by_version", '''
+    SELECT payload FROM AnalyticsResults WHERE kind = ? AND version = ?
+''')
+ANALYTICS_RESULT_VERSIONS = statement("analytics_results.versions", '''
+    SELECT version, computed_at, duration_ms FROM AnalyticsResults WHERE kind = ? ORDER BY version DESC
+''')
+
+@db_writer.operation
+def save_analytics_result(kind: str, result: dict, duration_ms: float) -> dict:
+    """Сохранение результата расчёта новой версией; старые версии сверх ANALYTICS_RESULTS_KEEP удаляются"""
+    if not schema.analytics_results:
+        raise ValueError("Результаты аналитики недоступны: обновите схему БД")
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute(ANALYTICS_RESULT_NEXT_VERSION, (kind,))
+    version = cursor.fetchone()[0]
+    meta = {"kind": kind, "version": version, "computed_at": datetime.now().isoformat(),
+            "duration_ms": round(duration_ms, 3)}
+    payload = json.dumps({**meta, **result}, ensure_ascii=False, separators=(",", ":"))
+    cursor.execute(ANALYTICS_RESULT_INSERT, (kind, version, meta["computed_at"], meta["duration_ms"], payload))
+    cursor.execute(ANALYTICS_RESULT_PRUNE, (kind, version - ANALYTICS_RESULTS_KEEP))
+    conn.commit()
+    conn.close()
+    return meta
+
+def get_analytics_result(kind: str, version: int = None) -> Optional[str]:
+    """Готовый JSON результата (последняя или заданная версия) или None"""
+    if not schema.analytics_results:
+        return None
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    if version is None:
+        cursor.execute(ANALYTICS_RESULT_LATEST, (kind,))
+    else:
+        cursor.execute(ANALYTICS_RESULT_BY_VERSION, (kind, version))
+    row = cursor.fetchone()
+    conn.close()
+    return row[0] if row else None
+
+def list_analytics_results(kind: str) -> list:
+    if not schema.analytics_results:
+        return []
     conn = get_db_connection()
     cursor = conn.cursor()
+    cursor.execute(ANALYTICS_RESULT_VERSIONS, (kind,))
+    versions = [dict(row) for row in cursor.fetchall()]
+    conn.close()
+    return versions
+
+def run_participation_funnel() -> dict:
+    """Расчёт воронки участия и когорт по копии БД и сохранение новой версии результата"""
+    started = time.perf_counter()
+    conn = get_analytics_connection()
     try:
-        cursor.execute("PRAGMA table_info(Hackathons)")
-        columns = [column[1] for column in cursor.fetchall()]
-
-        if 'min_participants' not in columns:
-            cursor.execute("ALTER TABLE Hackathons ADD COLUMN min_participants INTEGER DEFAULT 0")
-            conn.commit()
-
-        if 'published' not in columns:
-            cursor.execute("ALTER TABLE Hackathons ADD COLUMN published INTEGER DEFAULT 0")
-            conn.commit()
-    except Exception as e:
-        print(f"Migration warning: {e}")
+        result = funnel.build_report(conn)
     finally:
         conn.close()
+    result["data_as_of"] = analytics_snapshot.info()["taken_at"]
+    return save_analytics_result(PARTICIPATION_FUNNEL, result, (time.perf_counter() - started) * 1000)
+
+# Статусы хакатонов, вебинаров и курсов по датам начала и окончания
+# Запросы *_STATUS_DATES получают recovery_cutoff: давно завершённые строки не загружаются
+# Длительность вебинара, если она не указана
+WEBINAR_DEFAULT_HOURS = 1.0
+
+HACKATHON_STATUS_DATES = statement("hackathons.status_dates", '''
+    SELECT id, status, start_date, end_date FROM Hackathons
+    WHERE status IN ('upcoming', 'ongoing') OR (status = 'completed' AND end_date >= ?)
+''')
+HACKATHON_STATUS_TRANSITION = statement("hackathons.status_transition", '''
+    UPDATE Hackathons SET status = ?
+    WHERE id = ? AND start_date IS ? AND end_date IS ?
+      AND status IN ('upcoming', 'ongoing', 'completed') AND status != ?
+''')
+WEBINAR_STATUS_DATES = statement("webinars.status_dates", f'''
+    SELECT id, status, date_time, duration_hours FROM Webinars
+    WHERE status IN ('upcoming', 'ongoing')
+       OR (status = 'completed'
+           AND julianday(date_time) + COALESCE(duration_hours, {WEBINAR_DEFAULT_HOURS}) / 24.0 >= julianday(?))
+''')
+WEBINAR_STATUS_TRANSITION = statement("webinars.status_transition", '''
+    UPDATE Webinars SET status = ?
+    WHERE id = ? AND date_time IS ? AND duration_hours IS ?
+      AND status IN ('upcoming', 'ongoing', 'completed') AND status != ?
+''')
+COURSE_STATUS_DATES = statement("courses.status_dates", '''
+    SELECT id, status, start_date, end_date FROM Courses
+    WHERE status IN ('upcoming', 'ongoing') OR (status = 'completed' AND end_date >= ?)
+''')
+COURSE_STATUS_TRANSITION = statement("courses.status_transition", '''
+    UPDATE Courses SET status = ?
+    WHERE id = ? AND start_date IS ? AND end_date IS ?
+      AND status IN ('upcoming', 'ongoing', 'completed') AND status != ?
+''')
+
+def _period_bounds(start_date, end_date):
+    start, end = parse_moment(start_date), parse_moment(end_date, end=True)
+    return (start, end) if start and end else None
+
+def _webinar_bounds(date_time, duration_hours):
+    start = parse_moment(date_time)
+    if start is None:
+        return None
+    return start, start + timedelta(hours=duration_hours or WEBINAR_DEFAULT_HOURS)
+
+@db_writer.operation
+def apply_status_transitions(kinds: dict, batch: dict) -> dict:
+    """Смена статусов пачкой: {вид: [(статус, id, *даты, статус)]} -> {вид: изменено строк}"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    changed = {}
+    for kind, rows in batch.items():
+        cursor.executemany(kinds[kind].update, rows)
+        changed[kind] = cursor.rowcount
+    conn.commit()
+    conn.close()
+    return changed
+
+status_scheduler = StatusScheduler(
+    [
+        StatusKind("hackathons", HACKATHON_STATUS_DATES, HACKATHON_STATUS_TRANSITION, _period_bounds),
+        StatusKind("webinars", WEBINAR_STATUS_DATES, WEBINAR_STATUS_TRANSITION, _webinar_bounds),
+        StatusKind("courses", COURSE_STATUS_DATES, COURSE_STATUS_TRANSITION, _period_bounds),
+    ],
+    connect=_open_connection,
+    apply=apply_status_transitions
+)
+metrics.registry.callback("status_transitions_total", "Hackathon, webinar and course status changes applied by date",
+                          lambda: status_scheduler.info()["applied"], kind="counter")
+
+# ========== Уведомления ==========
+# Получатели уведомлений о событии; виды событий - как у status_scheduler
+NOTIFICATION_AUDIENCES = {
+    "hackathons": "SELECT DISTINCT user_id FROM Participations WHERE hackathon_id = ?",
+    "webinars": "SELECT user_id FROM WebinarRegistrations WHERE webinar_id = ?",
+    "courses": "SELECT user_id FROM CourseRegistrations WHERE course_id = ?",
+}
+NOTIFICATION_EVENT_NAMES = {
+    kind: statement(f"notifications.{kind}_name", f"SELECT name FROM {table} WHERE id = ?")
+    for kind, table in (("hackathons", "Hackathons"), ("webinars", "Webinars"), ("courses", "Courses"))
+}
+# Письма всем получателям одним запросом; уже поставленные (тот же ключ) пропускаются
+OUTBOX_FAN_OUT = {
+    kind: statement(f"notifications.fan_out_{kind}", f'''
+        INSERT OR IGNORE INTO NotificationOutbox
+            (user_id, event_type, event_id, dedup_key, subject, body, next_attempt_at, created_at)
+        SELECT user_id, ?, ?, ? || user_id, ?, ?, ?, ?
+        FROM ({audience})
+    ''')
+    for kind, audience in NOTIFICATION_AUDIENCES.items()
+}
+
+def _fan_out(cursor, event_type: str, event_id: int, key: str, subject: str, body: str, send_at: str, now: str) -> int:
+    """Постановка письма получателям события (в транзакции вызывающего): число новых писем"""
+    cursor.execute(OUTBOX_FAN_OUT[event_type],
+                   (event_type, event_id, f"{key}:{event_type}:{event_id}:", subject, body, send_at, now, event_id))
+    return cursor.rowcount
+
+def _event_name(cursor, event_type: str, event_id: int):
+    cursor.execute(NOTIFICATION_EVENT_NAMES[event_type], (event_id,))
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+@db_writer.operation
+def enqueue_event_notification(event_type: str, event_id: int, subject: str, body: str,
+                               send_at: Optional[str] = None, key: Optional[str] = None) -> int:
+    """Постановка письма участникам события в очередь отправки; возвращает число новых писем
+
+    key - ключ рассылки (по умолчанию - хэш темы и текста): повтор той же
+    рассылки не создаёт писем тем, кому она уже поставлена.
+    """
+    if not schema.notification_outbox:
+        raise ValueError("Схема БД не поддерживает уведомления")
+    if event_type not in NOTIFICATION_AUDIENCES:
+        raise ValueError("Неизвестный вид события")
+    if send_at is not None:
+        # Время в очереди сравнивается как строка ISO - приводим к одному виду
+        moment = parse_moment(send_at)
+        if moment is None:
+            raise ValueError("Некорректное время отправки")
+        send_at = moment.isoformat()
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    if _event_name(cursor, event_type, event_id) is None:
+        conn.close()
+        raise ValueError("Событие не найдено")
+    now = datetime.now().isoformat()
+    key = key or hashlib.sha1(f"{subject}\n{body}".encode("utf-8")).hexdigest()[:16]
+    count = _fan_out(cursor, event_type, event_id, f"announcement:{key}", subject, body, send_at or now, now)
+    conn.commit()
+    conn.close()
+    notification_dispatcher.wake()
+    return count
+
+@db_writer.operation
+def fan_out_reminders(batch: list) -> int:
+    """Напоминания [(вид, id, метка, начало)] участникам событий; возвращает число новых писем"""
+    if not schema.notification_outbox:
+        return 0
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    now = datetime.now().isoformat()
+    count = 0
+    for event_type, event_id, label, start in batch:
+        name = _event_name(cursor, event_type, event_id)
+        if name is None:
+            continue
+        # Начало в ключе: после переноса события напоминания рассылаются заново
+        count += _fan_out(cursor, event_type, event_id, f"reminder:{label}:{start.isoformat()}",
+                          f"Напоминание: «{name}» начнётся через {describe_offset(label)}",
+                          f"«{name}» начнётся {start:%d.%m.%Y в %H:%M}.", now, now)
+    conn.commit()
+    conn.close()
+    if count:
+        notification_dispatcher.wake()
+    return count
+
+OUTBOX_DUE = statement("notifications.due", '''
+    SELECT id FROM NotificationOutbox
+    WHERE status = 'pending' AND next_attempt_at <= ?
+    ORDER BY next_attempt_at
+    LIMIT ?
+''')
+OUTBOX_LEASE = template("notifications.lease", '''
+    UPDATE NotificationOutbox SET next_attempt_at = ?, attempts = attempts + 1
+    WHERE id IN ({placeholders})
+''')
+OUTBOX_CLAIMED = template("notifications.claimed", '''
+    SELECT o.id, o.user_id, o.event_type, o.event_id, o.subject, o.body, o.attempts,
+           u.email, u.fio, u.telegram_nickname
+    FROM NotificationOutbox o
+    LEFT JOIN Users u ON u.id = o.user_id
+    WHERE o.id IN ({placeholders})
+    ORDER BY o.next_attempt_at, o.id
+''')
+
+@db_writer.operation
+def claim_notifications(limit: int, lease_seconds: float) -> list:
+    """Письма, время отправки которых наступило; откладываются на lease_seconds, попытка засчитывается
+
+    Выборка и отметка идут в одной транзакции записи, поэтому одно письмо
+    не заберут два отправителя.
+    """
+    if not schema.notification_outbox:
+        return []
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    now = datetime.now()
+    cursor.execute(OUTBOX_DUE, (now.isoformat(), limit))
+    ids = [row[0] for row in cursor.fetchall()]
+    if not ids:
+        conn.close()
+        return []
+    placeholders = ", ".join("?" * len(ids))
+    cursor.execute(OUTBOX_LEASE.format(placeholders=placeholders),
+                   [(now + timedelta(seconds=lease_seconds)).isoformat(), *ids])
+    cursor.execute(OUTBOX_CLAIMED.format(placeholders=placeholders), ids)
+    messages = [dict(row) for row in cursor.fetchall()]
+    conn.commit()
+    conn.close()
+    return messages
+
+OUTBOX_SENT = statement("notifications.sent", '''
+    UPDATE NotificationOutbox SET status = 'sent', sent_at = ?, last_error = NULL
+    WHERE id = ?
+''')
+OUTBOX_RETRY = statement("notifications.retry", '''
+    UPDATE NotificationOutbox SET next_attempt_at = ?, last_error = ?
+    WHERE id = ?
+''')
+OUTBOX_FAILED = statement("notifications.failed", '''
+    UPDATE NotificationOutbox SET status = 'failed', last_error = ?
+    WHERE id = ?
+''')
+
+@db_writer.operation
+def complete_notifications(sent: list, failures: list):
+    """Итог отправки пачки: sent - ID отправленных, failures - [(ID, ошибка, время повтора или None)]"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    now = datetime.now().isoformat()
+    cursor.executemany(OUTBOX_SENT, [(now, message_id) for message_id in sent])
+    cursor.executemany(OUTBOX_RETRY, [(retry_at.isoformat(), error, message_id)
+                                      for message_id, error, retry_at in failures if retry_at is not None])
+    cursor.executemany(OUTBOX_FAILED, [(error, message_id)
+                                       for message_id, error, retry_at in failures if retry_at is None])
+    conn.commit()
+    conn.close()
+
+OUTBOX_NEXT_DUE = statement("notifications.next_due", '''
+    SELECT MIN(next_attempt_at) FROM NotificationOutbox WHERE status = 'pending'
+''')
+
+def next_notification_due():
+    """Время ближайшего письма в очереди или None"""
+    if not schema.notification_outbox:
+        return None
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute(OUTBOX_NEXT_DUE)
+    value = cursor.fetchone()[0]
+    conn.close()
+    return parse_moment(value)
+
+OUTBOX_STATUS_COUNTS = statement("notifications.status_counts", '''
+    SELECT status, COUNT(*) FROM NotificationOutbox GROUP BY status
+''')
+
+def get_notification_stats() -> dict:
+    """Письма в очереди по статусам, состояние отправителя и расписания напоминаний"""
+    outbox = {}
+    if schema.notification_outbox:
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        cursor.execute(OUTBOX_STATUS_COUNTS)
+        outbox = dict(cursor.fetchall())
+        conn.close()
+    return {"outbox": outbox, "dispatcher": notification_dispatcher.info(), "reminders": reminder_scheduler.info()}
+
+OUTBOX_RETRY_FAILED = statement("notifications.retry_failed", '''
+    UPDATE NotificationOutbox SET status = 'pending', attempts = 0, next_attempt_at = ?
+    WHERE status = 'failed'
+''')
+
+@db_writer.operation
+def retry_failed_notifications() -> int:
+    """Возврат писем, исчерпавших попытки, в очередь"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute(OUTBOX_RETRY_FAILED, (datetime.now().isoformat(),))
+    count = cursor.rowcount
+    conn.commit()
+    conn.close()
+    if count:
+        notification_dispatcher.wake()
+    return count
+
+OUTBOX_PURGE = statement("notifications.purge", '''
+    DELETE FROM NotificationOutbox WHERE status = 'sent' AND sent_at < ?
+''')
+
+@db_writer.operation
+def purge_sent_notifications(days: int = 30) -> int:
+    """Удаление отправленных писем старше days дней"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute(OUTBOX_PURGE, ((datetime.now() - timedelta(days=days)).isoformat(),))
+    count = cursor.rowcount
+    conn.commit()
+    conn.close()
+    return count
+
+# Отправка писем из очереди и напоминания перед началом событий (запускаются в main.py)
+notification_dispatcher = NotificationDispatcher(
+    create_sink(), claim_notifications, complete_notifications, next_notification_due
+)
+reminder_scheduler = ReminderScheduler(
+    status_scheduler.kinds.values(), parse_offsets(REMINDERS), _open_connection, fan_out_reminders
+)
+
+def _notification_outcomes():
+    info = notification_dispatcher.info()
+    return {(outcome,): info[outcome] for outcome in ("sent", "retried", "failed")}
+
+metrics.registry.callback("notifications_total", "Notification delivery attempts by outcome",
+                          _notification_outcomes, ("outcome",), kind="counter")
+metrics.registry.callback("notification_batches_total", "Notification batches handed to the sink",
+                          lambda: notification_dispatcher.info()["batches"], kind="counter")
+metrics.registry.callback("notification_sink_throughput", "Notifications delivered per second of sink time",
+                          lambda: notification_dispatcher.info()["sent_per_second"])
@@ -0,0 +1,182 @@
+from datetime import datetime
+
+import numpy as np
+
+from queries import statement
+
+# Этапы воронки участия; пользователь учитывается на этапе, если дошёл до него или дальше
+FUNNEL_STAGES = ("registered", "joined", "in_team", "submitted", "rated")
+# Сколько месяцев после регистрации показывать в удержании когорт
+RETENTION_MONTHS = 12
+
+# Номер месяца (год * 12 + месяц - 1) считается в SQL, чтобы выборка состояла из целых чисел
+_MONTH = "CAST(strftime('%Y', {0}) AS INTEGER) * 12 + CAST(strftime('%m', {0}) AS INTEGER) - 1"
+
+FUNNEL_USERS = statement("funnel.users", f'''
+    SELECT id, COALESCE({_MONTH.format("created_at")}, -1) FROM Users WHERE role = 'user'
+''')
+FUNNEL_PARTICIPATIONS = statement("funnel.participations", f'''
+    SELECT id, user_id, hackathon_id, COALESCE(team_id, -1), COALESCE({_MONTH.format("created_at")}, -1)
+    FROM Participations WHERE role != 'expert'
+''')
+FUNNEL_PROJECTS = statement("funnel.projects", "SELECT id, participation_id, COALESCE(team_id, -1) FROM Projects")
+FUNNEL_RATED_PROJECTS = statement(
+    "funnel.rated_projects", "SELECT DISTINCT project_id FROM ProjectComments WHERE rating IS NOT NULL"
+)
+FUNNEL_HACKATHONS = statement("funnel.hackathons", "SELECT id, name FROM Hackathons")
+
+
+def _columns(rows, width: int) -> list:
+    """Строки целых чисел как столбцы int64"""
+    data = np.array(rows, dtype=np.int64).reshape(-1, width)
+    return [data[:, i] for i in range(width)]
+
+
+def month_number(timestamp) -> int:
+    """Номер месяца метки времени ISO, как _MONTH в SQL; -1 без даты"""
+    if not timestamp:
+        return -1
+    return int(timestamp[:4]) * 12 + int(timestamp[5:7]) - 1
+
+
+def month_label(month: int) -> str:
+    return f"{month // 12:04d}-{month % 12 + 1:02d}"
+
+
+def _reached(counts: np.ndarray) -> np.ndarray:
+    """Из числа остановившихся на каждом этапе - число дошедших до этапа или дальше"""
+    return np.flip(np.cumsum(np.flip(counts, axis=-1), axis=-1), axis=-1)
+
+
+def _conversion(reached: np.ndarray) -> np.ndarray:
+    """Доля перешедших с предыдущего этапа; для первого этапа - 1"""
+    previous = np.concatenate([reached[..., :1], reached[..., :-1]], axis=-1)
+    return np.divide(reached, previous, out=np.zeros(reached.shape), where=previous > 0)
+
+
+def participation_levels(part_ids, part_teams, project_ids, project_parts, project_teams, rated_ids):
+    """Этап каждого участия: 1 - участвует, 2 - в команде, 3 - сдал проект, 4 - проект оценён
+
+    Проект команды засчитывается всем её участникам. Сдавший проект без
+    команды считается прошедшим этап команды: этапы упорядочены и
+    участие относится к самому дальнему достигнутому.
+    """
+    in_team = part_teams >= 0
+    rated = np.isin(project_ids, rated_ids)
+    team_projects = project_teams >= 0
+
+    submitted = np.isin(part_ids, project_parts) | (in_team & np.isin(part_teams, project_teams[team_projects]))
+    rated_parts = (np.isin(part_ids, project_parts[rated])
+                   | (in_team & np.isin(part_teams, project_teams[team_projects & rated])))
+
+    levels = 1 + in_team.astype(np.int64)
+    levels[submitted] = 3
+    levels[rated_parts] = 4
+    return levels
+
+
+def compute_funnel(user_ids, user_months, part_ids, part_users, part_hackathons, part_teams, part_months,
+                   project_ids, project_parts, project_teams, rated_ids, now_month: int,
+                   retention_months: int = RETENTION_MONTHS) -> dict:
+    """Воронка участия, воронки по хакатонам и когорты по месяцу регистрации
+
+    На вход - столбцы выборок FUNNEL_* как массивы int64. Этап пользователя -
+    самый дальний этап среди его участий; когорта - месяц регистрации.
+    Удержание когорты на месяце k - доля пользователей, вступивших хотя бы
+    в один хакатон через k месяцев после регистрации; ещё не наступившие
+    месяцы возвращаются как None. Все шаги векторизованы.
+    """
+    n_stages = len(FUNNEL_STAGES)
+    order = np.argsort(user_ids, kind="stable")
+    user_ids, user_months = user_ids[order], user_months[order]
+
+    levels = participation_levels(part_ids, part_teams, project_ids, project_parts, project_teams, rated_ids)
+
+    # Участия пользователей вне воронки (администраторы, эксперты) не учитываются
+    position = np.minimum(np.searchsorted(user_ids, part_users), max(len(user_ids) - 1, 0))
+    known = (user_ids[position] == part_users) if len(user_ids) else np.zeros(len(part_users), dtype=bool)
+    part_user_idx = position[known]
+
+    user_levels = np.zeros(len(user_ids), dtype=np.int64)
+    np.maximum.at(user_levels, part_user_idx, levels[known])
+    reached = _reached(np.bincount(user_levels, minlength=n_stages))
+    conversion = _conversion(reached)
+
+    # Воронки по хакатонам: этапы начиная с участия
+    hackathons, hackathon_idx = np.unique(part_hackathons, return_inverse=True)
+    by_hackathon = np.bincount(hackathon_idx * n_stages + levels, minlength=len(hackathons) * n_stages)
+    by_hackathon = _reached(by_hackathon.reshape(len(hackathons), n_stages))[:, 1:]
+    hackathon_conversion = _conversion(by_hackathon)
+
+    # Когорты: воронка по месяцу регистрации
+    dated = user_months >= 0
+    cohorts, cohort_idx = np.unique(user_months[dated], return_inverse=True)
+    n_cohorts = len(cohorts)
+    cohort_sizes = np.bincount(cohort_idx, minlength=n_cohorts)
+    cohort_levels = np.bincount(cohort_idx * n_stages + user_levels[dated], minlength=n_cohorts * n_stages)
+    cohort_reached = _reached(cohort_levels.reshape(n_cohorts, n_stages))
+
+    # Удержание: различные пары (пользователь, месяц от регистрации) с участием
+    user_cohort = np.full(len(user_ids), -1, dtype=np.int64)
+    user_cohort[dated] = cohort_idx
+    part_user_months = user_months[part_user_idx]
+    offsets = part_months[known] - part_user_months
+    active = (part_user_months >= 0) & (part_months[known] >= 0) & (offsets >= 0) & (offsets < retention_months)
+    pairs = np.unique(part_user_idx[active] * retention_months + offsets[active])
+    active_users = pairs // retention_months
+    retained = np.bincount(user_cohort[active_users] * retention_months + pairs % retention_months,
+                           minlength=n_cohorts * retention_months).reshape(n_cohorts, retention_months)
+    retention = np.divide(retained, cohort_sizes[:, None], out=np.zeros(retained.shape),
+                          where=cohort_sizes[:, None] > 0)
+    observed = cohorts[:, None] + np.arange(retention_months)[None, :] <= now_month
+
+    return {
+        "stages": list(FUNNEL_STAGES),
+        "funnel": [
+            {"stage": stage, "users": int(reached[i]), "conversion": round(float(conversion[i]), 4),
+             "share": round(float(reached[i] / reached[0]), 4) if reached[0] else 0.0}
+            for i, stage in enumerate(FUNNEL_STAGES)
+        ],
+        "hackathons": [
+            {"hackathon_id": int(hackathons[i]),
+             "counts": by_hackathon[i].tolist(),
+             "conversion": np.round(hackathon_conversion[i], 4).tolist()}
+            for i in np.argsort(-by_hackathon[:, 0], kind="stable")
+        ],
+        "cohorts": [
+            {"month": month_label(int(cohorts[i])),
+             "size": int(cohort_sizes[i]),
+             "funnel": cohort_reached[i].tolist(),
+             "retention": [round(float(value), 4) if seen else None
+                           for value, seen in zip(retention[i], observed[i])]}
+            for i in range(n_cohorts)
+        ],
+        "retention_months": retention_months
+    }
+
+
+def build_report(conn, now: datetime = None) -> dict:
+    """Выгрузка нужных столбцов из БД и расчёт воронки и когорт"""
+    cursor = conn.cursor()
+    rows = []
+    for sql in (FUNNEL_USERS, FUNNEL_PARTICIPATIONS, FUNNEL_PROJECTS, FUNNEL_RATED_PROJECTS, FUNNEL_HACKATHONS):
+        cursor.execute(sql)
+        rows.append(cursor.fetchall())
+    users, participations, projects, rated, hackathons = rows
+    return report_from_rows(users, participations, projects, [project_id for project_id, in rated],
+                            dict(hackathons), now)
+
+
+def report_from_rows(users, participations, projects, rated_ids, names: dict, now: datetime = None) -> dict:
+    """Расчёт воронки и когорт по строкам вида выборок FUNNEL_* (хранилище в памяти передаёт их без SQL)"""
+    now = now or datetime.now()
+    user_ids, user_months = _columns(users, 2)
+    part_ids, part_users, part_hackathons, part_teams, part_months = _columns(participations, 5)
+    project_ids, project_parts, project_teams = _columns(projects, 3)
+    (rated_ids,) = _columns(rated_ids, 1)
+
+    report = compute_funnel(user_ids, user_months, part_ids, part_users, part_hackathons, part_teams, part_months,
+                            project_ids, project_parts, project_teams, rated_ids, now.year * 12 + now.month - 1)
+    for hackathon in report["hackathons"]:
+        hackathon["name"] = names.get(hackathon["hackathon_id"])
+    return report
@@ -0,0 +1,77 @@
+import logging
+import os
+
+from queries import begin_request, end_request
+
+logger = logging.getLogger("db.requests")
+
+# Сколько раз запрос одной формы может выполниться за HTTP-запрос до предупреждения об N+1
+N_PLUS_ONE_THRESHOLD = int(os.getenv("DB_N_PLUS_ONE_THRESHOLD", "5"))
+# warn - превышение бюджета пишется в лог; enforce (тестовый режим) - запрос завершается ошибкой
+BUDGET_MODE = os.getenv("DB_QUERY_BUDGETS", "warn")
+
+
+class QueryBudgetExceeded(AssertionError):
+    """Маршрут выполнил больше запросов к БД, чем разрешает его бюджет"""
+
+
+def query_budget(queries: int):
+    """Декоратор маршрута: максимум запросов к БД за один HTTP-запрос"""
+    def decorator(endpoint):
+        endpoint.query_budget = queries
+        return endpoint
+    return decorator
+
+
+class DBInstrumentationMiddleware:
+    """ASGI middleware: учёт соединений, запросов и времени БД по HTTP-запросу
+
+    Итог отдаётся заголовком Server-Timing. Повтор запроса одной формы больше
+    n_plus_one_threshold раз пишется в лог как вероятный N+1. Если у маршрута
+    задан бюджет (query_budget), превышение пишется в лог, а в режиме enforce
+    приводит к QueryBudgetExceeded - так бюджеты проверяются в тестах.
+    """
+
+    def __init__(self, app, n_plus_one_threshold: int = N_PLUS_ONE_THRESHOLD, budget_mode: str = BUDGET_MODE):
+        if budget_mode not in ("warn", "enforce"):
+            raise ValueError("budget_mode должен быть 'warn' или 'enforce'")
+        self.app = app
+        self.n_plus_one_threshold = n_plus_one_threshold
+        self.budget_mode = budget_mode
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats, token = begin_request()
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                self._check(scope, stats)
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", self._server_timing(stats).encode()))
+                message = dict(message, headers=headers)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            end_request(token)
+
+    @staticmethod
+    def _server_timing(stats) -> str:
+        return (f'db;dur={stats.db_ms:.3f};desc="{stats.queries} queries, '
+                f'{stats.connections} connections"')
+
+    def _check(self, scope, stats):
+        route = f'{scope["method"]} {scope["path"]}'
+        for shape, count in stats.repeated(self.n_plus_one_threshold).items():
+            logger.warning("Possible N+1 in %s: %s executed %d times", route, shape, count)
+
+        budget = getattr(scope.get("endpoint"), "query_budget", None)
+        if budget is not None and stats.queries > budget:
+            message = f"{route}: {stats.queries} queries, budget {budget}"
+            if self.budget_mode == "enforce":
+                raise QueryBudgetExceeded(message)
+            logger.warning("Query budget exceeded in %s", message)
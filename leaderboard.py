@@ -0,0 +1,395 @@
+import threading
+from bisect import bisect_left, insort
+
+from queries import statement
+
+LEADERBOARD_PARTICIPATIONS = statement(
+    "leaderboards.participations", "SELECT hackathon_id, user_id, team_id, reputation FROM Participations"
+)
+LEADERBOARD_TEAMS = statement("leaderboards.teams", "SELECT id, hackathon_id FROM Teams")
+
+
+class RankedSet:
+    """Упорядоченное множество с поиском позиции и элемента по позиции за O(log n)
+
+    Элементы хранятся в отсортированных блоках ограниченного размера, а длины
+    блоков - в дереве Фенвика, поэтому ранг считается без прохода по всем данным.
+    """
+
+    _LOAD = 512
+
+    def __init__(self, items=()):
+        self._lists = []
+        self._maxes = []
+        self._tree = [0]
+        self._len = 0
+        items = sorted(items)
+        for i in range(0, len(items), self._LOAD):
+            chunk = items[i:i + self._LOAD]
+            self._lists.append(chunk)
+            self._maxes.append(chunk[-1])
+        self._len = len(items)
+        self._rebuild()
+
+    def __len__(self):
+        return self._len
+
+    def _rebuild(self):
+        n = len(self._lists)
+        tree = [0] * (n + 1)
+        for i, lst in enumerate(self._lists, 1):
+            tree[i] += len(lst)
+            j = i + (i & -i)
+            if j <= n:
+                tree[j] += tree[i]
+        self._tree = tree
+
+    def _bump(self, i: int, delta: int):
+        n = len(self._lists)
+        i += 1
+        while i <= n:
+            self._tree[i] += delta
+            i += i & -i
+
+    def _prefix(self, i: int) -> int:
+        """Количество элементов в блоках [0, i)"""
+        total = 0
+        while i > 0:
+            total += self._tree[i]
+            i -= i & -i
+        return total
+
+    def _locate(self, pos: int):
+        """Поиск (блок, смещение) для позиции pos"""
+        n = len(self._lists)
+        i = 0
+        step = 1 << n.bit_length()
+        while step:
+            j = i + step
+            if j <= n and self._tree[j] <= pos:
+                pos -= self._tree[j]
+                i = j
+            step >>= 1
+        return i, pos
+
+    def add(self, item):
+        if not self._maxes:
+            self._lists.append([item])
+            self._maxes.append(item)
+            self._len = 1
+            self._rebuild()
+            return
+
+        i = bisect_left(self._maxes, item)
+        if i == len(self._maxes):
+            i -= 1
+            self._lists[i].append(item)
+            self._maxes[i] = item
+        else:
+            insort(self._lists[i], item)
+        self._len += 1
+        self._bump(i, 1)
+
+        lst = self._lists[i]
+        if len(lst) > 2 * self._LOAD:
+            half = lst[self._LOAD:]
+            del lst[self._LOAD:]
+            self._maxes[i] = lst[-1]
+            self._lists.insert(i + 1, half)
+            self._maxes.insert(i + 1, half[-1])
+            self._rebuild()
+
+    def remove(self, item):
+        i = bisect_left(self._maxes, item)
+        if i == len(self._maxes):
+            raise KeyError(item)
+        lst = self._lists[i]
+        j = bisect_left(lst, item)
+        if j == len(lst) or lst[j] != item:
+            raise KeyError(item)
+        del lst[j]
+        self._len -= 1
+        if lst:
+            self._maxes[i] = lst[-1]
+            self._bump(i, -1)
+        else:
+            del self._lists[i]
+            del self._maxes[i]
+            self._rebuild()
+
+    def index(self, item) -> int:
+        """Позиция элемента (с нуля)"""
+        i = bisect_left(self._maxes, item)
+        if i == len(self._maxes):
+            raise KeyError(item)
+        lst = self._lists[i]
+        j = bisect_left(lst, item)
+        if j == len(lst) or lst[j] != item:
+            raise KeyError(item)
+        return self._prefix(i) + j
+
+    def slice(self, start: int, stop: int):
+        """Элементы в позициях [start, stop)"""
+        start = max(start, 0)
+        stop = min(stop, self._len)
+        result = []
+        if start >= stop:
+            return result
+        i, j = self._locate(start)
+        while len(result) < stop - start:
+            lst = self._lists[i]
+            result.extend(lst[j:j + (stop - start - len(result))])
+            i += 1
+            j = 0
+        return result
+
+
+class Leaderboard:
+    """Таблица лидеров: ключ -> очки, упорядочена по убыванию очков"""
+
+    def __init__(self, scores: dict = None):
+        self._scores = dict(scores or {})
+        # Храним (-очки, ключ): по возрастанию кортежа идут лучшие
+        self._index = RankedSet((-score, key) for key, score in self._scores.items())
+
+    def __len__(self):
+        return len(self._scores)
+
+    def __contains__(self, key):
+        return key in self._scores
+
+    def score(self, key):
+        return self._scores.get(key)
+
+    def set(self, key, score: int):
+        old = self._scores.get(key)
+        if old is not None:
+            if old == score:
+                return
+            self._index.remove((-old, key))
+        self._scores[key] = score
+        self._index.add((-score, key))
+
+    def add(self, key, delta: int):
+        self.set(key, self._scores.get(key, 0) + delta)
+
+    def discard(self, key):
+        old = self._scores.pop(key, None)
+        if old is not None:
+            self._index.remove((-old, key))
+
+    def rank(self, key):
+        """Место ключа в таблице (с единицы) или None"""
+        score = self._scores.get(key)
+        if score is None:
+            return None
+        return self._index.index((-score, key)) + 1
+
+    def top(self, limit: int):
+        return self._entries(0, limit)
+
+    def around(self, key, radius: int):
+        """Окно из radius мест выше и ниже ключа"""
+        rank = self.rank(key)
+        if rank is None:
+            return []
+        return self._entries(rank - 1 - radius, rank + radius)
+
+    def _entries(self, start: int, stop: int):
+        start = max(start, 0)
+        return [
+            {"rank": start + offset + 1, "key": key, "score": -neg_score}
+            for offset, (neg_score, key) in enumerate(self._index.slice(start, stop))
+        ]
+
+
+class LeaderboardRegistry:
+    """Таблицы лидеров по хакатонам и глобальные, обновляемые инкрементально
+
+    Состояние загружается из БД один раз (см. db.get_leaderboards), после чего
+    каждое изменение применяется как дельта. Хуки вызываются писателем после
+    фиксации и задают итоговое состояние участия, а не приращение, поэтому
+    повтор изменения, уже попавшего в загрузку, ничего не меняет. Загрузка идёт
+    под блокировкой: хуки, пришедшие во время неё, применяются после.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self.loaded = False
+        # Обращения к уже загруженным таблицам и загрузки из БД (см. db.get_leaderboards)
+        self.hits = 0
+        self.misses = 0
+        self._reset()
+
+    def _reset(self):
+        # (hackathon_id, user_id) -> [team_id, reputation]
+        self._members = {}
+        # team_id -> ID участников команды
+        self._team_members = {}
+        # user_id -> число участий пользователя
+        self._user_participations = {}
+        self.participants = {}
+        self.teams = {}
+        self.global_users = Leaderboard()
+        self.global_teams = Leaderboard()
+
+    def load(self, conn):
+        """Полная загрузка таблиц из БД (соединение должно видеть только зафиксированные данные)"""
+        with self._lock:
+            cursor = conn.cursor()
+            cursor.execute(LEADERBOARD_PARTICIPATIONS)
+            rows = cursor.fetchall()
+            cursor.execute(LEADERBOARD_TEAMS)
+            team_rows = cursor.fetchall()
+
+            self._reset()
+            participant_scores = {}
+            team_scores = {}
+            user_totals = {}
+            all_teams = {}
+            for team_id, hackathon_id in team_rows:
+                team_scores.setdefault(hackathon_id, {})[team_id] = 0
+                all_teams[team_id] = 0
+
+            for hackathon_id, user_id, team_id, reputation in rows:
+                reputation = reputation or 0
+                self._members[(hackathon_id, user_id)] = [team_id, reputation]
+                self._user_participations[user_id] = self._user_participations.get(user_id, 0) + 1
+                participant_scores.setdefault(hackathon_id, {})[user_id] = reputation
+                user_totals[user_id] = user_totals.get(user_id, 0) + reputation
+                if team_id is not None:
+                    self._team_members.setdefault(team_id, set()).add(user_id)
+                    scores = team_scores.setdefault(hackathon_id, {})
+                    scores[team_id] = scores.get(team_id, 0) + reputation
+                    all_teams[team_id] = all_teams.get(team_id, 0) + reputation
+
+            self.participants = {h: Leaderboard(s) for h, s in participant_scores.items()}
+            self.teams = {h: Leaderboard(s) for h, s in team_scores.items()}
+            self.global_users = Leaderboard(user_totals)
+            self.global_teams = Leaderboard(all_teams)
+            self.loaded = True
+
+    def invalidate(self):
+        with self._lock:
+            self.loaded = False
+            self._reset()
+
+    def _board(self, hackathon_id, teams: bool) -> Leaderboard:
+        if hackathon_id is None:
+            return self.global_teams if teams else self.global_users
+        boards = self.teams if teams else self.participants
+        return boards.get(hackathon_id) or Leaderboard()
+
+    def top(self, limit: int, hackathon_id: int = None, teams: bool = False) -> dict:
+        """Первые limit мест таблицы хакатона (без hackathon_id - глобальной)"""
+        with self._lock:
+            board = self._board(hackathon_id, teams)
+            return {"total": len(board), "entries": board.top(limit)}
+
+    def position(self, key, radius: int, hackathon_id: int = None, teams: bool = False):
+        """Место ключа, его очки и окно из radius соседей; None, если ключа нет в таблице"""
+        with self._lock:
+            board = self._board(hackathon_id, teams)
+            rank = board.rank(key)
+            if rank is None:
+                return None
+            return {"rank": rank, "score": board.score(key), "total": len(board),
+                    "around": board.around(key, radius)}
+
+    def _team_delta(self, hackathon_id: int, team_id, delta: int):
+        if team_id is None:
+            return
+        self.teams.setdefault(hackathon_id, Leaderboard()).add(team_id, delta)
+        self.global_teams.add(team_id, delta)
+
+    def _set_team(self, hackathon_id: int, user_id: int, member: list, team_id):
+        old_team_id, reputation = member
+        if old_team_id == team_id:
+            return
+        member[0] = team_id
+        if old_team_id is not None:
+            self._team_members.get(old_team_id, set()).discard(user_id)
+            self._team_delta(hackathon_id, old_team_id, -reputation)
+        if team_id is not None:
+            self._team_members.setdefault(team_id, set()).add(user_id)
+            self._team_delta(hackathon_id, team_id, reputation)
+
+    def _set_reputation(self, hackathon_id: int, user_id: int, member: list, reputation: int):
+        delta = reputation - member[1]
+        if not delta:
+            return
+        member[1] = reputation
+        self.participants.setdefault(hackathon_id, Leaderboard()).set(user_id, reputation)
+        self.global_users.add(user_id, delta)
+        self._team_delta(hackathon_id, member[0], delta)
+
+    # Хуки, вызываемые писателем после фиксации транзакции (db_writer.after_commit)
+    def on_participation_created(self, hackathon_id: int, user_id: int, team_id=None, reputation: int = 0):
+        with self._lock:
+            if not self.loaded:
+                return
+            member = self._members.get((hackathon_id, user_id))
+            if member is None:
+                member = self._members[(hackathon_id, user_id)] = [None, 0]
+                self._user_participations[user_id] = self._user_participations.get(user_id, 0) + 1
+                self.participants.setdefault(hackathon_id, Leaderboard()).set(user_id, 0)
+                self.global_users.add(user_id, 0)
+            self._set_team(hackathon_id, user_id, member, team_id)
+            self._set_reputation(hackathon_id, user_id, member, reputation)
+
+    def on_participation_deleted(self, hackathon_id: int, user_id: int):
+        with self._lock:
+            if not self.loaded:
+                return
+            member = self._members.get((hackathon_id, user_id))
+            if member is None:
+                return
+            self._set_team(hackathon_id, user_id, member, None)
+            self._set_reputation(hackathon_id, user_id, member, 0)
+            del self._members[(hackathon_id, user_id)]
+            self.participants.get(hackathon_id, Leaderboard()).discard(user_id)
+            remaining = self._user_participations.pop(user_id, 1) - 1
+            if remaining:
+                self._user_participations[user_id] = remaining
+            else:
+                self.global_users.discard(user_id)
+
+    def on_team_created(self, hackathon_id: int, team_id: int):
+        with self._lock:
+            if not self.loaded:
+                return
+            self._team_delta(hackathon_id, team_id, 0)
+
+    def on_team_deleted(self, hackathon_id: int, team_id: int):
+        """Участники удалённой команды остаются в хакатоне без команды"""
+        with self._lock:
+            if not self.loaded:
+                return
+            for user_id in list(self._team_members.get(team_id, ())):
+                self._set_team(hackathon_id, user_id, self._members[(hackathon_id, user_id)], None)
+            self._team_members.pop(team_id, None)
+            self.teams.get(hackathon_id, Leaderboard()).discard(team_id)
+            self.global_teams.discard(team_id)
+
+    def on_reputation_changed(self, hackathon_id: int, user_id: int, new_reputation: int):
+        with self._lock:
+            if not self.loaded:
+                return
+            member = self._members.get((hackathon_id, user_id))
+            if member is None:
+                self.invalidate()
+                return
+            self._set_reputation(hackathon_id, user_id, member, new_reputation)
+
+    def on_team_changed(self, hackathon_id: int, user_id: int, team_id):
+        with self._lock:
+            if not self.loaded:
+                return
+            member = self._members.get((hackathon_id, user_id))
+            if member is None:
+                self.invalidate()
+                return
+            self._set_team(hackathon_id, user_id, member, team_id)
+
+
+leaderboards = LeaderboardRegistry()
@@ -1,15 +1,35 @@
+import logging
 import os
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, PlainTextResponse
 from fastapi.staticfiles import StaticFiles
 from starlette.middleware.sessions import SessionMiddleware
 
 
 from routes import auth, hackathon, webinars_courses, admin
-from db import init_database, migrate_hackathons_table
+from db import init_database, audit_writer, db_writer, status_scheduler, notification_dispatcher, reminder_scheduler
+from writer import WriteQueueFull
+from audit import AuditLogError
+from instrumentation import DBInstrumentationMiddleware
+import metrics
+import profiling
+import templating
+from rows import FastJSONResponse
 
 
+# Журнал приложения: ошибки фоновых потоков и письма LogSink (уровень INFO)
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"), format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
 ADM_PASS = os.getenv('ADM_PASS')
-app = FastAPI(title="Хакатон Хаб}")
+# Если задан, /metrics требует заголовок Authorization: Bearer <токен>
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+# Ответы API сериализуются через orjson (rows.FastJSONResponse)
+app = FastAPI(title="Хакатон Хаб}", default_response_class=FastJSONResponse)
+
+# Профилирование запросов по заголовку администратора или по доле маршрута
+# (добавляется первым, чтобы оказаться внутри SessionMiddleware)
+if profiling.ENABLED:
+    app.add_middleware(profiling.ProfilingMiddleware)
 
 # Middleware для сессий
 app.add_middleware(
@@ -18,6 +38,13 @@ app.add_middleware(
     max_age=86400
 )
 
+# Учёт запросов к БД по каждому HTTP-запросу: Server-Timing, N+1, бюджеты маршрутов
+app.add_middleware(DBInstrumentationMiddleware)
+
+# Задержки и статусы HTTP-запросов по шаблонам маршрутов для /metrics
+if metrics.ENABLED:
+    app.add_middleware(metrics.MetricsMiddleware)
+
 # Статические файлы
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
@@ -29,7 +56,46 @@ app.include_router(admin.router, tags=["Admin"])
 
 # Инициализация БД
 init_database()
-migrate_hackathons_table()
+
+# Все шаблоны компилируются при запуске, а не при первом запросе к странице
+templating.precompile()
+
+@app.exception_handler(WriteQueueFull)
+async def write_queue_full_handler(request: Request, exc: WriteQueueFull):
+    """Очередь записи переполнена: просим клиента повторить запрос"""
+    return JSONResponse(status_code=503, content={"detail": str(exc)}, headers={"Retry-After": "1"})
+
+@app.exception_handler(AuditLogError)
+async def audit_log_error_handler(request: Request, exc: AuditLogError):
+    """Журнал действий в режиме sync не сохранил запись: действие выполнено, но не зафиксировано в журнале"""
+    return JSONResponse(status_code=500, content={"detail": str(exc)})
+
+@app.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+async def metrics_endpoint(request: Request):
+    """Метрики в текстовом формате Prometheus"""
+    if METRICS_TOKEN and request.headers.get("authorization") != f"Bearer {METRICS_TOKEN}":
+        return PlainTextResponse("Unauthorized", status_code=401)
+    return PlainTextResponse(metrics.registry.render(), media_type="text/plain; version=0.0.4")
+
+@app.on_event("startup")
+def start_background_tasks():
+    """Запуск фоновых потоков вместе с сервером, а не при импорте приложения"""
+    # Статусы хакатонов, вебинаров и курсов меняются по датам (STATUS_SCHEDULER=0 - только вручную)
+    if os.getenv("STATUS_SCHEDULER", "1") != "0":
+        status_scheduler.start()
+    # Рассылка писем из очереди и напоминания перед началом событий (NOTIFICATIONS=0 - не запускаются)
+    if os.getenv("NOTIFICATIONS", "1") != "0":
+        notification_dispatcher.start()
+        reminder_scheduler.start()
+
+@app.on_event("shutdown")
+def flush_audit_log():
+    """Сброс очередей записи в БД при остановке"""
+    status_scheduler.stop()
+    reminder_scheduler.stop()
+    notification_dispatcher.stop()
+    db_writer.stop()
+    audit_writer.stop()
 
 if __name__ == "__main__":
     import uvicorn
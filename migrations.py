@@ -0,0 +1,788 @@
+import argparse
+import sqlite3
+from datetime import datetime
+
+
+def _column_names(cursor, table: str):
+    cursor.execute(f"PRAGMA table_info({table})")
+    return {column[1] for column in cursor.fetchall()}
+
+
+def _core_tables(cursor):
+    """Базовая схема и примеры хакатонов"""
+    # Создание таблицы пользователей с новой схемой
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS Users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT NOT NULL,
+            email TEXT NOT NULL UNIQUE,
+            password TEXT NOT NULL,
+            age INTEGER,
+            fio TEXT,
+            telegram_nickname TEXT UNIQUE,
+            basics_knowledge TEXT,
+            city TEXT,
+            team_name TEXT,
+            looking_for_team BOOLEAN DEFAULT FALSE,
+            role TEXT NOT NULL DEFAULT 'user',
+            created_at TEXT NOT NULL
+        )
+    ''')
+
+    # Создание таблицы хакатонов
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS Hackathons (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            description TEXT,
+            organizer TEXT,
+            start_date TEXT NOT NULL,
+            end_date TEXT NOT NULL,
+            duration_hours INTEGER,
+            prize_fund TEXT,
+            max_team_size INTEGER,
+            status TEXT NOT NULL DEFAULT 'upcoming',
+            created_at TEXT NOT NULL
+        )
+    ''')
+
+    # Создание таблицы команд
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS Teams (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            hackathon_id INTEGER NOT NULL,
+            name TEXT NOT NULL,
+            description TEXT,
+            captain_id INTEGER NOT NULL,
+            created_at TEXT NOT NULL,
+            FOREIGN KEY (hackathon_id) REFERENCES Hackathons(id) ON DELETE CASCADE,
+            FOREIGN KEY (captain_id) REFERENCES Users(id) ON DELETE CASCADE,
+            UNIQUE(hackathon_id, name)
+        )
+    ''')
+
+    # Создание таблицы участий (Participation) - связывает пользователя, хакатон, роль и репутацию
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS Participations (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            hackathon_id INTEGER NOT NULL,
+            role TEXT NOT NULL,
+            team_id INTEGER,
+            reputation INTEGER DEFAULT 0,
+            created_at TEXT NOT NULL,
+            updated_at TEXT NOT NULL,
+            FOREIGN KEY (user_id) REFERENCES Users(id) ON DELETE CASCADE,
+            FOREIGN KEY (hackathon_id) REFERENCES Hackathons(id) ON DELETE CASCADE,
+            FOREIGN KEY (team_id) REFERENCES Teams(id) ON DELETE SET NULL,
+            UNIQUE(user_id, hackathon_id)
+        )
+    ''')
+
+    # Создание таблицы истории изменений репутации
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS ReputationHistory (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            participation_id INTEGER NOT NULL,
+            old_reputation INTEGER NOT NULL,
+            new_reputation INTEGER NOT NULL,
+            changed_by INTEGER NOT NULL,
+            reason TEXT,
+            created_at TEXT NOT NULL,
+            FOREIGN KEY (participation_id) REFERENCES Participations(id) ON DELETE CASCADE,
+            FOREIGN KEY (changed_by) REFERENCES Users(id) ON DELETE CASCADE
+        )
+    ''')
+
+    # Создание таблицы проектов/презентаций
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS Projects (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            hackathon_id INTEGER NOT NULL,
+            team_id INTEGER,
+            participation_id INTEGER NOT NULL,
+            title TEXT NOT NULL,
+            description TEXT,
+            presentation_url TEXT,
+            area_topic TEXT,
+            status TEXT DEFAULT 'draft',
+            created_at TEXT NOT NULL,
+            updated_at TEXT NOT NULL,
+            FOREIGN KEY (hackathon_id) REFERENCES Hackathons(id) ON DELETE CASCADE,
+            FOREIGN KEY (team_id) REFERENCES Teams(id) ON DELETE SET NULL,
+            FOREIGN KEY (participation_id) REFERENCES Participations(id) ON DELETE CASCADE
+        )
+    ''')
+
+    # Создание таблицы областей экспертизы экспертов
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS ExpertAreas (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            expert_id INTEGER NOT NULL,
+            hackathon_id INTEGER NOT NULL,
+            area_topic TEXT NOT NULL,
+            created_at TEXT NOT NULL,
+            FOREIGN KEY (expert_id) REFERENCES Users(id) ON DELETE CASCADE,
+            FOREIGN KEY (hackathon_id) REFERENCES Hackathons(id) ON DELETE CASCADE,
+            UNIQUE(expert_id, hackathon_id, area_topic)
+        )
+    ''')
+
+    # Создание таблицы комментариев экспертов к проектам
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS ProjectComments (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            project_id INTEGER NOT NULL,
+            expert_id INTEGER NOT NULL,
+            comment TEXT NOT NULL,
+            rating INTEGER,
+            created_at TEXT NOT NULL,
+            updated_at TEXT NOT NULL,
+            FOREIGN KEY (project_id) REFERENCES Projects(id) ON DELETE CASCADE,
+            FOREIGN KEY (expert_id) REFERENCES Users(id) ON DELETE CASCADE
+        )
+    ''')
+
+    # Создание таблицы аудита действий экспертов
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS ExpertAuditLog (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            expert_id INTEGER NOT NULL,
+            hackathon_id INTEGER NOT NULL,
+            action_type TEXT NOT NULL,
+            target_type TEXT,
+            target_id INTEGER,
+            details TEXT,
+            ip_address TEXT,
+            created_at TEXT NOT NULL,
+            FOREIGN KEY (expert_id) REFERENCES Users(id) ON DELETE CASCADE,
+            FOREIGN KEY (hackathon_id) REFERENCES Hackathons(id) ON DELETE CASCADE
+        )
+    ''')
+
+    # Создание таблицы вебинаров/семинаров
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS Webinars (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            description TEXT,
+            speaker TEXT NOT NULL,
+            date_time TEXT NOT NULL,
+            duration_hours REAL,
+            location TEXT DEFAULT 'Онлайн',
+            max_participants INTEGER,
+            status TEXT NOT NULL DEFAULT 'upcoming',
+            created_at TEXT NOT NULL
+        )
+    ''')
+
+    # Создание таблицы интенсивных курсов
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS Courses (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            description TEXT,
+            instructor TEXT NOT NULL,
+            start_date TEXT NOT NULL,
+            end_date TEXT NOT NULL,
+            hours_per_week INTEGER,
+            max_students INTEGER,
+            status TEXT NOT NULL DEFAULT 'upcoming',
+            certificate_available BOOLEAN DEFAULT FALSE,
+            created_at TEXT NOT NULL
+        )
+    ''')
+
+    # Создание таблицы регистраций на вебинары
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS WebinarRegistrations (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            webinar_id INTEGER NOT NULL,
+            created_at TEXT NOT NULL,
+            FOREIGN KEY (user_id) REFERENCES Users(id) ON DELETE CASCADE,
+            FOREIGN KEY (webinar_id) REFERENCES Webinars(id) ON DELETE CASCADE,
+            UNIQUE(user_id, webinar_id)
+        )
+    ''')
+
+    # Создание таблицы регистраций на курсы
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS CourseRegistrations (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            course_id INTEGER NOT NULL,
+            created_at TEXT NOT NULL,
+            FOREIGN KEY (user_id) REFERENCES Users(id) ON DELETE CASCADE,
+            FOREIGN KEY (course_id) REFERENCES Courses(id) ON DELETE CASCADE,
+            UNIQUE(user_id, course_id)
+        )
+    ''')
+
+    # Добавляем примеры хакатонов для тестирования (если их нет)
+    cursor.execute("SELECT COUNT(*) FROM Hackathons")
+    if cursor.fetchone()[0] == 0:
+        sample_hackathons = [
+            {
+                "name": "Tech Innovation Challenge 2024",
+                "description": "Создайте инновационные решения для будущего технологий. Фокус на AI, IoT и блокчейн.",
+                "organizer": "TechCorp",
+                "start_date": "2024-03-15T00:00:00",
+                "end_date": "2024-03-17T00:00:00",
+                "duration_hours": 48,
+                "prize_fund": "$50,000",
+                "max_team_size": 5,
+                "status": "upcoming"
+            },
+            {
+                "name": "GreenTech Hackathon",
+                "description": "Разработайте экологичные технологические решения для устойчивого будущего.",
+                "organizer": "EcoSolutions",
+                "start_date": "2024-03-22T00:00:00",
+                "end_date": "2024-03-24T00:00:00",
+                "duration_hours": 36,
+                "prize_fund": "$30,000",
+                "max_team_size": 4,
+                "status": "upcoming"
+            },
+            {
+                "name": "Web Development Marathon",
+                "description": "Создайте современные веб-приложения с использованием последних технологий.",
+                "organizer": "WebDev Academy",
+                "start_date": "2024-03-10T00:00:00",
+                "end_date": "2024-03-12T00:00:00",
+                "duration_hours": 48,
+                "prize_fund": "$25,000",
+                "max_team_size": 4,
+                "status": "ongoing"
+            }
+        ]
+
+        for hackathon in sample_hackathons:
+            cursor.execute('''
+                INSERT INTO Hackathons (name, description, organizer, start_date, end_date, 
+                                       duration_hours, prize_fund, max_team_size, status, created_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (
+                hackathon["name"], hackathon["description"], hackathon["organizer"],
+                hackathon["start_date"], hackathon["end_date"], hackathon["duration_hours"],
+                hackathon["prize_fund"], hackathon["max_team_size"], hackathon["status"],
+                datetime.now().isoformat()
+            ))
+
+
+def _hackathon_publishing(cursor):
+    """Минимум участников и флаг публикации хакатона"""
+    columns = _column_names(cursor, "Hackathons")
+    if 'min_participants' not in columns:
+        cursor.execute("ALTER TABLE Hackathons ADD COLUMN min_participants INTEGER DEFAULT 0")
+    if 'published' not in columns:
+        cursor.execute("ALTER TABLE Hackathons ADD COLUMN published INTEGER DEFAULT 0")
+
+
+def _user_profile_columns(cursor):
+    """Колонки профиля, которые заполняет регистрация"""
+    columns = _column_names(cursor, "Users")
+    if 'balls' not in columns:
+        cursor.execute("ALTER TABLE Users ADD COLUMN balls INTEGER DEFAULT 0")
+    if 'hackathons' not in columns:
+        cursor.execute("ALTER TABLE Users ADD COLUMN hackathons TEXT DEFAULT ''")
+    if 'intensives' not in columns:
+        cursor.execute("ALTER TABLE Users ADD COLUMN intensives TEXT DEFAULT ''")
+
+
+def _reputation_rollups(cursor):
+    """Агрегаты изменений репутации по часам и дням"""
+    # scope: 'participation' или 'hackathon', bucket_start - начало интервала
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS ReputationRollups (
+            scope TEXT NOT NULL,
+            scope_id INTEGER NOT NULL,
+            granularity TEXT NOT NULL,
+            bucket_start TEXT NOT NULL,
+            changes_count INTEGER NOT NULL DEFAULT 0,
+            delta_sum INTEGER NOT NULL DEFAULT 0,
+            gain_sum INTEGER NOT NULL DEFAULT 0,
+            loss_sum INTEGER NOT NULL DEFAULT 0,
+            last_reputation INTEGER,
+            PRIMARY KEY (scope, scope_id, granularity, bucket_start)
+        ) WITHOUT ROWID
+    ''')
+
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_reputation_history_participation
+        ON ReputationHistory (participation_id, created_at)
+    ''')
+
+    # Заполняем агрегаты по уже существующей истории (часовой интервал - "YYYY-MM-DDTHH:00:00", дневной - дата)
+    cursor.execute('''
+        WITH changes AS (
+            SELECT rh.id, rh.participation_id, p.hackathon_id, rh.new_reputation, rh.created_at,
+                   rh.new_reputation - COALESCE(rh.old_reputation, 0) AS delta
+            FROM ReputationHistory rh
+            JOIN Participations p ON rh.participation_id = p.id
+            WHERE rh.created_at IS NOT NULL
+        ),
+        bucketed AS (
+            SELECT *, 'hour' AS granularity, substr(created_at, 1, 13) || ':00:00' AS bucket_start FROM changes
+            UNION ALL
+            SELECT *, 'day', substr(created_at, 1, 10) FROM changes
+        ),
+        ranked AS (
+            SELECT *, FIRST_VALUE(new_reputation) OVER (
+                PARTITION BY participation_id, granularity, bucket_start ORDER BY created_at DESC, id DESC
+            ) AS last_reputation
+            FROM bucketed
+        )
+        INSERT INTO ReputationRollups (scope, scope_id, granularity, bucket_start, changes_count,
+                                       delta_sum, gain_sum, loss_sum, last_reputation)
+        SELECT 'participation', participation_id, granularity, bucket_start, COUNT(*),
+               SUM(delta), SUM(MAX(delta, 0)), SUM(MAX(-delta, 0)), MAX(last_reputation)
+        FROM ranked
+        GROUP BY participation_id, granularity, bucket_start
+        UNION ALL
+        SELECT 'hackathon', hackathon_id, granularity, bucket_start, COUNT(*),
+               SUM(delta), SUM(MAX(delta, 0)), SUM(MAX(-delta, 0)), NULL
+        FROM bucketed
+        GROUP BY hackathon_id, granularity, bucket_start
+    ''')
+
+
+def _review_queue_indexes(cursor):
+    """Индексы для очереди проектов эксперта"""
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_projects_hackathon_area
+        ON Projects (hackathon_id, area_topic)
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_project_comments_project_expert
+        ON ProjectComments (project_id, expert_id)
+    ''')
+
+
+def _audit_log_archive(cursor):
+    """Индексы журнала экспертов, политики хранения и архивные сегменты"""
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_expert_audit_log_expert
+        ON ExpertAuditLog (expert_id, hackathon_id, created_at)
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_expert_audit_log_hackathon
+        ON ExpertAuditLog (hackathon_id, created_at)
+    ''')
+
+    # Политики хранения журнала экспертов и индекс архивных сегментов
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS AuditRetentionPolicies (
+            hackathon_id INTEGER PRIMARY KEY,
+            retention_days INTEGER NOT NULL,
+            updated_at TEXT NOT NULL,
+            FOREIGN KEY (hackathon_id) REFERENCES Hackathons(id) ON DELETE CASCADE
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS AuditArchiveSegments (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            hackathon_id INTEGER NOT NULL,
+            path TEXT NOT NULL UNIQUE,
+            min_created_at TEXT NOT NULL,
+            max_created_at TEXT NOT NULL,
+            row_count INTEGER NOT NULL,
+            created_at TEXT NOT NULL
+        )
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_audit_segments_range
+        ON AuditArchiveSegments (hackathon_id, max_created_at)
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS AuditArchiveSegmentExperts (
+            segment_id INTEGER NOT NULL,
+            expert_id INTEGER NOT NULL,
+            PRIMARY KEY (segment_id, expert_id),
+            FOREIGN KEY (segment_id) REFERENCES AuditArchiveSegments(id) ON DELETE CASCADE
+        ) WITHOUT ROWID
+    ''')
+
+
+def _activity_rollups(cursor):
+    """Агрегаты регистраций и других событий по дням, неделям и месяцам"""
+    # entity - сущность (users, participations, ...), event - тип события, bucket_start - начало интервала
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS ActivityRollups (
+            entity TEXT NOT NULL,
+            granularity TEXT NOT NULL,
+            bucket_start TEXT NOT NULL,
+            event TEXT NOT NULL,
+            count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (entity, granularity, bucket_start, event)
+        ) WITHOUT ROWID
+    ''')
+
+    # Заполняем агрегаты событий создания по уже существующим строкам; неделя начинается с понедельника
+    sources = (
+        ("users", "registered", "Users"),
+        ("participations", "joined", "Participations"),
+        ("teams", "created", "Teams"),
+        ("webinar_registrations", "registered", "WebinarRegistrations"),
+        ("course_registrations", "registered", "CourseRegistrations"),
+    )
+    for entity, event, table in sources:
+        cursor.execute(f'''
+            WITH days AS (
+                SELECT substr(created_at, 1, 10) AS day, COUNT(*) AS count FROM {table}
+                WHERE created_at IS NOT NULL
+                GROUP BY day
+            )
+            INSERT INTO ActivityRollups (entity, granularity, bucket_start, event, count)
+            SELECT ?1, 'day', day, ?2, count FROM days
+            UNION ALL
+            SELECT ?1, 'week', date(day, '-6 days', 'weekday 1') AS week, ?2, SUM(count) FROM days GROUP BY week
+            UNION ALL
+            SELECT ?1, 'month', substr(day, 1, 7) || '-01' AS month, ?2, SUM(count) FROM days GROUP BY month
+        ''', (entity, event))
+
+
+def _demographics(cursor):
+    """Счётчики пользователей по возрасту, городу, навыкам, поиску команды и роли, включая попарные"""
+    # Для одиночного измерения value2 = ''; для пары dimension = "первое:второе"
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS DemographicCounts (
+            dimension TEXT NOT NULL,
+            value TEXT NOT NULL,
+            value2 TEXT NOT NULL DEFAULT '',
+            count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (dimension, value, value2)
+        ) WITHOUT ROWID
+    ''')
+
+    # Заполняем счётчики по уже существующим пользователям: корзины - как в db.demographic_values
+    cursor.execute('''
+        CREATE TEMP TABLE UserBuckets AS
+        SELECT
+            CASE
+                WHEN typeof(age) NOT IN ('integer', 'real') THEN 'Не указан'
+                WHEN age < 18 THEN 'До 18'
+                WHEN age <= 25 THEN '18-25'
+                WHEN age <= 35 THEN '26-35'
+                WHEN age <= 45 THEN '36-45'
+                ELSE '45+'
+            END AS age,
+            COALESCE(city, '') AS city,
+            COALESCE(basics_knowledge, '') AS basics_knowledge,
+            CASE WHEN looking_for_team = 1 THEN '1' ELSE '0' END AS looking_for_team,
+            COALESCE(role, '') AS role
+        FROM Users
+    ''')
+    dimensions = ("age", "city", "basics_knowledge", "looking_for_team", "role")
+    groups = [(dimension, dimension, "''") for dimension in dimensions]
+    groups += [(f"{first}:{second}", first, second)
+               for i, first in enumerate(dimensions) for second in dimensions[i + 1:]]
+    for dimension, value, value2 in groups:
+        cursor.execute(f'''
+            INSERT INTO DemographicCounts (dimension, value, value2, count)
+            SELECT ?, {value}, {value2}, COUNT(*) FROM UserBuckets GROUP BY {value}, {value2}
+        ''', (dimension,))
+    cursor.execute("DROP TABLE UserBuckets")
+
+
+def _analytics_results(cursor):
+    """Версионированные результаты пакетных аналитических расчётов"""
+    # payload - готовый JSON-документ результата, отдаётся клиенту без пересборки
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS AnalyticsResults (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT NOT NULL,
+            version INTEGER NOT NULL,
+            computed_at TEXT NOT NULL,
+            duration_ms REAL NOT NULL,
+            payload TEXT NOT NULL,
+            UNIQUE(kind, version)
+        )
+    ''')
+
+
+def _team_member_counts(cursor):
+    """Число участников команды в Teams, поддерживаемое триггерами на Participations"""
+    if 'member_count' not in _column_names(cursor, "Teams"):
+        cursor.execute("ALTER TABLE Teams ADD COLUMN member_count INTEGER NOT NULL DEFAULT 0")
+
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_participations_team_insert
+        AFTER INSERT ON Participations WHEN NEW.team_id IS NOT NULL
+        BEGIN
+            UPDATE Teams SET member_count = member_count + 1 WHERE id = NEW.team_id;
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_participations_team_delete
+        AFTER DELETE ON Participations WHEN OLD.team_id IS NOT NULL
+        BEGIN
+            UPDATE Teams SET member_count = member_count - 1 WHERE id = OLD.team_id;
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_participations_team_update
+        AFTER UPDATE OF team_id ON Participations WHEN OLD.team_id IS NOT NEW.team_id
+        BEGIN
+            UPDATE Teams SET member_count = member_count - 1 WHERE id = OLD.team_id;
+            UPDATE Teams SET member_count = member_count + 1 WHERE id = NEW.team_id;
+        END
+    ''')
+
+    # Команды со свободными местами хакатона - диапазон по индексу
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_teams_hackathon_members
+        ON Teams (hackathon_id, member_count)
+    ''')
+
+    cursor.execute('''
+        UPDATE Teams SET member_count = (SELECT COUNT(*) FROM Participations p WHERE p.team_id = Teams.id)
+    ''')
+
+
+def _waitlists(cursor):
+    """Листы ожидания вебинаров и курсов"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS Waitlists (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT NOT NULL,
+            event_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            created_at TEXT NOT NULL,
+            UNIQUE(kind, event_id, user_id),
+            FOREIGN KEY (user_id) REFERENCES Users(id) ON DELETE CASCADE
+        )
+    ''')
+    # Голова очереди события - первые строки индекса
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_waitlists_event
+        ON Waitlists (kind, event_id, id)
+    ''')
+
+
+def _notification_outbox(cursor):
+    """Очередь исходящих уведомлений"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS NotificationOutbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            event_type TEXT,
+            event_id INTEGER,
+            dedup_key TEXT NOT NULL UNIQUE,
+            subject TEXT NOT NULL,
+            body TEXT,
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt_at TEXT NOT NULL,
+            last_error TEXT,
+            created_at TEXT NOT NULL,
+            sent_at TEXT,
+            FOREIGN KEY (user_id) REFERENCES Users(id) ON DELETE CASCADE
+        )
+    ''')
+    # Отправитель забирает письма, время которых наступило, - диапазон по индексу
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_notification_outbox_due
+        ON NotificationOutbox (status, next_attempt_at)
+    ''')
+
+
+def _reputation_running_totals(cursor):
+    """Накопленное изменение репутации в каждом интервале агрегатов"""
+    cursor.execute("ALTER TABLE ReputationRollups ADD COLUMN cumulative_delta INTEGER NOT NULL DEFAULT 0")
+    cursor.execute('''
+        UPDATE ReputationRollups SET cumulative_delta = totals.total
+        FROM (
+            SELECT scope, scope_id, granularity, bucket_start,
+                   SUM(delta_sum) OVER (PARTITION BY scope, scope_id, granularity ORDER BY bucket_start) AS total
+            FROM ReputationRollups
+        ) AS totals
+        WHERE ReputationRollups.scope = totals.scope AND ReputationRollups.scope_id = totals.scope_id
+          AND ReputationRollups.granularity = totals.granularity
+          AND ReputationRollups.bucket_start = totals.bucket_start
+    ''')
+
+
+def _foreign_key_indexes(cursor):
+    """Индексы дочерних колонок внешних ключей, по которым идут каскады удаления
+
+    С включёнными внешними ключами удаление пользователя, команды или участия
+    ищет зависимые строки по этим колонкам; без индекса - полный просмотр таблицы.
+    """
+    for name, table, column in (
+        ("idx_teams_captain", "Teams", "captain_id"),
+        ("idx_participations_team", "Participations", "team_id"),
+        ("idx_reputation_history_changed_by", "ReputationHistory", "changed_by"),
+        ("idx_projects_participation", "Projects", "participation_id"),
+        ("idx_projects_team", "Projects", "team_id"),
+        ("idx_project_comments_expert", "ProjectComments", "expert_id"),
+        ("idx_waitlists_user", "Waitlists", "user_id"),
+        ("idx_notification_outbox_user", "NotificationOutbox", "user_id"),
+    ):
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({column})")
+
+
+# Упорядоченный список миграций: (версия, описание, функция)
+MIGRATIONS = [
+    (1, "Базовая схема", _core_tables),
+    (2, "Публикация хакатонов", _hackathon_publishing),
+    (3, "Колонки профиля пользователя", _user_profile_columns),
+    (4, "Агрегаты репутации", _reputation_rollups),
+    (5, "Индексы очереди проектов", _review_queue_indexes),
+    (6, "Архив журнала экспертов", _audit_log_archive),
+    (7, "Агрегаты регистраций по дням", _activity_rollups),
+    (8, "Демографические агрегаты", _demographics),
+    (9, "Результаты аналитических расчётов", _analytics_results),
+    (10, "Число участников команд", _team_member_counts),
+    (11, "Листы ожидания", _waitlists),
+    (12, "Очередь уведомлений", _notification_outbox),
+    (13, "Накопленные итоги агрегатов репутации", _reputation_running_totals),
+    (14, "Индексы внешних ключей", _foreign_key_indexes),
+]
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+# Минимальная версия схемы для каждой возможности
+FEATURES = {
+    "hackathon_publishing": 2,
+    "user_profile_columns": 3,
+    "reputation_rollups": 4,
+    "review_queue_indexes": 5,
+    "audit_archive": 6,
+    "activity_rollups": 7,
+    "demographics": 8,
+    "analytics_results": 9,
+    "team_member_counts": 10,
+    "waitlists": 11,
+    "notification_outbox": 12,
+    "reputation_running_totals": 13,
+}
+
+
+class SchemaCapabilities:
+    """Возможности схемы, известные по её версии без обращения к БД"""
+
+    def __init__(self, version: int = 0):
+        self.set_version(version)
+
+    def set_version(self, version: int):
+        self.version = version
+        for feature, required in FEATURES.items():
+            setattr(self, feature, version >= required)
+
+    def as_dict(self) -> dict:
+        return {"version": self.version, **{feature: getattr(self, feature) for feature in FEATURES}}
+
+
+def current_version(conn) -> int:
+    """Версия схемы из заголовка файла БД"""
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def upgrade(db_path: str, target: int = None):
+    """Применение недостающих миграций, каждая в своей транзакции
+
+    Версия хранится в PRAGMA user_version (читается из заголовка файла),
+    а история применения - в таблице SchemaVersion. Транзакция открывается
+    как IMMEDIATE, поэтому одновременно стартующие процессы не применят
+    одну миграцию дважды.
+    """
+    target = LATEST_VERSION if target is None else target
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    applied = []
+    try:
+        if current_version(conn) >= target:
+            return applied
+        for version, description, migrate in MIGRATIONS:
+            if version > target:
+                break
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                # Версию перечитываем под блокировкой записи
+                if current_version(conn) >= version:
+                    conn.execute("ROLLBACK")
+                    continue
+                cursor = conn.cursor()
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS SchemaVersion (
+                        version INTEGER PRIMARY KEY,
+                        description TEXT NOT NULL,
+                        applied_at TEXT NOT NULL
+                    )
+                ''')
+                migrate(cursor)
+                cursor.execute(
+                    "INSERT OR REPLACE INTO SchemaVersion (version, description, applied_at) VALUES (?, ?, ?)",
+                    (version, description, datetime.now().isoformat())
+                )
+                cursor.execute(f"PRAGMA user_version = {int(version)}")
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            applied.append(version)
+        return applied
+    finally:
+        conn.close()
+
+
+def ensure_schema(db_path: str, auto_upgrade: bool = True) -> int:
+    """Проверка версии схемы при старте; при актуальной схеме - одно чтение заголовка"""
+    conn = sqlite3.connect(db_path)
+    try:
+        version = current_version(conn)
+    finally:
+        conn.close()
+    if version >= LATEST_VERSION:
+        return version
+    if not auto_upgrade:
+        print(f"Schema version {version} is behind {LATEST_VERSION}, run: python migrations.py upgrade")
+        return version
+    upgrade(db_path)
+    return LATEST_VERSION
+
+
+def get_status(db_path: str) -> dict:
+    """Текущая версия схемы и список применённых и ожидающих миграций"""
+    conn = sqlite3.connect(db_path)
+    try:
+        version = current_version(conn)
+        history = {}
+        if conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'SchemaVersion'").fetchone():
+            history = {row[0]: row[1] for row in conn.execute("SELECT version, applied_at FROM SchemaVersion")}
+    finally:
+        conn.close()
+    return {
+        "version": version,
+        "latest": LATEST_VERSION,
+        "migrations": [
+            {
+                "version": number,
+                "description": description,
+                "applied": number <= version,
+                "applied_at": history.get(number)
+            }
+            for number, description, _ in MIGRATIONS
+        ]
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Миграции схемы БД")
+    parser.add_argument("command", choices=["upgrade", "status"])
+    parser.add_argument("--db", default="hackathon_hub.db", help="путь к файлу БД")
+    parser.add_argument("--target", type=int, default=None, help="версия для upgrade (по умолчанию последняя)")
+    args = parser.parse_args(argv)
+
+    if args.command == "upgrade":
+        applied = upgrade(args.db, args.target)
+        print(f"Applied: {', '.join(map(str, applied))}" if applied else "Schema is up to date")
+    info = get_status(args.db)
+    print(f"Schema version: {info['version']} (latest {info['latest']})")
+    for migration in info["migrations"]:
+        mark = "x" if migration["applied"] else " "
+        print(f"  [{mark}] {migration['version']:>3} {migration['description']} {migration['applied_at'] or ''}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,321 @@
+import heapq
+import json
+import logging
+import os
+import random
+import smtplib
+import threading
+import time
+from datetime import datetime, timedelta
+from email.message import EmailMessage
+
+from scheduler import MANAGED_STATUSES, TimeHeapRunner
+
+# Сколько писем забирать из очереди за раз и сколько попыток отправки делать до статуса failed
+BATCH_SIZE = int(os.getenv("NOTIFY_BATCH_SIZE", "200"))
+MAX_ATTEMPTS = int(os.getenv("NOTIFY_MAX_ATTEMPTS", "5"))
+# Пауза перед повтором: BACKOFF_BASE * 2^(попытка - 1), не больше BACKOFF_MAX (секунды)
+BACKOFF_BASE = float(os.getenv("NOTIFY_BACKOFF_BASE", "30"))
+BACKOFF_MAX = float(os.getenv("NOTIFY_BACKOFF_MAX", "3600"))
+# На сколько секунд забранные письма скрываются от других отправителей (после падения процесса - повтор)
+LEASE_SECONDS = float(os.getenv("NOTIFY_LEASE_SECONDS", "300"))
+# За сколько до начала события напоминать участникам: "24h,1h" (m - минуты, h - часы, d - дни)
+REMINDERS = os.getenv("NOTIFY_REMINDERS", "24h,1h")
+# Дольше этого потоки не спят даже без работы
+MAX_SLEEP = 60.0
+
+logger = logging.getLogger(__name__)
+
+_UNITS = {"m": "minutes", "h": "hours", "d": "days"}
+_UNIT_NAMES = {"m": "мин", "h": "ч", "d": "дн."}
+
+
+def parse_offsets(value: str) -> list:
+    """Разбор строки "24h,1h" в список (метка, смещение) по убыванию смещения"""
+    offsets = []
+    for label in filter(None, (part.strip() for part in value.split(","))):
+        amount, unit = label[:-1], label[-1:]
+        if unit not in _UNITS or not amount.isdigit():
+            raise ValueError(f"Ожидается число и единица m, h или d: {label}")
+        offsets.append((label, timedelta(**{_UNITS[unit]: int(amount)})))
+    return sorted(offsets, key=lambda item: item[1], reverse=True)
+
+
+def describe_offset(label: str) -> str:
+    return f"{label[:-1]} {_UNIT_NAMES[label[-1]]}"
+
+
+def backoff(attempts: int) -> float:
+    """Пауза перед следующей попыткой со случайным разбросом, чтобы повторы не шли одной волной"""
+    delay = min(BACKOFF_BASE * 2 ** max(attempts - 1, 0), BACKOFF_MAX)
+    return delay * (0.5 + random.random() / 2)
+
+
+# ========== Получатели ==========
+class LogSink:
+    """Вывод писем в журнал процесса (уровень INFO)"""
+
+    name = "log"
+
+    def send(self, messages: list) -> list:
+        for message in messages:
+            logger.info("Notification #%s to user %s: %s", message["id"], message["user_id"], message["subject"])
+        return [None] * len(messages)
+
+
+class FileSink:
+    """Запись писем в файл JSON Lines (по строке на письмо)"""
+
+    name = "file"
+
+    def __init__(self, path: str = os.getenv("NOTIFY_FILE", "notifications.jsonl")):
+        self.path = path
+
+    def send(self, messages: list) -> list:
+        with open(self.path, "a", encoding="utf-8") as f:
+            for message in messages:
+                f.write(json.dumps(message, ensure_ascii=False, default=str) + "\n")
+        return [None] * len(messages)
+
+
+class SMTPSink:
+    """Отправка писем через SMTP-сервер (по умолчанию локальная заглушка на порту 1025)
+
+    Пачка отправляется через одно соединение. Ошибка соединения - исключение
+    на всю пачку; отказ по адресу - ошибка только этого письма.
+    """
+
+    name = "smtp"
+
+    def __init__(self, host: str = os.getenv("SMTP_HOST", "localhost"), port: int = int(os.getenv("SMTP_PORT", "1025")),
+                 sender: str = os.getenv("SMTP_FROM", "noreply@hackathon-hub.local"), timeout: float = 10.0):
+        self.host = host
+        self.port = port
+        self.sender = sender
+        self.timeout = timeout
+
+    def send(self, messages: list) -> list:
+        errors = []
+        with smtplib.SMTP(self.host, self.port, timeout=self.timeout) as smtp:
+            for message in messages:
+                if not message.get("email"):
+                    errors.append("У пользователя нет адреса почты")
+                    continue
+                email = EmailMessage()
+                email["From"] = self.sender
+                email["To"] = message["email"]
+                email["Subject"] = message["subject"]
+                email.set_content(message["body"] or "")
+                try:
+                    smtp.send_message(email)
+                    errors.append(None)
+                except smtplib.SMTPRecipientsRefused as e:
+                    errors.append(str(e))
+        return errors
+
+
+SINKS = {sink.name: sink for sink in (LogSink, FileSink, SMTPSink)}
+
+
+def create_sink(name: str = os.getenv("NOTIFY_SINK", "log")):
+    if name not in SINKS:
+        raise ValueError(f"Неизвестный получатель уведомлений: {name}")
+    return SINKS[name]()
+
+
+# ========== Отправка ==========
+class NotificationDispatcher:
+    """Фоновая пакетная отправка писем из таблицы NotificationOutbox
+
+    claim(limit, lease) забирает до limit писем, время отправки которых
+    наступило, и откладывает их на lease секунд с увеличением числа попыток;
+    complete(sent, failures) отмечает отправленные и назначает повтор
+    остальным (или статус failed после MAX_ATTEMPTS). Если процесс упал
+    между ними, письма вернутся в очередь по истечении lease: доставка
+    "хотя бы один раз". next_due() - время ближайшего письма, до него поток
+    спит; wake() будит его после постановки новых писем.
+    """
+
+    def __init__(self, sink, claim, complete, next_due, batch_size: int = BATCH_SIZE,
+                 lease: float = LEASE_SECONDS, max_attempts: int = MAX_ATTEMPTS, clock=datetime.now):
+        self.sink = sink
+        self._claim = claim
+        self._complete = complete
+        self._next_due = next_due
+        self.batch_size = batch_size
+        self.lease = lease
+        self.max_attempts = max_attempts
+        self._clock = clock
+        self._cond = threading.Condition()
+        self._woken = False
+        self._thread = None
+        self._stopping = False
+        self._stats_lock = threading.Lock()
+        self._stats = {"sent": 0, "retried": 0, "failed": 0, "batches": 0, "last_batch_ms": 0.0,
+                       "max_batch_ms": 0.0, "total_batch_ms": 0.0, "last_run": None}
+
+    def wake(self):
+        with self._cond:
+            self._woken = True
+            self._cond.notify()
+
+    def run_once(self) -> int:
+        """Отправка одной пачки; возвращает число забранных писем"""
+        messages = self._claim(self.batch_size, self.lease)
+        if not messages:
+            return 0
+        started = time.perf_counter()
+        try:
+            errors = self.sink.send(messages)
+        except Exception as e:
+            errors = [f"{type(e).__name__}: {e}"] * len(messages)
+
+        now = self._clock()
+        sent, failures = [], []
+        for message, error in zip(messages, errors):
+            if error is None:
+                sent.append(message["id"])
+            elif message["attempts"] >= self.max_attempts:
+                failures.append((message["id"], error, None))
+            else:
+                failures.append((message["id"], error, now + timedelta(seconds=backoff(message["attempts"]))))
+        self._complete(sent, failures)
+
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        with self._stats_lock:
+            self._stats["sent"] += len(sent)
+            self._stats["retried"] += sum(1 for _, _, retry_at in failures if retry_at is not None)
+            self._stats["failed"] += sum(1 for _, _, retry_at in failures if retry_at is None)
+            self._stats["batches"] += 1
+            self._stats["last_batch_ms"] = round(elapsed_ms, 3)
+            self._stats["max_batch_ms"] = max(self._stats["max_batch_ms"], round(elapsed_ms, 3))
+            self._stats["total_batch_ms"] += elapsed_ms
+            self._stats["last_run"] = now.isoformat()
+        return len(messages)
+
+    def _timeout(self) -> float:
+        next_due = self._next_due()
+        if next_due is None:
+            return MAX_SLEEP
+        return min(max((next_due - self._clock()).total_seconds(), 0.0), MAX_SLEEP)
+
+    def _run(self):
+        while True:
+            try:
+                # Полная пачка - в очереди, вероятно, есть ещё: следующая сразу
+                while self.run_once() >= self.batch_size and not self._stopping:
+                    pass
+                timeout = self._timeout()
+            except Exception:
+                logger.exception("Notification dispatcher failed")
+                timeout = MAX_SLEEP
+            with self._cond:
+                if not self._woken and not self._stopping and timeout > 0:
+                    self._cond.wait(timeout)
+                self._woken = False
+                if self._stopping:
+                    return
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name="notification-dispatcher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        with self._cond:
+            self._stopping = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def info(self) -> dict:
+        with self._stats_lock:
+            stats = dict(self._stats)
+        busy_s = stats["total_batch_ms"] / 1000
+        return {
+            "running": self._thread is not None and self._thread.is_alive(),
+            "sink": self.sink.name,
+            "batch_size": self.batch_size,
+            "max_attempts": self.max_attempts,
+            # Пропускная способность получателя: писем в секунду времени отправки
+            "sent_per_second": round(stats["sent"] / busy_s, 1) if busy_s else None,
+            **stats,
+            "total_batch_ms": round(stats["total_batch_ms"], 3)
+        }
+
+
+# ========== Напоминания ==========
+class ReminderScheduler(TimeHeapRunner):
+    """Напоминания участникам за заданное время до начала хакатонов, вебинаров и курсов
+
+    Виды событий - те же StatusKind, что у StatusScheduler: load читает даты,
+    bounds даёт начало. Моменты напоминаний (начало минус смещение) лежат
+    в куче; поток спит до ближайшего и передаёт наступившие в
+    fan_out([(вид, id, метка, начало)]), который ставит письма участникам
+    в NotificationOutbox. Куча не хранится: recover() строит её по БД, и
+    напоминания, пришедшиеся на простой, рассылаются сразу, если событие
+    ещё не началось. Повторная рассылка безопасна - письма дедуплицируются.
+    """
+
+    name = "reminder-scheduler"
+
+    def __init__(self, kinds, offsets, connect, fan_out, clock=datetime.now):
+        super().__init__(kinds, connect, clock)
+        self.offsets = offsets
+        self._fan_out = fan_out
+        self._stats = {"fanned_out": 0, "notifications": 0, "last_run": None}
+
+    def _push(self, kind: str, row_id: int, key, now: datetime):
+        bounds = self.kinds[kind].bounds(*key)
+        if bounds is None or bounds[0] <= now:
+            self._keys.pop((kind, row_id), None)
+            return
+        start = bounds[0]
+        self._keys[(kind, row_id)] = key
+        for label, offset in self.offsets:
+            self._push_at(start - offset, kind, row_id, key, label, start)
+
+    def schedule(self, kind: str, row_id: int, key, status: str = "upcoming"):
+        """Постановка напоминаний события (после создания или изменения дат); отменённым - не напоминать"""
+        with self._cond:
+            if status not in MANAGED_STATUSES:
+                self._keys.pop((kind, row_id), None)
+                return
+            self._push(kind, row_id, tuple(key), self._clock())
+            self._cond.notify()
+
+    def recover(self):
+        """Построение кучи по датам событий из БД"""
+        self._rebuild(lambda kind, row, now: self._push(kind.name, row[0], tuple(row[2:]), now))
+
+    def _due(self, now: datetime) -> list:
+        batch = []
+        while self._heap and self._heap[0][0] <= now:
+            _, _, kind, row_id, key, label, start = heapq.heappop(self._heap)
+            if self._keys.get((kind, row_id)) != key or start <= now:
+                continue
+            batch.append((kind, row_id, label, start))
+        return batch
+
+    def _process(self, batch: list) -> int:
+        count = self._fan_out(batch)
+        with self._stats_lock:
+            self._stats["fanned_out"] += len(batch)
+            self._stats["notifications"] += count
+            self._stats["last_run"] = self._clock().isoformat()
+        return count
+
+    def info(self) -> dict:
+        running, pending, next_at = self._state()
+        with self._stats_lock:
+            stats = dict(self._stats)
+        return {
+            "running": running,
+            "offsets": [label for label, _ in self.offsets],
+            "pending": pending,
+            "next_reminder_at": next_at,
+            **stats
+        }
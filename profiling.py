@@ -0,0 +1,247 @@
+import cProfile
+import contextvars
+import io
+import itertools
+import os
+import pstats
+import random
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from fnmatch import fnmatchcase
+
+from fastapi.concurrency import run_in_threadpool
+
+from repository import get_repository
+
+# Профилирование запросов (PROFILING=0 - middleware не подключается)
+ENABLED = os.getenv("PROFILING", "1") != "0"
+# Заголовок, которым администратор запрашивает профиль своего запроса
+PROFILE_HEADER = b"x-profile"
+# Доля запросов, профилируемых без заголовка (0 - только по заголовку)
+SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+# Доли по маршрутам: "/api/hackathons=0.05,/admin*=0.2" (шаблоны fnmatch по пути, первый совпавший)
+ROUTE_RATES = os.getenv("PROFILE_ROUTE_RATES", "")
+# Каталог с сохранёнными профилями и сколько последних профилей хранить
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", "50"))
+# Поля сортировки pstats, доступные в отчёте
+SORT_KEYS = ("cumulative", "tottime", "ncalls", "filename")
+
+
+def parse_route_rates(value: str) -> dict:
+    """Разбор строки "шаблон=доля,..." в словарь"""
+    rates = {}
+    for item in filter(None, (part.strip() for part in value.split(","))):
+        pattern, _, rate = item.rpartition("=")
+        if not pattern:
+            raise ValueError(f"Ожидается шаблон=доля: {item}")
+        rates[pattern] = float(rate)
+    return rates
+
+
+class ProfileStore:
+    """Последние профили запросов: файлы pstats в каталоге и их описание в памяти"""
+
+    def __init__(self, directory: str = PROFILE_DIR, keep: int = PROFILE_KEEP):
+        self.directory = directory
+        self.keep = keep
+        self._lock = threading.Lock()
+        self._profiles = deque()
+        self._ids = itertools.count(1)
+
+    def _path(self, profile_id: int) -> str:
+        return os.path.join(self.directory, f"{profile_id}.pstats")
+
+    def new_id(self) -> int:
+        with self._lock:
+            return next(self._ids)
+
+    def save(self, profile_id: int, profiler: cProfile.Profile, info: dict):
+        os.makedirs(self.directory, exist_ok=True)
+        profiler.dump_stats(self._path(profile_id))
+        info = dict(info, id=profile_id)
+        with self._lock:
+            self._profiles.append(info)
+            while len(self._profiles) > self.keep:
+                old = self._profiles.popleft()
+                try:
+                    os.remove(self._path(old["id"]))
+                except OSError:
+                    pass
+
+    def list(self) -> list:
+        with self._lock:
+            return list(reversed(self._profiles))
+
+    def get(self, profile_id: int):
+        with self._lock:
+            for info in self._profiles:
+                if info["id"] == profile_id:
+                    return info
+        return None
+
+    def path(self, profile_id: int):
+        return self._path(profile_id) if self.get(profile_id) else None
+
+    def report(self, profile_id: int, sort: str = "cumulative", limit: int = 40):
+        """Текстовый отчёт pstats по профилю или None, если профиль не найден"""
+        path = self.path(profile_id)
+        if path is None:
+            return None
+        if sort not in SORT_KEYS:
+            raise ValueError("Недопустимое поле сортировки")
+        out = io.StringIO()
+        stats = pstats.Stats(path, stream=out)
+        stats.strip_dirs().sort_stats(sort).print_stats(limit)
+        return out.getvalue()
+
+    def clear(self):
+        with self._lock:
+            profiles, self._profiles = list(self._profiles), deque()
+        for info in profiles:
+            try:
+                os.remove(self._path(info["id"]))
+            except OSError:
+                pass
+
+
+class ProfilingSettings:
+    """Доли профилируемых запросов; меняются администратором без перезапуска"""
+
+    def __init__(self, sample_rate: float = SAMPLE_RATE, route_rates: dict = None):
+        self.update(sample_rate, route_rates or {})
+
+    def update(self, sample_rate: float, route_rates: dict):
+        for rate in [sample_rate, *route_rates.values()]:
+            if not 0 <= rate <= 1:
+                raise ValueError("Доля профилирования должна быть от 0 до 1")
+        self.sample_rate = sample_rate
+        self.route_rates = dict(route_rates)
+        # Без долей решение принимается только по заголовку
+        self.sampling = bool(sample_rate or any(route_rates.values()))
+
+    def rate_for(self, path: str) -> float:
+        for pattern, rate in self.route_rates.items():
+            if fnmatchcase(path, pattern):
+                return rate
+        return self.sample_rate
+
+    def as_dict(self) -> dict:
+        return {"sample_rate": self.sample_rate, "route_rates": self.route_rates}
+
+
+profile_store = ProfileStore()
+profiling_settings = ProfilingSettings(SAMPLE_RATE, parse_route_rates(ROUTE_RATES))
+
+
+class _Profiled:
+    """Обёртка корутины: профилировщик включён только пока выполняется её шаг
+
+    Пока корутина ждёт (await), цикл событий выполняет другие запросы;
+    их код не должен попадать в профиль, поэтому профилировщик
+    выключается на каждом возврате управления в цикл.
+    """
+
+    def __init__(self, coro, profiler: cProfile.Profile):
+        self.coro = coro
+        self.profiler = profiler
+
+    def __await__(self):
+        value, error = None, None
+        while True:
+            self.profiler.enable()
+            try:
+                if error is None:
+                    future = self.coro.send(value)
+                else:
+                    future = self.coro.throw(error)
+            except StopIteration as stop:
+                return stop.value
+            finally:
+                self.profiler.disable()
+            try:
+                value, error = (yield future), None
+            except BaseException as e:
+                value, error = None, e
+
+
+class ProfilingMiddleware:
+    """ASGI middleware: профиль cProfile для выбранных запросов
+
+    Запрос профилируется, если администратор прислал заголовок X-Profile: 1
+    или он попал в выборку по доле маршрута. Профилируются только шаги
+    корутины запроса в потоке цикла событий: маршрутизация, асинхронные
+    обработчики и их запросы к БД. Синхронные обработчики (def) и вызовы
+    run_in_threadpool выполняются в пуле потоков, их функции в профиль
+    не попадают - видно только время ожидания потока. Одновременно
+    профилируется один запрос. Номер профиля возвращается в X-Profile-Id.
+    Должен стоять внутри SessionMiddleware - по сессии проверяется администратор.
+    """
+
+    def __init__(self, app, store: ProfileStore = profile_store, settings: ProfilingSettings = profiling_settings):
+        self.app = app
+        self.store = store
+        self.settings = settings
+        self._busy = threading.Lock()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        trigger = self._trigger(scope)
+        if trigger is None or not self._busy.acquire(blocking=False):
+            await self.app(scope, receive, send)
+            return
+
+        profile_id = self.store.new_id()
+        status = None
+
+        async def send_with_id(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                headers = list(message.get("headers", []))
+                headers.append((b"x-profile-id", str(profile_id).encode()))
+                message = dict(message, headers=headers)
+            await send(message)
+
+        profiler = cProfile.Profile()
+        started = time.perf_counter()
+        try:
+            await _Profiled(self.app(scope, receive, send_with_id), profiler)
+        finally:
+            self._busy.release()
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            # Запись файла pstats не должна задерживать цикл событий
+            await run_in_threadpool(self.store.save, profile_id, profiler, {
+                "method": scope["method"],
+                "path": scope["path"],
+                "route": getattr(scope.get("route"), "path_format", None),
+                "status": status,
+                "trigger": trigger,
+                "duration_ms": round(elapsed_ms, 3),
+                "created_at": datetime.now().isoformat()
+            })
+
+    def _trigger(self, scope):
+        """Причина профилирования: header, sample или None"""
+        for name, value in scope["headers"]:
+            if name == PROFILE_HEADER and value not in (b"", b"0"):
+                # Проверка идёт в пустом контексте, чтобы её запрос не учитывался в бюджете маршрута
+                if contextvars.Context().run(self._is_admin, scope):
+                    return "header"
+                break
+        if self.settings.sampling and random.random() < self.settings.rate_for(scope["path"]):
+            return "sample"
+        return None
+
+    @staticmethod
+    def _is_admin(scope) -> bool:
+        user_id = scope.get("session", {}).get("user_id")
+        if not user_id:
+            return False
+        user = get_repository().get_user_by_id(user_id)
+        return bool(user) and user["role"] == "admin"
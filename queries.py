@@ -0,0 +1,315 @@
+import atexit
+import contextvars
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+import metrics
+
+# Сбор статистики по запросам (QUERY_STATS=0 - обычные соединения без замеров)
+ENABLED = os.getenv("QUERY_STATS", "1") != "0"
+# Файл для выгрузки статистики; при заданном QUERY_STATS_DUMP выгружается и при завершении
+DUMP_PATH = os.getenv("QUERY_STATS_DUMP") or "query_stats.json"
+# Сколько вариантов текста (разные длины списков IN и т.п.) держать в кэше на каждый шаблон
+TEMPLATE_VARIANTS = 8
+# Запас кэша под служебные и незарегистрированные запросы
+CACHE_HEADROOM = 16
+# Имя, под которым учитываются запросы не из реестра
+UNREGISTERED = "<unregistered>"
+
+
+class Statement(str):
+    """Текст SQL-запроса с именем из реестра"""
+
+    def __new__(cls, name: str, sql: str):
+        statement = super().__new__(cls, sql)
+        statement.name = name
+        return statement
+
+
+class Template:
+    """Запрос, текст которого собирается при вызове (списки IN, набор колонок, условия)"""
+
+    def __init__(self, name: str, sql: str):
+        self.name = name
+        self.sql = sql
+
+    def format(self, **parts) -> Statement:
+        return Statement(self.name, self.sql.format(**parts))
+
+
+class _StatementStats:
+    __slots__ = ("calls", "errors", "rows", "total_ms", "max_ms")
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.rows = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def as_dict(self) -> dict:
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "rows": self.rows,
+            "total_ms": round(self.total_ms, 3),
+            "mean_ms": round(self.total_ms / self.calls, 3) if self.calls else 0.0,
+            "max_ms": round(self.max_ms, 3)
+        }
+
+
+class QueryRegistry:
+    """Реестр именованных SQL-запросов и статистика их выполнения
+
+    Запросы регистрируются при импорте модулей, поэтому к открытию первого
+    соединения реестр полон и по нему рассчитывается размер кэша
+    подготовленных запросов SQLite. Время запроса включает выполнение
+    и чтение строк; rows - число прочитанных строк для выборок
+    и изменённых строк для INSERT/UPDATE/DELETE.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._statements = {}
+        self._templates = {}
+        self._stats = {}
+        self._since = datetime.now().isoformat()
+
+    def _check_name(self, name: str, sql: str):
+        existing = self._statements.get(name)
+        if existing is None:
+            existing = self._templates.get(name)
+            existing = existing.sql if existing else None
+        if existing is not None and " ".join(existing.split()) != " ".join(sql.split()):
+            raise ValueError(f"Запрос {name} уже зарегистрирован с другим текстом")
+
+    def statement(self, name: str, sql: str) -> Statement:
+        """Регистрация запроса с постоянным текстом"""
+        self._check_name(name, sql)
+        statement = Statement(name, sql)
+        self._statements[name] = statement
+        return statement
+
+    def template(self, name: str, sql: str) -> Template:
+        """Регистрация запроса, части которого ({...}) подставляются при вызове"""
+        self._check_name(name, sql)
+        template = Template(name, sql)
+        self._templates[name] = template
+        return template
+
+    def names(self) -> list:
+        return sorted(list(self._statements) + list(self._templates))
+
+    def cache_size(self) -> int:
+        """Размер кэша подготовленных запросов, вмещающий весь реестр"""
+        return len(self._statements) + len(self._templates) * TEMPLATE_VARIANTS + CACHE_HEADROOM
+
+    def record(self, name: str, elapsed_ms: float, rows: int = 0, failed: bool = False,
+               call: bool = True, call_ms: float = None):
+        """Учёт выполнения (call=True) или дочитывания строк уже учтённого вызова"""
+        with self._lock:
+            stats = self._stats.get(name)
+            if stats is None:
+                stats = self._stats[name] = _StatementStats()
+            if call:
+                stats.calls += 1
+            stats.errors += failed
+            stats.rows += rows
+            stats.total_ms += elapsed_ms
+            stats.max_ms = max(stats.max_ms, elapsed_ms if call_ms is None else call_ms)
+
+    def stats(self, sort: str = "total_ms", limit: int = None) -> dict:
+        with self._lock:
+            statements = {name: stats.as_dict() for name, stats in self._stats.items()}
+            since = self._since
+        ordered = sorted(statements.items(), key=lambda item: item[1].get(sort, 0), reverse=True)
+        if limit is not None:
+            ordered = ordered[:limit]
+        return {
+            "since": since,
+            "enabled": ENABLED,
+            "registered": len(self._statements) + len(self._templates),
+            "cache_size": self.cache_size(),
+            "unused": [name for name in self.names() if name not in statements],
+            "statements": [dict(name=name, **values) for name, values in ordered]
+        }
+
+    def reset(self):
+        with self._lock:
+            self._stats = {}
+            self._since = datetime.now().isoformat()
+
+    def dump(self, path: str = None) -> str:
+        """Выгрузка статистики в JSON-файл; возвращает путь"""
+        path = path or DUMP_PATH
+        data = self.stats()
+        data["dumped_at"] = datetime.now().isoformat()
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, path)
+        return path
+
+
+registry = QueryRegistry()
+statement = registry.statement
+template = registry.template
+
+
+class RequestQueryStats:
+    """Счётчики БД в рамках одного HTTP-запроса"""
+
+    __slots__ = ("connections", "queries", "db_ms", "shapes")
+
+    def __init__(self):
+        self.connections = 0
+        self.queries = 0
+        self.db_ms = 0.0
+        self.shapes = {}
+
+    def repeated(self, threshold: int) -> dict:
+        """Запросы одной формы, выполненные больше threshold раз (признак N+1)"""
+        return {shape: count for shape, count in self.shapes.items() if count > threshold}
+
+
+_request_stats = contextvars.ContextVar("request_query_stats", default=None)
+
+
+def begin_request() -> tuple:
+    """Начало учёта запросов к БД для текущего контекста; возвращает (stats, token)"""
+    stats = RequestQueryStats()
+    return stats, _request_stats.set(stats)
+
+
+def end_request(token):
+    _request_stats.reset(token)
+
+
+def _shape(sql) -> str:
+    """Имя запроса из реестра или текст без литералов для незарегистрированных"""
+    name = getattr(sql, "name", None)
+    if name is not None:
+        return name
+    text = re.sub(r"'[^']*'|\b\d+\b", "?", " ".join(str(sql).split()))
+    return f"{UNREGISTERED} {text[:200]}"
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """Курсор, учитывающий время и строки каждого запроса под его именем"""
+
+    _query_name = UNREGISTERED
+    _call_ms = 0.0
+    # Время выборки попадает в гистограмму после первого чтения строк
+    _observe_pending = False
+
+    def _observe(self):
+        self._observe_pending = False
+        metrics.db_query_duration.observe(self._call_ms / 1000, self._query_name)
+
+    def _run(self, method, sql, params):
+        if self._observe_pending:
+            self._observe()
+        name = getattr(sql, "name", UNREGISTERED)
+        self._query_name = name
+        request = _request_stats.get()
+        started = time.perf_counter()
+        try:
+            method(sql, params)
+        except Exception:
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            registry.record(name, elapsed_ms, failed=True)
+            if request is not None:
+                self._count(request, sql, elapsed_ms)
+            raise
+        self._call_ms = (time.perf_counter() - started) * 1000
+        registry.record(name, self._call_ms, max(self.rowcount, 0))
+        if request is not None:
+            self._count(request, sql, self._call_ms)
+        if metrics.ENABLED:
+            if self.description is None:
+                self._observe()
+            else:
+                self._observe_pending = True
+        return self
+
+    @staticmethod
+    def _count(request, sql, elapsed_ms):
+        shape = _shape(sql)
+        request.queries += 1
+        request.db_ms += elapsed_ms
+        request.shapes[shape] = request.shapes.get(shape, 0) + 1
+
+    def execute(self, sql, params=()):
+        return self._run(super().execute, sql, params)
+
+    def executemany(self, sql, params):
+        return self._run(super().executemany, sql, params)
+
+    def _fetch(self, method, *args):
+        started = time.perf_counter()
+        result = method(*args)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        self._call_ms += elapsed_ms
+        rows = len(result) if isinstance(result, list) else int(result is not None)
+        registry.record(self._query_name, elapsed_ms, rows, call=False, call_ms=self._call_ms)
+        request = _request_stats.get()
+        if request is not None:
+            request.db_ms += elapsed_ms
+        if self._observe_pending:
+            self._observe()
+        return result
+
+    def fetchone(self):
+        return self._fetch(super().fetchone)
+
+    def fetchmany(self, size=None):
+        return self._fetch(super().fetchmany, self.arraysize if size is None else size)
+
+    def fetchall(self):
+        return self._fetch(super().fetchall)
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    _open = False
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = _request_stats.get()
+        if request is not None:
+            request.connections += 1
+        if metrics.ENABLED:
+            self._open = True
+            metrics.db_connections_opened.inc()
+            metrics.db_connections_open.inc()
+
+    def close(self):
+        if self._open:
+            self._open = False
+            metrics.db_connections_open.dec()
+        super().close()
+
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, params=()):
+        return self.cursor().execute(sql, params)
+
+    def executemany(self, sql, params):
+        return self.cursor().executemany(sql, params)
+
+
+def connect_options() -> dict:
+    """Параметры sqlite3.connect: замеры запросов и кэш по размеру реестра"""
+    options = {"cached_statements": registry.cache_size()}
+    if ENABLED:
+        options["factory"] = InstrumentedConnection
+    return options
+
+
+if os.getenv("QUERY_STATS_DUMP"):
+    atexit.register(registry.dump)
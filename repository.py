@@ -0,0 +1,1664 @@
+import json
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from typing import Optional, List
+
+from fastapi import Request, HTTPException, status
+
+import audit_archive
+import db
+import funnel
+from leaderboard import Leaderboard
+from scoring import compute_scores
+
+
+class Repository(ABC):
+    """Интерфейс хранилища: пользователи, хакатоны, команды, участия,
+    репутация, проекты, вебинары и курсы.
+
+    Методы повторяют функции db.py по именам, аргументам и форме
+    результата (словари с теми же ключами, ValueError при нарушении правил).
+    """
+
+    # ========== Пользователи ==========
+    @abstractmethod
+    def get_user_by_id(self, user_id: int): ...
+
+    @abstractmethod
+    def get_user_by_email(self, email: str): ...
+
+    @abstractmethod
+    def get_user_by_telegram(self, telegram_nickname: str): ...
+
+    @abstractmethod
+    def get_all_users(self): ...
+
+    @abstractmethod
+    def list_users(self): ...
+
+    @abstractmethod
+    def create_user(self, fields: dict): ...
+
+    @abstractmethod
+    def update_user(self, user_id: int, fields: dict): ...
+
+    @abstractmethod
+    def delete_user(self, user_id: int): ...
+
+    # ========== Хакатоны ==========
+    @abstractmethod
+    def get_hackathon_by_id(self, hackathon_id: int): ...
+
+    @abstractmethod
+    def get_hackathons_by_ids(self, hackathon_ids: List[int]): ...
+
+    @abstractmethod
+    def get_all_hackathons(self, status_filter: str = None): ...
+
+    @abstractmethod
+    def list_hackathons(self, status_filter: str = None): ...
+
+    @abstractmethod
+    def create_hackathon(self, data: dict): ...
+
+    @abstractmethod
+    def update_hackathon(self, hackathon_id: int, data: dict): ...
+
+    @abstractmethod
+    def get_participant_counts(self, hackathon_ids: List[int]): ...
+
+    @property
+    @abstractmethod
+    def hackathon_publishing(self) -> bool:
+        """Есть ли у хакатонов публикация и минимум участников (published, min_participants)"""
+
+    # ========== Участия ==========
+    @abstractmethod
+    def get_participation(self, user_id: int, hackathon_id: int): ...
+
+    @abstractmethod
+    def get_participation_by_id(self, participation_id: int): ...
+
+    @abstractmethod
+    def get_participations_by_ids(self, participation_ids: List[int]): ...
+
+    @abstractmethod
+    def get_user_participations(self, user_id: int): ...
+
+    @abstractmethod
+    def get_hackathon_participants(self, hackathon_id: int): ...
+
+    @abstractmethod
+    def create_participation(self, user_id: int, hackathon_id: int, role: str, team_id: int = None): ...
+
+    @abstractmethod
+    def join_open_team(self, user_id: int, hackathon_id: int, role: str = "team_member"): ...
+
+    @abstractmethod
+    def delete_participation(self, user_id: int, hackathon_id: int): ...
+
+    @abstractmethod
+    def update_participation_role(self, user_id: int, hackathon_id: int, new_role: str): ...
+
+    # ========== Команды ==========
+    @abstractmethod
+    def create_team(self, hackathon_id: int, name: str, captain_id: int, description: str = None): ...
+
+    @abstractmethod
+    def get_team_by_id(self, team_id: int): ...
+
+    @abstractmethod
+    def get_team_by_code(self, hackathon_id: int, team_code: str): ...
+
+    @abstractmethod
+    def get_team_members(self, team_id: int): ...
+
+    @abstractmethod
+    def get_user_team_in_hackathon(self, user_id: int, hackathon_id: int): ...
+
+    @abstractmethod
+    def add_member_to_team(self, user_id: int, hackathon_id: int, team_id: int): ...
+
+    @abstractmethod
+    def set_participation_team(self, user_id: int, hackathon_id: int, team_id: int): ...
+
+    @abstractmethod
+    def remove_member_from_team(self, user_id: int, hackathon_id: int): ...
+
+    @abstractmethod
+    def update_team_name(self, team_id: int, new_name: str, hackathon_id: int): ...
+
+    @abstractmethod
+    def get_available_teams(self, hackathon_id: int): ...
+
+    @abstractmethod
+    def verify_team_member_counts(self, repair: bool = True) -> dict: ...
+
+    # ========== Репутация ==========
+    @abstractmethod
+    def update_reputation(self, participation_id: int, new_reputation: int, changed_by: int,
+                          reason: str = None): ...
+
+    @abstractmethod
+    def update_reputation_batch(self, updates: List[dict], changed_by: int): ...
+
+    @abstractmethod
+    def get_reputation_history(self, participation_id: int, limit: int = 50, offset: int = 0): ...
+
+    @abstractmethod
+    def get_reputation_timeseries(self, scope: str, scope_id: int, granularity: str = "day",
+                                  start: str = None, end: str = None): ...
+
+    # ========== Таблицы лидеров ==========
+    @abstractmethod
+    def get_leaderboard(self, limit: int, hackathon_id: int = None, teams: bool = False): ...
+
+    @abstractmethod
+    def get_leaderboard_position(self, user_id: int, radius: int, hackathon_id: int = None): ...
+
+    @abstractmethod
+    def get_usernames(self, user_ids: List[int]): ...
+
+    @abstractmethod
+    def get_team_names(self, team_ids: List[int]): ...
+
+    # ========== Проекты и экспертиза ==========
+    @abstractmethod
+    def create_project(self, hackathon_id: int, participation_id: int, title: str, description: str = None,
+                       presentation_url: str = None, area_topic: str = None, team_id: int = None,
+                       status: str = "draft"): ...
+
+    @abstractmethod
+    def get_projects_by_hackathon(self, hackathon_id: int, area_topic: str = None): ...
+
+    @abstractmethod
+    def get_project_by_id(self, project_id: int): ...
+
+    @abstractmethod
+    def get_expert_areas(self, expert_id: int, hackathon_id: int): ...
+
+    @abstractmethod
+    def add_expert_area(self, expert_id: int, hackathon_id: int, area_topic: str): ...
+
+    @abstractmethod
+    def remove_expert_area(self, expert_id: int, hackathon_id: int, area_topic: str): ...
+
+    @abstractmethod
+    def get_project_comments(self, project_id: int): ...
+
+    @abstractmethod
+    def get_project_comment_by_id(self, comment_id: int): ...
+
+    @abstractmethod
+    def add_project_comment(self, project_id: int, expert_id: int, comment: str, rating: int = None): ...
+
+    @abstractmethod
+    def update_project_comment(self, comment_id: int, comment: str, rating: int = None): ...
+
+    @abstractmethod
+    def get_review_queue(self, expert_id: int, hackathon_id: int, all_areas: bool = False,
+                         review_status: str = None, limit: int = 20, offset: int = 0): ...
+
+    @abstractmethod
+    def get_project_scores(self, hackathon_id: int): ...
+
+    # ========== Журнал экспертов ==========
+    @abstractmethod
+    def log_expert_action(self, expert_id: int, hackathon_id: int, action_type: str, target_type: str = None,
+                          target_id: int = None, details: str = None, ip_address: str = None): ...
+
+    @abstractmethod
+    def get_expert_audit_log(self, expert_id: int, hackathon_id: int = None, limit: int = 50, offset: int = 0): ...
+
+    @abstractmethod
+    def query_audit_log(self, expert_id: int = None, hackathon_id: int = None, start: str = None,
+                        end: str = None, limit: int = 50, offset: int = 0): ...
+
+    @abstractmethod
+    def get_audit_retention(self, hackathon_id: int): ...
+
+    @abstractmethod
+    def set_audit_retention(self, hackathon_id: int, retention_days: int): ...
+
+    @abstractmethod
+    def rotate_audit_log(self): ...
+
+    # ========== Статистика ==========
+    @abstractmethod
+    def get_user_statistics(self): ...
+
+    @abstractmethod
+    def get_age_statistics(self): ...
+
+    @abstractmethod
+    def get_registration_statistics(self): ...
+
+    @abstractmethod
+    def get_activity_timeline(self, entity: str = "users", granularity: str = "day",
+                              start: str = None, end: str = None) -> dict: ...
+
+    @abstractmethod
+    def backfill_activity_rollups(self, entities=None) -> dict: ...
+
+    @abstractmethod
+    def get_demographics(self, dimension: str, by: str = None) -> dict: ...
+
+    @abstractmethod
+    def reconcile_demographics(self, repair: bool = True) -> dict: ...
+
+    # ========== Пакетная аналитика ==========
+    @abstractmethod
+    def run_participation_funnel(self) -> dict: ...
+
+    @abstractmethod
+    def get_analytics_result(self, kind: str, version: int = None) -> Optional[str]: ...
+
+    @abstractmethod
+    def list_analytics_results(self, kind: str) -> list: ...
+
+    # ========== Уведомления ==========
+    @abstractmethod
+    def enqueue_event_notification(self, event_type: str, event_id: int, subject: str, body: str,
+                                   send_at: Optional[str] = None, key: Optional[str] = None) -> int: ...
+
+    @abstractmethod
+    def get_notification_stats(self) -> dict: ...
+
+    @abstractmethod
+    def retry_failed_notifications(self) -> int: ...
+
+    @abstractmethod
+    def purge_sent_notifications(self, days: int = 30) -> int: ...
+
+    # ========== Вебинары ==========
+    @abstractmethod
+    def get_all_webinars(self, status_filter: Optional[str] = None): ...
+
+    @abstractmethod
+    def get_webinar_by_id(self, webinar_id: int): ...
+
+    @abstractmethod
+    def create_webinar(self, name: str, description: str, speaker: str, date_time: str,
+                       duration_hours: Optional[float] = None, location: str = "Онлайн",
+                       max_participants: Optional[int] = None, status: str = "upcoming"): ...
+
+    @abstractmethod
+    def register_for_webinar(self, user_id: int, webinar_id: int): ...
+
+    @abstractmethod
+    def cancel_webinar_registration(self, user_id: int, webinar_id: int): ...
+
+    @abstractmethod
+    def get_user_webinar_registrations(self, user_id: int): ...
+
+    @abstractmethod
+    def is_user_registered_for_webinar(self, user_id: int, webinar_id: int): ...
+
+    @abstractmethod
+    def get_webinar_participant_count(self, webinar_id: int): ...
+
+    @abstractmethod
+    def get_webinar_participant_counts(self, webinar_ids: List[int]): ...
+
+    # ========== Курсы ==========
+    @abstractmethod
+    def get_all_courses(self, status_filter: Optional[str] = None): ...
+
+    @abstractmethod
+    def get_course_by_id(self, course_id: int): ...
+
+    @abstractmethod
+    def create_course(self, name: str, description: str, instructor: str, start_date: str, end_date: str,
+                      hours_per_week: Optional[int] = None, max_students: Optional[int] = None,
+                      status: str = "upcoming", certificate_available: bool = False): ...
+
+    @abstractmethod
+    def register_for_course(self, user_id: int, course_id: int): ...
+
+    @abstractmethod
+    def cancel_course_registration(self, user_id: int, course_id: int): ...
+
+    @abstractmethod
+    def get_user_course_registrations(self, user_id: int): ...
+
+    @abstractmethod
+    def is_user_registered_for_course(self, user_id: int, course_id: int): ...
+
+    @abstractmethod
+    def get_course_participant_count(self, course_id: int): ...
+
+    @abstractmethod
+    def get_course_participant_counts(self, course_ids: List[int]): ...
+
+    # ========== Листы ожидания ==========
+    @abstractmethod
+    def enroll(self, kind: str, user_id: int, event_id: int) -> dict: ...
+
+    @abstractmethod
+    def leave_waitlist(self, kind: str, user_id: int, event_id: int): ...
+
+    @abstractmethod
+    def get_waitlist_position(self, kind: str, event_id: int, user_id: int) -> dict: ...
+
+    # ========== Сессия и права (общие для всех хранилищ) ==========
+    def get_current_user(self, request: Request):
+        """Получение текущего пользователя из сессии"""
+        user_id = request.session.get("user_id")
+        if not user_id:
+            return None
+        return self.get_user_by_id(user_id)
+
+    def require_admin(self, request: Request):
+        """Проверка прав администратора"""
+        user = self.get_current_user(request)
+        if not user or user["role"] != "admin":
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="Требуются права администратора"
+            )
+        return user
+
+    def require_expert_in_hackathon(self, request: Request, hackathon_id: int):
+        """Проверка, что пользователь является экспертом в данном хакатоне"""
+        user = self.get_current_user(request)
+        if not user:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Требуется авторизация"
+            )
+        if user["role"] == "admin":
+            return user
+        participation = self.get_participation(user["id"], hackathon_id)
+        if not participation or participation["role"] != "expert":
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="Требуются права эксперта в данном хакатоне"
+            )
+        return user
+
+
+class SQLiteRepository(Repository):
+    """Хранилище на SQLite: методы - функции db.py"""
+
+    # Пользователи
+    get_user_by_id = staticmethod(db.get_user_by_id)
+    get_user_by_email = staticmethod(db.get_user_by_email)
+    get_user_by_telegram = staticmethod(db.get_user_by_telegram)
+    get_all_users = staticmethod(db.get_all_users)
+    list_users = staticmethod(db.list_users)
+    create_user = staticmethod(db.create_user)
+    update_user = staticmethod(db.update_user)
+    delete_user = staticmethod(db.delete_user)
+
+    # Хакатоны
+    get_hackathon_by_id = staticmethod(db.get_hackathon_by_id)
+    get_hackathons_by_ids = staticmethod(db.get_hackathons_by_ids)
+    get_all_hackathons = staticmethod(db.get_all_hackathons)
+    list_hackathons = staticmethod(db.list_hackathons)
+    create_hackathon = staticmethod(db.create_hackathon)
+    update_hackathon = staticmethod(db.update_hackathon)
+    get_participant_counts = staticmethod(db.get_participant_counts)
+
+    @property
+    def hackathon_publishing(self) -> bool:
+        return db.schema.hackathon_publishing
+
+    # Участия
+    get_participation = staticmethod(db.get_participation)
+    get_participation_by_id = staticmethod(db.get_participation_by_id)
+    get_participations_by_ids = staticmethod(db.get_participations_by_ids)
+    get_user_participations = staticmethod(db.get_user_participations)
+    get_hackathon_participants = staticmethod(db.get_hackathon_participants)
+    create_participation = staticmethod(db.create_participation)
+    join_open_team = staticmethod(db.join_open_team)
+    delete_participation = staticmethod(db.delete_participation)
+    update_participation_role = staticmethod(db.update_participation_role)
+
+    # Команды
+    create_team = staticmethod(db.create_team)
+    get_team_by_id = staticmethod(db.get_team_by_id)
+    get_team_by_code = staticmethod(db.get_team_by_code)
+    get_team_members = staticmethod(db.get_team_members)
+    get_user_team_in_hackathon = staticmethod(db.get_user_team_in_hackathon)
+    add_member_to_team = staticmethod(db.add_member_to_team)
+    set_participation_team = staticmethod(db.set_participation_team)
+    remove_member_from_team = staticmethod(db.remove_member_from_team)
+    update_team_name = staticmethod(db.update_team_name)
+    get_available_teams = staticmethod(db.get_available_teams)
+    verify_team_member_counts = staticmethod(db.verify_team_member_counts)
+
+    # Репутация
+    update_reputation = staticmethod(db.update_reputation)
+    update_reputation_batch = staticmethod(db.update_reputation_batch)
+    get_reputation_history = staticmethod(db.get_reputation_history)
+    get_reputation_timeseries = staticmethod(db.get_reputation_timeseries)
+
+    # Таблицы лидеров
+    get_leaderboard = staticmethod(db.get_leaderboard)
+    get_leaderboard_position = staticmethod(db.get_leaderboard_position)
+    get_usernames = staticmethod(db.get_usernames)
+    get_team_names = staticmethod(db.get_team_names)
+
+    # Проекты и экспертиза
+    create_project = staticmethod(db.create_project)
+    get_projects_by_hackathon = staticmethod(db.get_projects_by_hackathon)
+    get_project_by_id = staticmethod(db.get_project_by_id)
+    get_expert_areas = staticmethod(db.get_expert_areas)
+    add_expert_area = staticmethod(db.add_expert_area)
+    remove_expert_area = staticmethod(db.remove_expert_area)
+    get_project_comments = staticmethod(db.get_project_comments)
+    get_project_comment_by_id = staticmethod(db.get_project_comment_by_id)
+    add_project_comment = staticmethod(db.add_project_comment)
+    update_project_comment = staticmethod(db.update_project_comment)
+    get_review_queue = staticmethod(db.get_review_queue)
+    get_project_scores = staticmethod(db.get_project_scores)
+
+    # Журнал экспертов
+    log_expert_action = staticmethod(db.log_expert_action)
+    get_expert_audit_log = staticmethod(db.get_expert_audit_log)
+    query_audit_log = staticmethod(db.query_audit_log)
+    get_audit_retention = staticmethod(db.get_audit_retention)
+    set_audit_retention = staticmethod(db.set_audit_retention)
+    rotate_audit_log = staticmethod(db.rotate_audit_log)
+
+    # Статистика (по копии БД для аналитики)
+    get_user_statistics = staticmethod(db.get_user_statistics)
+    get_age_statistics = staticmethod(db.get_age_statistics)
+    get_registration_statistics = staticmethod(db.get_registration_statistics)
+    get_activity_timeline = staticmethod(db.get_activity_timeline)
+    backfill_activity_rollups = staticmethod(db.backfill_activity_rollups)
+    get_demographics = staticmethod(db.get_demographics)
+    reconcile_demographics = staticmethod(db.reconcile_demographics)
+
+    # Пакетная аналитика
+    run_participation_funnel = staticmethod(db.run_participation_funnel)
+    get_analytics_result = staticmethod(db.get_analytics_result)
+    list_analytics_results = staticmethod(db.list_analytics_results)
+
+    # Уведомления
+    enqueue_event_notification = staticmethod(db.enqueue_event_notification)
+    get_notification_stats = staticmethod(db.get_notification_stats)
+    retry_failed_notifications = staticmethod(db.retry_failed_notifications)
+    purge_sent_notifications = staticmethod(db.purge_sent_notifications)
+
+    # Вебинары
+    get_all_webinars = staticmethod(db.get_all_webinars)
+    get_webinar_by_id = staticmethod(db.get_webinar_by_id)
+    create_webinar = staticmethod(db.create_webinar)
+    register_for_webinar = staticmethod(db.register_for_webinar)
+    cancel_webinar_registration = staticmethod(db.cancel_webinar_registration)
+    get_user_webinar_registrations = staticmethod(db.get_user_webinar_registrations)
+    is_user_registered_for_webinar = staticmethod(db.is_user_registered_for_webinar)
+    get_webinar_participant_count = staticmethod(db.get_webinar_participant_count)
+    get_webinar_participant_counts = staticmethod(db.get_webinar_participant_counts)
+
+    # Курсы
+    get_all_courses = staticmethod(db.get_all_courses)
+    get_course_by_id = staticmethod(db.get_course_by_id)
+    create_course = staticmethod(db.create_course)
+    register_for_course = staticmethod(db.register_for_course)
+    cancel_course_registration = staticmethod(db.cancel_course_registration)
+    get_user_course_registrations = staticmethod(db.get_user_course_registrations)
+    is_user_registered_for_course = staticmethod(db.is_user_registered_for_course)
+    get_course_participant_count = staticmethod(db.get_course_participant_count)
+    get_course_participant_counts = staticmethod(db.get_course_participant_counts)
+
+    # Листы ожидания
+    enroll = staticmethod(db.enroll)
+    leave_waitlist = staticmethod(db.leave_waitlist)
+    get_waitlist_position = staticmethod(db.get_waitlist_position)
+
+
+class _Table:
+    """Таблица в памяти: строки по ID и вторичные индексы
+
+    indexes - имя индекса -> функция ключа от строки. Поиск по индексу
+    возвращает строки в порядке ID, как SQLite без ORDER BY.
+    """
+
+    def __init__(self, columns: dict, **indexes):
+        self.columns = columns
+        self.rows = {}
+        self.next_id = 1
+        self.key_functions = indexes
+        self.indexes = {name: defaultdict(set) for name in indexes}
+
+    @staticmethod
+    def _normalize(value):
+        # SQLite хранит булевы значения как 0/1
+        return int(value) if isinstance(value, bool) else value
+
+    def insert(self, values: dict) -> int:
+        row_id = self.next_id
+        self.next_id += 1
+        row = {"id": row_id}
+        for column, default in self.columns.items():
+            row[column] = self._normalize(values.get(column, default))
+        self.rows[row_id] = row
+        self._index(row)
+        return row_id
+
+    def update(self, row_id: int, **values):
+        row = self.rows[row_id]
+        self._unindex(row)
+        for column, value in values.items():
+            row[column] = self._normalize(value)
+        self._index(row)
+
+    def delete(self, row_id: int):
+        row = self.rows.pop(row_id, None)
+        if row is not None:
+            self._unindex(row)
+        return row
+
+    def get(self, row_id):
+        return self.rows.get(row_id)
+
+    def find(self, index: str, key) -> list:
+        return [self.rows[row_id] for row_id in sorted(self.indexes[index].get(key, ()))]
+
+    def first(self, index: str, key):
+        ids = self.indexes[index].get(key)
+        return self.rows[min(ids)] if ids else None
+
+    def all(self) -> list:
+        return list(self.rows.values())
+
+    def _index(self, row):
+        for name, key_function in self.key_functions.items():
+            self.indexes[name][key_function(row)].add(row["id"])
+
+    def _unindex(self, row):
+        for name, key_function in self.key_functions.items():
+            key = key_function(row)
+            ids = self.indexes[name][key]
+            ids.discard(row["id"])
+            if not ids:
+                del self.indexes[name][key]
+
+
+def _synchronized(method):
+    def wrapper(self, *args, **kwargs):
+        with self._lock:
+            return method(self, *args, **kwargs)
+    wrapper.__name__ = method.__name__
+    wrapper.__doc__ = method.__doc__
+    return wrapper
+
+
+def _copy(row):
+    return dict(row) if row else None
+
+
+class MemoryRepository(Repository):
+    """Хранилище в памяти на словарях с индексами, без файла на диске"""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self.users = _Table(
+            {"username": None, "email": None, "password": None, "age": None, "fio": None,
+             "telegram_nickname": None, "basics_knowledge": None, "city": None, "team_name": None,
+             "looking_for_team": False, "role": "user", "created_at": None, "balls": 0,
+             "hackathons": "", "intensives": ""},
+            email=lambda row: (row["email"] or "").lower(),
+            telegram=lambda row: row["telegram_nickname"]
+        )
+        self.hackathons = _Table(
+            {"name": None, "description": None, "organizer": None, "start_date": None, "end_date": None,
+             "duration_hours": None, "prize_fund": None, "max_team_size": None, "status": "upcoming",
+             "created_at": None, "min_participants": 0, "published": 0}
+        )
+        self.teams = _Table(
+            {"hackathon_id": None, "name": None, "description": None, "captain_id": None, "created_at": None},
+            hackathon=lambda row: row["hackathon_id"],
+            name=lambda row: (row["hackathon_id"], row["name"]),
+            captain=lambda row: row["captain_id"]
+        )
+        self.participations = _Table(
+            {"user_id": None, "hackathon_id": None, "role": None, "team_id": None, "reputation": 0,
+             "created_at": None, "updated_at": None},
+            user=lambda row: row["user_id"],
+            hackathon=lambda row: row["hackathon_id"],
+            team=lambda row: row["team_id"],
+            user_hackathon=lambda row: (row["user_id"], row["hackathon_id"])
+        )
+        self.reputation_history = _Table(
+            {"participation_id": None, "old_reputation": None, "new_reputation": None, "changed_by": None,
+             "reason": None, "created_at": None},
+            participation=lambda row: row["participation_id"],
+            changed_by=lambda row: row["changed_by"]
+        )
+        self.projects = _Table(
+            {"hackathon_id": None, "team_id": None, "participation_id": None, "title": None,
+             "description": None, "presentation_url": None, "area_topic": None, "status": "draft",
+             "created_at": None, "updated_at": None},
+            hackathon=lambda row: row["hackathon_id"],
+            team=lambda row: row["team_id"],
+            participation=lambda row: row["participation_id"]
+        )
+        self.expert_areas = _Table(
+            {"expert_id": None, "hackathon_id": None, "area_topic": None, "created_at": None},
+            expert=lambda row: row["expert_id"],
+            expert_hackathon=lambda row: (row["expert_id"], row["hackathon_id"])
+        )
+        self.comments = _Table(
+            {"project_id": None, "expert_id": None, "comment": None, "rating": None,
+             "created_at": None, "updated_at": None},
+            project=lambda row: row["project_id"],
+            expert=lambda row: row["expert_id"]
+        )
+        self.webinars = _Table(
+            {"name": None, "description": None, "speaker": None, "date_time": None, "duration_hours": None,
+             "location": "Онлайн", "max_participants": None, "status": "upcoming", "created_at": None}
+        )
+        self.courses = _Table(
+            {"name": None, "description": None, "instructor": None, "start_date": None, "end_date": None,
+             "hours_per_week": None, "max_students": None, "status": "upcoming",
+             "certificate_available": False, "created_at": None}
+        )
+        registration = {"user_id": None, "created_at": None}
+        self.webinar_registrations = _Table(
+            {**registration, "webinar_id": None},
+            user=lambda row: row["user_id"],
+            webinar=lambda row: row["webinar_id"],
+            user_webinar=lambda row: (row["user_id"], row["webinar_id"])
+        )
+        self.course_registrations = _Table(
+            {**registration, "course_id": None},
+            user=lambda row: row["user_id"],
+            course=lambda row: row["course_id"],
+            user_course=lambda row: (row["user_id"], row["course_id"])
+        )
+        self.waitlists = _Table(
+            {"kind": None, "event_id": None, "user_id": None, "created_at": None},
+            event=lambda row: (row["kind"], row["event_id"]),
+            user=lambda row: row["user_id"],
+            user_event=lambda row: (row["kind"], row["event_id"], row["user_id"])
+        )
+        self.audit_log = _Table(
+            {"expert_id": None, "hackathon_id": None, "action_type": None, "target_type": None,
+             "target_id": None, "details": None, "ip_address": None, "created_at": None, "archived": False},
+            expert=lambda row: row["expert_id"]
+        )
+        # ID хакатона -> срок хранения журнала экспертов в днях
+        self.audit_retention = {}
+        # (сущность, интервал, начало интервала, событие) -> число событий, как ActivityRollups
+        self.activity = defaultdict(int)
+        # Вид результата -> версии по возрастанию, как AnalyticsResults
+        self.analytics_results = defaultdict(list)
+        # Вид события -> (события, регистрации, колонка вместимости, сообщения об ошибках)
+        self._enrollments = {
+            "webinar": (self.webinars, self.webinar_registrations, "max_participants",
+                        ("Вы уже зарегистрированы на этот вебинар", "Достигнуто максимальное количество участников")),
+            "course": (self.courses, self.course_registrations, "max_students",
+                       ("Вы уже зарегистрированы на этот курс", "Достигнуто максимальное количество студентов")),
+        }
+
+    # ========== Пользователи ==========
+    @_synchronized
+    def get_user_by_id(self, user_id: int):
+        return _copy(self.users.get(user_id))
+
+    @_synchronized
+    def get_user_by_email(self, email: str):
+        return _copy(self.users.first("email", email.lower()))
+
+    @_synchronized
+    def get_user_by_telegram(self, telegram_nickname: str):
+        return _copy(self.users.first("telegram", telegram_nickname))
+
+    @_synchronized
+    def get_all_users(self):
+        return [dict(row) for row in self.users.all()]
+
+    @_synchronized
+    def list_users(self):
+        return [{key: value for key, value in row.items() if key != "password"} for row in self.users.all()]
+
+    @_synchronized
+    def create_user(self, fields: dict):
+        email = (fields.get("email") or "").lower()
+        telegram = fields.get("telegram_nickname")
+        if self.users.first("email", email) or (telegram and self.users.first("telegram", telegram)):
+            raise ValueError("Пользователь с таким email или Telegram nickname уже существует")
+        values = {key: value for key, value in fields.items() if key in self.users.columns}
+        values.setdefault("created_at", datetime.now().isoformat())
+        user_id = self.users.insert(values)
+        self._record_activity("users", "registered", values["created_at"])
+        return user_id
+
+    @_synchronized
+    def update_user(self, user_id: int, fields: dict):
+        values = {key: value for key, value in fields.items() if key in self.users.columns}
+        if not values:
+            raise ValueError("Нет полей для обновления")
+        if user_id not in self.users.rows:
+            raise ValueError("Пользователь не найден")
+        self.users.update(user_id, **values)
+
+    @_synchronized
+    def delete_user(self, user_id: int):
+        # Те же каскады, что ON DELETE в схеме SQLite
+        if not self.users.delete(user_id):
+            raise ValueError("Пользователь не найден")
+        for team in self.teams.find("captain", user_id):
+            self._delete_team(team["id"])
+        for participation in self.participations.find("user", user_id):
+            self._delete_participation(participation["id"])
+        for table, index in ((self.reputation_history, "changed_by"), (self.expert_areas, "expert"),
+                             (self.comments, "expert"), (self.audit_log, "expert"), (self.waitlists, "user")):
+            for row in table.find(index, user_id):
+                table.delete(row["id"])
+        # Освободившиеся места на событиях занимает лист ожидания
+        for kind, (_, registrations, _, _) in self._enrollments.items():
+            for registration in registrations.find("user", user_id):
+                registrations.delete(registration["id"])
+                self._promote(kind, registration[f"{kind}_id"])
+
+    # ========== Хакатоны ==========
+    @_synchronized
+    def get_hackathon_by_id(self, hackathon_id: int):
+        return _copy(self.hackathons.get(hackathon_id))
+
+    @_synchronized
+    def get_hackathons_by_ids(self, hackathon_ids: List[int]):
+        return [dict(self.hackathons.get(hackathon_id)) for hackathon_id in hackathon_ids
+                if self.hackathons.get(hackathon_id)]
+
+    @_synchronized
+    def get_all_hackathons(self, status_filter: str = None):
+        rows = [row for row in self.hackathons.all() if not status_filter or row["status"] == status_filter]
+        return [dict(row) for row in sorted(rows, key=lambda row: row["start_date"], reverse=True)]
+
+    def list_hackathons(self, status_filter: str = None):
+        return [dict(row, participant_count=None) for row in self.get_all_hackathons(status_filter)]
+
+    # Колонки published и min_participants есть всегда
+    hackathon_publishing = True
+
+    @staticmethod
+    def _hackathon_values(data: dict):
+        return {
+            "name": data["name"], "description": data.get("description"), "organizer": data.get("organizer"),
+            "start_date": data["start_date"], "end_date": data["end_date"],
+            "duration_hours": data.get("duration_hours"), "prize_fund": data.get("prize_fund"),
+            "max_team_size": data.get("max_team_size"),
+            "status": db.status_scheduler.current_status("hackathons", (data["start_date"], data["end_date"]),
+                                                         data.get("status", "upcoming")),
+            "min_participants": data.get("min_participants") or 0, "published": data.get("published") or 0
+        }
+
+    @_synchronized
+    def create_hackathon(self, data: dict):
+        return self.hackathons.insert({**self._hackathon_values(data), "created_at": datetime.now().isoformat()})
+
+    @_synchronized
+    def update_hackathon(self, hackathon_id: int, data: dict):
+        if hackathon_id in self.hackathons.rows:
+            self.hackathons.update(hackathon_id, **self._hackathon_values(data))
+
+    @_synchronized
+    def get_participant_counts(self, hackathon_ids: List[int]):
+        return {hackathon_id: len(self.participations.indexes["hackathon"].get(hackathon_id, ()))
+                for hackathon_id in hackathon_ids}
+
+    # ========== Участия ==========
+    @_synchronized
+    def get_participation(self, user_id: int, hackathon_id: int):
+        participation = self.participations.first("user_hackathon", (user_id, hackathon_id))
+        if not participation:
+            return None
+        user = self.users.get(user_id)
+        hackathon = self.hackathons.get(hackathon_id)
+        if not user or not hackathon:
+            return None
+        team = self.teams.get(participation["team_id"])
+        return {**participation, "username": user["username"], "fio": user["fio"], "email": user["email"],
+                "hackathon_name": hackathon["name"], "team_name": team["name"] if team else None}
+
+    @_synchronized
+    def get_participation_by_id(self, participation_id: int):
+        return _copy(self.participations.get(participation_id))
+
+    @_synchronized
+    def get_participations_by_ids(self, participation_ids: List[int]):
+        return {participation_id: dict(self.participations.rows[participation_id])
+                for participation_id in participation_ids if participation_id in self.participations.rows}
+
+    @_synchronized
+    def get_user_participations(self, user_id: int):
+        result = []
+        for participation in self.participations.find("user", user_id):
+            hackathon = self.hackathons.get(participation["hackathon_id"])
+            if not hackathon:
+                continue
+            team = self.teams.get(participation["team_id"])
+            result.append({
+                **participation,
+                "hackathon_name": hackathon["name"], "hackathon_status": hackathon["status"],
+                "start_date": hackathon["start_date"], "end_date": hackathon["end_date"],
+                "team_name": team["name"] if team else None, "team_id": team["id"] if team else None
+            })
+        result.sort(key=lambda row: row["start_date"], reverse=True)
+        return result
+
+    @_synchronized
+    def get_hackathon_participants(self, hackathon_id: int):
+        result = []
+        for participation in self.participations.find("hackathon", hackathon_id):
+            user = self.users.get(participation["user_id"])
+            if user:
+                result.append({**participation, "username": user["username"], "fio": user["fio"],
+                               "email": user["email"], "telegram_nickname": user["telegram_nickname"]})
+        result.sort(key=lambda row: (-(row["reputation"] or 0), row["username"]))
+        return result
+
+    def _team_has_room(self, team_id: int, hackathon_id: int) -> bool:
+        hackathon = self.hackathons.get(hackathon_id)
+        if not hackathon or not hackathon["max_team_size"]:
+            return True
+        return len(self.participations.indexes["team"].get(team_id, ())) < hackathon["max_team_size"]
+
+    @_synchronized
+    def create_participation(self, user_id: int, hackathon_id: int, role: str, team_id: int = None):
+        if self.participations.first("user_hackathon", (user_id, hackathon_id)):
+            raise ValueError("Пользователь уже участвует в этом хакатоне")
+        if team_id is not None:
+            team = self.teams.get(team_id)
+            if not team or team["hackathon_id"] != hackathon_id:
+                raise ValueError("Команда не найдена")
+            if not self._team_has_room(team_id, hackathon_id):
+                raise ValueError("Команда достигла максимального размера")
+        now = datetime.now().isoformat()
+        self._record_activity("participations", "joined", now)
+        return self.participations.insert({"user_id": user_id, "hackathon_id": hackathon_id, "role": role,
+                                           "team_id": team_id, "reputation": 0,
+                                           "created_at": now, "updated_at": now})
+
+    @_synchronized
+    def join_open_team(self, user_id: int, hackathon_id: int, role: str = "team_member"):
+        if self.participations.first("user_hackathon", (user_id, hackathon_id)):
+            raise ValueError("Пользователь уже участвует в этом хакатоне")
+        teams = self.get_available_teams(hackathon_id)
+        if not teams:
+            return None
+        team_id = teams[0]["id"]
+        return self.create_participation(user_id, hackathon_id, role, team_id), team_id
+
+    @_synchronized
+    def delete_participation(self, user_id: int, hackathon_id: int):
+        participation = self.participations.first("user_hackathon", (user_id, hackathon_id))
+        if not participation:
+            return
+        team = self.teams.get(participation["team_id"])
+        if team and team["captain_id"] == user_id:
+            # Если пользователь - капитан, удаляем команду
+            self._delete_team(team["id"])
+        self._delete_participation(participation["id"])
+        self._record_activity("participations", "left", datetime.now().isoformat())
+
+    def _delete_participation(self, participation_id: int):
+        self.participations.delete(participation_id)
+        for entry in self.reputation_history.find("participation", participation_id):
+            self.reputation_history.delete(entry["id"])
+        for project in self.projects.find("participation", participation_id):
+            self.projects.delete(project["id"])
+            for comment in self.comments.find("project", project["id"]):
+                self.comments.delete(comment["id"])
+
+    @_synchronized
+    def update_participation_role(self, user_id: int, hackathon_id: int, new_role: str):
+        participation = self.participations.first("user_hackathon", (user_id, hackathon_id))
+        if participation:
+            self.participations.update(participation["id"], role=new_role, updated_at=datetime.now().isoformat())
+
+    # ========== Команды ==========
+    @_synchronized
+    def create_team(self, hackathon_id: int, name: str, captain_id: int, description: str = None):
+        if self.teams.first("name", (hackathon_id, name)):
+            raise ValueError("Команда с таким именем уже существует в этом хакатоне")
+        now = datetime.now().isoformat()
+        self._record_activity("teams", "created", now)
+        return self.teams.insert({"hackathon_id": hackathon_id, "name": name, "description": description,
+                                  "captain_id": captain_id, "created_at": now})
+
+    def _delete_team(self, team_id: int):
+        # Участники и проекты удалённой команды остаются без команды (ON DELETE SET NULL)
+        self.teams.delete(team_id)
+        for table in (self.participations, self.projects):
+            for row in table.find("team", team_id):
+                table.update(row["id"], team_id=None)
+
+    def _team_row(self, team):
+        """Копия команды с числом участников (как Teams.member_count в SQLite)"""
+        if not team:
+            return None
+        return {**team, "member_count": len(self.participations.indexes["team"].get(team["id"], ()))}
+
+    @_synchronized
+    def get_team_by_id(self, team_id: int):
+        team = self._team_row(self.teams.get(team_id))
+        if not team:
+            return None
+        captain = self.users.get(team["captain_id"])
+        hackathon = self.hackathons.get(team["hackathon_id"])
+        if not captain or not hackathon:
+            return None
+        return {**team, "captain_username": captain["username"], "captain_fio": captain["fio"],
+                "hackathon_name": hackathon["name"]}
+
+    @_synchronized
+    def get_team_by_code(self, hackathon_id: int, team_code: str):
+        try:
+            team = self.teams.get(int(team_code))
+        except ValueError:
+            return None
+        return self._team_row(team) if team and team["hackathon_id"] == hackathon_id else None
+
+    @_synchronized
+    def get_team_members(self, team_id: int):
+        role_order = {"captain": 1, "team_member": 2}
+        members = []
+        for participation in self.participations.find("team", team_id):
+            user = self.users.get(participation["user_id"])
+            if user:
+                members.append({**participation, "username": user["username"], "fio": user["fio"],
+                                "email": user["email"], "telegram_nickname": user["telegram_nickname"]})
+        members.sort(key=lambda row: (role_order.get(row["role"], 3), row["username"]))
+        return members
+
+    @_synchronized
+    def get_user_team_in_hackathon(self, user_id: int, hackathon_id: int):
+        participation = self.participations.first("user_hackathon", (user_id, hackathon_id))
+        return self._team_row(self.teams.get(participation["team_id"])) if participation else None
+
+    @_synchronized
+    def add_member_to_team(self, user_id: int, hackathon_id: int, team_id: int):
+        participation = self.participations.first("user_hackathon", (user_id, hackathon_id))
+        if not participation:
+            raise ValueError("Пользователь не участвует в этом хакатоне")
+        if participation["team_id"] != team_id and not self._team_has_room(team_id, hackathon_id):
+            raise ValueError("Команда достигла максимального размера")
+        self.participations.update(participation["id"], team_id=team_id, updated_at=datetime.now().isoformat())
+
+    @_synchronized
+    def set_participation_team(self, user_id: int, hackathon_id: int, team_id: int):
+        participation = self.participations.first("user_hackathon", (user_id, hackathon_id))
+        if participation:
+            self.participations.update(participation["id"], team_id=team_id, updated_at=datetime.now().isoformat())
+
+    @_synchronized
+    def remove_member_from_team(self, user_id: int, hackathon_id: int):
+        self.set_participation_team(user_id, hackathon_id, None)
+
+    @_synchronized
+    def update_team_name(self, team_id: int, new_name: str, hackathon_id: int):
+        existing = self.teams.first("name", (hackathon_id, new_name))
+        if existing and existing["id"] != team_id:
+            raise ValueError("Команда с таким именем уже существует")
+        if team_id in self.teams.rows:
+            self.teams.update(team_id, name=new_name)
+
+    @_synchronized
+    def verify_team_member_counts(self, repair: bool = True) -> dict:
+        """Участники команд считаются по индексу участий: отдельных счётчиков, которые могли бы разойтись, нет"""
+        return {"drift": 0, "repaired": False, "teams": []}
+
+    @_synchronized
+    def get_available_teams(self, hackathon_id: int):
+        hackathon = self.hackathons.get(hackathon_id)
+        if not hackathon:
+            return []
+        max_team_size = hackathon["max_team_size"]
+        teams = []
+        for team in self.teams.find("hackathon", hackathon_id):
+            captain = self.users.get(team["captain_id"])
+            if not captain:
+                continue
+            member_count = len(self.participations.indexes["team"].get(team["id"], ()))
+            if max_team_size is None or member_count < max_team_size:
+                teams.append({**team, "member_count": member_count, "max_team_size": max_team_size,
+                              "captain_username": captain["username"], "captain_fio": captain["fio"]})
+        teams.sort(key=lambda row: row["name"])
+        return teams
+
+    # ========== Репутация ==========
+    @_synchronized
+    def update_reputation(self, participation_id: int, new_reputation: int, changed_by: int, reason: str = None):
+        participation = self.participations.get(participation_id)
+        if not participation:
+            raise ValueError("Участие не найдено")
+        now = datetime.now().isoformat()
+        old_reputation = participation["reputation"]
+        self.participations.update(participation_id, reputation=new_reputation, updated_at=now)
+        self.reputation_history.insert({"participation_id": participation_id, "old_reputation": old_reputation,
+                                        "new_reputation": new_reputation, "changed_by": changed_by,
+                                        "reason": reason, "created_at": now})
+
+    @_synchronized
+    def update_reputation_batch(self, updates: List[dict], changed_by: int):
+        results = []
+        for item in updates:
+            participation_id = item["participation_id"]
+            participation = self.participations.get(participation_id)
+            if not participation:
+                results.append({"participation_id": participation_id, "status": "error",
+                                "detail": "Участие не найдено"})
+                continue
+            old_reputation = participation["reputation"]
+            self.update_reputation(participation_id, item["new_reputation"], changed_by, item.get("reason"))
+            results.append({"participation_id": participation_id, "status": "ok",
+                            "old_reputation": old_reputation, "new_reputation": item["new_reputation"]})
+        return results
+
+    @_synchronized
+    def get_reputation_history(self, participation_id: int, limit: int = 50, offset: int = 0):
+        history = []
+        for entry in self.reputation_history.find("participation", participation_id):
+            user = self.users.get(entry["changed_by"])
+            if user:
+                history.append({**entry, "changed_by_username": user["username"], "changed_by_fio": user["fio"]})
+        history.sort(key=lambda row: (row["created_at"], row["id"]), reverse=True)
+        return history[offset:offset + limit]
+
+    @_synchronized
+    def get_reputation_timeseries(self, scope: str, scope_id: int, granularity: str = "day",
+                                  start: str = None, end: str = None):
+        start_bucket = db.rollup_bucket(db.period_moment(start), granularity) if start else ""
+        end_bucket = db.rollup_bucket(db.period_moment(end, end=True), granularity) if end else "9999"
+        if scope == "participation":
+            participation_ids = [scope_id]
+        else:
+            participation_ids = [row["id"] for row in self.participations.find("hackathon", scope_id)]
+        changes = [entry for participation_id in participation_ids
+                   for entry in self.reputation_history.find("participation", participation_id)]
+        changes.sort(key=lambda row: (row["created_at"], row["id"]))
+
+        buckets = {}
+        for entry in changes:
+            delta = entry["new_reputation"] - (entry["old_reputation"] or 0)
+            bucket_start = db.rollup_bucket(entry["created_at"], granularity)
+            bucket = buckets.setdefault(bucket_start, {
+                "bucket_start": bucket_start, "changes_count": 0, "delta_sum": 0, "gain_sum": 0, "loss_sum": 0
+            })
+            bucket["changes_count"] += 1
+            bucket["delta_sum"] += delta
+            bucket["gain_sum"] += max(delta, 0)
+            bucket["loss_sum"] += max(-delta, 0)
+            if scope == "participation":
+                bucket["last_reputation"] = entry["new_reputation"]
+
+        series = []
+        cumulative = 0
+        for bucket_start in sorted(buckets):
+            bucket = buckets[bucket_start]
+            cumulative += bucket["delta_sum"]
+            if start_bucket <= bucket_start <= end_bucket:
+                series.append({**bucket, "cumulative_delta": cumulative})
+        return series
+
+    # ========== Таблицы лидеров ==========
+    def _leaderboard(self, hackathon_id, teams: bool) -> Leaderboard:
+        """Таблица лидеров по текущим участиям (как LeaderboardRegistry после загрузки)"""
+        if hackathon_id is None:
+            participations = self.participations.all()
+        else:
+            participations = self.participations.find("hackathon", hackathon_id)
+        scores = {}
+        if teams:
+            team_rows = self.teams.all() if hackathon_id is None else self.teams.find("hackathon", hackathon_id)
+            scores = {team["id"]: 0 for team in team_rows}
+        for participation in participations:
+            key = participation["team_id"] if teams else participation["user_id"]
+            if key is not None:
+                scores[key] = scores.get(key, 0) + (participation["reputation"] or 0)
+        return Leaderboard(scores)
+
+    @_synchronized
+    def get_leaderboard(self, limit: int, hackathon_id: int = None, teams: bool = False):
+        board = self._leaderboard(hackathon_id, teams)
+        return {"total": len(board), "entries": board.top(limit)}
+
+    @_synchronized
+    def get_leaderboard_position(self, user_id: int, radius: int, hackathon_id: int = None):
+        board = self._leaderboard(hackathon_id, False)
+        rank = board.rank(user_id)
+        if rank is None:
+            return None
+        return {"rank": rank, "score": board.score(user_id), "total": len(board),
+                "around": board.around(user_id, radius)}
+
+    @_synchronized
+    def get_usernames(self, user_ids: List[int]):
+        users = (self.users.get(user_id) for user_id in user_ids)
+        return {user["id"]: {"id": user["id"], "username": user["username"], "fio": user["fio"]}
+                for user in users if user}
+
+    @_synchronized
+    def get_team_names(self, team_ids: List[int]):
+        teams = (self.teams.get(team_id) for team_id in team_ids)
+        return {team["id"]: {"id": team["id"], "name": team["name"], "hackathon_id": team["hackathon_id"]}
+                for team in teams if team}
+
+    # ========== Проекты и экспертиза ==========
+    @_synchronized
+    def create_project(self, hackathon_id: int, participation_id: int, title: str, description: str = None,
+                       presentation_url: str = None, area_topic: str = None, team_id: int = None,
+                       status: str = "draft"):
+        now = datetime.now().isoformat()
+        return self.projects.insert({"hackathon_id": hackathon_id, "team_id": team_id,
+                                     "participation_id": participation_id, "title": title,
+                                     "description": description, "presentation_url": presentation_url,
+                                     "area_topic": area_topic, "status": status,
+                                     "created_at": now, "updated_at": now})
+
+    def _project_view(self, project):
+        participation = self.participations.get(project["participation_id"])
+        user = self.users.get(participation["user_id"]) if participation else None
+        if not user:
+            return None
+        team = self.teams.get(project["team_id"])
+        return {**project, "team_name": team["name"] if team else None, "username": user["username"],
+                "fio": user["fio"], "role": participation["role"]}
+
+    @_synchronized
+    def get_projects_by_hackathon(self, hackathon_id: int, area_topic: str = None):
+        projects = []
+        for project in self.projects.find("hackathon", hackathon_id):
+            if area_topic and project["area_topic"] != area_topic:
+                continue
+            view = self._project_view(project)
+            if view:
+                projects.append(view)
+        projects.sort(key=lambda row: row["created_at"], reverse=True)
+        return projects
+
+    @_synchronized
+    def get_project_by_id(self, project_id: int):
+        project = self.projects.get(project_id)
+        return self._project_view(project) if project else None
+
+    @_synchronized
+    def get_expert_areas(self, expert_id: int, hackathon_id: int):
+        areas = [dict(row) for row in self.expert_areas.find("expert_hackathon", (expert_id, hackathon_id))]
+        return sorted(areas, key=lambda row: row["area_topic"])
+
+    @_synchronized
+    def add_expert_area(self, expert_id: int, hackathon_id: int, area_topic: str):
+        for area in self.expert_areas.find("expert_hackathon", (expert_id, hackathon_id)):
+            if area["area_topic"] == area_topic:
+                raise ValueError("Эта область уже назначена эксперту")
+        return self.expert_areas.insert({"expert_id": expert_id, "hackathon_id": hackathon_id,
+                                         "area_topic": area_topic, "created_at": datetime.now().isoformat()})
+
+    @_synchronized
+    def remove_expert_area(self, expert_id: int, hackathon_id: int, area_topic: str):
+        for area in self.expert_areas.find("expert_hackathon", (expert_id, hackathon_id)):
+            if area["area_topic"] == area_topic:
+                self.expert_areas.delete(area["id"])
+
+    @_synchronized
+    def get_project_comments(self, project_id: int):
+        comments = []
+        for comment in self.comments.find("project", project_id):
+            user = self.users.get(comment["expert_id"])
+            if user:
+                comments.append({**comment, "username": user["username"], "fio": user["fio"]})
+        comments.sort(key=lambda row: row["created_at"], reverse=True)
+        return comments
+
+    @_synchronized
+    def get_project_comment_by_id(self, comment_id: int):
+        comment = self.comments.get(comment_id)
+        project = self.projects.get(comment["project_id"]) if comment else None
+        return {**comment, "hackathon_id": project["hackathon_id"]} if project else None
+
+    @_synchronized
+    def add_project_comment(self, project_id: int, expert_id: int, comment: str, rating: int = None):
+        if project_id not in self.projects.rows:
+            raise ValueError("Проект не найден")
+        now = datetime.now().isoformat()
+        return self.comments.insert({"project_id": project_id, "expert_id": expert_id, "comment": comment,
+                                     "rating": rating, "created_at": now, "updated_at": now})
+
+    @_synchronized
+    def update_project_comment(self, comment_id: int, comment: str, rating: int = None):
+        if comment_id in self.comments.rows:
+            self.comments.update(comment_id, comment=comment, rating=rating, updated_at=datetime.now().isoformat())
+
+    @_synchronized
+    def get_review_queue(self, expert_id: int, hackathon_id: int, all_areas: bool = False,
+                         review_status: str = None, limit: int = 20, offset: int = 0):
+        areas = {area["area_topic"] for area in self.expert_areas.find("expert_hackathon", (expert_id, hackathon_id))}
+        projects = []
+        for project in self.projects.find("hackathon", hackathon_id):
+            if not all_areas and project["area_topic"] not in areas:
+                continue
+            comments = self.comments.find("project", project["id"])
+            own = [comment for comment in comments if comment["expert_id"] == expert_id]
+            mine = max(own, key=lambda comment: comment["updated_at"]) if own else None
+            if review_status == "reviewed" and not mine or review_status == "pending" and mine:
+                continue
+            ratings = [comment["rating"] for comment in comments if comment["rating"] is not None]
+            team = self.teams.get(project["team_id"])
+            projects.append({
+                **project, "team_name": team["name"] if team else None, "comment_count": len(comments),
+                "average_rating": sum(ratings) / len(ratings) if ratings else None,
+                "my_comment_id": mine["id"] if mine else None, "my_rating": mine["rating"] if mine else None,
+                "my_reviewed_at": mine["updated_at"] if mine else None,
+                "review_status": "reviewed" if mine else "pending"
+            })
+        projects.sort(key=lambda row: (row["created_at"], row["id"]), reverse=True)
+        return {"total": len(projects), "limit": limit, "offset": offset,
+                "projects": projects[offset:offset + limit]}
+
+    @_synchronized
+    def get_project_scores(self, hackathon_id: int):
+        rated = [comment for project in self.projects.find("hackathon", hackathon_id)
+                 for comment in self.comments.find("project", project["id"]) if comment["rating"] is not None]
+        rated.sort(key=lambda comment: (comment["updated_at"], comment["id"]))
+        return compute_scores([comment["project_id"] for comment in rated],
+                              [comment["expert_id"] for comment in rated],
+                              [comment["rating"] for comment in rated])
+
+    # ========== Вебинары и курсы ==========
+    def _free_seats(self, kind: str, event_id: int):
+        events, registrations, capacity_column, _ = self._enrollments[kind]
+        event = events.get(event_id)
+        if not event or not event[capacity_column]:
+            return None
+        return max(event[capacity_column] - len(registrations.indexes[kind].get(event_id, ())), 0)
+
+    def _register(self, kind: str, user_id: int, event_id: int, waitlist: bool = False):
+        _, registrations, _, errors = self._enrollments[kind]
+        if registrations.first(f"user_{kind}", (user_id, event_id)):
+            raise ValueError(errors[0])
+        queued = False
+        if waitlist:
+            if self.waitlists.first("user_event", (kind, event_id, user_id)):
+                raise ValueError("Вы уже в листе ожидания")
+            queued = bool(self.waitlists.indexes["event"].get((kind, event_id)))
+        if not queued and self._free_seats(kind, event_id) != 0:
+            now = datetime.now().isoformat()
+            registration_id = registrations.insert({"user_id": user_id, f"{kind}_id": event_id, "created_at": now})
+            self._record_activity(f"{kind}_registrations", "registered", now)
+            return {"status": "registered", "registration_id": registration_id}
+        if not waitlist:
+            raise ValueError(errors[1])
+        self.waitlists.insert({"kind": kind, "event_id": event_id, "user_id": user_id,
+                               "created_at": datetime.now().isoformat()})
+        self._promote(kind, event_id)
+        registration = registrations.first(f"user_{kind}", (user_id, event_id))
+        if registration:
+            return {"status": "registered", "registration_id": registration["id"]}
+        return {"status": "waitlisted", **self._waitlist_position(kind, event_id, user_id)}
+
+    def _promote(self, kind: str, event_id: int):
+        _, registrations, _, _ = self._enrollments[kind]
+        free = self._free_seats(kind, event_id)
+        entries = self.waitlists.find("event", (kind, event_id))
+        for entry in entries if free is None else entries[:free]:
+            now = datetime.now().isoformat()
+            self.waitlists.delete(entry["id"])
+            registrations.insert({"user_id": entry["user_id"], f"{kind}_id": event_id, "created_at": now})
+            self._record_activity(f"{kind}_registrations", "registered", now)
+
+    def _cancel(self, kind: str, user_id: int, event_id: int):
+        _, registrations, _, _ = self._enrollments[kind]
+        registration = registrations.first(f"user_{kind}", (user_id, event_id))
+        if not registration:
+            raise ValueError("Регистрация не найдена")
+        registrations.delete(registration["id"])
+        self._record_activity(f"{kind}_registrations", "cancelled", datetime.now().isoformat())
+        self._promote(kind, event_id)
+        return True
+
+    def _waitlist_position(self, kind: str, event_id: int, user_id: int):
+        ids = sorted(self.waitlists.indexes["event"].get((kind, event_id), ()))
+        entry = self.waitlists.first("user_event", (kind, event_id, user_id))
+        return {"position": bisect_left(ids, entry["id"]) + 1 if entry else None, "length": len(ids)}
+
+    def _user_registrations(self, events, registrations, event_key, order_column, user_id):
+        result = []
+        for registration in registrations.find("user", user_id):
+            event = events.get(registration[f"{event_key}_id"])
+            if event:
+                result.append({**event, "registration_date": registration["created_at"]})
+        result.sort(key=lambda row: row[order_column])
+        return result
+
+    @_synchronized
+    def get_all_webinars(self, status_filter: Optional[str] = None):
+        rows = [dict(row) for row in self.webinars.all() if not status_filter or row["status"] == status_filter]
+        return sorted(rows, key=lambda row: row["date_time"])
+
+    @_synchronized
+    def get_webinar_by_id(self, webinar_id: int):
+        return _copy(self.webinars.get(webinar_id))
+
+    @_synchronized
+    def create_webinar(self, name: str, description: str, speaker: str, date_time: str,
+                       duration_hours: Optional[float] = None, location: str = "Онлайн",
+                       max_participants: Optional[int] = None, status: str = "upcoming"):
+        return self.webinars.insert({"name": name, "description": description, "speaker": speaker,
+                                     "date_time": date_time, "duration_hours": duration_hours,
+                                     "location": location, "max_participants": max_participants,
+                                     "status": db.status_scheduler.current_status(
+                                         "webinars", (date_time, duration_hours), status),
+                                     "created_at": datetime.now().isoformat()})
+
+    @_synchronized
+    def register_for_webinar(self, user_id: int, webinar_id: int):
+        return self._register("webinar", user_id, webinar_id)["registration_id"]
+
+    @_synchronized
+    def cancel_webinar_registration(self, user_id: int, webinar_id: int):
+        return self._cancel("webinar", user_id, webinar_id)
+
+    @_synchronized
+    def get_user_webinar_registrations(self, user_id: int):
+        return self._user_registrations(self.webinars, self.webinar_registrations, "webinar", "date_time", user_id)
+
+    @_synchronized
+    def is_user_registered_for_webinar(self, user_id: int, webinar_id: int):
+        return self.webinar_registrations.first("user_webinar", (user_id, webinar_id)) is not None
+
+    @_synchronized
+    def get_webinar_participant_count(self, webinar_id: int):
+        return len(self.webinar_registrations.indexes["webinar"].get(webinar_id, ()))
+
+    @_synchronized
+    def get_webinar_participant_counts(self, webinar_ids: List[int]):
+        return {webinar_id: self.get_webinar_participant_count(webinar_id) for webinar_id in webinar_ids}
+
+    @_synchronized
+    def get_all_courses(self, status_filter: Optional[str] = None):
+        rows = [dict(row) for row in self.courses.all() if not status_filter or row["status"] == status_filter]
+        return sorted(rows, key=lambda row: row["start_date"])
+
+    @_synchronized
+    def get_course_by_id(self, course_id: int):
+        return _copy(self.courses.get(course_id))
+
+    @_synchronized
+    def create_course(self, name: str, description: str, instructor: str, start_date: str, end_date: str,
+                      hours_per_week: Optional[int] = None, max_students: Optional[int] = None,
+                      status: str = "upcoming", certificate_available: bool = False):
+        return self.courses.insert({"name": name, "description": description, "instructor": instructor,
+                                    "start_date": start_date, "end_date": end_date,
+                                    "hours_per_week": hours_per_week, "max_students": max_students,
+                                    "status": db.status_scheduler.current_status(
+                                        "courses", (start_date, end_date), status),
+                                    "certificate_available": certificate_available,
+                                    "created_at": datetime.now().isoformat()})
+
+    @_synchronized
+    def register_for_course(self, user_id: int, course_id: int):
+        return self._register("course", user_id, course_id)["registration_id"]
+
+    @_synchronized
+    def cancel_course_registration(self, user_id: int, course_id: int):
+        return self._cancel("course", user_id, course_id)
+
+    @_synchronized
+    def get_user_course_registrations(self, user_id: int):
+        return self._user_registrations(self.courses, self.course_registrations, "course", "start_date", user_id)
+
+    @_synchronized
+    def is_user_registered_for_course(self, user_id: int, course_id: int):
+        return self.course_registrations.first("user_course", (user_id, course_id)) is not None
+
+    @_synchronized
+    def get_course_participant_count(self, course_id: int):
+        return len(self.course_registrations.indexes["course"].get(course_id, ()))
+
+    @_synchronized
+    def get_course_participant_counts(self, course_ids: List[int]):
+        return {course_id: self.get_course_participant_count(course_id) for course_id in course_ids}
+
+    # ========== Листы ожидания ==========
+    @_synchronized
+    def enroll(self, kind: str, user_id: int, event_id: int) -> dict:
+        return self._register(kind, user_id, event_id, waitlist=True)
+
+    @_synchronized
+    def leave_waitlist(self, kind: str, user_id: int, event_id: int):
+        entry = self.waitlists.first("user_event", (kind, event_id, user_id))
+        if not entry:
+            raise ValueError("Вы не в листе ожидания")
+        self.waitlists.delete(entry["id"])
+        return True
+
+    @_synchronized
+    def get_waitlist_position(self, kind: str, event_id: int, user_id: int) -> dict:
+        return self._waitlist_position(kind, event_id, user_id)
+
+    # ========== Журнал экспертов ==========
+    @staticmethod
+    def _audit_view(row, with_archived: bool = False):
+        view = {column: row[column] for column in audit_archive.AUDIT_COLUMNS}
+        if with_archived:
+            view["archived"] = row["archived"]
+        return view
+
+    @_synchronized
+    def log_expert_action(self, expert_id: int, hackathon_id: int, action_type: str, target_type: str = None,
+                          target_id: int = None, details: str = None, ip_address: str = None):
+        self.audit_log.insert({"expert_id": expert_id, "hackathon_id": hackathon_id, "action_type": action_type,
+                               "target_type": target_type, "target_id": target_id, "details": details,
+                               "ip_address": ip_address, "created_at": datetime.now().isoformat()})
+
+    @_synchronized
+    def get_expert_audit_log(self, expert_id: int, hackathon_id: int = None, limit: int = 50, offset: int = 0):
+        rows = [row for row in self.audit_log.find("expert", expert_id)
+                if not row["archived"] and (not hackathon_id or row["hackathon_id"] == hackathon_id)]
+        rows.sort(key=lambda row: (row["created_at"], row["id"]), reverse=True)
+        return [self._audit_view(row) for row in rows[offset:offset + limit]]
+
+    @_synchronized
+    def query_audit_log(self, expert_id: int = None, hackathon_id: int = None, start: str = None,
+                        end: str = None, limit: int = 50, offset: int = 0):
+        start = db.period_moment(start) if start else ""
+        end = db.period_moment(end, end=True) if end else "9999"
+        rows = self.audit_log.all() if expert_id is None else self.audit_log.find("expert", expert_id)
+        rows = [row for row in rows if start <= row["created_at"] <= end
+                and (hackathon_id is None or row["hackathon_id"] == hackathon_id)]
+        rows.sort(key=lambda row: (row["created_at"], row["id"]), reverse=True)
+        return [self._audit_view(row, with_archived=True) for row in rows[offset:offset + limit]]
+
+    @_synchronized
+    def get_audit_retention(self, hackathon_id: int):
+        return self.audit_retention.get(hackathon_id, audit_archive.DEFAULT_RETENTION_DAYS)
+
+    @_synchronized
+    def set_audit_retention(self, hackathon_id: int, retention_days: int):
+        self.audit_retention[hackathon_id] = retention_days
+
+    @_synchronized
+    def rotate_audit_log(self):
+        """Устаревшие записи помечаются архивными: файлов сегментов у хранилища в памяти нет"""
+        now = datetime.now()
+        expired = {}
+        for row in self.audit_log.all():
+            if row["archived"]:
+                continue
+            retention_days = self.audit_retention.get(row["hackathon_id"], audit_archive.DEFAULT_RETENTION_DAYS)
+            if row["created_at"] < (now - timedelta(days=retention_days)).isoformat():
+                expired.setdefault(row["hackathon_id"], []).append(row)
+        segments = []
+        for hackathon_id, rows in expired.items():
+            rows.sort(key=lambda row: (row["created_at"], row["id"]))
+            for i in range(0, len(rows), audit_archive.SEGMENT_ROWS):
+                chunk = rows[i:i + audit_archive.SEGMENT_ROWS]
+                for row in chunk:
+                    self.audit_log.update(row["id"], archived=True)
+                segments.append({"hackathon_id": hackathon_id, "path": None, "rows": len(chunk)})
+        return segments
+
+    # ========== Статистика ==========
+    @_synchronized
+    def get_user_statistics(self):
+        users = self.users.all()
+        month = datetime.now().strftime("%Y-%m")
+        cities = {}
+        for user in users:
+            if user["city"]:
+                cities[user["city"]] = cities.get(user["city"], 0) + 1
+        return {
+            "totalUsers": len(users),
+            "adminUsers": sum(user["role"] == "admin" for user in users),
+            "regularUsers": sum(user["role"] == "user" for user in users),
+            "usersThisMonth": sum((user["created_at"] or "").startswith(month) for user in users),
+            "citiesStats": cities,
+            "lookingForTeam": sum(user["looking_for_team"] == 1 for user in users)
+        }
+
+    @_synchronized
+    def get_age_statistics(self):
+        counts = {}
+        for user in self.users.all():
+            group = db.age_group(user["age"])
+            counts[group] = counts.get(group, 0) + 1
+        return [(group, counts[group]) for group in db.AGE_GROUPS if group in counts]
+
+    @_synchronized
+    def get_registration_statistics(self):
+        since = (date.today() - timedelta(days=30)).isoformat()
+        counts = {}
+        for user in self.users.all():
+            day = (user["created_at"] or "")[:10]
+            if day >= since:
+                counts[day] = counts.get(day, 0) + 1
+        return sorted(counts.items())
+
+    def _record_activity(self, entity: str, event: str, timestamp: str, count: int = 1):
+        day = timestamp[:10]
+        for granularity in db.ACTIVITY_GRANULARITIES:
+            self.activity[(entity, granularity, db.activity_bucket(day, granularity), event)] += count
+
+    def _activity_buckets(self, entity: str, granularity: str, first: str, last: str) -> list:
+        return [(bucket, event, count) for (row_entity, row_granularity, bucket, event), count in self.activity.items()
+                if row_entity == entity and row_granularity == granularity and first <= bucket <= last]
+
+    @_synchronized
+    def get_activity_timeline(self, entity: str = "users", granularity: str = "day",
+                              start: str = None, end: str = None) -> dict:
+        return db.activity_timeline(entity, granularity, start, end, self._activity_buckets)
+
+    @_synchronized
+    def backfill_activity_rollups(self, entities=None) -> dict:
+        """Пересчёт событий создания по строкам таблиц, как rebuild_activity_rollups"""
+        tables = {"users": self.users, "participations": self.participations, "teams": self.teams,
+                  "webinar_registrations": self.webinar_registrations,
+                  "course_registrations": self.course_registrations}
+        totals = {}
+        for entity, event in db.ACTIVITY_SOURCES:
+            if entities and entity not in entities:
+                continue
+            for key in [key for key in self.activity if key[0] == entity and key[3] == event]:
+                del self.activity[key]
+            rows = [row for row in tables[entity].all() if row["created_at"]]
+            for row in rows:
+                self._record_activity(entity, event, row["created_at"])
+            totals[entity] = len(rows)
+        return totals
+
+    def _demographic_counts(self) -> dict:
+        return db.tally_demographics((user["age"], user["city"], user["basics_knowledge"],
+                                      user["looking_for_team"], user["role"]) for user in self.users.all())
+
+    @_synchronized
+    def get_demographics(self, dimension: str, by: str = None) -> dict:
+        stored, swapped = db.demographic_slice(dimension, by)
+        rows = [(value, value2, count) for (name, value, value2), count in self._demographic_counts().items()
+                if name == stored]
+        return db.demographics_view(dimension, by, swapped, rows)
+
+    @_synchronized
+    def reconcile_demographics(self, repair: bool = True) -> dict:
+        """Счётчики считаются по строкам при каждом запросе, поэтому расхождений не бывает"""
+        return {"buckets": len(self._demographic_counts()), "drift": 0, "repaired": False, "differences": []}
+
+    # ========== Пакетная аналитика ==========
+    @_synchronized
+    def run_participation_funnel(self) -> dict:
+        started = time.perf_counter()
+        result = funnel.report_from_rows(
+            [(user["id"], funnel.month_number(user["created_at"]))
+             for user in self.users.all() if user["role"] == "user"],
+            [(row["id"], row["user_id"], row["hackathon_id"], -1 if row["team_id"] is None else row["team_id"],
+              funnel.month_number(row["created_at"]))
+             for row in self.participations.all() if row["role"] != "expert"],
+            [(project["id"], project["participation_id"], -1 if project["team_id"] is None else project["team_id"])
+             for project in self.projects.all()],
+            sorted({comment["project_id"] for comment in self.comments.all() if comment["rating"] is not None}),
+            {hackathon["id"]: hackathon["name"] for hackathon in self.hackathons.all()}
+        )
+        # Копии для аналитики нет: данные актуальны на момент расчёта
+        result["data_as_of"] = datetime.now().isoformat()
+        versions = self.analytics_results[db.PARTICIPATION_FUNNEL]
+        meta = {"kind": db.PARTICIPATION_FUNNEL, "version": versions[-1]["version"] + 1 if versions else 1,
+                "computed_at": datetime.now().isoformat(),
+                "duration_ms": round((time.perf_counter() - started) * 1000, 3)}
+        payload = json.dumps({**meta, **result}, ensure_ascii=False, separators=(",", ":"))
+        versions.append({"version": meta["version"], "computed_at": meta["computed_at"],
+                         "duration_ms": meta["duration_ms"], "payload": payload})
+        del versions[:-db.ANALYTICS_RESULTS_KEEP]
+        return meta
+
+    @_synchronized
+    def get_analytics_result(self, kind: str, version: int = None) -> Optional[str]:
+        versions = self.analytics_results.get(kind, [])
+        for row in reversed(versions):
+            if version is None or row["version"] == version:
+                return row["payload"]
+        return None
+
+    @_synchronized
+    def list_analytics_results(self, kind: str) -> list:
+        return [{column: row[column] for column in ("version", "computed_at", "duration_ms")}
+                for row in reversed(self.analytics_results.get(kind, []))]
+
+    # ========== Уведомления ==========
+    # Очередь писем ведётся только в SQLite: хранилище в памяти ведёт себя как БД без NotificationOutbox
+    def enqueue_event_notification(self, event_type: str, event_id: int, subject: str, body: str,
+                                   send_at: Optional[str] = None, key: Optional[str] = None) -> int:
+        raise ValueError("Хранилище не поддерживает уведомления")
+
+    def get_notification_stats(self) -> dict:
+        return {"outbox": {}, "dispatcher": db.notification_dispatcher.info(),
+                "reminders": db.reminder_scheduler.info()}
+
+    def retry_failed_notifications(self) -> int:
+        return 0
+
+    def purge_sent_notifications(self, days: int = 30) -> int:
+        return 0
+
+
+# Доступные хранилища; выбирается переменной окружения REPOSITORY_BACKEND
+BACKENDS = {
+    "sqlite": SQLiteRepository,
+    "memory": MemoryRepository,
+}
+
+_repository = None
+_repository_lock = threading.Lock()
+
+
+def get_repository() -> Repository:
+    """Общее хранилище приложения, создаётся при первом обращении"""
+    global _repository
+    if _repository is None:
+        with _repository_lock:
+            if _repository is None:
+                backend = os.getenv("REPOSITORY_BACKEND", "sqlite")
+                if backend not in BACKENDS:
+                    raise ValueError(f"Неизвестное хранилище: {backend}")
+                _repository = BACKENDS[backend]()
+    return _repository
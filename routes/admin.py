@@ -1,35 +1,45 @@
 from fastapi import APIRouter, Request, Depends, HTTPException
-from fastapi.responses import HTMLResponse
-from fastapi.templating import Jinja2Templates
+from fastapi.responses import HTMLResponse, PlainTextResponse, FileResponse, Response
+from typing import Optional, Dict
+from pydantic import BaseModel
 import os
 from dotenv import load_dotenv
-from db import get_current_user, require_admin, get_db_connection
+from db import audit_writer, db_writer, analytics_snapshot, status_scheduler, ACTIVITY_EVENTS, PARTICIPATION_FUNNEL
+from queries import registry as query_registry
+from admission import admission_window
+from profiling import profile_store, profiling_settings
+from instrumentation import query_budget
+from rows import FastJSONResponse
+from repository import get_repository
+import templating
+from templating import templates
 from routes.auth import UserCreate
 
-templates = Jinja2Templates(directory="templates")
+repo = get_repository()
+
 router = APIRouter()
 load_dotenv()
 ADM_PASS = os.getenv('ADM_PASS')
 
 # Роуты страниц админки
 @router.get("/admin-hackathons.html", response_class=HTMLResponse)
-async def admin_hackathons_page(request: Request, user=Depends(require_admin)):
+async def admin_hackathons_page(request: Request, user=Depends(repo.require_admin)):
     return templates.TemplateResponse("admin-hackathons.html", {"request": request, "user": user})
 
 @router.get("/admin-hackathon-details.html", response_class=HTMLResponse)
-async def admin_hackathon_details_page(request: Request, user=Depends(require_admin)):
+async def admin_hackathon_details_page(request: Request, user=Depends(repo.require_admin)):
     return templates.TemplateResponse("admin-hackathon-details.html", {"request": request, "user": user})
 
 @router.get("/admin-webinars.html", response_class=HTMLResponse)
-async def admin_webinars_page(request: Request, user=Depends(require_admin)):
+async def admin_webinars_page(request: Request, user=Depends(repo.require_admin)):
     return templates.TemplateResponse("admin-webinars.html", {"request": request, "user": user})
 
 @router.get("/admin-analytics.html", response_class=HTMLResponse)
-async def admin_analytics_page(request: Request, user=Depends(require_admin)):
+async def admin_analytics_page(request: Request, user=Depends(repo.require_admin)):
     return templates.TemplateResponse("admin-analytics.html", {"request": request, "user": user})
 
 @router.get("/admin.html", response_class=HTMLResponse)
-async def admin_page(request: Request, user=Depends(require_admin)):
+async def admin_page(request: Request, user=Depends(repo.require_admin)):
     return templates.TemplateResponse("admin.html", {"request": request, "user": user})
 
 @router.get("/admin-login.html", response_class=HTMLResponse)
@@ -38,32 +48,21 @@ async def admin_login_page(request: Request):
 
 # API роуты админки
 @router.post("/api/admin/login")
-async def admin_login(request: Request, credentials: dict):
+def admin_login(request: Request, credentials: dict):
     login = credentials.get("login", "").strip()
     password = credentials.get("password", "").strip()
 
     if login == "admin" and password == ADM_PASS:
-        from db import get_user_by_email, get_user_by_id
-        user = get_user_by_email("admin@hackathon.local")
+        user = repo.get_user_by_email("admin@hackathon.local")
         if not user:
-            conn = get_db_connection()
-            cursor = conn.cursor()
-            from datetime import datetime
-            cursor.execute('''
-                INSERT INTO Users (username, email, password, role, created_at)
-                VALUES (?, ?, ?, ?, ?)
-            ''', ("admin", "admin@hackathon.local", "admin123", "admin", datetime.now().isoformat()))
-            conn.commit()
-            user_id = cursor.lastrowid
-            conn.close()
-            user = get_user_by_id(user_id)
+            user_id = repo.create_user({
+                "username": "admin", "email": "admin@hackathon.local",
+                "password": "admin123", "role": "admin"
+            })
+            user = repo.get_user_by_id(user_id)
         else:
             if user["password"] != "admin123":
-                conn = get_db_connection()
-                cursor = conn.cursor()
-                cursor.execute("UPDATE Users SET password = ? WHERE id = ?", ("admin123", user["id"]))
-                conn.commit()
-                conn.close()
+                repo.update_user(user["id"], {"password": "admin123"})
 
         request.session["user_id"] = user["id"]
         request.session["role"] = "admin"
@@ -75,106 +74,33 @@ async def admin_login(request: Request, credentials: dict):
         raise HTTPException(status_code=401, detail="Неверный логин или пароль")
 
 @router.get("/api/users")
-async def get_users(request: Request, admin=Depends(require_admin)):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM Users")
-    users = [dict(row) for row in cursor.fetchall()]
-    conn.close()
-
-    for user in users:
-        user.pop("password", None)
-
-    return users
+@query_budget(2)
+async def get_users(request: Request, admin=Depends(repo.require_admin)):
+    # Пароль не выбирается из БД; список отдаётся сразу, без jsonable_encoder
+    return FastJSONResponse(repo.list_users())
 
 @router.get("/api/statistics")
-async def get_statistics(request: Request, admin=Depends(require_admin)):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-
-    cursor.execute("SELECT COUNT(*) FROM Users")
-    total_users = cursor.fetchone()[0]
-
-    cursor.execute("SELECT COUNT(*) FROM Users WHERE role = 'admin'")
-    admin_users = cursor.fetchone()[0]
-
-    cursor.execute("SELECT COUNT(*) FROM Users WHERE role = 'user'")
-    regular_users = cursor.fetchone()[0]
-
-    from datetime import datetime
-    current_month = datetime.now().strftime("%Y-%m")
-    cursor.execute("SELECT COUNT(*) FROM Users WHERE strftime('%Y-%m', created_at) = ?", (current_month,))
-    users_this_month = cursor.fetchone()[0]
-
-    cursor.execute("SELECT city, COUNT(*) FROM Users WHERE city IS NOT NULL GROUP BY city")
-    cities_stats = dict(cursor.fetchall())
-
-    cursor.execute("SELECT COUNT(*) FROM Users WHERE looking_for_team = 1")
-    looking_for_team = cursor.fetchone()[0]
-
-    conn.close()
-
-    stats = {
-        "totalUsers": total_users,
-        "adminUsers": admin_users,
-        "regularUsers": regular_users,
-        "usersThisMonth": users_this_month,
-        "citiesStats": cities_stats,
-        "lookingForTeam": looking_for_team
-    }
+@query_budget(7)
+async def get_statistics(request: Request, admin=Depends(repo.require_admin)):
+    stats = repo.get_user_statistics()
+    stats["snapshot"] = analytics_snapshot.info()
     return stats
 
 @router.delete("/api/users/{user_id}")
-async def delete_user(user_id: int, request: Request, admin=Depends(require_admin)):
+def delete_user(user_id: int, request: Request, admin=Depends(repo.require_admin)):
     if user_id == 1:
         raise HTTPException(status_code=400, detail="Нельзя удалить первого администратора")
 
-    conn = get_db_connection()
-    cursor = conn.cursor()
-
-    cursor.execute("SELECT * FROM Users WHERE id = ?", (user_id,))
-    if not cursor.fetchone():
-        conn.close()
+    try:
+        repo.delete_user(user_id)
+    except ValueError:
         raise HTTPException(status_code=404, detail="Пользователь не найден")
 
-    cursor.execute("DELETE FROM Users WHERE id = ?", (user_id,))
-    conn.commit()
-    conn.close()
-
     return {"message": "Пользователь удалён"}
 @router.get("/api/statistics/age-distribution")
-async def get_age_distribution(request: Request, admin=Depends(require_admin)):
+async def get_age_distribution(request: Request, admin=Depends(repo.require_admin)):
     """Получение распределения возрастов пользователей"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-
-    # Получаем распределение возрастов
-    cursor.execute('''
-        SELECT 
-            CASE 
-                WHEN age < 18 THEN 'До 18'
-                WHEN age BETWEEN 18 AND 25 THEN '18-25'
-                WHEN age BETWEEN 26 AND 35 THEN '26-35' 
-                WHEN age BETWEEN 36 AND 45 THEN '36-45'
-                WHEN age > 45 THEN '45+'
-                ELSE 'Не указан'
-            END as age_group,
-            COUNT(*) as count
-        FROM Users 
-        GROUP BY age_group
-        ORDER BY 
-            CASE age_group
-                WHEN 'До 18' THEN 1
-                WHEN '18-25' THEN 2
-                WHEN '26-35' THEN 3
-                WHEN '36-45' THEN 4
-                WHEN '45+' THEN 5
-                ELSE 6
-            END
-    ''')
-
-    age_data = cursor.fetchall()
-    conn.close()
+    age_data = repo.get_age_statistics()
 
     # Форматируем данные для графика
     age_groups = []
@@ -186,62 +112,30 @@ async def get_age_distribution(request: Request, admin=Depends(require_admin)):
 
     return {
         "age_groups": age_groups,
-        "counts": counts
+        "counts": counts,
+        "snapshot": analytics_snapshot.info()
     }
 @router.put("/api/users/{user_id}")
-async def update_user(user_id: int, user_data: dict, request: Request, admin=Depends(require_admin)):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-
-    cursor.execute("SELECT * FROM Users WHERE id = ?", (user_id,))
-    if not cursor.fetchone():
-        conn.close()
+def update_user(user_id: int, user_data: dict, request: Request, admin=Depends(repo.require_admin)):
+    if not repo.get_user_by_id(user_id):
         raise HTTPException(status_code=404, detail="Пользователь не найден")
 
     allowed_fields = ['username', 'age', 'fio', 'telegram_nickname', 'basics_knowledge',
                       'city', 'team_name', 'looking_for_team', 'hackathons', 'intensives']
 
-    update_fields = []
-    update_values = []
-
-    for field in allowed_fields:
-        if field in user_data:
-            update_fields.append(f"{field} = ?")
-            update_values.append(user_data[field])
-
+    update_fields = {field: user_data[field] for field in allowed_fields if field in user_data}
     if not update_fields:
-        conn.close()
         raise HTTPException(status_code=400, detail="Нет полей для обновления")
 
-    update_values.append(user_id)
-    query = f"UPDATE Users SET {', '.join(update_fields)} WHERE id = ?"
-
-    cursor.execute(query, update_values)
-    conn.commit()
-    conn.close()
+    repo.update_user(user_id, update_fields)
 
     return {"message": "Пользователь обновлен"}
 
 # +1 строка - добавить после существующих endpoint'ов
 @router.get("/api/statistics/registration-timeline")
-async def get_registration_timeline(request: Request, admin=Depends(require_admin)):
+async def get_registration_timeline(request: Request, admin=Depends(repo.require_admin)):
     """Получение данных о регистрациях пользователей по датам"""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-
-    # Получаем количество регистраций по дням за последние 30 дней
-    cursor.execute('''
-        SELECT 
-            DATE(created_at) as registration_date,
-            COUNT(*) as user_count
-        FROM Users 
-        WHERE created_at >= date('now', '-30 days')
-        GROUP BY DATE(created_at)
-        ORDER BY registration_date
-    ''')
-
-    timeline_data = cursor.fetchall()
-    conn.close()
+    timeline_data = repo.get_registration_statistics()
 
     # Форматируем данные для графика
     dates = []
@@ -253,5 +147,241 @@ async def get_registration_timeline(request: Request, admin=Depends(require_admi
 
     return {
         "dates": dates,
-        "counts": counts
+        "counts": counts,
+        "snapshot": analytics_snapshot.info()
     }
+
+@router.get("/api/statistics/timeline")
+async def get_activity_timeline_endpoint(
+        request: Request, entity: str = "users", granularity: str = "day",
+        start: Optional[str] = None, end: Optional[str] = None, admin=Depends(repo.require_admin)
+):
+    """События по дням, неделям или месяцам за произвольный период (из агрегатов)"""
+    try:
+        return repo.get_activity_timeline(entity, granularity, start, end)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.get("/api/statistics/demographics")
+async def get_demographics_endpoint(request: Request, dimension: str = "age", by: Optional[str] = None,
+                                    admin=Depends(repo.require_admin)):
+    """Распределение пользователей по измерению или разрез двух измерений (например, city и age)"""
+    try:
+        result = repo.get_demographics(dimension, by)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    result["snapshot"] = analytics_snapshot.info()
+    return result
+
+@router.post("/api/admin/demographics/reconcile")
+def reconcile_demographics_endpoint(request: Request, repair: bool = True, admin=Depends(repo.require_admin)):
+    """Сверка демографических счётчиков с таблицей пользователей"""
+    return repo.reconcile_demographics(repair)
+
+@router.get("/api/admin/analytics/funnel")
+async def get_participation_funnel(request: Request, version: Optional[int] = None,
+                                   admin=Depends(repo.require_admin)):
+    """Последний (или заданный) рассчитанный результат воронки участия и когорт"""
+    payload = repo.get_analytics_result(PARTICIPATION_FUNNEL, version)
+    if payload is None:
+        raise HTTPException(status_code=404, detail="Результат не найден: запустите расчёт")
+    return Response(content=payload, media_type="application/json")
+
+@router.get("/api/admin/analytics/funnel/versions")
+async def get_participation_funnel_versions(request: Request, admin=Depends(repo.require_admin)):
+    return repo.list_analytics_results(PARTICIPATION_FUNNEL)
+
+@router.post("/api/admin/analytics/funnel/run")
+def run_participation_funnel_endpoint(request: Request, admin=Depends(repo.require_admin)):
+    """Пересчёт воронки участия и когорт с сохранением новой версии"""
+    try:
+        return repo.run_participation_funnel()
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.post("/api/admin/team-member-counts/verify")
+def verify_team_member_counts_endpoint(request: Request, repair: bool = True,
+                                             admin=Depends(repo.require_admin)):
+    """Сверка счётчиков участников команд с Participations"""
+    try:
+        return repo.verify_team_member_counts(repair)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.post("/api/admin/activity-rollups/rebuild")
+def rebuild_activity_rollups_endpoint(request: Request, entity: Optional[str] = None,
+                                            admin=Depends(repo.require_admin)):
+    """Пересчёт агрегатов событий создания по строкам таблиц"""
+    if entity is not None and entity not in ACTIVITY_EVENTS:
+        raise HTTPException(status_code=400, detail="Неизвестная сущность")
+    totals = repo.backfill_activity_rollups([entity] if entity else None)
+    return {"message": "Агрегаты пересчитаны", "totals": totals}
+
+@router.get("/api/admin/audit-log/metrics")
+async def get_audit_log_metrics(request: Request, admin=Depends(repo.require_admin)):
+    """Состояние очереди журнала экспертов: глубина и время сброса"""
+    return audit_writer.metrics()
+
+@router.get("/api/admin/db-writer/metrics")
+async def get_db_writer_metrics(request: Request, admin=Depends(repo.require_admin)):
+    """Очередь записи в БД: размер пачек, отказы и задержки по операциям"""
+    return db_writer.metrics()
+
+@router.get("/api/admin/analytics-snapshot")
+async def get_analytics_snapshot_info(request: Request, admin=Depends(repo.require_admin)):
+    """Возраст и параметры копии БД для аналитики"""
+    return analytics_snapshot.info()
+
+@router.post("/api/admin/analytics-snapshot/refresh")
+def refresh_analytics_snapshot(request: Request, admin=Depends(repo.require_admin)):
+    """Немедленное обновление копии БД для аналитики"""
+    analytics_snapshot.refresh()
+    return analytics_snapshot.info()
+
+@router.get("/api/admin/query-stats")
+async def get_query_stats(request: Request, sort: str = "total_ms", limit: Optional[int] = None,
+                          admin=Depends(repo.require_admin)):
+    """Статистика SQL-запросов по именам из реестра: вызовы, время, строки"""
+    if sort not in ("calls", "errors", "rows", "total_ms", "mean_ms", "max_ms"):
+        raise HTTPException(status_code=400, detail="Недопустимое поле сортировки")
+    return query_registry.stats(sort, limit)
+
+@router.post("/api/admin/query-stats/dump")
+async def dump_query_stats(request: Request, admin=Depends(repo.require_admin)):
+    """Выгрузка статистики SQL-запросов в файл"""
+    path = query_registry.dump()
+    return {"message": "Статистика выгружена", "path": path}
+
+@router.post("/api/admin/query-stats/reset")
+async def reset_query_stats(request: Request, admin=Depends(repo.require_admin)):
+    query_registry.reset()
+    return {"message": "Статистика сброшена"}
+
+@router.get("/api/admin/status-scheduler")
+async def get_status_scheduler(request: Request, admin=Depends(repo.require_admin)):
+    """Очередь смены статусов по датам: ближайший переход и счётчики"""
+    return status_scheduler.info()
+
+class NotificationCreate(BaseModel):
+    event_type: str
+    event_id: int
+    subject: str
+    body: str = ""
+    send_at: Optional[str] = None
+    key: Optional[str] = None
+
+@router.post("/api/admin/notifications")
+def create_notification(data: NotificationCreate, request: Request, admin=Depends(repo.require_admin)):
+    """Письмо всем участникам хакатона, вебинара или курса через очередь отправки"""
+    try:
+        queued = repo.enqueue_event_notification(data.event_type, data.event_id, data.subject, data.body,
+                                            data.send_at, data.key)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"message": "Уведомления поставлены в очередь", "queued": queued}
+
+@router.get("/api/admin/notifications")
+async def get_notifications_info(request: Request, admin=Depends(repo.require_admin)):
+    """Очередь уведомлений по статусам, отправитель и расписание напоминаний"""
+    return repo.get_notification_stats()
+
+@router.post("/api/admin/notifications/retry-failed")
+def retry_failed_notifications_endpoint(request: Request, admin=Depends(repo.require_admin)):
+    """Повтор писем, исчерпавших попытки отправки"""
+    return {"message": "Письма возвращены в очередь", "requeued": repo.retry_failed_notifications()}
+
+@router.post("/api/admin/notifications/purge")
+def purge_notifications(request: Request, days: int = 30, admin=Depends(repo.require_admin)):
+    """Удаление отправленных писем старше days дней"""
+    return {"message": "Отправленные письма удалены", "deleted": repo.purge_sent_notifications(days)}
+
+@router.get("/api/admin/templates")
+async def get_templates_info(request: Request, admin=Depends(repo.require_admin)):
+    """Скомпилированные при запуске шаблоны и кэш байткода"""
+    return templating.info()
+
+@router.get("/api/admin/admission")
+async def get_admission_window(request: Request, admin=Depends(repo.require_admin)):
+    """Окно допуска регистраций на вебинары и курсы: параметры и исходы запросов"""
+    return admission_window.info()
+
+@router.post("/api/admin/status-scheduler/recover")
+def recover_status_scheduler(request: Request, admin=Depends(repo.require_admin)):
+    """Пересчёт статусов и очереди переходов по датам из БД"""
+    changed = status_scheduler.recover()
+    return {"message": "Статусы пересчитаны", "changed": changed}
+
+class ProfilingConfig(BaseModel):
+    sample_rate: float = 0.0
+    route_rates: Dict[str, float] = {}
+
+@router.get("/api/admin/profiles")
+async def list_profiles(request: Request, admin=Depends(repo.require_admin)):
+    """Последние профили запросов (по заголовку X-Profile или по выборке)"""
+    return {"config": profiling_settings.as_dict(), "profiles": profile_store.list()}
+
+@router.get("/api/admin/profiles/{profile_id}", response_class=PlainTextResponse)
+async def get_profile_report(profile_id: int, request: Request, sort: str = "cumulative", limit: int = 40,
+                             admin=Depends(repo.require_admin)):
+    """Текстовый отчёт pstats по профилю"""
+    try:
+        report = profile_store.report(profile_id, sort, min(max(limit, 1), 500))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if report is None:
+        raise HTTPException(status_code=404, detail="Профиль не найден")
+    return report
+
+@router.get("/api/admin/profiles/{profile_id}/pstats")
+async def download_profile(profile_id: int, request: Request, admin=Depends(repo.require_admin)):
+    """Файл pstats для snakeviz, flameprof и других просмотрщиков"""
+    path = profile_store.path(profile_id)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Профиль не найден")
+    return FileResponse(path, media_type="application/octet-stream", filename=f"profile-{profile_id}.pstats")
+
+@router.delete("/api/admin/profiles")
+async def clear_profiles(request: Request, admin=Depends(repo.require_admin)):
+    profile_store.clear()
+    return {"message": "Профили удалены"}
+
+@router.put("/api/admin/profiling/config")
+async def update_profiling_config(config: ProfilingConfig, request: Request, admin=Depends(repo.require_admin)):
+    """Доли профилируемых запросов: общая и по шаблонам путей"""
+    try:
+        profiling_settings.update(config.sample_rate, config.route_rates)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return profiling_settings.as_dict()
+
+@router.get("/api/admin/audit-log")
+def get_audit_log(
+        request: Request, expert_id: Optional[int] = None, hackathon_id: Optional[int] = None,
+        start: Optional[str] = None, end: Optional[str] = None, limit: int = 50, offset: int = 0,
+        admin=Depends(repo.require_admin)
+):
+    """Журнал экспертов за период (горячая таблица и архив)"""
+    try:
+        return repo.query_audit_log(expert_id, hackathon_id, start, end, min(max(limit, 1), 500), max(offset, 0))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.post("/api/admin/audit-log/rotate")
+def rotate_audit_log_endpoint(request: Request, admin=Depends(repo.require_admin)):
+    """Перенос устаревших записей журнала в архивные сегменты"""
+    segments = repo.rotate_audit_log()
+    return {"message": "Ротация журнала выполнена", "segments": segments}
+
+@router.get("/api/admin/hackathons/{hackathon_id}/audit-retention")
+async def get_audit_retention_endpoint(hackathon_id: int, request: Request, admin=Depends(repo.require_admin)):
+    return {"hackathon_id": hackathon_id, "retention_days": repo.get_audit_retention(hackathon_id)}
+
+@router.put("/api/admin/hackathons/{hackathon_id}/audit-retention")
+def set_audit_retention_endpoint(hackathon_id: int, policy: dict, request: Request, admin=Depends(repo.require_admin)):
+    """Установка срока хранения журнала экспертов для хакатона"""
+    retention_days = policy.get("retention_days")
+    if not isinstance(retention_days, int) or retention_days < 0:
+        raise HTTPException(status_code=400, detail="retention_days должен быть неотрицательным целым числом")
+
+    repo.set_audit_retention(hackathon_id, retention_days)
+    return {"message": "Политика хранения обновлена", "retention_days": retention_days}
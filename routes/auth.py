@@ -1,17 +1,15 @@
 from fastapi import APIRouter, Request, Depends, HTTPException
 from fastapi.responses import HTMLResponse, RedirectResponse
-from fastapi.templating import Jinja2Templates
 from pydantic import BaseModel, EmailStr
 from typing import Optional
 from datetime import datetime
 
-from db import (
-    get_current_user, get_user_by_id, get_user_by_email,
-    get_db_connection, require_admin, get_user_participations,
-    get_hackathon_by_id
-)
+from instrumentation import query_budget
+from repository import get_repository
+from templating import templates
+
+repo = get_repository()
 
-templates = Jinja2Templates(directory="templates")
 router = APIRouter()
 
 class UserLogin(BaseModel):
@@ -36,9 +34,8 @@ class UserCreate(BaseModel):
 # Роуты страниц
 @router.get("/", response_class=HTMLResponse)
 async def index(request: Request):
-    user = get_current_user(request)
-    from db import get_all_hackathons
-    active_hackathons = get_all_hackathons("ongoing")
+    user = repo.get_current_user(request)
+    active_hackathons = repo.get_all_hackathons("ongoing")
     return templates.TemplateResponse("index.html", {
         "request": request,
         "user": user,
@@ -47,9 +44,8 @@ async def index(request: Request):
 
 @router.get("/index.html", response_class=HTMLResponse)
 async def index(request: Request):
-    user = get_current_user(request)
-    from db import get_all_hackathons
-    active_hackathons = get_all_hackathons("ongoing")
+    user = repo.get_current_user(request)
+    active_hackathons = repo.get_all_hackathons("ongoing")
     return templates.TemplateResponse("index.html", {
         "request": request,
         "user": user,
@@ -65,18 +61,16 @@ async def registration_page(request: Request):
     return templates.TemplateResponse("registration.html", {"request": request})
 
 @router.get("/profile.html", response_class=HTMLResponse)
+@query_budget(3)
 async def profile_page(request: Request):
-    user = get_current_user(request)
+    user = repo.get_current_user(request)
     if not user:
         return RedirectResponse(url="/login.html", status_code=302)
 
-    user_participations = get_user_participations(user["id"])
-    user_hackathons = []
-
-    for participation in user_participations:
-        hackathon = get_hackathon_by_id(participation["hackathon_id"])
-        if hackathon:
-            user_hackathons.append(hackathon)
+    user_participations = repo.get_user_participations(user["id"])
+    # Хакатоны всех участий одним запросом, а не по запросу на участие
+    user_hackathons = repo.get_hackathons_by_ids(
+        [participation["hackathon_id"] for participation in user_participations])
 
     return templates.TemplateResponse("profile.html", {
         "request": request,
@@ -86,14 +80,14 @@ async def profile_page(request: Request):
 
 @router.get("/about.html", response_class=HTMLResponse)
 async def about_page(request: Request):
-    user = get_current_user(request)
+    user = repo.get_current_user(request)
     return templates.TemplateResponse("about.html", {"request": request, "user": user})
 
 # API роуты
 @router.post("/api/login")
 async def login(request: Request, credentials: UserLogin):
     email_lower = credentials.email.lower()
-    user = get_user_by_email(email_lower)
+    user = repo.get_user_by_email(email_lower)
 
     if not user or credentials.password != user["password"]:
         raise HTTPException(status_code=401, detail="Неверный email или пароль")
@@ -107,22 +101,13 @@ async def login(request: Request, credentials: UserLogin):
     return {"message": "Успешный вход", "user": user_response}
 
 @router.post("/api/register")
-async def register(request: Request, user_data: UserCreate):
+def register(request: Request, user_data: UserCreate):
     email_lower = user_data.email.lower()
-    if get_user_by_email(email_lower):
+    if repo.get_user_by_email(email_lower):
         raise HTTPException(status_code=400, detail="Пользователь с таким email уже существует")
 
-    if user_data.telegram_nickname:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute("SELECT * FROM Users WHERE telegram_nickname = ?", (user_data.telegram_nickname,))
-        if cursor.fetchone():
-            conn.close()
-            raise HTTPException(status_code=400, detail="Пользователь с таким Telegram nickname уже существует")
-        conn.close()
-
-    conn = get_db_connection()
-    cursor = conn.cursor()
+    if user_data.telegram_nickname and repo.get_user_by_telegram(user_data.telegram_nickname):
+        raise HTTPException(status_code=400, detail="Пользователь с таким Telegram nickname уже существует")
 
     new_user = {
         "username": user_data.username,
@@ -141,25 +126,12 @@ async def register(request: Request, user_data: UserCreate):
         "created_at": datetime.now().isoformat()
     }
 
-    cursor.execute('''
-        INSERT INTO Users (
-            username, email, password, age, fio, telegram_nickname, 
-            basics_knowledge, city, team_name, looking_for_team, 
-            hackathons, intensives, role, created_at
-        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-    ''', (
-        new_user["username"], new_user["email"], new_user["password"],
-        new_user["age"], new_user["fio"], new_user["telegram_nickname"],
-        new_user["basics_knowledge"], new_user["city"], new_user["team_name"],
-        new_user["looking_for_team"], new_user["hackathons"], new_user["intensives"],
-        new_user["role"], new_user["created_at"]
-    ))
-
-    user_id = cursor.lastrowid
-    conn.commit()
-    conn.close()
-
-    created_user = get_user_by_id(user_id)
+    try:
+        user_id = repo.create_user(new_user)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    created_user = repo.get_user_by_id(user_id)
 
     request.session["user_id"] = user_id
     request.session["role"] = new_user["role"]
@@ -175,50 +147,33 @@ async def logout(request: Request):
     return {"message": "Успешный выход"}
 
 @router.get("/api/user")
+@query_budget(1)
 async def get_user(request: Request):
-    user = get_current_user(request)
+    user = repo.get_current_user(request)
     if not user:
         raise HTTPException(status_code=401, detail="Не авторизован")
     user_response = {k: v for k, v in user.items() if k != "password"}
     return user_response
 
 @router.put("/api/user")
-async def update_current_user(request: Request, user_data: dict):
-    user = get_current_user(request)
+def update_current_user(request: Request, user_data: dict):
+    user = repo.get_current_user(request)
     if not user:
         raise HTTPException(status_code=401, detail="Не авторизован")
 
     user_id = user["id"]
-    conn = get_db_connection()
-    cursor = conn.cursor()
-
-    cursor.execute("SELECT * FROM Users WHERE id = ?", (user_id,))
-    if not cursor.fetchone():
-        conn.close()
-        raise HTTPException(status_code=404, detail="Пользователь не найден")
-
     allowed_fields = ['username', 'age', 'fio', 'telegram_nickname', 'basics_knowledge',
                       'city', 'team_name', 'looking_for_team', 'hackathons', 'intensives']
 
-    update_fields = []
-    update_values = []
-
-    for field in allowed_fields:
-        if field in user_data:
-            update_fields.append(f"{field} = ?")
-            update_values.append(user_data[field])
-
+    update_fields = {field: user_data[field] for field in allowed_fields if field in user_data}
     if not update_fields:
-        conn.close()
         raise HTTPException(status_code=400, detail="Нет полей для обновления")
 
-    update_values.append(user_id)
-    query = f"UPDATE Users SET {', '.join(update_fields)} WHERE id = ?"
-
-    cursor.execute(query, update_values)
-    conn.commit()
-    conn.close()
+    try:
+        repo.update_user(user_id, update_fields)
+    except ValueError:
+        raise HTTPException(status_code=404, detail="Пользователь не найден")
 
-    updated_user = get_user_by_id(user_id)
+    updated_user = repo.get_user_by_id(user_id)
     user_response = {k: v for k, v in updated_user.items() if k != "password"}
     return {"message": "Профиль обновлен", "user": user_response}
@@ -1,22 +1,17 @@
 from fastapi import APIRouter, Request, Depends, HTTPException
 from fastapi.responses import HTMLResponse, RedirectResponse
-from fastapi.templating import Jinja2Templates
-from pydantic import BaseModel
-from typing import Optional
+from pydantic import BaseModel, Field
+from typing import Optional, List
 from datetime import datetime
 
-from db import (
-    get_current_user, get_db_connection, require_admin,
-    require_expert_in_hackathon, get_hackathon_by_id,
-    get_all_hackathons, get_participation, get_user_participations,
-    get_hackathon_participants, create_participation, update_participation_role,
-    update_reputation, get_reputation_history, delete_participation,
-    create_team, get_team_by_id, get_team_by_code, get_team_members,
-    get_user_team_in_hackathon, add_member_to_team, remove_member_from_team,
-    update_team_name, get_available_teams, get_expert_areas
-)
-
-templates = Jinja2Templates(directory="templates")
+from db import ROLLUP_GRANULARITIES
+from instrumentation import query_budget
+from rows import FastJSONResponse
+from repository import get_repository
+from templating import templates
+
+repo = get_repository()
+
 router = APIRouter()
 
 class HackathonCreate(BaseModel):
@@ -45,6 +40,17 @@ class ReputationUpdate(BaseModel):
     new_reputation: int
     reason: Optional[str] = None
 
+class ReputationBatchUpdate(BaseModel):
+    updates: List[ReputationUpdate]
+
+MAX_REPUTATION_BATCH = 1000
+
+MIN_RATING, MAX_RATING = 1, 10
+
+class ProjectCommentData(BaseModel):
+    comment: str
+    rating: Optional[int] = Field(None, ge=MIN_RATING, le=MAX_RATING)
+
 class TeamCreate(BaseModel):
     hackathon_id: int
     name: str
@@ -55,7 +61,7 @@ class TeamUpdate(BaseModel):
 # Роуты страниц хакатонов
 @router.get("/hackathons.html", response_class=HTMLResponse)
 async def hackathons_page(request: Request):
-    user = get_current_user(request)
+    user = repo.get_current_user(request)
     return templates.TemplateResponse("hackathons.html", {
         "request": request,
         "user": user
@@ -63,14 +69,14 @@ async def hackathons_page(request: Request):
 
 @router.get("/expert.html", response_class=HTMLResponse)
 async def expert_page(request: Request):
-    user = get_current_user(request)
+    user = repo.get_current_user(request)
     if not user:
         return RedirectResponse(url="/login.html", status_code=302)
     return templates.TemplateResponse("expert.html", {"request": request, "user": user})
 
 @router.get("/team.html", response_class=HTMLResponse)
 async def team_page(request: Request):
-    user = get_current_user(request)
+    user = repo.get_current_user(request)
     if not user:
         return RedirectResponse(url="/login.html", status_code=302)
 
@@ -87,22 +93,22 @@ async def team_page(request: Request):
         raise HTTPException(status_code=400, detail="Неверный формат параметров")
 
     if not team_id:
-        team = get_user_team_in_hackathon(user["id"], hackathon_id)
+        team = repo.get_user_team_in_hackathon(user["id"], hackathon_id)
         if team:
             team_id = team["id"]
         else:
             raise HTTPException(status_code=404, detail="Команда не найдена")
 
-    team = get_team_by_id(team_id)
+    team = repo.get_team_by_id(team_id)
     if not team:
         raise HTTPException(status_code=404, detail="Команда не найдена")
 
-    participation = get_participation(user["id"], hackathon_id)
+    participation = repo.get_participation(user["id"], hackathon_id)
     if not participation and user["role"] != "admin":
         raise HTTPException(status_code=403, detail="Нет доступа к этой команде")
 
-    members = get_team_members(team_id)
-    hackathon = get_hackathon_by_id(hackathon_id)
+    members = repo.get_team_members(team_id)
+    hackathon = repo.get_hackathon_by_id(hackathon_id)
 
     return templates.TemplateResponse("team.html", {
         "request": request,
@@ -116,11 +122,11 @@ async def team_page(request: Request):
 # Роуты для страниц хакатонов по ролям
 @router.get("/hackathon/{hackathon_id}")
 async def hackathon_main_page(hackathon_id: int, request: Request):
-    hackathon = get_hackathon_by_id(hackathon_id)
+    hackathon = repo.get_hackathon_by_id(hackathon_id)
     if not hackathon:
         raise HTTPException(status_code=404, detail="Хакатон не найден")
 
-    user = get_current_user(request)
+    user = repo.get_current_user(request)
     return templates.TemplateResponse("hackathon_main.html", {
         "request": request,
         "hackathon": hackathon,
@@ -129,15 +135,15 @@ async def hackathon_main_page(hackathon_id: int, request: Request):
 
 @router.get("/hackathon/{hackathon_id}/role-check")
 async def role_checkup(hackathon_id: int, request: Request):
-    user = get_current_user(request)
+    user = repo.get_current_user(request)
     if not user:
         return RedirectResponse(url="/login.html")
 
-    hackathon = get_hackathon_by_id(hackathon_id)
+    hackathon = repo.get_hackathon_by_id(hackathon_id)
     if not hackathon:
         raise HTTPException(status_code=404, detail="Хакатон не найден")
 
-    participation = get_participation(user["id"], hackathon_id)
+    participation = repo.get_participation(user["id"], hackathon_id)
     if participation:
         role = participation["role"].lower()
         if role == "captain":
@@ -157,11 +163,11 @@ async def role_checkup(hackathon_id: int, request: Request):
 
 @router.get("/hackathon/{hackathon_id}/user")
 async def user_hackathon_page(hackathon_id: int, request: Request):
-    user = get_current_user(request)
+    user = repo.get_current_user(request)
     if not user:
         return RedirectResponse(url="/login.html")
 
-    hackathon = get_hackathon_by_id(hackathon_id)
+    hackathon = repo.get_hackathon_by_id(hackathon_id)
     if not hackathon:
         raise HTTPException(status_code=404, detail="Хакатон не найден")
 
@@ -174,11 +180,11 @@ async def user_hackathon_page(hackathon_id: int, request: Request):
 
 @router.get("/hackathon/{hackathon_id}/captain")
 async def captain_hackathon_page(hackathon_id: int, request: Request):
-    user = get_current_user(request)
+    user = repo.get_current_user(request)
     if not user:
         return RedirectResponse(url="/login.html")
 
-    hackathon = get_hackathon_by_id(hackathon_id)
+    hackathon = repo.get_hackathon_by_id(hackathon_id)
     if not hackathon:
         raise HTTPException(status_code=404, detail="Хакатон не найден")
 
@@ -191,11 +197,11 @@ async def captain_hackathon_page(hackathon_id: int, request: Request):
 
 @router.get("/hackathon/{hackathon_id}/case-holder")
 async def case_holder_hackathon_page(hackathon_id: int, request: Request):
-    user = get_current_user(request)
+    user = repo.get_current_user(request)
     if not user:
         return RedirectResponse(url="/login.html")
 
-    hackathon = get_hackathon_by_id(hackathon_id)
+    hackathon = repo.get_hackathon_by_id(hackathon_id)
     if not hackathon:
         raise HTTPException(status_code=404, detail="Хакатон не найден")
 
@@ -208,11 +214,11 @@ async def case_holder_hackathon_page(hackathon_id: int, request: Request):
 
 @router.get("/hackathon/{hackathon_id}/admin")
 async def admin_hackathon_page(hackathon_id: int, request: Request):
-    user = get_current_user(request)
+    user = repo.get_current_user(request)
     if not user:
         return RedirectResponse(url="/login.html")
 
-    hackathon = get_hackathon_by_id(hackathon_id)
+    hackathon = repo.get_hackathon_by_id(hackathon_id)
     if not hackathon:
         raise HTTPException(status_code=404, detail="Хакатон не найден")
 
@@ -225,21 +231,21 @@ async def admin_hackathon_page(hackathon_id: int, request: Request):
 
 @router.get("/hackathon/{hackathon_id}/expert")
 async def expert_hackathon_page(hackathon_id: int, request: Request):
-    user = get_current_user(request)
+    user = repo.get_current_user(request)
     if not user:
         return RedirectResponse(url="/login.html")
 
     try:
-        require_expert_in_hackathon(request, hackathon_id)
+        repo.require_expert_in_hackathon(request, hackathon_id)
     except HTTPException:
         if user["role"] != "admin":
             raise HTTPException(status_code=403, detail="Требуются права эксперта в данном хакатоне")
 
-    hackathon = get_hackathon_by_id(hackathon_id)
+    hackathon = repo.get_hackathon_by_id(hackathon_id)
     if not hackathon:
         raise HTTPException(status_code=404, detail="Хакатон не найден")
 
-    expert_areas = get_expert_areas(user["id"], hackathon_id)
+    expert_areas = repo.get_expert_areas(user["id"], hackathon_id)
 
     return templates.TemplateResponse("expert_hackathon.html", {
         "request": request,
@@ -251,36 +257,25 @@ async def expert_hackathon_page(hackathon_id: int, request: Request):
 
 # API роуты хакатонов
 @router.get("/api/hackathons")
+@query_budget(3)
 async def get_hackathons_api(request: Request, status_filter: Optional[str] = None, admin_only: Optional[bool] = False):
-    user = get_current_user(request)
+    user = repo.get_current_user(request)
     is_admin = user and user.get("role") == "admin"
 
+    hackathons = repo.list_hackathons(status_filter)
+    participant_counts = repo.get_participant_counts([hackathon["id"] for hackathon in hackathons])
+    for hackathon in hackathons:
+        hackathon["participant_count"] = participant_counts[hackathon["id"]]
+
     if admin_only or (is_admin and "/admin" in str(request.url)):
-        hackathons = get_all_hackathons(status_filter)
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        for hackathon in hackathons:
-            cursor.execute("SELECT COUNT(*) FROM Participations WHERE hackathon_id = ?", (hackathon["id"],))
-            hackathon["participant_count"] = cursor.fetchone()[0]
-        conn.close()
-        return hackathons
-
-    hackathons = get_all_hackathons(status_filter)
-    conn = get_db_connection()
-    cursor = conn.cursor()
-
-    cursor.execute("PRAGMA table_info(Hackathons)")
-    columns = [column[1] for column in cursor.fetchall()]
-    has_published = 'published' in columns
-    has_min_participants = 'min_participants' in columns
+        return FastJSONResponse(hackathons)
 
     # Для обычных пользователей показываем все хакатоны, кроме черновиков
     filtered_hackathons = []
     for hackathon in hackathons:
-        cursor.execute("SELECT COUNT(*) FROM Participations WHERE hackathon_id = ?", (hackathon["id"],))
-        participant_count = cursor.fetchone()[0]
+        participant_count = participant_counts[hackathon["id"]]
 
-        if has_published and has_min_participants:
+        if repo.hackathon_publishing:
             published = hackathon.get("published", 0) or 0
             min_participants = hackathon.get("min_participants", 0) or 0
 
@@ -291,136 +286,61 @@ async def get_hackathons_api(request: Request, status_filter: Optional[str] = No
             # Если колонок нет, показываем все хакатоны
             filtered_hackathons.append(hackathon)
 
-    conn.close()
-    return filtered_hackathons
+    return FastJSONResponse(filtered_hackathons)
 
 @router.get("/api/hackathons/{hackathon_id}")
+@query_budget(1)
 async def get_hackathon_api(hackathon_id: int, request: Request):
-    hackathon = get_hackathon_by_id(hackathon_id)
+    hackathon = repo.get_hackathon_by_id(hackathon_id)
     if not hackathon:
         raise HTTPException(status_code=404, detail="Хакатон не найден")
     return hackathon
 
 @router.post("/api/hackathons")
-async def create_hackathon(hackathon_data: HackathonCreate, request: Request, admin=Depends(require_admin)):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-
-    now = datetime.now().isoformat()
-    cursor.execute("PRAGMA table_info(Hackathons)")
-    columns = [column[1] for column in cursor.fetchall()]
-    has_min_participants = 'min_participants' in columns
-    has_published = 'published' in columns
-
-    if has_min_participants and has_published:
-        cursor.execute('''
-            INSERT INTO Hackathons (name, description, organizer, start_date, end_date, 
-                                   duration_hours, prize_fund, max_team_size, status, 
-                                   min_participants, published, created_at)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            hackathon_data.name, hackathon_data.description, hackathon_data.organizer,
-            hackathon_data.start_date, hackathon_data.end_date, hackathon_data.duration_hours,
-            hackathon_data.prize_fund, hackathon_data.max_team_size, hackathon_data.status,
-            hackathon_data.min_participants or 0, hackathon_data.published or 0, now
-        ))
-    else:
-        cursor.execute('''
-            INSERT INTO Hackathons (name, description, organizer, start_date, end_date, 
-                                   duration_hours, prize_fund, max_team_size, status, created_at)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            hackathon_data.name, hackathon_data.description, hackathon_data.organizer,
-            hackathon_data.start_date, hackathon_data.end_date, hackathon_data.duration_hours,
-            hackathon_data.prize_fund, hackathon_data.max_team_size, hackathon_data.status, now
-        ))
-
-    hackathon_id = cursor.lastrowid
-    conn.commit()
-    conn.close()
-
+def create_hackathon(hackathon_data: HackathonCreate, request: Request, admin=Depends(repo.require_admin)):
+    hackathon_id = repo.create_hackathon(hackathon_data.dict())
     return {"message": "Хакатон создан", "hackathon_id": hackathon_id}
 
 @router.put("/api/hackathons/{hackathon_id}")
-async def update_hackathon(hackathon_id: int, hackathon_data: HackathonCreate, request: Request, admin=Depends(require_admin)):
-    user = get_current_user(request)
+def update_hackathon(hackathon_id: int, hackathon_data: HackathonCreate, request: Request, admin=Depends(repo.require_admin)):
+    user = repo.get_current_user(request)
     if not user or user["role"] != "admin":
         raise HTTPException(status_code=403, detail="Требуются права администратора")
 
-    conn = get_db_connection()
-    cursor = conn.cursor()
-
-    cursor.execute("SELECT * FROM Hackathons WHERE id = ?", (hackathon_id,))
-    hackathon = cursor.fetchone()
+    hackathon = repo.get_hackathon_by_id(hackathon_id)
     if not hackathon:
-        conn.close()
         raise HTTPException(status_code=404, detail="Хакатон не найден")
 
-    hackathon_dict = dict(hackathon)
-    start_date = datetime.fromisoformat(hackathon_dict["start_date"])
+    start_date = datetime.fromisoformat(hackathon["start_date"])
     if start_date <= datetime.now():
-        conn.close()
         raise HTTPException(status_code=400, detail="Можно редактировать только предстоящие хакатоны")
 
-    cursor.execute("PRAGMA table_info(Hackathons)")
-    columns = [column[1] for column in cursor.fetchall()]
-    has_min_participants = 'min_participants' in columns
-    has_published = 'published' in columns
-
-    if has_min_participants and has_published:
-        cursor.execute('''
-            UPDATE Hackathons 
-            SET name = ?, description = ?, organizer = ?, start_date = ?, end_date = ?,
-                duration_hours = ?, prize_fund = ?, max_team_size = ?, status = ?,
-                min_participants = ?, published = ?
-            WHERE id = ?
-        ''', (
-            hackathon_data.name, hackathon_data.description, hackathon_data.organizer,
-            hackathon_data.start_date, hackathon_data.end_date, hackathon_data.duration_hours,
-            hackathon_data.prize_fund, hackathon_data.max_team_size, hackathon_data.status,
-            hackathon_data.min_participants or 0, hackathon_data.published or 0, hackathon_id
-        ))
-    else:
-        cursor.execute('''
-            UPDATE Hackathons 
-            SET name = ?, description = ?, organizer = ?, start_date = ?, end_date = ?,
-                duration_hours = ?, prize_fund = ?, max_team_size = ?, status = ?
-            WHERE id = ?
-        ''', (
-            hackathon_data.name, hackathon_data.description, hackathon_data.organizer,
-            hackathon_data.start_date, hackathon_data.end_date, hackathon_data.duration_hours,
-            hackathon_data.prize_fund, hackathon_data.max_team_size, hackathon_data.status,
-            hackathon_id
-        ))
-
-    conn.commit()
-    conn.close()
-
+    repo.update_hackathon(hackathon_id, hackathon_data.dict())
     return {"message": "Хакатон обновлён"}
 
 # ========== Participations API ==========
 @router.get("/api/participations")
 async def get_my_participations(request: Request):
     """Получение всех участий текущего пользователя"""
-    user = get_current_user(request)
+    user = repo.get_current_user(request)
     if not user:
         raise HTTPException(status_code=401, detail="Не авторизован")
 
-    participations = get_user_participations(user["id"])
+    participations = repo.get_user_participations(user["id"])
     return participations
 
 @router.get("/api/participations/{user_id}/{hackathon_id}")
 async def get_participation_info(user_id: int, hackathon_id: int, request: Request):
     """Получение информации об участии"""
-    participation = get_participation(user_id, hackathon_id)
+    participation = repo.get_participation(user_id, hackathon_id)
     if not participation:
         raise HTTPException(status_code=404, detail="Участие не найдено")
     return participation
 
 @router.post("/api/participations")
-async def create_participation_endpoint(participation_data: ParticipationCreate, request: Request):
+def create_participation_endpoint(participation_data: ParticipationCreate, request: Request):
     """Создание участия в хакатоне"""
-    user = get_current_user(request)
+    user = repo.get_current_user(request)
     if not user:
         raise HTTPException(status_code=401, detail="Не авторизован")
 
@@ -430,7 +350,7 @@ async def create_participation_endpoint(participation_data: ParticipationCreate,
         raise HTTPException(status_code=400, detail=f"Неверная роль. Допустимые: {', '.join(valid_roles)}")
 
     # Проверяем существование хакатона
-    hackathon = get_hackathon_by_id(participation_data.hackathon_id)
+    hackathon = repo.get_hackathon_by_id(participation_data.hackathon_id)
     if not hackathon:
         raise HTTPException(status_code=404, detail="Хакатон не найден")
 
@@ -441,7 +361,7 @@ async def create_participation_endpoint(participation_data: ParticipationCreate,
         # Капитан создает команду
         if participation_data.team_name:
             try:
-                team_id = create_team(
+                team_id = repo.create_team(
                     participation_data.hackathon_id,
                     participation_data.team_name,
                     user["id"],
@@ -455,25 +375,28 @@ async def create_participation_endpoint(participation_data: ParticipationCreate,
     elif participation_data.role == "team_member":
         # Участник присоединяется к команде
         if participation_data.team_code:
-            team = get_team_by_code(participation_data.hackathon_id, participation_data.team_code)
+            team = repo.get_team_by_code(participation_data.hackathon_id, participation_data.team_code)
             if not team:
                 raise HTTPException(status_code=404, detail="Команда не найдена")
             team_id = team["id"]
         elif participation_data.team_id:
-            team = get_team_by_id(participation_data.team_id)
+            team = repo.get_team_by_id(participation_data.team_id)
             if not team or team["hackathon_id"] != participation_data.hackathon_id:
                 raise HTTPException(status_code=404, detail="Команда не найдена")
             team_id = participation_data.team_id
         else:
-            # Автоматическое присоединение к доступной команде
-            available_teams = get_available_teams(participation_data.hackathon_id)
-            if not available_teams or len(available_teams) == 0:
+            # Автоматическое присоединение к первой команде со свободным местом (выбор и вступление - одна запись)
+            try:
+                joined = repo.join_open_team(user["id"], participation_data.hackathon_id, participation_data.role)
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+            if joined is None:
                 raise HTTPException(status_code=404, detail="Нет доступных команд для присоединения")
-            # Берем первую доступную команду
-            team_id = available_teams[0]["id"]
+            participation_id, team_id = joined
+            return {"message": "Участие создано", "participation_id": participation_id, "team_id": team_id}
 
     try:
-        participation_id = create_participation(
+        participation_id = repo.create_participation(
             user["id"],
             participation_data.hackathon_id,
             participation_data.role,
@@ -484,26 +407,26 @@ async def create_participation_endpoint(participation_data: ParticipationCreate,
         raise HTTPException(status_code=400, detail=str(e))
 
 @router.delete("/api/participations/{hackathon_id}")
-async def cancel_participation_endpoint(hackathon_id: int, request: Request):
+def cancel_participation_endpoint(hackathon_id: int, request: Request):
     """Отмена участия в хакатоне"""
-    user = get_current_user(request)
+    user = repo.get_current_user(request)
     if not user:
         raise HTTPException(status_code=401, detail="Не авторизован")
 
     # Проверяем существование участия
-    participation = get_participation(user["id"], hackathon_id)
+    participation = repo.get_participation(user["id"], hackathon_id)
     if not participation:
         raise HTTPException(status_code=404, detail="Участие не найдено")
 
     try:
-        delete_participation(user["id"], hackathon_id)
+        repo.delete_participation(user["id"], hackathon_id)
         return {"message": "Участие отменено"}
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 @router.put("/api/participations/{user_id}/{hackathon_id}/role")
-async def update_participation_role_endpoint(
-        user_id: int, hackathon_id: int, role_data: dict, request: Request, admin=Depends(require_admin)
+def update_participation_role_endpoint(
+        user_id: int, hackathon_id: int, role_data: dict, request: Request, admin=Depends(repo.require_admin)
 ):
     """Обновление роли участия (только для администраторов)"""
     new_role = role_data.get("role")
@@ -514,57 +437,50 @@ async def update_participation_role_endpoint(
     if new_role not in valid_roles:
         raise HTTPException(status_code=400, detail=f"Неверная роль. Допустимые: {', '.join(valid_roles)}")
 
-    update_participation_role(user_id, hackathon_id, new_role)
+    repo.update_participation_role(user_id, hackathon_id, new_role)
     return {"message": "Роль обновлена"}
 
 # ========== Reputation API ==========
 @router.get("/api/hackathons/{hackathon_id}/participants")
+@query_budget(3)
 async def get_hackathon_participants_endpoint(hackathon_id: int, request: Request):
     """Получение списка участников хакатона"""
-    user = get_current_user(request)
+    user = repo.get_current_user(request)
     if not user:
         raise HTTPException(status_code=401, detail="Не авторизован")
 
     # Проверяем, что пользователь является экспертом или администратором
     try:
-        require_expert_in_hackathon(request, hackathon_id)
+        repo.require_expert_in_hackathon(request, hackathon_id)
     except HTTPException:
         if user["role"] != "admin":
             raise HTTPException(status_code=403, detail="Требуются права эксперта")
 
-    participants = get_hackathon_participants(hackathon_id)
+    participants = repo.get_hackathon_participants(hackathon_id)
     return participants
 
 @router.put("/api/reputation")
-async def update_reputation_endpoint(reputation_data: ReputationUpdate, request: Request):
+def update_reputation_endpoint(reputation_data: ReputationUpdate, request: Request):
     """Обновление репутации (только для экспертов)"""
-    user = get_current_user(request)
+    user = repo.get_current_user(request)
     if not user:
         raise HTTPException(status_code=401, detail="Не авторизован")
 
     # Получаем информацию об участии
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute('''
-        SELECT p.*, h.id as hackathon_id FROM Participations p
-        JOIN Hackathons h ON p.hackathon_id = h.id
-        WHERE p.id = ?
-    ''', (reputation_data.participation_id,))
-    participation = cursor.fetchone()
-    conn.close()
+    participation = repo.get_participation_by_id(reputation_data.participation_id)
 
     if not participation:
         raise HTTPException(status_code=404, detail="Участие не найдено")
 
     # Проверяем права эксперта
     try:
-        require_expert_in_hackathon(request, participation["hackathon_id"])
+        repo.require_expert_in_hackathon(request, participation["hackathon_id"])
     except HTTPException:
         if user["role"] != "admin":
             raise HTTPException(status_code=403, detail="Требуются права эксперта в данном хакатоне")
 
     # Обновляем репутацию
-    update_reputation(
+    repo.update_reputation(
         reputation_data.participation_id,
         reputation_data.new_reputation,
         user["id"],
@@ -573,23 +489,57 @@ async def update_reputation_endpoint(reputation_data: ReputationUpdate, request:
 
     return {"message": "Репутация обновлена"}
 
-@router.get("/api/reputation/history/{participation_id}")
-async def get_reputation_history_endpoint(participation_id: int, request: Request):
-    """Получение истории изменений репутации"""
-    user = get_current_user(request)
+@router.put("/api/reputation/batch")
+def update_reputation_batch_endpoint(batch_data: ReputationBatchUpdate, request: Request):
+    """Пакетное обновление репутации (только для экспертов)"""
+    user = repo.get_current_user(request)
+    if not user:
+        raise HTTPException(status_code=401, detail="Не авторизован")
+
+    if len(batch_data.updates) > MAX_REPUTATION_BATCH:
+        raise HTTPException(status_code=400, detail=f"Не более {MAX_REPUTATION_BATCH} изменений за запрос")
+
+    participations = repo.get_participations_by_ids([item.participation_id for item in batch_data.updates])
+
+    # Права эксперта проверяем один раз на каждый хакатон
+    allowed_hackathons = {}
+    for participation in participations.values():
+        hackathon_id = participation["hackathon_id"]
+        if hackathon_id in allowed_hackathons:
+            continue
+        try:
+            repo.require_expert_in_hackathon(request, hackathon_id)
+            allowed_hackathons[hackathon_id] = True
+        except HTTPException:
+            allowed_hackathons[hackathon_id] = user["role"] == "admin"
+
+    results = [None] * len(batch_data.updates)
+    allowed_updates = []
+    allowed_positions = []
+    for position, item in enumerate(batch_data.updates):
+        participation = participations.get(item.participation_id)
+        if not participation:
+            results[position] = {"participation_id": item.participation_id, "status": "error", "detail": "Участие не найдено"}
+        elif not allowed_hackathons[participation["hackathon_id"]]:
+            results[position] = {"participation_id": item.participation_id, "status": "error", "detail": "Требуются права эксперта в данном хакатоне"}
+        else:
+            allowed_updates.append(item.dict())
+            allowed_positions.append(position)
+
+    for position, result in zip(allowed_positions, repo.update_reputation_batch(allowed_updates, user["id"])):
+        results[position] = result
+
+    updated = sum(1 for result in results if result["status"] == "ok")
+    return {"message": "Репутация обновлена", "updated": updated, "failed": len(results) - updated, "results": results}
+
+def _require_history_access(request: Request, participation_id: int):
+    """Проверка доступа к истории репутации участия"""
+    user = repo.get_current_user(request)
     if not user:
         raise HTTPException(status_code=401, detail="Не авторизован")
 
     # Получаем информацию об участии
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute('''
-        SELECT p.*, h.id as hackathon_id FROM Participations p
-        JOIN Hackathons h ON p.hackathon_id = h.id
-        WHERE p.id = ?
-    ''', (participation_id,))
-    participation = cursor.fetchone()
-    conn.close()
+    participation = repo.get_participation_by_id(participation_id)
 
     if not participation:
         raise HTTPException(status_code=404, detail="Участие не найдено")
@@ -597,85 +547,330 @@ async def get_reputation_history_endpoint(participation_id: int, request: Reques
     # Пользователь может видеть свою историю, эксперты и админы - любую
     if participation["user_id"] != user["id"]:
         try:
-            require_expert_in_hackathon(request, participation["hackathon_id"])
+            repo.require_expert_in_hackathon(request, participation["hackathon_id"])
         except HTTPException:
             if user["role"] != "admin":
                 raise HTTPException(status_code=403, detail="Нет доступа к этой истории")
 
-    history = get_reputation_history(participation_id)
+def _check_granularity(granularity: str):
+    if granularity not in ROLLUP_GRANULARITIES:
+        raise HTTPException(status_code=400, detail=f"Неверный интервал. Допустимые: {', '.join(ROLLUP_GRANULARITIES)}")
+
+@router.get("/api/reputation/history/{participation_id}")
+async def get_reputation_history_endpoint(participation_id: int, request: Request, limit: int = 50, offset: int = 0):
+    """Получение истории изменений репутации (постранично)"""
+    _require_history_access(request, participation_id)
+    history = repo.get_reputation_history(participation_id, min(max(limit, 1), 500), max(offset, 0))
     return history
 
+@router.get("/api/reputation/timeseries/{participation_id}")
+async def get_reputation_timeseries_endpoint(
+        participation_id: int, request: Request, granularity: str = "day",
+        start: Optional[str] = None, end: Optional[str] = None
+):
+    """Изменения репутации участника по часам или дням"""
+    _require_history_access(request, participation_id)
+    _check_granularity(granularity)
+    try:
+        return repo.get_reputation_timeseries("participation", participation_id, granularity, start, end)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.get("/api/hackathons/{hackathon_id}/reputation/timeseries")
+async def get_hackathon_reputation_timeseries_endpoint(
+        hackathon_id: int, request: Request, granularity: str = "day",
+        start: Optional[str] = None, end: Optional[str] = None
+):
+    """Изменения репутации по всему хакатону по часам или дням"""
+    user = repo.get_current_user(request)
+    if not user:
+        raise HTTPException(status_code=401, detail="Не авторизован")
+
+    try:
+        repo.require_expert_in_hackathon(request, hackathon_id)
+    except HTTPException:
+        if user["role"] != "admin":
+            raise HTTPException(status_code=403, detail="Требуются права эксперта")
+
+    _check_granularity(granularity)
+    try:
+        return repo.get_reputation_timeseries("hackathon", hackathon_id, granularity, start, end)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+# ========== Project Review API ==========
+@router.get("/api/hackathons/{hackathon_id}/review-queue")
+@query_budget(4)
+async def get_review_queue_endpoint(
+        hackathon_id: int, request: Request, status: Optional[str] = None,
+        limit: int = 20, offset: int = 0
+):
+    """Очередь проектов на оценку для эксперта"""
+    user = repo.require_expert_in_hackathon(request, hackathon_id)
+
+    if status and status not in ("pending", "reviewed"):
+        raise HTTPException(status_code=400, detail="Неверный статус. Допустимые: pending, reviewed")
+
+    # Администратор без назначенных областей видит все проекты хакатона
+    all_areas = user["role"] == "admin" and not repo.get_expert_areas(user["id"], hackathon_id)
+    return repo.get_review_queue(
+        user["id"], hackathon_id, all_areas, status,
+        min(max(limit, 1), 100), max(offset, 0)
+    )
+
+@router.get("/api/hackathons/{hackathon_id}/project-scores")
+@query_budget(4)
+async def get_project_scores_endpoint(hackathon_id: int, request: Request):
+    """Рейтинг проектов по нормализованным оценкам экспертов"""
+    repo.require_expert_in_hackathon(request, hackathon_id)
+
+    projects = {project["id"]: project for project in repo.get_projects_by_hackathon(hackathon_id)}
+    scores = []
+    for score in repo.get_project_scores(hackathon_id):
+        project = projects.get(score["project_id"])
+        if project:
+            scores.append({**score, "title": project["title"], "team_name": project["team_name"],
+                           "area_topic": project["area_topic"]})
+    return scores
+
+@router.get("/api/projects/{project_id}/comments")
+async def get_project_comments_endpoint(project_id: int, request: Request):
+    """Получение комментариев экспертов к проекту"""
+    project = repo.get_project_by_id(project_id)
+    if not project:
+        raise HTTPException(status_code=404, detail="Проект не найден")
+
+    repo.require_expert_in_hackathon(request, project["hackathon_id"])
+    return repo.get_project_comments(project_id)
+
+@router.post("/api/projects/{project_id}/comments")
+def add_project_comment_endpoint(project_id: int, comment_data: ProjectCommentData, request: Request):
+    """Добавление отзыва эксперта к проекту"""
+    project = repo.get_project_by_id(project_id)
+    if not project:
+        raise HTTPException(status_code=404, detail="Проект не найден")
+
+    user = repo.require_expert_in_hackathon(request, project["hackathon_id"])
+    comment_id = repo.add_project_comment(project_id, user["id"], comment_data.comment, comment_data.rating)
+    repo.log_expert_action(
+        user["id"], project["hackathon_id"], "add_comment", "project", project_id,
+        f"rating={comment_data.rating}", request.client.host if request.client else None
+    )
+    return {"message": "Отзыв добавлен", "comment_id": comment_id}
+
+@router.put("/api/comments/{comment_id}")
+def update_project_comment_endpoint(comment_id: int, comment_data: ProjectCommentData, request: Request):
+    """Изменение своего отзыва к проекту"""
+    comment = repo.get_project_comment_by_id(comment_id)
+    if not comment:
+        raise HTTPException(status_code=404, detail="Отзыв не найден")
+
+    user = repo.require_expert_in_hackathon(request, comment["hackathon_id"])
+    if comment["expert_id"] != user["id"] and user["role"] != "admin":
+        raise HTTPException(status_code=403, detail="Можно изменять только свои отзывы")
+
+    repo.update_project_comment(comment_id, comment_data.comment, comment_data.rating)
+    repo.log_expert_action(
+        user["id"], comment["hackathon_id"], "update_comment", "project", comment["project_id"],
+        f"rating={comment_data.rating}", request.client.host if request.client else None
+    )
+    return {"message": "Отзыв обновлён"}
+
+@router.get("/api/expert/audit-log")
+def get_expert_audit_log_endpoint(
+        request: Request, hackathon_id: Optional[int] = None, expert_id: Optional[int] = None,
+        start: Optional[str] = None, end: Optional[str] = None, limit: int = 50, offset: int = 0
+):
+    """Журнал действий эксперта (свой; администратор - любого эксперта)"""
+    user = repo.get_current_user(request)
+    if not user:
+        raise HTTPException(status_code=401, detail="Не авторизован")
+
+    target_id = expert_id or user["id"]
+    if target_id != user["id"] and user["role"] != "admin":
+        raise HTTPException(status_code=403, detail="Нет доступа к журналу другого эксперта")
+
+    limit, offset = min(max(limit, 1), 500), max(offset, 0)
+    # Запросы за период читают и архивные сегменты
+    if start or end:
+        try:
+            return repo.query_audit_log(target_id, hackathon_id, start, end, limit, offset)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    return repo.get_expert_audit_log(target_id, hackathon_id, limit, offset)
+
+# ========== Leaderboard API ==========
+def _user_entries(entries):
+    """Подстановка имён пользователей в записи таблицы лидеров"""
+    users = repo.get_usernames([entry["key"] for entry in entries])
+    result = []
+    for entry in entries:
+        info = users.get(entry["key"], {})
+        result.append({
+            "rank": entry["rank"],
+            "user_id": entry["key"],
+            "username": info.get("username"),
+            "fio": info.get("fio"),
+            "reputation": entry["score"]
+        })
+    return result
+
+def _team_entries(entries):
+    """Подстановка названий команд в записи таблицы лидеров"""
+    teams = repo.get_team_names([entry["key"] for entry in entries])
+    result = []
+    for entry in entries:
+        info = teams.get(entry["key"], {})
+        result.append({
+            "rank": entry["rank"],
+            "team_id": entry["key"],
+            "team_name": info.get("name"),
+            "hackathon_id": info.get("hackathon_id"),
+            "reputation": entry["score"]
+        })
+    return result
+
+def _user_position(user_id: int, radius: int, hackathon_id: int = None):
+    position = repo.get_leaderboard_position(user_id, radius, hackathon_id)
+    if position is None:
+        raise HTTPException(status_code=404, detail="Пользователь не найден в таблице лидеров")
+    return {
+        "user_id": user_id,
+        "rank": position["rank"],
+        "reputation": position["score"],
+        "total": position["total"],
+        "around": _user_entries(position["around"])
+    }
+
+@router.get("/api/leaderboard")
+@query_budget(4)
+async def get_global_leaderboard(request: Request, limit: int = 10):
+    """Глобальная таблица лидеров (суммарная репутация по всем хакатонам)"""
+    user = repo.get_current_user(request)
+    if not user:
+        raise HTTPException(status_code=401, detail="Не авторизован")
+
+    board = repo.get_leaderboard(min(limit, 100))
+    return {"total": board["total"], "entries": _user_entries(board["entries"])}
+
+@router.get("/api/leaderboard/teams")
+@query_budget(4)
+async def get_global_team_leaderboard(request: Request, limit: int = 10):
+    """Глобальная таблица лидеров команд"""
+    user = repo.get_current_user(request)
+    if not user:
+        raise HTTPException(status_code=401, detail="Не авторизован")
+
+    board = repo.get_leaderboard(min(limit, 100), teams=True)
+    return {"total": board["total"], "entries": _team_entries(board["entries"])}
+
+@router.get("/api/leaderboard/users/{user_id}")
+@query_budget(4)
+async def get_global_user_rank(user_id: int, request: Request, radius: int = 5):
+    """Место пользователя в глобальной таблице и соседи по рейтингу"""
+    user = repo.get_current_user(request)
+    if not user:
+        raise HTTPException(status_code=401, detail="Не авторизован")
+
+    return _user_position(user_id, min(radius, 50))
+
+@router.get("/api/hackathons/{hackathon_id}/leaderboard")
+@query_budget(4)
+async def get_hackathon_leaderboard(hackathon_id: int, request: Request, limit: int = 10):
+    """Таблица лидеров участников хакатона"""
+    user = repo.get_current_user(request)
+    if not user:
+        raise HTTPException(status_code=401, detail="Не авторизован")
+
+    board = repo.get_leaderboard(min(limit, 100), hackathon_id)
+    return {"total": board["total"], "entries": _user_entries(board["entries"])}
+
+@router.get("/api/hackathons/{hackathon_id}/leaderboard/teams")
+@query_budget(4)
+async def get_hackathon_team_leaderboard(hackathon_id: int, request: Request, limit: int = 10):
+    """Таблица лидеров команд хакатона (сумма репутации участников)"""
+    user = repo.get_current_user(request)
+    if not user:
+        raise HTTPException(status_code=401, detail="Не авторизован")
+
+    board = repo.get_leaderboard(min(limit, 100), hackathon_id, teams=True)
+    return {"total": board["total"], "entries": _team_entries(board["entries"])}
+
+@router.get("/api/hackathons/{hackathon_id}/leaderboard/users/{user_id}")
+@query_budget(4)
+async def get_hackathon_user_rank(hackathon_id: int, user_id: int, request: Request, radius: int = 5):
+    """Место пользователя в хакатоне и соседи по рейтингу"""
+    user = repo.get_current_user(request)
+    if not user:
+        raise HTTPException(status_code=401, detail="Не авторизован")
+
+    return _user_position(user_id, min(radius, 50), hackathon_id)
+
 # ========== Teams API ==========
 @router.get("/api/teams/{team_id}")
+@query_budget(4)
 async def get_team_info(team_id: int, request: Request):
     """Получение информации о команде"""
-    user = get_current_user(request)
+    user = repo.get_current_user(request)
     if not user:
         raise HTTPException(status_code=401, detail="Не авторизован")
 
-    team = get_team_by_id(team_id)
+    team = repo.get_team_by_id(team_id)
     if not team:
         raise HTTPException(status_code=404, detail="Команда не найдена")
 
     # Проверяем, что пользователь участвует в этом хакатоне
-    participation = get_participation(user["id"], team["hackathon_id"])
+    participation = repo.get_participation(user["id"], team["hackathon_id"])
     if not participation and user["role"] != "admin":
         raise HTTPException(status_code=403, detail="Нет доступа к этой команде")
 
-    members = get_team_members(team_id)
+    members = repo.get_team_members(team_id)
     team_data = dict(team)
     team_data["members"] = members
 
     return team_data
 
 @router.get("/api/hackathons/{hackathon_id}/teams")
+@query_budget(2)
 async def get_available_teams_endpoint(hackathon_id: int, request: Request):
     """Получение доступных команд в хакатоне"""
-    user = get_current_user(request)
+    user = repo.get_current_user(request)
     if not user:
         raise HTTPException(status_code=401, detail="Не авторизован")
 
-    teams = get_available_teams(hackathon_id)
+    teams = repo.get_available_teams(hackathon_id)
     return teams
 
 @router.post("/api/teams")
-async def create_team_endpoint(team_data: TeamCreate, request: Request):
+def create_team_endpoint(team_data: TeamCreate, request: Request):
     """Создание команды"""
-    user = get_current_user(request)
+    user = repo.get_current_user(request)
     if not user:
         raise HTTPException(status_code=401, detail="Не авторизован")
 
     # Проверяем, что пользователь участвует в хакатоне как капитан
-    participation = get_participation(user["id"], team_data.hackathon_id)
+    participation = repo.get_participation(user["id"], team_data.hackathon_id)
     if not participation or participation["role"] != "captain":
         raise HTTPException(status_code=403, detail="Только капитаны могут создавать команды")
 
     try:
-        team_id = create_team(team_data.hackathon_id, team_data.name, user["id"])
+        team_id = repo.create_team(team_data.hackathon_id, team_data.name, user["id"])
 
         # Обновляем участие, чтобы связать с командой
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        now = datetime.now().isoformat()
-        cursor.execute('''
-            UPDATE Participations SET team_id = ?, updated_at = ?
-            WHERE user_id = ? AND hackathon_id = ?
-        ''', (team_id, now, user["id"], team_data.hackathon_id))
-        conn.commit()
-        conn.close()
+        repo.set_participation_team(user["id"], team_data.hackathon_id, team_id)
 
         return {"message": "Команда создана", "team_id": team_id}
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 @router.put("/api/teams/{team_id}")
-async def update_team_endpoint(team_id: int, team_data: TeamUpdate, request: Request):
+def update_team_endpoint(team_id: int, team_data: TeamUpdate, request: Request):
     """Обновление команды (только капитан)"""
-    user = get_current_user(request)
+    user = repo.get_current_user(request)
     if not user:
         raise HTTPException(status_code=401, detail="Не авторизован")
 
-    team = get_team_by_id(team_id)
+    team = repo.get_team_by_id(team_id)
     if not team:
         raise HTTPException(status_code=404, detail="Команда не найдена")
 
@@ -684,24 +879,24 @@ async def update_team_endpoint(team_id: int, team_data: TeamUpdate, request: Req
         raise HTTPException(status_code=403, detail="Только капитан может редактировать команду")
 
     try:
-        update_team_name(team_id, team_data.name, team["hackathon_id"])
+        repo.update_team_name(team_id, team_data.name, team["hackathon_id"])
         return {"message": "Команда обновлена"}
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 @router.post("/api/teams/{team_id}/members")
-async def add_team_member_endpoint(team_id: int, request: Request):
+def add_team_member_endpoint(team_id: int, request: Request):
     """Добавление участника в команду"""
-    user = get_current_user(request)
+    user = repo.get_current_user(request)
     if not user:
         raise HTTPException(status_code=401, detail="Не авторизован")
 
-    team = get_team_by_id(team_id)
+    team = repo.get_team_by_id(team_id)
     if not team:
         raise HTTPException(status_code=404, detail="Команда не найдена")
 
     # Проверяем, что пользователь участвует в этом хакатоне
-    participation = get_participation(user["id"], team["hackathon_id"])
+    participation = repo.get_participation(user["id"], team["hackathon_id"])
     if not participation:
         raise HTTPException(status_code=403, detail="Вы не участвуете в этом хакатоне")
 
@@ -710,19 +905,19 @@ async def add_team_member_endpoint(team_id: int, request: Request):
         raise HTTPException(status_code=403, detail="Только участники команды могут присоединяться")
 
     try:
-        add_member_to_team(user["id"], team["hackathon_id"], team_id)
+        repo.add_member_to_team(user["id"], team["hackathon_id"], team_id)
         return {"message": "Участник добавлен в команду"}
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 @router.delete("/api/teams/{team_id}/members")
-async def remove_team_member_endpoint(team_id: int, user_id: Optional[int] = None, request: Request = None):
+def remove_team_member_endpoint(team_id: int, user_id: Optional[int] = None, request: Request = None):
     """Удаление участника из команды"""
-    user = get_current_user(request)
+    user = repo.get_current_user(request)
     if not user:
         raise HTTPException(status_code=401, detail="Не авторизован")
 
-    team = get_team_by_id(team_id)
+    team = repo.get_team_by_id(team_id)
     if not team:
         raise HTTPException(status_code=404, detail="Команда не найдена")
 
@@ -736,7 +931,7 @@ async def remove_team_member_endpoint(team_id: int, user_id: Optional[int] = Non
                 raise HTTPException(status_code=403, detail="Только капитан может удалять участников")
 
     try:
-        remove_member_from_team(target_user_id, team["hackathon_id"])
+        repo.remove_member_from_team(target_user_id, team["hackathon_id"])
         return {"message": "Участник удален из команды"}
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
@@ -1,20 +1,16 @@
 from fastapi import APIRouter, Request, Depends, HTTPException
+from fastapi.concurrency import run_in_threadpool
 from fastapi.responses import HTMLResponse
-from fastapi.templating import Jinja2Templates
 from pydantic import BaseModel
 from typing import Optional
 
-from db import (
-    get_current_user, require_admin, get_all_webinars, get_webinar_by_id,
-    create_webinar, register_for_webinar, get_user_webinar_registrations,
-    cancel_webinar_registration, is_user_registered_for_webinar,
-    get_webinar_participant_count, get_all_courses, get_course_by_id,
-    create_course, register_for_course, get_user_course_registrations,
-    cancel_course_registration, is_user_registered_for_course,
-    get_course_participant_count
-)
-
-templates = Jinja2Templates(directory="templates")
+from instrumentation import query_budget
+from repository import get_repository
+from templating import templates
+from admission import admission_window, AdmissionRejected
+
+repo = get_repository()
+
 router = APIRouter()
 
 class WebinarCreate(BaseModel):
@@ -38,10 +34,43 @@ class CourseCreate(BaseModel):
     status: str = "upcoming"
     certificate_available: bool = False
 
+# Проверка регистрации и сообщение о повторной регистрации по виду события
+_REGISTERED = {
+    "webinar": (repo.is_user_registered_for_webinar, "Вы уже зарегистрированы на этот вебинар"),
+    "course": (repo.is_user_registered_for_course, "Вы уже зарегистрированы на этот курс"),
+}
+
+async def _enroll(kind: str, event_id: int, user_id: int):
+    """Регистрация или постановка в лист ожидания через окно допуска события
+
+    Уже зарегистрированный или стоящий в очереди пользователь получает ответ
+    без занятия слота окна: повторы запроса не расходуют пропускную способность.
+    """
+    is_registered, error = _REGISTERED[kind]
+    if is_registered(user_id, event_id):
+        raise HTTPException(status_code=400, detail=error)
+    waitlist = repo.get_waitlist_position(kind, event_id, user_id)
+    if waitlist["position"] is not None:
+        return {"message": "Вы в листе ожидания", "status": "waitlisted", **waitlist}
+
+    try:
+        await admission_window.acquire(f"{kind}:{event_id}")
+    except AdmissionRejected as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": e.retry_after_header})
+
+    try:
+        # Запись ждёт фиксации пакета писателем: в потоке, чтобы не останавливать цикл событий
+        result = await run_in_threadpool(repo.enroll, kind, user_id, event_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if result["status"] == "registered":
+        return {"message": "Регистрация успешна", **result}
+    return {"message": "Мест нет, вы добавлены в лист ожидания", **result}
+
 # Роуты страниц
 @router.get("/seminars.html", response_class=HTMLResponse)
 async def seminars_page(request: Request):
-    user = get_current_user(request)
+    user = repo.get_current_user(request)
     return templates.TemplateResponse("seminars.html", {
         "request": request,
         "user": user
@@ -49,39 +78,41 @@ async def seminars_page(request: Request):
 
 # Webinars API
 @router.get("/api/webinars")
+@query_budget(4)
 async def get_webinars_api(request: Request, status_filter: Optional[str] = None):
-    webinars = get_all_webinars(status_filter)
+    webinars = repo.get_all_webinars(status_filter)
 
-    user = get_current_user(request)
-    if user:
-        for webinar in webinars:
-            webinar["is_registered"] = is_user_registered_for_webinar(user["id"], webinar["id"])
-            webinar["participant_count"] = get_webinar_participant_count(webinar["id"])
-    else:
-        for webinar in webinars:
-            webinar["is_registered"] = False
-            webinar["participant_count"] = get_webinar_participant_count(webinar["id"])
+    user = repo.get_current_user(request)
+    # Регистрации пользователя и число участников - одним запросом на весь список
+    registered = {row["id"] for row in repo.get_user_webinar_registrations(user["id"])} if user else set()
+    counts = repo.get_webinar_participant_counts([webinar["id"] for webinar in webinars])
+    for webinar in webinars:
+        webinar["is_registered"] = webinar["id"] in registered
+        webinar["participant_count"] = counts[webinar["id"]]
 
     return webinars
 
 @router.get("/api/webinars/{webinar_id}")
 async def get_webinar_api(webinar_id: int, request: Request):
-    webinar = get_webinar_by_id(webinar_id)
+    webinar = repo.get_webinar_by_id(webinar_id)
     if not webinar:
         raise HTTPException(status_code=404, detail="Вебинар не найден")
 
-    user = get_current_user(request)
+    user = repo.get_current_user(request)
     if user:
-        webinar["is_registered"] = is_user_registered_for_webinar(user["id"], webinar_id)
+        webinar["is_registered"] = repo.is_user_registered_for_webinar(user["id"], webinar_id)
     else:
         webinar["is_registered"] = False
-    webinar["participant_count"] = get_webinar_participant_count(webinar_id)
+    webinar["participant_count"] = repo.get_webinar_participant_count(webinar_id)
+    waitlist = repo.get_waitlist_position("webinar", webinar_id, user["id"] if user else None)
+    webinar["waitlist_length"] = waitlist["length"]
+    webinar["waitlist_position"] = waitlist["position"]
 
     return webinar
 
 @router.post("/api/webinars")
-async def create_webinar_api(webinar_data: WebinarCreate, request: Request, admin=Depends(require_admin)):
-    webinar_id = create_webinar(
+def create_webinar_api(webinar_data: WebinarCreate, request: Request, admin=Depends(repo.require_admin)):
+    webinar_id = repo.create_webinar(
         webinar_data.name,
         webinar_data.description,
         webinar_data.speaker,
@@ -95,72 +126,90 @@ async def create_webinar_api(webinar_data: WebinarCreate, request: Request, admi
 
 @router.post("/api/webinars/{webinar_id}/register")
 async def register_for_webinar_api(webinar_id: int, request: Request):
-    user = get_current_user(request)
+    user = repo.get_current_user(request)
+    if not user:
+        raise HTTPException(status_code=401, detail="Не авторизован")
+
+    return await _enroll("webinar", webinar_id, user["id"])
+
+@router.delete("/api/webinars/{webinar_id}/register")
+def cancel_webinar_registration_api(webinar_id: int, request: Request):
+    user = repo.get_current_user(request)
     if not user:
         raise HTTPException(status_code=401, detail="Не авторизован")
 
     try:
-        registration_id = register_for_webinar(user["id"], webinar_id)
-        return {"message": "Регистрация успешна", "registration_id": registration_id}
+        repo.cancel_webinar_registration(user["id"], webinar_id)
+        return {"message": "Регистрация отменена"}
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
 
-@router.delete("/api/webinars/{webinar_id}/register")
-async def cancel_webinar_registration_api(webinar_id: int, request: Request):
-    user = get_current_user(request)
+@router.get("/api/webinars/{webinar_id}/waitlist")
+async def get_webinar_waitlist_position_api(webinar_id: int, request: Request):
+    user = repo.get_current_user(request)
+    if not user:
+        raise HTTPException(status_code=401, detail="Не авторизован")
+
+    return repo.get_waitlist_position("webinar", webinar_id, user["id"])
+
+@router.delete("/api/webinars/{webinar_id}/waitlist")
+def leave_webinar_waitlist_api(webinar_id: int, request: Request):
+    user = repo.get_current_user(request)
     if not user:
         raise HTTPException(status_code=401, detail="Не авторизован")
 
     try:
-        cancel_webinar_registration(user["id"], webinar_id)
-        return {"message": "Регистрация отменена"}
+        repo.leave_waitlist("webinar", user["id"], webinar_id)
+        return {"message": "Вы вышли из листа ожидания"}
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 @router.get("/api/webinars/my-registrations")
 async def get_my_webinar_registrations_api(request: Request):
-    user = get_current_user(request)
+    user = repo.get_current_user(request)
     if not user:
         raise HTTPException(status_code=401, detail="Не авторизован")
 
-    registrations = get_user_webinar_registrations(user["id"])
+    registrations = repo.get_user_webinar_registrations(user["id"])
     return registrations
 
 # Courses API
 @router.get("/api/courses")
+@query_budget(4)
 async def get_courses_api(request: Request, status_filter: Optional[str] = None):
-    courses = get_all_courses(status_filter)
+    courses = repo.get_all_courses(status_filter)
 
-    user = get_current_user(request)
-    if user:
-        for course in courses:
-            course["is_registered"] = is_user_registered_for_course(user["id"], course["id"])
-            course["participant_count"] = get_course_participant_count(course["id"])
-    else:
-        for course in courses:
-            course["is_registered"] = False
-            course["participant_count"] = get_course_participant_count(course["id"])
+    user = repo.get_current_user(request)
+    # Регистрации пользователя и число участников - одним запросом на весь список
+    registered = {row["id"] for row in repo.get_user_course_registrations(user["id"])} if user else set()
+    counts = repo.get_course_participant_counts([course["id"] for course in courses])
+    for course in courses:
+        course["is_registered"] = course["id"] in registered
+        course["participant_count"] = counts[course["id"]]
 
     return courses
 
 @router.get("/api/courses/{course_id}")
 async def get_course_api(course_id: int, request: Request):
-    course = get_course_by_id(course_id)
+    course = repo.get_course_by_id(course_id)
     if not course:
         raise HTTPException(status_code=404, detail="Курс не найден")
 
-    user = get_current_user(request)
+    user = repo.get_current_user(request)
     if user:
-        course["is_registered"] = is_user_registered_for_course(user["id"], course_id)
+        course["is_registered"] = repo.is_user_registered_for_course(user["id"], course_id)
     else:
         course["is_registered"] = False
-    course["participant_count"] = get_course_participant_count(course_id)
+    course["participant_count"] = repo.get_course_participant_count(course_id)
+    waitlist = repo.get_waitlist_position("course", course_id, user["id"] if user else None)
+    course["waitlist_length"] = waitlist["length"]
+    course["waitlist_position"] = waitlist["position"]
 
     return course
 
 @router.post("/api/courses")
-async def create_course_api(course_data: CourseCreate, request: Request, admin=Depends(require_admin)):
-    course_id = create_course(
+def create_course_api(course_data: CourseCreate, request: Request, admin=Depends(repo.require_admin)):
+    course_id = repo.create_course(
         course_data.name,
         course_data.description,
         course_data.instructor,
@@ -175,33 +224,49 @@ async def create_course_api(course_data: CourseCreate, request: Request, admin=D
 
 @router.post("/api/courses/{course_id}/register")
 async def register_for_course_api(course_id: int, request: Request):
-    user = get_current_user(request)
+    user = repo.get_current_user(request)
+    if not user:
+        raise HTTPException(status_code=401, detail="Не авторизован")
+
+    return await _enroll("course", course_id, user["id"])
+
+@router.delete("/api/courses/{course_id}/register")
+def cancel_course_registration_api(course_id: int, request: Request):
+    user = repo.get_current_user(request)
     if not user:
         raise HTTPException(status_code=401, detail="Не авторизован")
 
     try:
-        registration_id = register_for_course(user["id"], course_id)
-        return {"message": "Регистрация успешна", "registration_id": registration_id}
+        repo.cancel_course_registration(user["id"], course_id)
+        return {"message": "Регистрация отменена"}
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
 
-@router.delete("/api/courses/{course_id}/register")
-async def cancel_course_registration_api(course_id: int, request: Request):
-    user = get_current_user(request)
+@router.get("/api/courses/{course_id}/waitlist")
+async def get_course_waitlist_position_api(course_id: int, request: Request):
+    user = repo.get_current_user(request)
+    if not user:
+        raise HTTPException(status_code=401, detail="Не авторизован")
+
+    return repo.get_waitlist_position("course", course_id, user["id"])
+
+@router.delete("/api/courses/{course_id}/waitlist")
+def leave_course_waitlist_api(course_id: int, request: Request):
+    user = repo.get_current_user(request)
     if not user:
         raise HTTPException(status_code=401, detail="Не авторизован")
 
     try:
-        cancel_course_registration(user["id"], course_id)
-        return {"message": "Регистрация отменена"}
+        repo.leave_waitlist("course", user["id"], course_id)
+        return {"message": "Вы вышли из листа ожидания"}
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 @router.get("/api/courses/my-registrations")
 async def get_my_course_registrations_api(request: Request):
-    user = get_current_user(request)
+    user = repo.get_current_user(request)
     if not user:
         raise HTTPException(status_code=401, detail="Не авторизован")
 
-    registrations = get_user_course_registrations(user["id"])
+    registrations = repo.get_user_course_registrations(user["id"])
     return registrations
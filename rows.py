@@ -0,0 +1,90 @@
+import json
+from dataclasses import field, make_dataclass
+from itertools import starmap
+from typing import Any
+
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class RowModel:
+    """Основа компактных строк: значения в слотах, доступ по ключу как у словаря
+
+    Экземпляр занимает память только под ссылки на значения (без хеш-таблицы
+    dict), а orjson сериализует такие dataclass напрямую, не создавая
+    промежуточных словарей.
+    """
+
+    __slots__ = ()
+    _fields = ()
+
+    def __getitem__(self, key):
+        if key not in self._fields:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __setitem__(self, key, value):
+        if key not in self._fields:
+            raise KeyError(key)
+        setattr(self, key, value)
+
+    def __contains__(self, key):
+        return key in self._fields
+
+    def get(self, key, default=None):
+        return getattr(self, key, default) if key in self._fields else default
+
+    def keys(self):
+        return self._fields
+
+    def items(self):
+        return [(name, getattr(self, name)) for name in self._fields]
+
+    def as_dict(self) -> dict:
+        return {name: getattr(self, name) for name in self._fields}
+
+
+def row_model(name: str, columns, extra=()) -> type:
+    """Класс строки с колонками выборки и дополнительными полями (по умолчанию None)"""
+    fields = [(column, Any) for column in columns]
+    fields += [(column, Any, field(default=None)) for column in extra]
+    model = make_dataclass(name, fields, bases=(RowModel,), slots=True, eq=False)
+    model._fields = frozenset(columns) | frozenset(extra)
+    return model
+
+
+def select_columns(columns) -> str:
+    return ", ".join(columns)
+
+
+def fetch_models(cursor, model) -> list:
+    """Все строки выборки как экземпляры model (порядок колонок - как в модели)"""
+    cursor.row_factory = None
+    return list(starmap(model, cursor.fetchall()))
+
+
+def _default(value):
+    if isinstance(value, RowModel):
+        return value.as_dict()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+class FastJSONResponse(JSONResponse):
+    """JSON-ответ через orjson (без orjson - стандартный json); понимает RowModel
+
+    Обработчики, возвращающие объект ответа сами, минуют jsonable_encoder
+    FastAPI - на больших списках это основная часть времени сериализации.
+    """
+
+    media_type = "application/json"
+
+    def render(self, content) -> bytes:
+        if orjson is not None:
+            return orjson.dumps(content, default=_default,
+                                option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+        return json.dumps(content, default=_default, ensure_ascii=False, allow_nan=False,
+                          separators=(",", ":")).encode("utf-8")
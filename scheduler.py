@@ -0,0 +1,284 @@
+import heapq
+import itertools
+import logging
+import threading
+from datetime import datetime, timedelta
+
+# Статусы, которые выставляются по датам; остальные (например, отмена) задаются вручную и не меняются
+MANAGED_STATUSES = ("upcoming", "ongoing", "completed")
+# Дольше этого поток не спит даже без переходов: перевод системных часов не сдвигает расписание надолго
+MAX_SLEEP = 60.0
+# Запас при отборе строк для восстановления: даты сравниваются строками, без учёта часового пояса и времени конца
+RECOVERY_SLACK = timedelta(days=1)
+
+logger = logging.getLogger(__name__)
+
+
+def parse_moment(value, end: bool = False):
+    """Дата или дата со временем в ISO-формате в местном времени
+
+    Время с часовым поясом переводится в местное; дата без времени как конец - начало следующего дня.
+    """
+    if not value:
+        return None
+    try:
+        moment = datetime.fromisoformat(str(value))
+    except ValueError:
+        return None
+    if end and len(str(value)) == 10:
+        moment += timedelta(days=1)
+    if moment.tzinfo is not None:
+        moment = moment.astimezone()
+    return moment.replace(tzinfo=None)
+
+
+def recovery_cutoff(now: datetime) -> str:
+    """Параметр запросов load: завершённые строки с концом раньше этого момента не загружаются"""
+    return (now - RECOVERY_SLACK).isoformat()
+
+
+def status_at(start: datetime, end: datetime, now: datetime) -> str:
+    if now < start:
+        return "upcoming"
+    if now < end:
+        return "ongoing"
+    return "completed"
+
+
+class StatusKind:
+    """Таблица со статусом по датам
+
+    load выбирает (id, статус, *key) строк, у которых ещё могут быть переходы:
+    завершённые с концом раньше параметра (recovery_cutoff) пропускаются;
+    key - значения колонок с датами, из которых считаются границы;
+    update получает (статус, id, *key, статус) и меняет строку, только если
+    её даты всё ещё равны key, а статус управляется расписанием и отличается.
+    """
+
+    def __init__(self, name: str, load, update, bounds):
+        self.name = name
+        self.load = load
+        self.update = update
+        self.bounds = bounds
+
+
+class TimeHeapRunner:
+    """Поток, который спит до ближайшего момента в куче и обрабатывает наступившие записи
+
+    Записи кучи - (момент, порядковый номер, вид, id строки, key, ...). _keys
+    хранит последние известные даты строки: записи по устаревшим датам
+    пропускаются. Куча не хранится: _rebuild() строит её по БД через
+    load видов (StatusKind). Подклассы задают _due(now) - снятие наступивших
+    записей под блокировкой - и _process(batch) - их обработку вне её.
+    """
+
+    name = "time-heap"
+
+    def __init__(self, kinds, connect, clock=datetime.now):
+        self.kinds = {kind.name: kind for kind in kinds}
+        self._connect = connect
+        self._clock = clock
+        self._cond = threading.Condition()
+        self._heap = []
+        self._seq = itertools.count()
+        self._keys = {}
+        self._thread = None
+        self._stopping = False
+        self._stats_lock = threading.Lock()
+
+    def _push_at(self, moment: datetime, kind: str, row_id: int, key, *payload):
+        heapq.heappush(self._heap, (moment, next(self._seq), kind, row_id, key, *payload))
+
+    def _rebuild(self, restore):
+        """Перестроение кучи по БД: restore(kind, row, now) для каждой строки load
+
+        Чтение идёт под блокировкой кучи: schedule() после фиксации записи
+        ждёт перестроения и не теряется. Запись, зафиксированная до чтения,
+        видна в нём, после - ставится вызовом schedule() поверх новой кучи.
+        """
+        with self._cond:
+            now = self._clock()
+            self._heap = []
+            self._keys = {}
+            conn = self._connect()
+            try:
+                for kind in self.kinds.values():
+                    for row in conn.execute(kind.load, (recovery_cutoff(now),)).fetchall():
+                        restore(kind, row, now)
+            finally:
+                conn.close()
+            self._cond.notify()
+
+    def recover(self):
+        raise NotImplementedError
+
+    def _due(self, now: datetime):
+        raise NotImplementedError
+
+    def _process(self, batch) -> int:
+        raise NotImplementedError
+
+    def run_due(self) -> int:
+        """Обработка наступивших записей (из потока или вручную)"""
+        with self._cond:
+            batch = self._due(self._clock())
+        if not batch:
+            return 0
+        return self._process(batch)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._stopping:
+                    now = self._clock()
+                    if self._heap and self._heap[0][0] <= now:
+                        break
+                    timeout = MAX_SLEEP
+                    if self._heap:
+                        timeout = min(timeout, (self._heap[0][0] - now).total_seconds())
+                    self._cond.wait(timeout)
+                if self._stopping:
+                    return
+            try:
+                self.run_due()
+            except Exception:
+                # Снятые с кучи записи не обработаны: через паузу куча строится заново по БД
+                logger.exception("%s failed", self.name)
+                with self._cond:
+                    self._cond.wait(MAX_SLEEP)
+                    if self._stopping:
+                        return
+                try:
+                    self.recover()
+                except Exception:
+                    logger.exception("%s recovery failed", self.name)
+
+    def start(self):
+        """Восстановление по БД и запуск потока"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stopping = False
+        self.recover()
+        self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        with self._cond:
+            self._stopping = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _state(self) -> tuple:
+        """(поток работает, записей в куче, ближайший момент ISO или None)"""
+        with self._cond:
+            pending = len(self._heap)
+            next_at = self._heap[0][0].isoformat() if self._heap else None
+        return self._thread is not None and self._thread.is_alive(), pending, next_at
+
+
+class StatusScheduler(TimeHeapRunner):
+    """Смена статусов хакатонов, вебинаров и курсов точно в момент начала и окончания
+
+    Будущие переходы лежат в куче по времени; поток спит до ближайшего и
+    применяет все наступившие переходы одной операцией записи. Очередь не
+    хранится: при запуске recover() перечитывает даты из БД, исправляет
+    статусы, переходы которых пришлись на время простоя, и заново строит
+    кучу.
+    """
+
+    name = "status-scheduler"
+
+    def __init__(self, kinds, connect, apply, clock=datetime.now):
+        super().__init__(kinds, connect, clock)
+        self._apply = apply
+        self._stats = {"recovered": 0, "applied": 0, "batches": 0, "last_run": None}
+
+    def _transitions(self, kind: str, key, now: datetime):
+        """Текущий статус по датам и будущие переходы [(время, статус)] или None, если дат нет"""
+        bounds = self.kinds[kind].bounds(*key)
+        if bounds is None:
+            return None
+        start, end = bounds
+        end = max(start, end)
+        current = status_at(start, end, now)
+        upcoming = [(moment, status) for moment, status in ((start, "ongoing"), (end, "completed")) if moment > now]
+        return current, upcoming
+
+    def current_status(self, kind: str, key, requested: str = "upcoming") -> str:
+        """Статус для записи: по датам для управляемых статусов, иначе заданный вручную"""
+        if requested not in MANAGED_STATUSES:
+            return requested
+        transitions = self._transitions(kind, key, self._clock())
+        return transitions[0] if transitions else requested
+
+    def schedule(self, kind: str, row_id: int, key, status: str):
+        """Постановка будущих переходов строки (после создания или изменения дат)"""
+        transitions = self._transitions(kind, tuple(key), self._clock())
+        with self._cond:
+            if status not in MANAGED_STATUSES or not transitions:
+                self._keys.pop((kind, row_id), None)
+                return
+            self._push(kind, row_id, tuple(key), transitions[1])
+            self._cond.notify()
+
+    def _push(self, kind, row_id, key, upcoming):
+        self._keys[(kind, row_id)] = key
+        for moment, status in upcoming:
+            self._push_at(moment, kind, row_id, key, status)
+
+    def recover(self) -> int:
+        """Построение кучи по БД и исправление статусов, устаревших за время простоя"""
+        overdue = {}
+
+        def restore(kind, row, now):
+            row_id, status, key = row[0], row[1], tuple(row[2:])
+            transitions = self._transitions(kind.name, key, now)
+            if transitions is None:
+                return
+            current, upcoming = transitions
+            if current != status:
+                overdue.setdefault(kind.name, []).append((current, row_id, *key, current))
+            self._push(kind.name, row_id, key, upcoming)
+
+        self._rebuild(restore)
+        changed = self._commit(overdue)
+        with self._stats_lock:
+            self._stats["recovered"] += changed
+        return changed
+
+    def _due(self, now: datetime) -> dict:
+        """Снятие с кучи всех наступивших переходов, сгруппированных по видам"""
+        batch = {}
+        while self._heap and self._heap[0][0] <= now:
+            _, _, kind, row_id, key, status = heapq.heappop(self._heap)
+            if self._keys.get((kind, row_id)) != key:
+                continue
+            if status == "completed":
+                del self._keys[(kind, row_id)]
+            batch.setdefault(kind, []).append((status, row_id, *key, status))
+        return batch
+
+    def _commit(self, batch: dict) -> int:
+        if not batch:
+            return 0
+        changed = self._apply(self.kinds, batch)
+        with self._stats_lock:
+            self._stats["batches"] += 1
+            self._stats["applied"] += sum(changed.values())
+            self._stats["last_run"] = self._clock().isoformat()
+        return sum(changed.values())
+
+    _process = _commit
+
+    def info(self) -> dict:
+        running, pending, next_at = self._state()
+        with self._stats_lock:
+            stats = dict(self._stats)
+        return {
+            "running": running,
+            "pending": pending,
+            "next_transition_at": next_at,
+            **stats
+        }
@@ -0,0 +1,322 @@
+import math
+import threading
+
+import numpy as np
+
+from leaderboard import RankedSet
+from queries import statement
+
+# Доля оценок, отбрасываемых с каждого края при усечённом среднем
+TRIM_FRACTION = 0.1
+# Квантиль нормального распределения для 95% доверительного интервала
+CI_Z = 1.96
+
+HACKATHON_RATINGS = statement("scores.hackathon_ratings", '''
+    SELECT c.id, c.project_id, c.expert_id, c.rating
+    FROM ProjectComments c
+    JOIN Projects p ON c.project_id = p.id
+    WHERE p.hackathon_id = ?
+    ORDER BY c.updated_at, c.id
+''')
+
+
+def _latest(project_ids, expert_ids, ratings, order):
+    """Последняя по order оценка каждого эксперта по каждому проекту"""
+    by_order = np.argsort(order, kind="stable")[::-1]
+    pairs = np.stack([project_ids[by_order], expert_ids[by_order]], axis=1)
+    _, first = np.unique(pairs, axis=0, return_index=True)
+    keep = by_order[first]
+    return project_ids[keep], expert_ids[keep], ratings[keep]
+
+
+def _project_table(project_ids, expert_ids, ratings, trim: float = TRIM_FRACTION):
+    """Показатели проектов по уникальным оценкам (проект, эксперт): массивы по отсортированным ID проектов"""
+    projects, project_idx = np.unique(project_ids, return_inverse=True)
+    _, expert_idx = np.unique(expert_ids, return_inverse=True)
+
+    # z-score внутри шкалы каждого эксперта
+    expert_count = np.bincount(expert_idx)
+    expert_mean = np.bincount(expert_idx, weights=ratings) / expert_count
+    expert_var = np.bincount(expert_idx, weights=ratings ** 2) / expert_count - expert_mean ** 2
+    expert_std = np.sqrt(np.maximum(expert_var, 0.0))
+    std = expert_std[expert_idx]
+    z = np.divide(ratings - expert_mean[expert_idx], std, out=np.zeros_like(ratings), where=std > 1e-9)
+
+    n_projects = len(projects)
+    count = np.bincount(project_idx, minlength=n_projects)
+    mean_rating = np.bincount(project_idx, weights=ratings, minlength=n_projects) / count
+    mean_z = np.bincount(project_idx, weights=z, minlength=n_projects) / count
+    var_z = np.bincount(project_idx, weights=z ** 2, minlength=n_projects) / count - mean_z ** 2
+    # Выборочное стандартное отклонение, для одной оценки интервал вырождается в точку
+    sample_var = np.divide(var_z * count, count - 1, out=np.zeros(n_projects), where=count > 1)
+    half_width = CI_Z * np.sqrt(np.maximum(sample_var, 0.0) / count)
+
+    # Усечённое среднее: позиция оценки внутри отсортированной группы проекта
+    sorted_idx = np.lexsort((z, project_idx))
+    group_start = np.concatenate(([0], np.cumsum(count)[:-1]))
+    position = np.arange(len(z)) - group_start[project_idx[sorted_idx]]
+    cut = np.floor(count * trim).astype(np.int64)[project_idx[sorted_idx]]
+    group_size = count[project_idx[sorted_idx]]
+    inside = (position >= cut) & (position < group_size - cut)
+    trimmed_count = np.bincount(project_idx[sorted_idx][inside], minlength=n_projects)
+    trimmed_sum = np.bincount(project_idx[sorted_idx][inside], weights=z[sorted_idx][inside], minlength=n_projects)
+    trimmed_z = trimmed_sum / np.maximum(trimmed_count, 1)
+    return projects, count, mean_rating, mean_z, trimmed_z, half_width
+
+
+def _rank_key(project_id: int, mean_rating: float, mean_z: float, trimmed_z: float):
+    """Ключ порядка проектов: усечённое среднее z, затем среднее z, сырая оценка и ID
+
+    Значения округляются, чтобы шум сложения с плавающей точкой не разбивал равенства.
+    """
+    return (-round(trimmed_z, 9), -round(mean_z, 9), -round(mean_rating, 9), project_id)
+
+
+def _rounded(count, mean_rating, mean_z, trimmed_z, half_width) -> tuple:
+    """Показатели проекта в виде ответа API"""
+    return (int(count), round(float(mean_rating), 4), round(float(mean_z), 4), round(float(trimmed_z), 4),
+            round(float(mean_z - half_width), 4), round(float(mean_z + half_width), 4))
+
+
+def _entry(project_id, rank, rounded) -> dict:
+    count, mean_rating, mean_z, trimmed_z, ci_low, ci_high = rounded
+    return {
+        "project_id": int(project_id),
+        "rank": rank,
+        "ratings_count": count,
+        "mean_rating": mean_rating,
+        "mean_z": mean_z,
+        "trimmed_z": trimmed_z,
+        "ci_low": ci_low,
+        "ci_high": ci_high
+    }
+
+
+def compute_scores(project_ids, expert_ids, ratings, order=None,
+                   trim: float = TRIM_FRACTION):
+    """Нормализация оценок экспертов и ранжирование проектов
+
+    На вход - параллельные массивы (проект, эксперт, оценка). Если эксперт
+    оценил проект несколько раз, учитывается последняя оценка по order.
+    Оценки каждого эксперта переводятся в z-score, чтобы разные шкалы
+    экспертов были сопоставимы, затем по проектам считаются среднее,
+    усечённое среднее и доверительный интервал. Все шаги векторизованы.
+    """
+    project_ids = np.asarray(project_ids, dtype=np.int64)
+    expert_ids = np.asarray(expert_ids, dtype=np.int64)
+    ratings = np.asarray(ratings, dtype=np.float64)
+    if not len(ratings):
+        return []
+    order = np.arange(len(ratings)) if order is None else np.asarray(order, dtype=np.int64)
+
+    table = _project_table(*_latest(project_ids, expert_ids, ratings, order), trim)
+    rows = sorted(zip(*table), key=lambda row: _rank_key(int(row[0]), row[2], row[3], row[4]))
+    return [_entry(project_id, rank, _rounded(*stats)) for rank, (project_id, *stats) in enumerate(rows, 1)]
+
+
+class _HackathonRatings:
+    """Оценки одного хакатона в памяти с показателями и порядком проектов
+
+    Хранятся действующие оценки (последняя оценка эксперта по проекту),
+    суммы оценок каждого эксперта и показатели каждого проекта. Изменение
+    оценки пересчитывает шкалу одного эксперта и показатели только тех
+    проектов, которые он оценил; порядок проектов - RankedSet ключей.
+    """
+
+    def __init__(self, rows, trim: float = TRIM_FRACTION):
+        self.trim = trim
+        # ID комментария -> [проект, эксперт, оценка, порядковый номер]
+        self.comments = {}
+        # (проект, эксперт) -> ID комментариев этой пары
+        self.pair_comments = {}
+        # эксперт -> {проект: действующая оценка}; проект -> {эксперт: действующая оценка}
+        self.expert_ratings = {}
+        self.project_ratings = {}
+        # эксперт -> [число оценок, сумма, сумма квадратов]
+        self.expert_sums = {}
+        # проект -> (ключ порядка, округлённые показатели для ответа)
+        self.stats = {}
+        self.ranking = RankedSet()
+        self.sequence = 0
+        self.results = None
+
+        for comment_id, project_id, expert_id, rating in rows:
+            self._record(comment_id, project_id, expert_id, rating)
+        for (project_id, expert_id), comment_ids in self.pair_comments.items():
+            rating = self._effective(comment_ids)
+            if rating is not None:
+                self._set_rating(project_id, expert_id, rating)
+        self._load_stats()
+
+    def _record(self, comment_id, project_id, expert_id, rating):
+        self.sequence += 1
+        comment = self.comments.get(comment_id)
+        if comment is None:
+            self.comments[comment_id] = [project_id, expert_id, rating, self.sequence]
+            self.pair_comments.setdefault((project_id, expert_id), []).append(comment_id)
+        else:
+            comment[2] = rating
+            comment[3] = self.sequence
+
+    def _effective(self, comment_ids):
+        """Последняя непустая оценка пары"""
+        rated = [self.comments[comment_id] for comment_id in comment_ids if self.comments[comment_id][2] is not None]
+        return max(rated, key=lambda comment: comment[3])[2] if rated else None
+
+    def _set_rating(self, project_id, expert_id, rating):
+        old = self.project_ratings.get(project_id, {}).get(expert_id)
+        sums = self.expert_sums.setdefault(expert_id, [0, 0, 0])
+        if old is not None:
+            sums[0] -= 1
+            sums[1] -= old
+            sums[2] -= old * old
+            del self.project_ratings[project_id][expert_id]
+            del self.expert_ratings[expert_id][project_id]
+        if rating is not None:
+            sums[0] += 1
+            sums[1] += rating
+            sums[2] += rating * rating
+            self.project_ratings.setdefault(project_id, {})[expert_id] = rating
+            self.expert_ratings.setdefault(expert_id, {})[project_id] = rating
+
+    def _expert_scale(self, expert_id):
+        count, total, squares = self.expert_sums[expert_id]
+        mean = total / count
+        return mean, math.sqrt(max(squares / count - mean ** 2, 0.0))
+
+    def _load_stats(self):
+        """Показатели всех проектов одним векторизованным расчётом"""
+        pairs = [(project_id, expert_id, rating) for project_id, ratings in self.project_ratings.items()
+                 for expert_id, rating in ratings.items()]
+        if not pairs:
+            return
+        project_ids, expert_ids, ratings = (np.asarray(column) for column in zip(*pairs))
+        table = _project_table(project_ids, expert_ids, ratings.astype(np.float64), self.trim)
+        keys = []
+        for project_id, count, mean_rating, mean_z, trimmed_z, half_width in zip(*table):
+            project_id = int(project_id)
+            key = _rank_key(project_id, float(mean_rating), float(mean_z), float(trimmed_z))
+            self.stats[project_id] = (key, _rounded(count, mean_rating, mean_z, trimmed_z, half_width))
+            keys.append(key)
+        self.ranking = RankedSet(keys)
+
+    def _refresh(self, project_id, scales: dict):
+        """Пересчёт показателей одного проекта по текущим шкалам экспертов (scales - уже посчитанные)"""
+        old = self.stats.pop(project_id, None)
+        if old is not None:
+            self.ranking.remove(old[0])
+        ratings = self.project_ratings.get(project_id)
+        if not ratings:
+            return
+        z = []
+        for expert_id, rating in ratings.items():
+            scale = scales.get(expert_id)
+            if scale is None:
+                scale = scales[expert_id] = self._expert_scale(expert_id)
+            mean, std = scale
+            z.append((rating - mean) / std if std > 1e-9 else 0.0)
+        count = len(z)
+        mean_rating = sum(ratings.values()) / count
+        mean_z = sum(z) / count
+        var_z = sum(value * value for value in z) / count - mean_z ** 2
+        sample_var = var_z * count / (count - 1) if count > 1 else 0.0
+        half_width = CI_Z * math.sqrt(max(sample_var, 0.0) / count)
+        z.sort()
+        cut = math.floor(count * self.trim)
+        inside = z[cut:count - cut]
+        trimmed_z = sum(inside) / max(len(inside), 1)
+
+        key = _rank_key(project_id, mean_rating, mean_z, trimmed_z)
+        self.stats[project_id] = (key, _rounded(count, mean_rating, mean_z, trimmed_z, half_width))
+        self.ranking.add(key)
+
+    def put(self, comment_id, project_id, expert_id, rating):
+        comment = self.comments.get(comment_id)
+        if comment is not None:
+            project_id, expert_id = comment[0], comment[1]
+        pair = self.pair_comments.get((project_id, expert_id), [])
+        old = self._effective(pair)
+        self._record(comment_id, project_id, expert_id, rating)
+        new = self._effective(self.pair_comments[(project_id, expert_id)])
+        if old == new:
+            return
+        self._set_rating(project_id, expert_id, new)
+        # Шкала эксперта изменилась: пересчитываются все оценённые им проекты
+        scales = {}
+        for affected in set(self.expert_ratings.get(expert_id, ())) | {project_id}:
+            self._refresh(affected, scales)
+        self.results = None
+
+    def scores(self):
+        if self.results is None:
+            self.results = [
+                _entry(key[3], rank, self.stats[key[3]][1])
+                for rank, key in enumerate(self.ranking.slice(0, len(self.ranking)), 1)
+            ]
+        return self.results
+
+
+class ProjectScoreCache:
+    """Кэш итоговых оценок проектов по хакатонам
+
+    Оценки хакатона читаются из БД один раз, затем добавление и изменение
+    комментариев применяется к данным в памяти: пересчитываются только
+    проекты, затронутые изменившейся шкалой эксперта. Хуки вызываются
+    писателем после фиксации; загрузка хакатона идёт под блокировкой на
+    соединении, видящем только зафиксированные данные, поэтому хук,
+    пришедший во время загрузки, применяется после неё. Хук для ещё не
+    загруженного хакатона пропускается: загрузка прочтёт его изменение из БД.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._hackathons = {}
+        self._comment_hackathon = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, hackathon_id: int, connect):
+        """Показатели проектов хакатона; connect открывает соединение для загрузки"""
+        with self._lock:
+            data = self._hackathons.get(hackathon_id)
+            if data is not None:
+                self.hits += 1
+            else:
+                self.misses += 1
+                conn = connect()
+                try:
+                    cursor = conn.cursor()
+                    cursor.execute(HACKATHON_RATINGS, (hackathon_id,))
+                    rows = [tuple(row) for row in cursor.fetchall()]
+                finally:
+                    conn.close()
+                data = _HackathonRatings(rows)
+                self._hackathons[hackathon_id] = data
+                for row in rows:
+                    self._comment_hackathon[row[0]] = hackathon_id
+            return data.scores()
+
+    def on_comment_added(self, hackathon_id: int, comment_id: int, project_id: int, expert_id: int, rating):
+        with self._lock:
+            data = self._hackathons.get(hackathon_id)
+            if data is not None:
+                data.put(comment_id, project_id, expert_id, rating)
+                self._comment_hackathon[comment_id] = hackathon_id
+
+    def on_comment_updated(self, comment_id: int, rating):
+        with self._lock:
+            hackathon_id = self._comment_hackathon.get(comment_id)
+            data = self._hackathons.get(hackathon_id)
+            if data is not None:
+                data.put(comment_id, None, None, rating)
+
+    def invalidate(self, hackathon_id: int = None):
+        with self._lock:
+            if hackathon_id is None:
+                self._hackathons.clear()
+                self._comment_hackathon.clear()
+            else:
+                self._hackathons.pop(hackathon_id, None)
+
+
+project_scores = ProjectScoreCache()
@@ -0,0 +1,184 @@
+import glob
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+# Файл поколения: analytics-<pid процесса-владельца>-<номер поколения>.db
+_GENERATION_NAME = re.compile(r"analytics-(\d+)-\d+\.db$")
+
+
+def _pid_running(pid: int) -> bool:
+    """Есть ли процесс с таким pid (сигнал 0 на POSIX, OpenProcess в Windows, где os.kill завершает процесс)"""
+    if os.name == "nt":
+        import ctypes
+        kernel32 = ctypes.windll.kernel32
+        handle = kernel32.OpenProcess(0x1000, False, pid)  # PROCESS_QUERY_LIMITED_INFORMATION
+        if not handle:
+            # ERROR_ACCESS_DENIED: процесс есть, но принадлежит другому пользователю
+            return kernel32.GetLastError() == 5
+        kernel32.CloseHandle(handle)
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class AnalyticsSnapshot:
+    """Периодически обновляемая копия БД только для чтения
+
+    Копия снимается через online backup API SQLite в новый файл поколения,
+    после чего читатели переключаются на него. Предыдущее поколение хранится
+    ещё retired_grace секунд: читатель мог взять его путь до переключения,
+    но не успеть открыть; более старые поколения удаляются при следующем
+    обновлении, когда их больше никто не держит открытыми. Имя поколения
+    содержит pid процесса: копии процессов, которых уже нет (перезапуск,
+    остановленные воркеры), удаляются там же. Если копия старше
+    refresh_interval, запрос получает текущую копию, а обновление идёт
+    в фоне, поэтому отчёты не ждут снятия копии и не блокируют запись.
+    connect_options - функция, возвращающая доп. параметры sqlite3.connect для читателей.
+    """
+
+    def __init__(self, source_path: str, directory: str, refresh_interval: float = 300.0,
+                 busy_timeout: float = 5.0, connect_options=None, retired_grace: float = 60.0):
+        self.source_path = source_path
+        self.directory = directory
+        self.refresh_interval = refresh_interval
+        self.busy_timeout = busy_timeout
+        self.connect_options = connect_options
+        self.retired_grace = retired_grace
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._path = None
+        self._generation = 0
+        # Путь прошлого поколения -> когда его сменило новое (time.monotonic)
+        self._retired = {}
+        self._taken_at = None
+        self._taken_monotonic = None
+        self._last_duration_ms = None
+        self._refreshing = False
+        # Чтения свежей копии и чтения, запустившие снятие новой
+        self.hits = 0
+        self.misses = 0
+
+    def refresh(self):
+        """Снятие новой копии (одновременные вызовы выполняют одно снятие)"""
+        with self._refresh_lock:
+            os.makedirs(self.directory, exist_ok=True)
+            generation = self._generation + 1
+            path = os.path.join(self.directory, f"analytics-{os.getpid()}-{generation}.db")
+            started = time.perf_counter()
+            source = sqlite3.connect(self.source_path, timeout=self.busy_timeout)
+            target = sqlite3.connect(path)
+            try:
+                # Копия за один шаг: в режиме WAL чтение не мешает записи
+                source.backup(target)
+                target.execute("PRAGMA journal_mode=DELETE")
+            finally:
+                target.close()
+                source.close()
+
+            with self._lock:
+                if self._path is not None:
+                    self._retired[self._path] = time.monotonic()
+                self._path = path
+                self._generation = generation
+                self._taken_at = datetime.now().isoformat()
+                self._taken_monotonic = time.monotonic()
+                self._last_duration_ms = round((time.perf_counter() - started) * 1000, 3)
+            self._cleanup()
+
+    def _cleanup(self):
+        now = time.monotonic()
+        with self._lock:
+            keep = {self._path}
+            keep.update(path for path, retired in self._retired.items() if now - retired < self.retired_grace)
+        owners = {}
+        for path in glob.glob(os.path.join(self.directory, "analytics-*-*.db")):
+            match = _GENERATION_NAME.search(os.path.basename(path))
+            if path in keep or not match:
+                continue
+            pid = int(match.group(1))
+            if pid != os.getpid():
+                # Поколения других живых процессов удаляют они сами; pid, занятый новым процессом, только откладывает удаление
+                if pid not in owners:
+                    owners[pid] = _pid_running(pid)
+                if owners[pid]:
+                    continue
+            try:
+                os.remove(path)
+            except OSError:
+                # Файл ещё открыт читателем - удалим при следующем обновлении
+                continue
+            with self._lock:
+                self._retired.pop(path, None)
+
+    def _refresh_in_background(self):
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+
+        def run():
+            try:
+                self.refresh()
+            except Exception:
+                logger.exception("Analytics snapshot refresh failed")
+            finally:
+                with self._lock:
+                    self._refreshing = False
+
+        threading.Thread(target=run, name="analytics-snapshot", daemon=True).start()
+
+    def age_seconds(self):
+        with self._lock:
+            if self._taken_monotonic is None:
+                return None
+            return round(time.monotonic() - self._taken_monotonic, 3)
+
+    def connect(self):
+        """Соединение только для чтения с актуальной копией"""
+        if self._path is None:
+            self.misses += 1
+            self.refresh()
+        elif self.age_seconds() >= self.refresh_interval:
+            self.misses += 1
+            self._refresh_in_background()
+        else:
+            self.hits += 1
+        options = self.connect_options() if self.connect_options else {}
+        while True:
+            with self._lock:
+                path = self._path
+            try:
+                conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True, **options)
+                break
+            except sqlite3.OperationalError:
+                # Поколение удалили между чтением пути и открытием: повторяем с новым путём
+                with self._lock:
+                    if self._path == path:
+                        raise
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def info(self) -> dict:
+        with self._lock:
+            taken_at = self._taken_at
+            duration_ms = self._last_duration_ms
+            refreshing = self._refreshing
+        return {
+            "taken_at": taken_at,
+            "age_seconds": self.age_seconds(),
+            "refresh_interval": self.refresh_interval,
+            "last_refresh_ms": duration_ms,
+            "refreshing": refreshing
+        }
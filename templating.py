@@ -0,0 +1,55 @@
+import os
+import time
+
+import jinja2
+from fastapi.templating import Jinja2Templates
+
+TEMPLATE_DIR = "templates"
+# Каталог байткода шаблонов: следующий запуск процесса не компилирует их заново (пусто - без кэша)
+BYTECODE_DIR = os.getenv("TEMPLATE_BYTECODE_DIR", "template_cache")
+# Проверять изменение файлов шаблонов при каждом рендере (0 - шаблоны неизменны после запуска)
+AUTO_RELOAD = os.getenv("TEMPLATES_AUTO_RELOAD", "1") != "0"
+
+
+def _bytecode_cache():
+    if not BYTECODE_DIR:
+        return None
+    try:
+        os.makedirs(BYTECODE_DIR, exist_ok=True)
+    except OSError:
+        return None
+    return jinja2.FileSystemBytecodeCache(BYTECODE_DIR)
+
+
+# Общее окружение шаблонов всех роутеров: каждый шаблон компилируется один раз на процесс
+templates = Jinja2Templates(
+    directory=TEMPLATE_DIR,
+    bytecode_cache=_bytecode_cache(),
+    auto_reload=AUTO_RELOAD
+)
+
+_precompiled = {"templates": 0, "errors": {}, "duration_ms": None}
+
+
+def precompile() -> dict:
+    """Компиляция всех шаблонов при запуске (из байткода, если он уже есть)"""
+    env = templates.env
+    started = time.perf_counter()
+    names = env.list_templates(extensions=["html"])
+    errors = {}
+    for name in names:
+        try:
+            env.get_template(name)
+        except jinja2.TemplateError as e:
+            errors[name] = str(e)
+    _precompiled.update(templates=len(names) - len(errors), errors=errors,
+                        duration_ms=round((time.perf_counter() - started) * 1000, 3))
+    return dict(_precompiled)
+
+
+def info() -> dict:
+    return {
+        "precompiled": dict(_precompiled),
+        "bytecode_dir": BYTECODE_DIR or None,
+        "auto_reload": AUTO_RELOAD
+    }
@@ -0,0 +1,52 @@
+"""Общая подготовка тестов: отдельная БД во временном каталоге и клиенты приложения"""
+import os
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ADMIN_PASSWORD = "admin123"
+
+# До импорта db: БД и рабочие каталоги во временном каталоге, фоновые задачи выключены
+WORKDIR = tempfile.mkdtemp(prefix="hackathon_hub_tests_")
+os.environ.update(
+    DB_PATH=os.path.join(WORKDIR, "hackathon_hub.db"),
+    ANALYTICS_SNAPSHOT_DIR=os.path.join(WORKDIR, "analytics_snapshot"),
+    AUDIT_ARCHIVE_DIR=os.path.join(WORKDIR, "audit_archive"),
+    PROFILE_DIR=os.path.join(WORKDIR, "profiles"),
+    TEMPLATE_BYTECODE_DIR=os.path.join(WORKDIR, "template_cache"),
+    STATUS_SCHEDULER="0",
+    NOTIFICATIONS="0",
+    # Превышение бюджета запросов маршрута - ошибка запроса, а не предупреждение в логе
+    DB_QUERY_BUDGETS="enforce",
+    ADM_PASS=ADMIN_PASSWORD
+)
+# Шаблоны и статика ищутся относительно корня репозитория
+os.chdir(ROOT)
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+
+@pytest.fixture(scope="session", autouse=True)
+def database():
+    """Схема временной БД создаётся миграциями, как при первом запуске приложения"""
+    import db
+    db.init_database()
+
+
+@pytest.fixture(scope="session")
+def app():
+    import main
+    return main.app
+
+
+@pytest.fixture(scope="session")
+def admin_client(app):
+    """TestClient приложения с сессией администратора"""
+    from fastapi.testclient import TestClient
+
+    with TestClient(app) as client:
+        response = client.post("/api/admin/login", json={"login": "admin", "password": ADMIN_PASSWORD})
+        assert response.status_code == 200, response.text
+        yield client
@@ -0,0 +1,55 @@
+"""Профиль запроса не включает код запросов, выполнявшихся во время его ожидания"""
+import asyncio
+
+import profiling
+
+# События, по которым профилируемый и второй запрос чередуются в цикле событий
+app_state = {}
+
+
+def _profiled_work():
+    return sum(range(1000))
+
+
+def _other_work():
+    return sum(range(1000))
+
+
+async def _app(scope, receive, send):
+    if scope["path"] == "/profiled":
+        _profiled_work()
+        app_state["waiting"].set()
+        await app_state["release"].wait()
+        _profiled_work()
+    else:
+        await app_state["waiting"].wait()
+        _other_work()
+        app_state["release"].set()
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b""})
+
+
+def test_profile_excludes_interleaved_requests(tmp_path):
+    store = profiling.ProfileStore(str(tmp_path), keep=5)
+    settings = profiling.ProfilingSettings(0, {"/profiled": 1})
+    middleware = profiling.ProfilingMiddleware(_app, store, settings)
+
+    async def request(path):
+        scope = {"type": "http", "method": "GET", "path": path, "headers": []}
+
+        async def send(message):
+            pass
+
+        await middleware(scope, None, send)
+
+    async def main():
+        app_state.update(waiting=asyncio.Event(), release=asyncio.Event())
+        await asyncio.gather(request("/profiled"), request("/other"))
+
+    asyncio.run(main())
+
+    [info] = store.list()
+    assert (info["path"], info["status"], info["trigger"]) == ("/profiled", 200, "sample")
+    report = store.report(info["id"], limit=100)
+    assert "_profiled_work" in report
+    assert "_other_work" not in report
@@ -0,0 +1,63 @@
+"""Бюджеты запросов маршрутов: в тестах они проверяются в режиме enforce"""
+import uuid
+
+import pytest
+from fastapi.testclient import TestClient
+
+ITEMS = 5
+
+
+@pytest.fixture(scope="module")
+def data():
+    """Несколько записей каждого вида: запрос на запись (N+1) сразу превышает бюджет"""
+    import db
+
+    tag = uuid.uuid4().hex[:8]
+    users = [db.create_user({"username": f"b{tag}{i}", "email": f"b{tag}{i}@example.com", "password": "x"})
+             for i in range(ITEMS)]
+    hackathons = [db.create_hackathon({"name": f"budget-{tag}-{i}", "start_date": "2030-01-01T00:00:00",
+                                       "end_date": "2030-01-02T00:00:00", "max_team_size": ITEMS})
+                  for i in range(ITEMS)]
+    for hackathon_id in hackathons:
+        participation_ids = [db.create_participation(user_id, hackathon_id, "participant") for user_id in users]
+    team_id = db.create_team(hackathons[0], f"t{tag}", users[0])
+    db.set_participation_team(users[0], hackathons[0], team_id)
+    for user_id in users[1:]:
+        db.add_member_to_team(user_id, hackathons[0], team_id)
+    db.create_project(hackathons[0], participation_ids[0], f"p{tag}", team_id=team_id, status="submitted")
+    for i in range(ITEMS):
+        webinar_id = db.create_webinar(f"w{tag}{i}", None, "speaker", "2030-01-01T10:00:00")
+        course_id = db.create_course(f"c{tag}{i}", None, "teacher", "2030-01-01", "2030-02-01")
+        db.register_for_webinar(users[0], webinar_id)
+        db.register_for_course(users[0], course_id)
+    return {"user_id": users[0], "hackathon_id": hackathons[0], "team_id": team_id,
+            "email": f"b{tag}0@example.com"}
+
+
+@pytest.fixture(scope="module")
+def user_client(app, data):
+    with TestClient(app) as client:
+        response = client.post("/api/login", json={"email": data["email"], "password": "x"})
+        assert response.status_code == 200, response.text
+        yield client
+
+
+def _budgeted_routes(app):
+    return {route.path for route in app.routes if hasattr(getattr(route, "endpoint", None), "query_budget")}
+
+
+def test_budgeted_routes_fit_their_budgets(app, admin_client, user_client, data):
+    """Каждый маршрут с бюджетом вызывается и укладывается в него (иначе QueryBudgetExceeded)"""
+    called = set()
+    for path in sorted(_budgeted_routes(app)):
+        url = path.format(**data)
+        response = admin_client.get(url)
+        assert response.status_code == 200, f"{url}: {response.status_code} {response.text}"
+        # У участника часть маршрутов отвечает 403, но и отказ должен уложиться в бюджет
+        response = user_client.get(url)
+        assert response.status_code in (200, 403), f"{url}: {response.status_code} {response.text}"
+        called.add(path)
+
+    assert called == _budgeted_routes(app)
+    # Бюджеты действительно проверяются, а не только пишутся в лог
+    assert "/api/webinars" in called and "/profile.html" in called
@@ -0,0 +1,332 @@
+"""Одинаковое поведение хранилищ: каждый тест выполняется на SQLite и в памяти"""
+import json
+import uuid
+from datetime import date
+
+import pytest
+
+import db
+from repository import BACKENDS
+
+
+@pytest.fixture(params=sorted(BACKENDS))
+def repo(request):
+    # Хранилище SQLite работает с общей временной БД тестов, поэтому тесты создают свои данные
+    return BACKENDS[request.param]()
+
+
+def _tag() -> str:
+    return uuid.uuid4().hex[:10]
+
+
+def _user(repo, **fields) -> int:
+    tag = _tag()
+    return repo.create_user({"username": f"u{tag}", "email": f"u{tag}@example.com", "password": "x", **fields})
+
+
+def _hackathon(repo, **fields) -> int:
+    return repo.create_hackathon({"name": f"h{_tag()}", "start_date": "2030-01-01T00:00:00",
+                                  "end_date": "2030-01-02T00:00:00", **fields})
+
+
+# ========== Пользователи ==========
+def test_users(repo):
+    user_id = _user(repo, city="Москва")
+    user = repo.get_user_by_id(user_id)
+    assert user["city"] == "Москва"
+    assert repo.get_user_by_email(user["email"].upper())["id"] == user_id
+    with pytest.raises(ValueError):
+        repo.create_user({"username": "dup", "email": user["email"], "password": "x"})
+
+    repo.update_user(user_id, {"age": 30, "looking_for_team": True})
+    user = repo.get_user_by_id(user_id)
+    assert (user["age"], user["looking_for_team"]) == (30, 1)
+
+    repo.delete_user(user_id)
+    assert repo.get_user_by_id(user_id) is None
+    with pytest.raises(ValueError):
+        repo.delete_user(user_id)
+
+
+# ========== Участия и команды ==========
+def test_participations_and_teams(repo):
+    hackathon_id = _hackathon(repo, max_team_size=2)
+    captain, member, other = _user(repo), _user(repo), _user(repo)
+    for user_id in (captain, member, other):
+        repo.create_participation(user_id, hackathon_id, "participant")
+    assert repo.get_participant_counts([hackathon_id]) == {hackathon_id: 3}
+    with pytest.raises(ValueError):
+        repo.create_participation(captain, hackathon_id, "participant")
+
+    team_id = repo.create_team(hackathon_id, f"t{_tag()}", captain)
+    repo.set_participation_team(captain, hackathon_id, team_id)
+    repo.add_member_to_team(member, hackathon_id, team_id)
+    assert {row["user_id"] for row in repo.get_team_members(team_id)} == {captain, member}
+    # Команда заполнена: свободных мест нет
+    assert [team["id"] for team in repo.get_available_teams(hackathon_id)] == []
+    with pytest.raises(ValueError):
+        repo.add_member_to_team(other, hackathon_id, team_id)
+
+    repo.remove_member_from_team(member, hackathon_id)
+    assert [team["id"] for team in repo.get_available_teams(hackathon_id)] == [team_id]
+    assert repo.get_user_team_in_hackathon(captain, hackathon_id)["id"] == team_id
+
+    repo.delete_participation(other, hackathon_id)
+    assert repo.get_participation(other, hackathon_id) is None
+    assert [row["id"] for row in repo.get_hackathons_by_ids([hackathon_id, -1])] == [hackathon_id]
+    assert repo.get_participant_counts([hackathon_id]) == {hackathon_id: 2}
+
+
+def test_deleting_team_and_user_cascades(repo):
+    hackathon_id = _hackathon(repo, max_team_size=3)
+    captain, member, leaving = _user(repo), _user(repo), _user(repo)
+    team_id = repo.create_team(hackathon_id, f"t{_tag()}", captain)
+    repo.create_participation(captain, hackathon_id, "captain", team_id)
+    repo.create_participation(member, hackathon_id, "team_member", team_id)
+    participation_id = repo.create_participation(leaving, hackathon_id, "participant")
+    other_team = repo.create_team(hackathon_id, f"t{_tag()}", member)
+    repo.add_member_to_team(leaving, hackathon_id, other_team)
+    project_id = repo.create_project(hackathon_id, participation_id, "p", team_id=other_team)
+    repo.add_project_comment(project_id, captain, "ok", 7)
+    repo.update_reputation(participation_id, 5, captain)
+
+    # Капитан уходит: команда удаляется, участник остаётся без команды
+    repo.delete_participation(captain, hackathon_id)
+    assert repo.get_team_by_id(team_id) is None
+    assert repo.get_participation(member, hackathon_id)["team_id"] is None
+    assert repo.get_participant_counts([hackathon_id]) == {hackathon_id: 2}
+    assert repo.get_team_by_id(other_team)["member_count"] == 1
+
+    # Вебинар на одно место: после удаления пользователя его место получает лист ожидания
+    webinar_id = repo.create_webinar(f"w{_tag()}", "", "", "2030-01-01T10:00:00", max_participants=1)
+    assert repo.enroll("webinar", leaving, webinar_id)["status"] == "registered"
+    assert repo.enroll("webinar", member, webinar_id)["status"] == "waitlisted"
+
+    repo.delete_user(leaving)
+    assert repo.get_participation(leaving, hackathon_id) is None
+    assert repo.get_participant_counts([hackathon_id]) == {hackathon_id: 1}
+    assert repo.get_team_by_id(other_team)["member_count"] == 0
+    assert repo.get_reputation_history(participation_id) == []
+    assert [project["id"] for project in repo.get_projects_by_hackathon(hackathon_id)] == []
+    assert repo.get_project_scores(hackathon_id) == []
+    assert repo.is_user_registered_for_webinar(member, webinar_id)
+    assert repo.get_waitlist_position("webinar", webinar_id, member) == {"position": None, "length": 0}
+    assert repo.get_leaderboard(10, hackathon_id)["total"] == 1
+
+    # Удаление эксперта убирает его комментарии к чужим проектам
+    member_participation = repo.get_participation(member, hackathon_id)["id"]
+    project_id = repo.create_project(hackathon_id, member_participation, "p2")
+    repo.add_project_comment(project_id, captain, "ok", 9)
+    repo.delete_user(captain)
+    assert repo.get_project_comments(project_id) == []
+    assert repo.get_project_scores(hackathon_id) == []
+    if isinstance(repo, BACKENDS["sqlite"]):
+        assert db.verify_team_member_counts(repair=False)["drift"] == 0
+
+
+# ========== Репутация ==========
+def test_reputation_history_and_timeseries(repo):
+    hackathon_id = _hackathon(repo)
+    expert = _user(repo)
+    participation_id = repo.create_participation(_user(repo), hackathon_id, "participant")
+
+    repo.update_reputation(participation_id, 10, expert, "first")
+    results = repo.update_reputation_batch([
+        {"participation_id": participation_id, "new_reputation": 4},
+        {"participation_id": 10 ** 9, "new_reputation": 1}
+    ], expert)
+    assert [result["status"] for result in results] == ["ok", "error"]
+    assert results[0]["old_reputation"] == 10
+
+    history = repo.get_reputation_history(participation_id)
+    assert [entry["new_reputation"] for entry in history] == [4, 10]
+
+    today = date.today().isoformat()
+    series = repo.get_reputation_timeseries("participation", participation_id, "day", today, today)
+    assert len(series) == 1
+    bucket = series[0]
+    assert (bucket["bucket_start"], bucket["changes_count"], bucket["delta_sum"]) == (today, 2, 4)
+    assert (bucket["gain_sum"], bucket["loss_sum"]) == (10, 6)
+    assert (bucket["last_reputation"], bucket["cumulative_delta"]) == (4, 4)
+
+    hackathon_series = repo.get_reputation_timeseries("hackathon", hackathon_id, "hour")
+    assert sum(bucket["changes_count"] for bucket in hackathon_series) == 2
+    assert "last_reputation" not in hackathon_series[0]
+    assert repo.get_reputation_timeseries("participation", participation_id, "day", "2000-01-01", "2000-01-02") == []
+    with pytest.raises(ValueError):
+        repo.get_reputation_timeseries("participation", participation_id, "day", "вчера")
+
+
+# ========== Таблицы лидеров ==========
+def test_leaderboards(repo):
+    hackathon_id = _hackathon(repo)
+    expert = _user(repo)
+    users = [_user(repo) for _ in range(3)]
+    participations = [repo.create_participation(user_id, hackathon_id, "participant") for user_id in users]
+    for participation_id, reputation in zip(participations, (5, 20, 10)):
+        repo.update_reputation(participation_id, reputation, expert)
+    team_id = repo.create_team(hackathon_id, f"t{_tag()}", users[0])
+    repo.set_participation_team(users[0], hackathon_id, team_id)
+    repo.add_member_to_team(users[2], hackathon_id, team_id)
+
+    board = repo.get_leaderboard(2, hackathon_id)
+    assert board["total"] == 3
+    assert [(entry["rank"], entry["key"], entry["score"]) for entry in board["entries"]] == [
+        (1, users[1], 20), (2, users[2], 10)
+    ]
+    teams = repo.get_leaderboard(10, hackathon_id, teams=True)
+    assert [(entry["key"], entry["score"]) for entry in teams["entries"]] == [(team_id, 15)]
+
+    position = repo.get_leaderboard_position(users[0], 1, hackathon_id)
+    assert (position["rank"], position["score"], position["total"]) == (3, 5, 3)
+    assert [entry["key"] for entry in position["around"]] == [users[2], users[0]]
+    assert repo.get_leaderboard_position(expert, 1, hackathon_id) is None
+    assert repo.get_leaderboard_position(users[1], 0)["score"] == 20
+
+    assert set(repo.get_usernames(users + [10 ** 9])) == set(users)
+    assert repo.get_team_names([team_id])[team_id]["hackathon_id"] == hackathon_id
+
+
+# ========== Проекты и экспертиза ==========
+def test_review_queue_and_scores(repo):
+    hackathon_id = _hackathon(repo)
+    experts = [_user(repo) for _ in range(2)]
+    participation_id = repo.create_participation(_user(repo), hackathon_id, "participant")
+    projects = [repo.create_project(hackathon_id, participation_id, f"p{i}", area_topic=area)
+                for i, area in enumerate(("ai", "ai", "web"))]
+    repo.add_expert_area(experts[0], hackathon_id, "ai")
+
+    queue = repo.get_review_queue(experts[0], hackathon_id)
+    assert queue["total"] == 2
+    assert {project["id"] for project in queue["projects"]} == set(projects[:2])
+    assert repo.get_review_queue(experts[0], hackathon_id, all_areas=True)["total"] == 3
+
+    for expert_id, ratings in zip(experts, ((9, 4, 6), (7, 3, 5))):
+        for project_id, rating in zip(projects, ratings):
+            repo.add_project_comment(project_id, expert_id, "ok", rating)
+    repo.add_project_comment(projects[1], experts[0], "без оценки")
+    repo.add_project_comment(projects[2], experts[0], "передумал", 10)
+
+    reviewed = repo.get_review_queue(experts[0], hackathon_id, review_status="reviewed")
+    assert reviewed["total"] == 2
+    project = next(project for project in reviewed["projects"] if project["id"] == projects[0])
+    assert (project["comment_count"], project["average_rating"], project["my_rating"]) == (2, 8, 9)
+    assert repo.get_review_queue(experts[0], hackathon_id, review_status="pending")["total"] == 0
+
+    scores = repo.get_project_scores(hackathon_id)
+    # Шкалы экспертов нормализуются: 9 из (9, 4, 10) и 7 из (7, 3, 5) выше, чем 10 и 5
+    assert [score["project_id"] for score in scores] == [projects[0], projects[2], projects[1]]
+    assert [score["ratings_count"] for score in scores] == [2, 2, 2]
+    assert scores[0]["mean_rating"] == 8
+
+
+# ========== Журнал экспертов ==========
+def test_audit_log(repo):
+    hackathon_id = _hackathon(repo)
+    expert = _user(repo)
+    repo.log_expert_action(expert, hackathon_id, "add_comment", "project", 1, "rating=5", "127.0.0.1")
+    repo.log_expert_action(expert, hackathon_id, "update_comment", "project", 1)
+
+    log = repo.get_expert_audit_log(expert, hackathon_id)
+    assert [entry["action_type"] for entry in log] == ["update_comment", "add_comment"]
+    assert log[1]["ip_address"] == "127.0.0.1"
+
+    # Дата без времени в end - весь этот день
+    today = date.today().isoformat()
+    period = repo.query_audit_log(expert, None, today, today)
+    assert [(entry["action_type"], entry["archived"]) for entry in period] == [
+        ("update_comment", False), ("add_comment", False)
+    ]
+    assert repo.query_audit_log(expert, None, "2000-01-01", "2000-01-02") == []
+    with pytest.raises(ValueError):
+        repo.query_audit_log(expert, None, "сегодня")
+
+    assert repo.get_audit_retention(hackathon_id) == 90
+    repo.set_audit_retention(hackathon_id, 30)
+    assert repo.get_audit_retention(hackathon_id) == 30
+
+
+# ========== Листы ожидания ==========
+def test_waitlists(repo):
+    webinar_id = repo.create_webinar(f"w{_tag()}", "", "", "2030-01-01T10:00:00", max_participants=1)
+    first, second, third = _user(repo), _user(repo), _user(repo)
+    assert repo.enroll("webinar", first, webinar_id)["status"] == "registered"
+    assert repo.enroll("webinar", second, webinar_id) == {"status": "waitlisted", "position": 1, "length": 1}
+    assert repo.enroll("webinar", third, webinar_id) == {"status": "waitlisted", "position": 2, "length": 2}
+    with pytest.raises(ValueError):
+        repo.enroll("webinar", third, webinar_id)
+
+    repo.leave_waitlist("webinar", second, webinar_id)
+    assert repo.get_waitlist_position("webinar", webinar_id, third) == {"position": 1, "length": 1}
+    # Отмена регистрации отдаёт место первому в очереди
+    repo.cancel_webinar_registration(first, webinar_id)
+    assert repo.is_user_registered_for_webinar(third, webinar_id)
+    assert repo.get_waitlist_position("webinar", webinar_id, third) == {"position": None, "length": 0}
+    assert repo.get_webinar_participant_counts([webinar_id, -1]) == {webinar_id: 1, -1: 0}
+
+
+# ========== Статистика ==========
+def _statistics(repo):
+    # SQLite считает статистику по копии БД для аналитики: снимаем свежую
+    db.analytics_snapshot.refresh()
+    return repo.get_user_statistics(), repo.get_age_statistics(), dict(repo.get_registration_statistics())
+
+
+def test_statistics(repo):
+    before, _, registrations_before = _statistics(repo)
+    city = f"c{_tag()}"
+    _user(repo, city=city, age=20, looking_for_team=True)
+    stats, ages, registrations = _statistics(repo)
+
+    assert stats["totalUsers"] == before["totalUsers"] + 1
+    assert stats["regularUsers"] == before["regularUsers"] + 1
+    assert stats["usersThisMonth"] == before["usersThisMonth"] + 1
+    assert stats["lookingForTeam"] == before["lookingForTeam"] + 1
+    assert stats["citiesStats"][city] == 1
+    assert sum(count for _, count in ages) == stats["totalUsers"]
+    assert [group for group, _ in ages] == [group for group in db.AGE_GROUPS if group in dict(ages)]
+    today = date.today().isoformat()
+    assert registrations[today] == registrations_before.get(today, 0) + 1
+
+
+def test_activity_and_demographics(repo):
+    def registered_today():
+        return repo.get_activity_timeline("users", "day")["buckets"][-1]["registered"]
+
+    before = registered_today()
+    _user(repo)
+    assert registered_today() == before + 1
+    # После пересчёта по строкам таблицы (удалённые пользователи не учитываются) события снова копятся
+    repo.backfill_activity_rollups(["users"])
+    before = registered_today()
+    city = f"c{_tag()}"
+    _user(repo, city=city, age=30)
+    assert registered_today() == before + 1
+    with pytest.raises(ValueError):
+        repo.get_activity_timeline("unknown")
+
+    db.analytics_snapshot.refresh()
+    assert repo.get_demographics("city")["counts"][city] == 1
+    assert repo.get_demographics("city", by="age")["counts"][city] == {"26-35": 1}
+    with pytest.raises(ValueError):
+        repo.get_demographics("age", by="age")
+    assert repo.reconcile_demographics(repair=False)["drift"] == 0
+    assert repo.verify_team_member_counts(repair=False)["drift"] == 0
+
+
+def test_participation_funnel_results(repo):
+    user_id = _user(repo)
+    repo.create_participation(user_id, _hackathon(repo), "participant")
+    db.analytics_snapshot.refresh()
+
+    first = repo.run_participation_funnel()
+    second = repo.run_participation_funnel()
+    assert second["version"] == first["version"] + 1
+    assert [row["version"] for row in repo.list_analytics_results(db.PARTICIPATION_FUNNEL)][:2] == \
+        [second["version"], first["version"]]
+    latest = json.loads(repo.get_analytics_result(db.PARTICIPATION_FUNNEL))
+    assert latest["version"] == second["version"]
+    assert latest["funnel"][0]["users"] >= 1
+    assert json.loads(repo.get_analytics_result(db.PARTICIPATION_FUNNEL, first["version"]))["version"] == \
+        first["version"]
+    assert repo.get_analytics_result(db.PARTICIPATION_FUNNEL, -1) is None
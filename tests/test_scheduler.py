@@ -0,0 +1,79 @@
+"""Планировщик статусов: разбор дат, восстановление по БД и постановка переходов"""
+import threading
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import db
+from scheduler import parse_moment
+
+
+def test_parse_moment_converts_to_local_time():
+    moment = datetime(2030, 1, 1, 12, 0)
+    aware = moment.astimezone(timezone(timedelta(hours=-11)))
+    assert parse_moment(aware.isoformat()) == moment
+    assert parse_moment("2030-01-01", end=True) == datetime(2030, 1, 2)
+    assert parse_moment("завтра") is None
+
+
+def _hackathon(start: datetime, end: datetime, status: str = "upcoming") -> int:
+    return db.create_hackathon({"name": f"s{start:%Y%m%d%H%M}", "start_date": start.isoformat(),
+                                "end_date": end.isoformat(), "status": status})
+
+
+def _pending(hackathon_id: int) -> list:
+    return sorted(status for _, _, kind, row_id, _, status in db.status_scheduler._heap
+                  if (kind, row_id) == ("hackathons", hackathon_id))
+
+
+def test_schedule_and_recover():
+    now = datetime.now()
+    future = _hackathon(now + timedelta(days=1), now + timedelta(days=2))
+    ongoing = _hackathon(now - timedelta(days=1), now + timedelta(days=1))
+    old = _hackathon(now - timedelta(days=30), now - timedelta(days=20))
+    # Переходы ставятся после фиксации записи
+    assert _pending(future) == ["completed", "ongoing"]
+    assert _pending(ongoing) == ["completed"]
+    assert _pending(old) == []
+    assert db.get_hackathon_by_id(ongoing)["status"] == "ongoing"
+
+    # Статус, устаревший за время простоя, исправляется при восстановлении
+    conn = db.get_db_connection()
+    conn.execute("UPDATE Hackathons SET status = 'upcoming' WHERE id = ?", (ongoing,))
+    conn.commit()
+    conn.close()
+    db.status_scheduler.recover()
+    assert db.get_hackathon_by_id(ongoing)["status"] == "ongoing"
+    assert _pending(future) == ["completed", "ongoing"]
+
+    # Давно завершённые хакатоны не загружаются
+    conn = db.get_db_connection()
+    loaded = {row[0] for row in conn.execute(db.HACKATHON_STATUS_DATES, (now.isoformat(),))}
+    conn.close()
+    assert {future, ongoing} <= loaded
+    assert old not in loaded
+
+
+@pytest.mark.parametrize("name", ["status_scheduler", "reminder_scheduler"])
+def test_schedule_during_recover_is_kept(name):
+    """Запись, поставленная во время чтения БД в recover(), не теряется при перестроении кучи"""
+    now = datetime.now()
+    hackathon_id = _hackathon(now + timedelta(days=1), now + timedelta(days=2))
+    key = (now + timedelta(days=3)).isoformat(), (now + timedelta(days=4)).isoformat()
+    scheduler = getattr(db, name)
+    connect = scheduler._connect
+    hook = threading.Thread(target=scheduler.schedule, args=("hackathons", hackathon_id, key, "upcoming"))
+
+    def connect_and_schedule():
+        # Запись фиксируется и вызывает schedule(), пока recover() читает даты
+        hook.start()
+        hook.join(0.5)
+        return connect()
+
+    scheduler._connect = connect_and_schedule
+    try:
+        scheduler.recover()
+    finally:
+        scheduler._connect = connect
+    hook.join()
+    assert scheduler._keys[("hackathons", hackathon_id)] == key
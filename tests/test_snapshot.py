@@ -0,0 +1,74 @@
+"""Переключение поколений копии БД для аналитики при одновременных чтениях"""
+import os
+import sqlite3
+import subprocess
+import sys
+import threading
+
+from snapshot import AnalyticsSnapshot
+
+
+def _source(tmp_path) -> str:
+    path = str(tmp_path / "source.db")
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE t (x INTEGER)")
+    conn.execute("INSERT INTO t VALUES (1)")
+    conn.commit()
+    conn.close()
+    return path
+
+
+def test_previous_generation_kept_for_grace_period(tmp_path):
+    snapshot = AnalyticsSnapshot(_source(tmp_path), str(tmp_path / "snapshots"), retired_grace=60.0)
+    snapshot.refresh()
+    previous = snapshot._path
+    snapshot.refresh()
+    assert os.path.exists(previous)
+
+    snapshot.retired_grace = 0.0
+    snapshot.refresh()
+    assert not os.path.exists(previous)
+    assert os.listdir(tmp_path / "snapshots") == [os.path.basename(snapshot._path)]
+
+
+def test_readers_survive_concurrent_refreshes(tmp_path):
+    snapshot = AnalyticsSnapshot(_source(tmp_path), str(tmp_path / "snapshots"), retired_grace=0.0)
+    snapshot.refresh()
+    errors = []
+    stop = threading.Event()
+
+    def read():
+        while not stop.is_set():
+            try:
+                conn = snapshot.connect()
+                assert conn.execute("SELECT x FROM t").fetchone()[0] == 1
+                conn.close()
+            except Exception as e:
+                errors.append(e)
+
+    readers = [threading.Thread(target=read) for _ in range(4)]
+    for reader in readers:
+        reader.start()
+    for _ in range(200):
+        snapshot.refresh()
+    stop.set()
+    for reader in readers:
+        reader.join()
+    assert errors == []
+
+
+def test_generations_of_finished_processes_removed(tmp_path):
+    directory = tmp_path / "snapshots"
+    directory.mkdir()
+    finished = subprocess.run([sys.executable, "-c", "import os; print(os.getpid())"],
+                              capture_output=True, text=True, check=True)
+    orphan = directory / f"analytics-{int(finished.stdout)}-3.db"
+    # Родительский процесс жив: его поколение не трогаем
+    alive = directory / f"analytics-{os.getppid()}-1.db"
+    orphan.touch()
+    alive.touch()
+
+    snapshot = AnalyticsSnapshot(_source(tmp_path), str(directory))
+    snapshot.refresh()
+    assert not orphan.exists()
+    assert alive.exists()
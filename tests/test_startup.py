@@ -0,0 +1,25 @@
+"""Фоновые потоки запускаются вместе с сервером, а не при импорте приложения"""
+import logging
+
+from fastapi.testclient import TestClient
+
+import db
+from notifications import LogSink
+
+
+def test_background_threads_start_with_server(app, monkeypatch):
+    monkeypatch.setenv("STATUS_SCHEDULER", "1")
+    monkeypatch.setenv("NOTIFICATIONS", "1")
+    threads = (db.status_scheduler, db.notification_dispatcher, db.reminder_scheduler)
+    # Импорт приложения (фикстура app) потоки не запускает
+    assert not any(thread.info()["running"] for thread in threads)
+
+    with TestClient(app):
+        assert all(thread.info()["running"] for thread in threads)
+    assert not any(thread.info()["running"] for thread in threads)
+
+
+def test_log_sink_writes_to_logging(caplog):
+    with caplog.at_level(logging.INFO, logger="notifications"):
+        assert LogSink().send([{"id": 1, "user_id": 2, "subject": "Напоминание"}]) == [None]
+    assert caplog.messages == ["Notification #1 to user 2: Напоминание"]
@@ -0,0 +1,133 @@
+"""Вступление в команды при одновременных запросах: команды не переполняются"""
+import subprocess
+import sys
+import threading
+import time
+import uuid
+
+import pytest
+
+import db
+
+TEAMS = 4
+MAX_TEAM_SIZE = 3
+JOINERS = 400
+THREADS = 32
+# Нижняя граница пропускной способности вступлений (с большим запасом: потоки записи и SQLite на диске)
+MIN_JOINS_PER_SECOND = 200
+
+
+@pytest.fixture(params=["member_count", "legacy"])
+def schema_variant(request, monkeypatch):
+    # legacy - запросы для схемы без Teams.member_count (*_LEGACY и подзапрос по участиям)
+    monkeypatch.setattr(db.schema, "team_member_counts", request.param == "member_count")
+
+
+def _setup(max_team_size):
+    tag = uuid.uuid4().hex[:10]
+    hackathon_id = db.create_hackathon({"name": f"h{tag}", "start_date": "2030-01-01T00:00:00",
+                                        "end_date": "2030-01-02T00:00:00", "max_team_size": max_team_size})
+    users = [db.create_user({"username": f"u{tag}{i}", "email": f"u{tag}{i}@example.com", "password": "x"})
+             for i in range(TEAMS + JOINERS)]
+    teams = []
+    for i, captain in enumerate(users[:TEAMS]):
+        team_id = db.create_team(hackathon_id, f"t{i}", captain)
+        db.create_participation(captain, hackathon_id, "captain", team_id)
+        teams.append(team_id)
+    return hackathon_id, teams, users[TEAMS:]
+
+
+def _run(joiners, join):
+    """Вступление всех пользователей из THREADS потоков одновременно: [(user_id, успех)], попыток в секунду"""
+    results = []
+    barrier = threading.Barrier(THREADS)
+
+    def worker(chunk):
+        barrier.wait()
+        for user_id in chunk:
+            try:
+                results.append((user_id, join(user_id)))
+            except ValueError:
+                results.append((user_id, False))
+
+    threads = [threading.Thread(target=worker, args=(joiners[i::THREADS],)) for i in range(THREADS)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results, len(joiners) / (time.perf_counter() - started)
+
+
+def _team_sizes(hackathon_id) -> dict:
+    conn = db.get_db_connection()
+    rows = conn.execute('''
+        SELECT t.id, t.member_count, COUNT(p.id) FROM Teams t
+        LEFT JOIN Participations p ON p.team_id = t.id
+        WHERE t.hackathon_id = ? GROUP BY t.id
+    ''', (hackathon_id,)).fetchall()
+    conn.close()
+    for team_id, stored, actual in rows:
+        assert stored == actual, f"member_count команды {team_id} разошёлся с составом"
+    return {row[0]: row[2] for row in rows}
+
+
+@pytest.mark.usefixtures("schema_variant")
+def test_concurrent_add_member_respects_capacity():
+    hackathon_id, teams, joiners = _setup(MAX_TEAM_SIZE)
+    for user_id in joiners:
+        db.create_participation(user_id, hackathon_id, "participant")
+
+    results, rate = _run(joiners,
+                         lambda user_id: db.add_member_to_team(user_id, hackathon_id, teams[user_id % 2]) is None)
+
+    sizes = _team_sizes(hackathon_id)
+    assert sizes[teams[0]] == sizes[teams[1]] == MAX_TEAM_SIZE
+    assert sum(joined for _, joined in results) == 2 * (MAX_TEAM_SIZE - 1)
+    assert rate >= MIN_JOINS_PER_SECOND, f"{rate:.0f} попыток в секунду"
+
+
+@pytest.mark.usefixtures("schema_variant")
+@pytest.mark.parametrize("max_team_size", [MAX_TEAM_SIZE, 0, None])
+def test_concurrent_join_open_team(max_team_size):
+    hackathon_id, teams, joiners = _setup(max_team_size)
+
+    results, rate = _run(joiners, lambda user_id: db.join_open_team(user_id, hackathon_id) is not None)
+
+    sizes = _team_sizes(hackathon_id)
+    joined = sum(joined for _, joined in results)
+    if max_team_size:
+        assert max(sizes.values()) == MAX_TEAM_SIZE
+        assert joined == TEAMS * (MAX_TEAM_SIZE - 1)
+        assert db.get_available_teams(hackathon_id) == []
+    else:
+        # 0 и NULL - без ограничения: вступают все, свободные команды остаются
+        assert joined == JOINERS
+        assert sum(sizes.values()) == TEAMS + JOINERS
+        assert len(db.get_available_teams(hackathon_id)) == TEAMS
+    # Вступления из сотен потоков объединяются в пакеты потока записи
+    assert rate >= MIN_JOINS_PER_SECOND, f"{rate:.0f} вступлений в секунду"
+
+
+# Несколько процессов с общим файлом БД: у каждого свой поток записи, место проверяется под блокировкой SQLite
+PROCESS_JOIN = """
+import sys
+import db
+hackathon_id, users = int(sys.argv[1]), map(int, sys.argv[2:])
+print(sum(db.join_open_team(user_id, hackathon_id) is not None for user_id in users))
+db.db_writer.stop()
+"""
+
+
+def test_join_open_team_across_processes():
+    hackathon_id, teams, joiners = _setup(MAX_TEAM_SIZE)
+    processes = [
+        subprocess.Popen([sys.executable, "-c", PROCESS_JOIN, str(hackathon_id), *map(str, joiners[i::4])],
+                         stdout=subprocess.PIPE, text=True)
+        for i in range(4)
+    ]
+    joined = sum(int(process.communicate(timeout=60)[0]) for process in processes)
+
+    assert [process.returncode for process in processes] == [0] * 4
+    assert max(_team_sizes(hackathon_id).values()) == MAX_TEAM_SIZE
+    assert joined == TEAMS * (MAX_TEAM_SIZE - 1)
@@ -0,0 +1,67 @@
+"""Групповая фиксация записей, пришедших через HTTP одновременно"""
+import asyncio
+import sqlite3
+import uuid
+
+import httpx
+
+from conftest import ADMIN_PASSWORD
+
+REQUESTS = 500
+
+
+def _participations(count: int) -> list:
+    import db
+
+    tag = uuid.uuid4().hex[:8]
+    hackathon_id = db.create_hackathon({
+        "name": f"writer-{tag}", "start_date": "2030-01-01T00:00:00", "end_date": "2030-01-02T00:00:00"
+    })
+    participation_ids = []
+    for i in range(count):
+        user_id = db.create_user({"username": f"w{tag}{i}", "email": f"w{tag}{i}@example.com", "password": "x"})
+        participation_ids.append(db.create_participation(user_id, hackathon_id, "participant"))
+    return participation_ids
+
+
+async def _update_concurrently(app, participation_ids) -> list:
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://testserver") as client:
+        response = await client.post("/api/admin/login", json={"login": "admin", "password": ADMIN_PASSWORD})
+        assert response.status_code == 200, response.text
+        # Исключения обработчиков возвращаются как результаты, чтобы проверить их тип
+        return await asyncio.gather(*(
+            client.put("/api/reputation", json={"participation_id": participation_id, "new_reputation": 10})
+            for participation_id in participation_ids
+        ), return_exceptions=True)
+
+
+def _operation_errors(metrics) -> int:
+    return sum(operation["errors"] for operation in metrics["operations_by_name"].values())
+
+
+def test_concurrent_write_requests_share_batches(app, caplog):
+    """Обработчики записи не блокируют цикл событий: одновременные запросы попадают в общие пакеты"""
+    import db
+
+    participation_ids = _participations(REQUESTS)
+    before = db.db_writer.metrics()
+    responses = asyncio.run(_update_concurrently(app, participation_ids))
+    after = db.db_writer.metrics()
+
+    # Сотни писателей не упираются в блокировку SQLite: записи идут через один поток записи
+    errors = [response for response in responses if isinstance(response, Exception)]
+    assert not [error for error in errors if isinstance(error, sqlite3.OperationalError)]
+    assert errors == []
+    assert not [response for response in responses if "database is locked" in response.text]
+    assert "database is locked" not in caplog.text
+    assert after["aborted_batches"] == before["aborted_batches"]
+    assert _operation_errors(after) == _operation_errors(before)
+    assert [response.status_code for response in responses] == [200] * REQUESTS
+    operations = after["operations"] - before["operations"]
+    batches = after["batches"] - before["batches"]
+    # Кроме обновлений репутации - запись при входе администратора
+    assert operations >= REQUESTS
+    assert batches < REQUESTS
+    for participation_id in participation_ids:
+        assert db.get_participation_by_id(participation_id)["reputation"] == 10
@@ -0,0 +1,89 @@
+import threading
+
+from leaderboard import RankedSet
+from queries import statement
+
+WAITLIST_ENTRIES = statement("waitlists.entries", "SELECT id, kind, event_id, user_id FROM Waitlists")
+
+
+class WaitlistRegistry:
+    """Очереди листов ожидания вебинаров и курсов в памяти
+
+    Очередь события - RankedSet из ID записей: ID растут в порядке постановки,
+    поэтому позиция пользователя - ранг его записи, и считается она за O(log n).
+    Состояние загружается из БД при первом обращении (см. db.get_waitlist_position),
+    после чего db.py применяет постановки и выходы из очереди как дельты.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self.loaded = False
+        self.hits = 0
+        self.misses = 0
+        self._reset()
+
+    def _reset(self):
+        # (kind, event_id) -> RankedSet ID записей
+        self._queues = {}
+        # (kind, event_id, user_id) -> ID записи
+        self._entries = {}
+
+    def load(self, conn):
+        """Полная загрузка очередей из БД (соединение должно видеть только зафиксированные данные)
+
+        Чтение идёт под блокировкой: хуки фиксаций, завершившихся после чтения,
+        ждут загрузки и применяются к ней как дельты.
+        """
+        with self._lock:
+            cursor = conn.cursor()
+            cursor.execute(WAITLIST_ENTRIES)
+            rows = cursor.fetchall()
+            self._reset()
+            queues = {}
+            for entry_id, kind, event_id, user_id in rows:
+                queues.setdefault((kind, event_id), []).append(entry_id)
+                self._entries[(kind, event_id, user_id)] = entry_id
+            self._queues = {key: RankedSet(ids) for key, ids in queues.items()}
+            self.loaded = True
+
+    def invalidate(self):
+        with self._lock:
+            self.loaded = False
+            self._reset()
+
+    # Хуки, которые db.py регистрирует через db_writer.after_commit
+    def on_added(self, kind: str, event_id: int, user_id: int, entry_id: int):
+        with self._lock:
+            # Запись уже прочитана загрузкой, если та шла после фиксации
+            if not self.loaded or (kind, event_id, user_id) in self._entries:
+                return
+            self._queues.setdefault((kind, event_id), RankedSet()).add(entry_id)
+            self._entries[(kind, event_id, user_id)] = entry_id
+
+    def on_removed(self, kind: str, event_id: int, user_id: int):
+        with self._lock:
+            if not self.loaded:
+                return
+            entry_id = self._entries.pop((kind, event_id, user_id), None)
+            if entry_id is None:
+                return
+            queue = self._queues[(kind, event_id)]
+            queue.remove(entry_id)
+            if not len(queue):
+                del self._queues[(kind, event_id)]
+
+    def length(self, kind: str, event_id: int) -> int:
+        with self._lock:
+            queue = self._queues.get((kind, event_id))
+            return len(queue) if queue else 0
+
+    def position(self, kind: str, event_id: int, user_id: int):
+        """Позиция пользователя в очереди (с единицы) или None, если его там нет"""
+        with self._lock:
+            entry_id = self._entries.get((kind, event_id, user_id))
+            if entry_id is None:
+                return None
+            return self._queues[(kind, event_id)].index(entry_id) + 1
+
+
+waitlists = WaitlistRegistry()
@@ -0,0 +1,310 @@
+import contextvars
+import functools
+import logging
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+from queries import statement
+
+# Сколько последних замеров хранить для перцентилей по операции
+LATENCY_SAMPLES = 1024
+
+BEGIN = statement("writer.begin", "BEGIN IMMEDIATE")
+SAVEPOINT = statement("writer.savepoint", "SAVEPOINT operation")
+ROLLBACK_TO = statement("writer.rollback_to", "ROLLBACK TO operation")
+RELEASE = statement("writer.release", "RELEASE operation")
+COMMIT = statement("writer.commit", "COMMIT")
+ROLLBACK = statement("writer.rollback", "ROLLBACK")
+
+logger = logging.getLogger(__name__)
+
+
+class WriteQueueFull(Exception):
+    """Очередь записи переполнена, запрос нужно повторить позже"""
+
+
+class _Job:
+    __slots__ = ("name", "fn", "args", "kwargs", "context", "future", "enqueued", "started", "callbacks")
+
+    def __init__(self, name, fn, args, kwargs):
+        self.name = name
+        # Операция выполняется в контексте вызывающего (учёт запросов к БД по HTTP-запросу)
+        self.context = contextvars.copy_context()
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.future = Future()
+        self.enqueued = time.perf_counter()
+        self.started = None
+        # Действия после фиксации, зарегистрированные операцией через after_commit
+        self.callbacks = []
+
+
+class _SharedConnection:
+    """Соединение потока записи, выдаваемое операции
+
+    Фиксацией управляет писатель: commit() и close() ничего не делают,
+    rollback() откатывает только изменения текущей операции.
+    """
+
+    def __init__(self, conn):
+        self._conn = conn
+
+    def cursor(self):
+        return self._conn.cursor()
+
+    def execute(self, *args):
+        return self._conn.execute(*args)
+
+    def executemany(self, *args):
+        return self._conn.executemany(*args)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        self._conn.execute(ROLLBACK_TO)
+
+    def close(self):
+        pass
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+
+class _OperationStats:
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.wait_ms = 0.0
+        self.samples = deque(maxlen=LATENCY_SAMPLES)
+
+    def add(self, wait_ms: float, total_ms: float, failed: bool):
+        self.count += 1
+        self.errors += failed
+        self.total_ms += total_ms
+        self.max_ms = max(self.max_ms, total_ms)
+        self.wait_ms += wait_ms
+        self.samples.append(total_ms)
+
+    def as_dict(self) -> dict:
+        samples = sorted(self.samples)
+
+        def percentile(p):
+            return round(samples[min(len(samples) - 1, int(len(samples) * p))], 3) if samples else 0.0
+
+        return {
+            "count": self.count,
+            "errors": self.errors,
+            "avg_ms": round(self.total_ms / self.count, 3) if self.count else 0.0,
+            "avg_wait_ms": round(self.wait_ms / self.count, 3) if self.count else 0.0,
+            "p50_ms": percentile(0.5),
+            "p95_ms": percentile(0.95),
+            "p99_ms": percentile(0.99),
+            "max_ms": round(self.max_ms, 3)
+        }
+
+
+class DatabaseWriter:
+    """Единственный поток записи в БД с групповой фиксацией
+
+    Операции из любых потоков ставятся в ограниченную очередь и выполняются
+    по очереди на одном соединении. Накопившиеся операции выполняются в одной
+    транзакции, каждая в своей точке сохранения: ошибка откатывает только
+    свою операцию, а вызывающий получает результат после общей фиксации.
+    Если очередь заполнена дольше submit_timeout, выбрасывается WriteQueueFull.
+    run() блокирует вызывающий поток до фиксации, поэтому обработчики FastAPI,
+    выполняющие запись, объявлены через def (выполняются в пуле потоков),
+    а асинхронные вызывают запись через run_in_threadpool.
+    Кэши в памяти обновляются через after_commit: действия выполняются только
+    после фиксации пакета и пропадают вместе с откатом своей операции.
+    """
+
+    def __init__(self, connect, batch_size: int = 64, max_queue: int = 1000,
+                 submit_timeout: float = 5.0, on_abort=None, enabled: bool = True):
+        self._connect = connect
+        self.batch_size = batch_size
+        self.submit_timeout = submit_timeout
+        self.enabled = enabled
+        self._on_abort = on_abort
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._local = threading.local()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._operations = {}
+        self._stats = {
+            "batches": 0,
+            "operations": 0,
+            "rejected": 0,
+            "aborted_batches": 0,
+            "max_batch": 0,
+            "total_commit_ms": 0.0
+        }
+
+    def connection(self):
+        """Общее соединение, если вызов идёт из операции в потоке записи"""
+        return getattr(self._local, "connection", None)
+
+    def operation(self, fn):
+        """Декоратор: функция выполняется в потоке записи"""
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            return self.run(fn.__name__, fn, *args, **kwargs)
+        return wrapper
+
+    def after_commit(self, fn, *args):
+        """Вызов fn(*args) после фиксации текущей операции (вне операции - сразу)"""
+        callbacks = getattr(self._local, "callbacks", None)
+        if callbacks is None:
+            fn(*args)
+        else:
+            callbacks.append((fn, args))
+
+    def _run_callbacks(self, callbacks):
+        for fn, args in callbacks:
+            try:
+                fn(*args)
+            except Exception:
+                logger.exception("After-commit callback %s failed", getattr(fn, "__qualname__", fn))
+                if self._on_abort:
+                    self._on_abort()
+
+    def run(self, name: str, fn, *args, **kwargs):
+        # Вложенные операции выполняются в транзакции внешней
+        if self.connection() is not None or getattr(self._local, "callbacks", None) is not None:
+            return fn(*args, **kwargs)
+        if not self.enabled:
+            # Без писателя операция фиксирует изменения сама до возврата
+            self._local.callbacks = callbacks = []
+            try:
+                result = fn(*args, **kwargs)
+            finally:
+                self._local.callbacks = None
+            self._run_callbacks(callbacks)
+            return result
+        self._ensure_started()
+        job = _Job(name, fn, args, kwargs)
+        try:
+            self._queue.put(job, timeout=self.submit_timeout)
+        except queue.Full:
+            with self._stats_lock:
+                self._stats["rejected"] += 1
+            raise WriteQueueFull("Сервер перегружен, повторите запрос позже")
+        return job.future.result()
+
+    def _ensure_started(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="db-writer", daemon=True)
+                self._thread.start()
+
+    def stop(self, timeout: float = 10.0):
+        """Остановка писателя после выполнения уже поставленных операций"""
+        if self._thread is None:
+            return
+        self._queue.put(None)
+        self._thread.join(timeout)
+        self._thread = None
+
+    def _run(self):
+        conn = self._connect()
+        self._local.connection = _SharedConnection(conn)
+        try:
+            while True:
+                item = self._queue.get()
+                batch = []
+                stop = False
+                while True:
+                    if item is None:
+                        stop = True
+                        break
+                    batch.append(item)
+                    if len(batch) >= self.batch_size:
+                        break
+                    try:
+                        item = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                if batch:
+                    self._execute(conn, batch)
+                if stop:
+                    break
+        finally:
+            self._local.connection = None
+            conn.close()
+
+    def _execute(self, conn, batch):
+        outcomes = []
+        try:
+            conn.execute(BEGIN)
+        except Exception as e:
+            for job in batch:
+                job.future.set_exception(e)
+            return
+        for job in batch:
+            job.started = time.perf_counter()
+            conn.execute(SAVEPOINT)
+            self._local.callbacks = job.callbacks
+            try:
+                outcomes.append((job, job.context.run(job.fn, *job.args, **job.kwargs), None))
+            except Exception as e:
+                conn.execute(ROLLBACK_TO)
+                job.callbacks.clear()
+                outcomes.append((job, None, e))
+            finally:
+                self._local.callbacks = None
+            conn.execute(RELEASE)
+
+        commit_started = time.perf_counter()
+        try:
+            conn.execute(COMMIT)
+        except Exception as e:
+            conn.execute(ROLLBACK)
+            outcomes = [(job, None, error or e) for job, _, error in outcomes]
+            with self._stats_lock:
+                self._stats["aborted_batches"] += 1
+            if self._on_abort:
+                self._on_abort()
+        else:
+            # До ответа вызывающим: вернувшись из операции, они видят обновлённые кэши
+            for job in batch:
+                self._run_callbacks(job.callbacks)
+        finished = time.perf_counter()
+
+        with self._stats_lock:
+            self._stats["batches"] += 1
+            self._stats["operations"] += len(batch)
+            self._stats["max_batch"] = max(self._stats["max_batch"], len(batch))
+            self._stats["total_commit_ms"] += (finished - commit_started) * 1000
+            for job, _, error in outcomes:
+                stats = self._operations.setdefault(job.name, _OperationStats())
+                stats.add((job.started - job.enqueued) * 1000, (finished - job.enqueued) * 1000,
+                          error is not None)
+
+        for job, result, error in outcomes:
+            if error is not None:
+                job.future.set_exception(error)
+            else:
+                job.future.set_result(result)
+
+    def metrics(self) -> dict:
+        with self._stats_lock:
+            stats = dict(self._stats)
+            operations = {name: op.as_dict() for name, op in sorted(self._operations.items())}
+        total_commit_ms = stats.pop("total_commit_ms")
+        stats["avg_batch"] = round(stats["operations"] / stats["batches"], 2) if stats["batches"] else 0.0
+        stats["avg_commit_ms"] = round(total_commit_ms / stats["batches"], 3) if stats["batches"] else 0.0
+        stats["queue_depth"] = self._queue.qsize()
+        stats["queue_capacity"] = self._queue.maxsize
+        stats["enabled"] = self.enabled
+        stats["running"] = self._thread is not None and self._thread.is_alive()
+        stats["operations_by_name"] = operations
+        return stats